@@ -0,0 +1,41 @@
+"""add new measurement trigger options
+
+Revision ID: 4f8a2c1d9e6b
+Revises: b354722c9b8b
+Create Date: 2022-03-02 18:41:12.503128
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f8a2c1d9e6b'
+down_revision = 'b354722c9b8b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for each_table in ["pid", "conditional"]:
+        with op.batch_alter_table(each_table) as batch_op:
+            batch_op.add_column(sa.Column('run_on_new_measurement', sa.Boolean))
+            batch_op.add_column(sa.Column('new_measurement_debounce', sa.Float))
+            batch_op.add_column(sa.Column('new_measurement_min_interval', sa.Float))
+
+        op.execute(
+            '''
+            UPDATE {table}
+            SET run_on_new_measurement=0,
+                new_measurement_debounce=0.0,
+                new_measurement_min_interval=0.0
+            '''.format(table=each_table)
+        )
+
+
+def downgrade():
+    for each_table in ["pid", "conditional"]:
+        with op.batch_alter_table(each_table) as batch_op:
+            batch_op.drop_column('run_on_new_measurement')
+            batch_op.drop_column('new_measurement_debounce')
+            batch_op.drop_column('new_measurement_min_interval')
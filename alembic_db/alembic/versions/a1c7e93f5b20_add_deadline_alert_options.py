@@ -0,0 +1,36 @@
+"""add deadline alert options
+
+Revision ID: a1c7e93f5b20
+Revises: 4f8a2c1d9e6b
+Create Date: 2022-03-04 11:26:47.119385
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c7e93f5b20'
+down_revision = '4f8a2c1d9e6b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("misc") as batch_op:
+        batch_op.add_column(sa.Column('deadline_alert_misses', sa.Integer))
+        batch_op.add_column(sa.Column('deadline_alert_function_id', sa.String))
+
+    op.execute(
+        '''
+        UPDATE misc
+        SET deadline_alert_misses=0,
+            deadline_alert_function_id=''
+        '''
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("misc") as batch_op:
+        batch_op.drop_column('deadline_alert_misses')
+        batch_op.drop_column('deadline_alert_function_id')
@@ -0,0 +1,33 @@
+"""add input isolate process
+
+Revision ID: c7d2e8a4b1f6
+Revises: a1c7e93f5b20
+Create Date: 2022-03-07 14:02:31.582117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2e8a4b1f6'
+down_revision = 'a1c7e93f5b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("input") as batch_op:
+        batch_op.add_column(sa.Column('isolate_process', sa.Boolean))
+
+    op.execute(
+        '''
+        UPDATE input
+        SET isolate_process=0
+        '''
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("input") as batch_op:
+        batch_op.drop_column('isolate_process')
@@ -0,0 +1,94 @@
+"""add note search indexes
+
+Revision ID: e3a9f1c6d482
+Revises: c7d2e8a4b1f6
+Create Date: 2022-03-14 10:21:07.428531
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a9f1c6d482'
+down_revision = 'c7d2e8a4b1f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'note_tag_association',
+        sa.Column('id', sa.Integer, nullable=False, unique=True),
+        sa.Column('note_id', sa.String, nullable=False),
+        sa.Column('tag_id', sa.String, nullable=False),
+        sa.Column('date_time', sa.DateTime),
+        sa.PrimaryKeyConstraint('id'),
+        keep_existing=True
+    )
+    op.create_index('ix_note_tag_association_note_id', 'note_tag_association', ['note_id'])
+    op.create_index('ix_note_tag_association_tag_id_date_time', 'note_tag_association', ['tag_id', 'date_time'])
+
+    # Associate notes with their tags (tag IDs, or tag names for notes created by Actions)
+    connection = op.get_bind()
+    tags = {}
+    for tag_id, name in connection.execute(sa.text("SELECT unique_id, name FROM note_tags")).fetchall():
+        tags.setdefault(name, tag_id)
+        tags[tag_id] = tag_id
+    rows = []
+    for note_id, note_tags, date_time in connection.execute(
+            sa.text("SELECT unique_id, tags, date_time FROM notes")).fetchall():
+        tag_ids = []
+        for each_tag in (note_tags or '').split(','):
+            if each_tag in tags and tags[each_tag] not in tag_ids:
+                tag_ids.append(tags[each_tag])
+        rows.extend({'note_id': note_id, 'tag_id': each_tag_id, 'date_time': date_time}
+                    for each_tag_id in tag_ids)
+    if rows:
+        connection.execute(sa.text(
+            "INSERT INTO note_tag_association (note_id, tag_id, date_time) "
+            "VALUES (:note_id, :tag_id, :date_time)"), rows)
+
+    # Full-text index of notes (trigram tokens require SQLite 3.34+)
+    for each_tokenizer in ('trigram', 'unicode61'):
+        try:
+            op.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5("
+                "name, note, content='notes', content_rowid='id', tokenize='{}')".format(each_tokenizer))
+            break
+        except Exception:
+            continue
+    else:
+        return  # SQLite without FTS5, notes are searched without an index
+
+    op.execute(
+        '''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts(rowid, name, note) VALUES (new.id, new.name, new.note);
+        END
+        '''
+    )
+    op.execute(
+        '''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+            INSERT INTO notes_fts(notes_fts, rowid, name, note) VALUES ('delete', old.id, old.name, old.note);
+        END
+        '''
+    )
+    op.execute(
+        '''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE ON notes BEGIN
+            INSERT INTO notes_fts(notes_fts, rowid, name, note) VALUES ('delete', old.id, old.name, old.note);
+            INSERT INTO notes_fts(rowid, name, note) VALUES (new.id, new.name, new.note);
+        END
+        '''
+    )
+    op.execute("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS notes_fts_insert")
+    op.execute("DROP TRIGGER IF EXISTS notes_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS notes_fts_update")
+    op.execute("DROP TABLE IF EXISTS notes_fts")
+    op.drop_table('note_tag_association')
@@ -6,7 +6,8 @@ from mycodo.databases.models import SMTP
 from mycodo.actions.base_action import AbstractFunctionAction
 from mycodo.utils.database import db_retrieve_table_daemon
 from mycodo.utils.actions import check_allowed_to_email
-from mycodo.utils.send_data import send_email
+from mycodo.utils.notifications import deliver_email
+from mycodo.utils.notifications import notification_dispatcher
 
 ACTION_INFORMATION = {
     'name_unique': 'email',
@@ -83,9 +84,12 @@ class ActionModule(AbstractFunctionAction):
             if not message_send:
                 message_send = message
             smtp = db_retrieve_table_daemon(SMTP, entry='first')
-            send_email(smtp.host, smtp.protocol, smtp.port,
-                       smtp.user, smtp.passw, smtp.email_from,
-                       email_recipients, message_send)
+            notification_dispatcher.dispatch(
+                'email', deliver_email,
+                smtp.host, smtp.protocol, smtp.port,
+                smtp.user, smtp.passw, smtp.email_from,
+                email_recipients, message_send,
+                description=f"email to {email_recipients}")
         else:
             self.logger.error(
                 f"Wait {smtp_wait_timer - time.time():.0f} seconds to email again.")
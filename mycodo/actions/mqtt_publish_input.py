@@ -131,7 +131,7 @@ class ActionModule(AbstractFunctionAction):
             self.setup_action()
 
     def setup_action(self):
-        import paho.mqtt.publish as publish
+        from mycodo.utils import mqtt_connections as publish
         self.publish = publish
         self.action_setup = True
 
@@ -175,7 +175,8 @@ class ActionModule(AbstractFunctionAction):
                 port=self.port,
                 client_id=self.clientid,
                 keepalive=self.keepalive,
-                auth=auth_dict)
+                auth=auth_dict,
+                owner=self.unique_id)
             message += f" MQTT Publish '{payload}'."
         except Exception as err:
             msg = f" Could not execute MQTT Publish: {err}"
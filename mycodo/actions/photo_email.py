@@ -11,7 +11,8 @@ from mycodo.devices.camera import camera_record
 from mycodo.actions.base_action import AbstractFunctionAction
 from mycodo.utils.database import db_retrieve_table_daemon
 from mycodo.utils.actions import check_allowed_to_email
-from mycodo.utils.send_data import send_email
+from mycodo.utils.notifications import deliver_email
+from mycodo.utils.notifications import notification_dispatcher
 
 ACTION_INFORMATION = {
     'name_unique': 'photo_email',
@@ -115,11 +116,14 @@ class ActionModule(AbstractFunctionAction):
             if not message_send:
                 message_send = message
             smtp = db_retrieve_table_daemon(SMTP, entry='first')
-            send_email(smtp.host, smtp.protocol, smtp.port,
-                       smtp.user, smtp.passw, smtp.email_from,
-                       email_recipients, message_send,
-                       attachment_file=attachment_file,
-                       attachment_type="still")
+            notification_dispatcher.dispatch(
+                'email', deliver_email,
+                smtp.host, smtp.protocol, smtp.port,
+                smtp.user, smtp.passw, smtp.email_from,
+                email_recipients, message_send,
+                attachment_file=attachment_file,
+                attachment_type="still",
+                description=f"email with photo to {email_recipients}")
         else:
             self.logger.error(
                 f"Wait {smtp_wait_timer - time.time():.0f} seconds to email again.")
@@ -1,6 +1,4 @@
 # coding=utf-8
-import http.client
-import logging
 import urllib
 from urllib.parse import urlparse
 
@@ -9,6 +7,8 @@ from flask_babel import lazy_gettext
 from mycodo.databases.models import Actions
 from mycodo.actions.base_action import AbstractFunctionAction
 from mycodo.utils.database import db_retrieve_table_daemon
+from mycodo.utils.notifications import deliver_webhook
+from mycodo.utils.notifications import notification_dispatcher
 
 ACTION_INFORMATION = {
     'name_unique': 'webhook',
@@ -91,22 +91,13 @@ class ActionModule(AbstractFunctionAction):
         message += f" Webhook with method: {method}, scheme: {parsed_url.scheme}, netloc: {parsed_url.netloc}, " \
                    f"path: {path_and_query}, headers: {headers}, body: {body}."
 
-        if parsed_url.scheme == 'http':
-            conn = http.client.HTTPConnection(parsed_url.netloc)
-        elif parsed_url.scheme == 'https':
-            conn = http.client.HTTPSConnection(parsed_url.netloc)
-        else:
+        if parsed_url.scheme not in ['http', 'https']:
             raise Exception(f"Unsupported url scheme '{parsed_url.scheme}'")
 
-        conn.request(method, path_and_query, body, headers)
-        response = conn.getresponse()
-        if self.logger.isEnabledFor(logging.DEBUG):
-            self.logger.debug(response.readlines())
-        if 200 <= response.getcode() < 300:
-            self.logger.debug(f"HTTP {response.getcode()} -> OK")
-        else:
-            raise Exception(f"Got HTTP {response.getcode()} response.")
-        response.close()
+        # The request is made in the background, so a slow server doesn't hold up the caller
+        notification_dispatcher.dispatch(
+            'webhook', deliver_webhook, method, url, headers, body,
+            description=f"webhook {method} {parsed_url.netloc}")
 
         self.logger.debug(f"Message: {message}")
 
@@ -14,7 +14,7 @@ sys.path.append(os.path.abspath(os.path.dirname(__file__)))
 from config_translations import TRANSLATIONS
 
 MYCODO_VERSION = '8.12.9'
-ALEMBIC_VERSION = 'b354722c9b8b'
+ALEMBIC_VERSION = 'e3a9f1c6d482'
 
 #  FORCE_UPGRADE_MASTER
 #  Set True to enable upgrading to the master branch of the Mycodo repository.
@@ -63,6 +63,7 @@ PATH_MEASUREMENTS_BACKUP = os.path.join(INSTALL_DIRECTORY, 'mycodo/backup_measur
 PATH_SETTINGS_BACKUP = os.path.join(INSTALL_DIRECTORY, 'mycodo/backup_settings')
 USAGE_REPORTS_PATH = os.path.join(INSTALL_DIRECTORY, 'output_usage_reports')
 DEPENDENCY_INIT_FILE = os.path.join(INSTALL_DIRECTORY, '.dependency')
+DEPENDENCY_STATUS_FILE = os.path.join(INSTALL_DIRECTORY, '.dependency_status.json')
 UPGRADE_INIT_FILE = os.path.join(INSTALL_DIRECTORY, '.upgrade')
 BACKUP_PATH = '/var/Mycodo-backups'  # Where Mycodo backups are stored
 
@@ -98,6 +99,12 @@ PATH_CAMERAS = os.path.join(INSTALL_DIRECTORY, 'cameras')
 # Notes
 PATH_NOTE_ATTACHMENTS = os.path.join(INSTALL_DIRECTORY, 'note_attachments')
 
+# Resized images (thumbnails) of camera images and note attachments
+PATH_IMAGE_CACHE = os.path.join(INSTALL_DIRECTORY, 'image_cache')
+
+# Indexes of the lines of log files, by controller, level, and phrase
+PATH_LOG_INDEX = os.path.join(INSTALL_DIRECTORY, 'log_index')
+
 # Determine if running in a Docker container
 DOCKER_CONTAINER = os.environ.get('DOCKER_CONTAINER', False) == 'TRUE'
 
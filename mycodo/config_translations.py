@@ -275,6 +275,9 @@ TRANSLATIONS = {
     'invert_scale': {
         'title': lazy_gettext('Invert Scale'),
         'phrase': lazy_gettext('Invert the scale')},
+    'isolate_process': {
+        'title': lazy_gettext('Run in Separate Process'),
+        'phrase': lazy_gettext('Run the Input module in a worker process, isolating the daemon from its CPU use and crashes. Not available for Inputs with the I2C, UART, or FTDI interface, which share the bus and device locks of the daemon.')},
     'linux_command_user': {
         'title': lazy_gettext('Execute as User'),
         'phrase': lazy_gettext('The user to execute the command')},
@@ -296,6 +299,12 @@ TRANSLATIONS = {
     'name': {
         'title': lazy_gettext('Name'),
         'phrase': lazy_gettext('A name to distinguish this from others')},
+    'new_measurement_debounce': {
+        'title': lazy_gettext('New Measurement Debounce (seconds)'),
+        'phrase': lazy_gettext('When running on new measurements, wait this duration after a new measurement arrives before running')},
+    'new_measurement_min_interval': {
+        'title': lazy_gettext('New Measurement Min Interval (seconds)'),
+        'phrase': lazy_gettext('When running on new measurements, the minimum duration between runs')},
     'off_command': {
         'title': lazy_gettext('Off Command'),
         'phrase': lazy_gettext('Command to execute when the output is instructed to turn off')},
@@ -376,6 +385,9 @@ TRANSLATIONS = {
     'rpm_pulses_per_rev': {
         'title': lazy_gettext('Pulses Per Rev'),
         'phrase': lazy_gettext('The number of pulses per revolution to calculate revolutions per minute (RPM)')},
+    'run_on_new_measurement': {
+        'title': lazy_gettext('Run on New Measurement'),
+        'phrase': lazy_gettext('Also run as soon as a new measurement is stored, rather than only every Period')},
     'sample_time': {
         'title': lazy_gettext('Sample Time'),
         'phrase': lazy_gettext('The amount of time (seconds) to sample the input before caluclating the measurement')},
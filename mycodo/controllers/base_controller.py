@@ -9,12 +9,19 @@ All Controllers should inherit from this class and overwrite methods that raise
 NotImplementedErrors
 """
 import logging
+import threading
 import time
 import timeit
 
 import Pyro5
 
 from mycodo.abstract_base_controller import AbstractBaseController
+from mycodo.databases.models import Misc
+from mycodo.utils.actions import parse_action_information
+from mycodo.utils.actions import trigger_controller_actions
+from mycodo.utils.database import db_retrieve_table_daemon
+from mycodo.utils.metrics import DeadlineMonitor
+from mycodo.utils.metrics import controller_metrics
 
 
 class AbstractController(AbstractBaseController):
@@ -32,6 +39,15 @@ class AbstractController(AbstractBaseController):
         self.unique_id = unique_id
         self.ready = ready
 
+        # Set to end the sleep between loop() calls early (e.g. when new data arrives)
+        self.loop_wake = threading.Event()
+
+        # Timing of loop() and other operations (see mycodo/utils/metrics.py)
+        self.metrics_id = unique_id or type(self).__name__.replace('Controller', '')
+        self.metrics = controller_metrics.register(
+            self.metrics_id, type(self).__name__.replace('Controller', ''))
+        self.deadline = None  # Created upon the first call to record_deadline()
+
         logger_name = "{}".format(name)
         if self.unique_id:
             logger_name += "_{}".format(unique_id.split('-')[0])
@@ -69,6 +85,7 @@ class AbstractController(AbstractBaseController):
     #
 
     def run(self):
+        controller_metrics.set_current(self.metrics_id)
         try:
             try:
                 self.initialize_variables()
@@ -78,18 +95,20 @@ class AbstractController(AbstractBaseController):
             self.logger.info("Activated in {:.1f} ms".format(
                 (timeit.default_timer() - self.thread_startup_timer) * 1000))
 
-            self.ready.set()
             self.running = True
+            self.ready.set()
 
             while self.running:
                 try:
-                    self.loop()
+                    with self.metrics.timed('loop'):
+                        self.loop()
                 except Pyro5.errors.TimeoutError:
                     self.logger.exception("Pyro5 TimeoutError")
                 except Exception:
                     self.logger.exception("loop() Error")
                 finally:
-                    time.sleep(self.sample_rate)
+                    self.loop_wake.wait(self.sample_rate)
+                    self.loop_wake.clear()
 
         except Exception:
             self.logger.exception("Run Error")
@@ -97,6 +116,7 @@ class AbstractController(AbstractBaseController):
         finally:
             self.run_finally()
             self.running = False
+            controller_metrics.unregister(self.metrics_id, self.metrics)
             if self.thread_shutdown_timer:
                 self.logger.info("Deactivated in {:.1f} ms".format(
                     (timeit.default_timer() - self.thread_shutdown_timer) * 1000))
@@ -110,6 +130,7 @@ class AbstractController(AbstractBaseController):
         self.thread_shutdown_timer = timeit.default_timer()
         self.pre_stop()
         self.running = False
+        self.loop_wake.set()
 
     def set_log_level_debug(self, log_level_debug):
         if log_level_debug:
@@ -117,11 +138,50 @@ class AbstractController(AbstractBaseController):
         else:
             self.logger.setLevel(logging.INFO)
 
+    def record_deadline(self, scheduled, started, period=None):
+        """
+        Record when a periodic run was scheduled and when it actually started
+
+        :param scheduled: epoch time the run was scheduled to start
+        :param started: epoch time the run started
+        :param period: the controller's period (seconds), used to determine missed deadlines
+        :return: True if the deadline was missed
+        """
+        if self.deadline is None:
+            misc = db_retrieve_table_daemon(Misc, entry='first')
+            self.deadline = DeadlineMonitor(
+                alert_misses=misc.deadline_alert_misses,
+                alert_callback=self.deadline_alert)
+            self.metrics.deadline = self.deadline
+        return self.deadline.record(scheduled, started, period)
+
+    def deadline_alert(self, consecutive_misses, lateness):
+        """Executed when the set number of consecutive deadlines have been missed."""
+        message = "{name} ({id}) missed {num} consecutive deadlines (last started {sec:.1f} seconds late).".format(
+            name=type(self).__name__, id=self.metrics_id, num=consecutive_misses, sec=lateness)
+        self.logger.error(message)
+
+        misc = db_retrieve_table_daemon(Misc, entry='first')
+        if misc.deadline_alert_function_id:
+            # Execute the alert Actions in a separate thread to not further delay this controller
+            alert_actions = threading.Thread(
+                target=trigger_controller_actions,
+                args=(parse_action_information(),
+                      misc.deadline_alert_function_id,),
+                kwargs={'message': message})
+            alert_actions.start()
+
+    def deadline_status(self):
+        """Return the deadline statistics, or None if the controller has no periodic runs."""
+        if self.deadline:
+            return self.deadline.status()
+
     def attempt_execute(self, func, times=3, delay_sec=10):
         """Attempt to execute a function several times with a delay between attempts."""
         for i in range(1, times + 1):
             try:
-                func()
+                with self.metrics.timed(func.__name__):
+                    func()
                 break
             except Exception:
                 if i < times:
@@ -37,6 +37,8 @@ from mycodo.databases.models import ConditionalConditions
 from mycodo.databases.models import Misc
 from mycodo.utils.conditional import save_conditional_code
 from mycodo.utils.database import db_retrieve_table_daemon
+from mycodo.utils.measurement_events import NewMeasurementTrigger
+from mycodo.utils.system_pi import get_measurement
 
 MYCODO_DB_PATH = 'sqlite:///' + SQL_DATABASE_MYCODO
 
@@ -69,6 +71,7 @@ class ConditionalController(AbstractController, threading.Thread):
         self.sample_rate = None
         self.time_conditional = None
         self.conditional_run = None
+        self.new_measurement_trigger = None
 
     def loop(self):
         # Pause loop to modify conditional statements.
@@ -80,15 +83,29 @@ class ConditionalController(AbstractController, threading.Thread):
                 time.sleep(0.1)
 
         self.time_conditional = time.time()
+        # Check if a measurement used by the conditions has been stored
+        if (self.is_activated and self.new_measurement_trigger and
+                self.new_measurement_trigger.is_due(self.time_conditional)):
+            self.new_measurement_trigger.mark_run(self.time_conditional)
+            self.timer_period = self.time_conditional + self.period
+            self.attempt_execute(self.check_conditionals)
+
         # Check if the conditional period has elapsed
-        if (self.is_activated and self.timer_period and
+        elif (self.is_activated and self.timer_period and
                 self.timer_period < self.time_conditional):
+            self.record_deadline(self.timer_period, self.time_conditional, self.period)
 
             while self.timer_period < self.time_conditional:
                 self.timer_period += self.period
 
+            if self.new_measurement_trigger:
+                self.new_measurement_trigger.mark_run(self.time_conditional)
             self.attempt_execute(self.check_conditionals)
 
+    def run_finally(self):
+        if self.new_measurement_trigger:
+            self.new_measurement_trigger.unsubscribe_all()
+
     def initialize_variables(self):
         """Define all settings."""
         cond = db_retrieve_table_daemon(
@@ -110,6 +127,27 @@ class ConditionalController(AbstractController, threading.Thread):
         now = time.time()
         self.timer_period = now + self.start_offset
 
+        # Run when a measurement used by a condition is stored, rather than only every period
+        if self.new_measurement_trigger:
+            self.new_measurement_trigger.unsubscribe_all()
+            self.new_measurement_trigger = None
+        if cond.run_on_new_measurement:
+            self.new_measurement_trigger = NewMeasurementTrigger(
+                debounce=cond.new_measurement_debounce,
+                min_interval=cond.new_measurement_min_interval,
+                wake_event=self.loop_wake,
+                not_before=self.timer_period)
+            conditions = db_retrieve_table_daemon(ConditionalConditions).filter(
+                ConditionalConditions.conditional_id == self.unique_id).all()
+            for each_condition in conditions:
+                if not each_condition.measurement or ',' not in each_condition.measurement:
+                    continue
+                device_id = each_condition.measurement.split(',')[0]
+                device_measurement = get_measurement(each_condition.measurement.split(',')[1])
+                self.new_measurement_trigger.subscribe(
+                    device_id,
+                    channels=[device_measurement.channel] if device_measurement else None)
+
         self.file_run = '{}/conditional_{}.py'.format(
             PATH_PYTHON_CODE_USER, self.unique_id)
 
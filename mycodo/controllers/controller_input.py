@@ -25,6 +25,7 @@
 import threading
 import time
 
+from mycodo.config import DAEMON_LOG_FILE
 from mycodo.controllers.base_controller import AbstractController
 from mycodo.databases.models import Actions
 from mycodo.databases.models import Conversion
@@ -37,9 +38,12 @@ from mycodo.databases.models import SMTP
 from mycodo.mycodo_client import DaemonControl
 from mycodo.utils.database import db_retrieve_table_daemon
 from mycodo.utils.influx import add_measurements_influxdb
+from mycodo.utils.input_worker import InputWorker
+from mycodo.utils.input_worker import InputWorkerError
+from mycodo.utils.input_worker import can_isolate
 from mycodo.utils.inputs import parse_input_information
 from mycodo.utils.inputs import parse_measurement
-from mycodo.utils.lockfile import LockFile
+from mycodo.utils.locks import lock_manager
 from mycodo.utils.modules import load_module_from_file
 
 
@@ -74,7 +78,6 @@ class InputController(AbstractController, threading.Thread):
 
         self.unique_id = unique_id
         self.sample_rate = None
-        self.lf = LockFile()
 
         self.control = DaemonControl()
 
@@ -101,7 +104,7 @@ class InputController(AbstractController, threading.Thread):
         self.pre_output_channel = None
         self.pre_output_duration = None
         self.pre_output_during_measure = None
-        self.pre_output_lock_file = None
+        self.pre_output_lock = None
         self.pre_output_setup = None
         self.last_measurement = None
         self.next_measurement = None
@@ -144,6 +147,7 @@ class InputController(AbstractController, threading.Thread):
             # Signal that a measurement needs to be obtained
             if (now > self.next_measurement and
                     not self.get_new_measurement):
+                self.record_deadline(self.next_measurement, now, self.period)
 
                 # Prevent double measurement if previous acquisition of a measurement was delayed
                 if self.last_measurement < self.next_measurement:
@@ -160,7 +164,7 @@ class InputController(AbstractController, threading.Thread):
                     self.pre_output_setup and
                     not self.pre_output_activated):
 
-                if self.lf.lock_acquire(self.pre_output_lock_file, timeout=30):
+                if lock_manager.acquire(self.pre_output_lock, timeout=30, owner=self.unique_id):
                     self.pre_output_timer = time.time() + self.pre_output_duration
                     self.pre_output_activated = True
 
@@ -183,8 +187,8 @@ class InputController(AbstractController, threading.Thread):
                             kwargs={'output_channel': self.pre_output_channel})
                         output_on.start()
                 else:
-                    self.logger.error("Could not acquire pre-output lock at {}".format(
-                        self.pre_output_lock_file))
+                    self.logger.error("Could not acquire pre-output lock {}".format(
+                        self.pre_output_lock))
 
             # If using a pre output, wait for it to complete before
             # querying the input for a measurement
@@ -194,7 +198,7 @@ class InputController(AbstractController, threading.Thread):
                         self.pre_output_activated and
                         now > self.pre_output_timer):
 
-                    if self.lf.lock_locked(self.pre_output_lock_file):
+                    if lock_manager.held_by(self.pre_output_lock, owner=self.unique_id):
                         try:
                             if self.pre_output_during_measure:
                                 # Measure then turn off pre-output
@@ -212,10 +216,10 @@ class InputController(AbstractController, threading.Thread):
                             self.get_new_measurement = False
                         finally:
                             # always remove lock
-                            self.lf.lock_release(self.pre_output_lock_file)
+                            lock_manager.release(self.pre_output_lock, owner=self.unique_id)
                     else:
-                        self.logger.error("Pre-output lock not found at {}".format(
-                            self.pre_output_lock_file))
+                        self.logger.error("Pre-output lock {} not held".format(
+                            self.pre_output_lock))
 
                 elif not self.pre_output_setup:
                     # Pre-output not enabled, just measure
@@ -256,6 +260,11 @@ class InputController(AbstractController, threading.Thread):
         except:
             pass
 
+        # Don't leave other Inputs waiting on a pre-output lock held when stopped
+        if (self.pre_output_lock and
+                lock_manager.held_by(self.pre_output_lock, owner=self.unique_id)):
+            lock_manager.release(self.pre_output_lock, owner=self.unique_id)
+
     def initialize_variables(self):
         input_dev = db_retrieve_table_daemon(
             Input, unique_id=self.unique_id)
@@ -295,7 +304,7 @@ class InputController(AbstractController, threading.Thread):
                 self.pre_output_during_measure = input_dev.pre_output_during_measure
                 self.pre_output_activated = False
                 self.pre_output_timer = time.time()
-                self.pre_output_lock_file = '/var/lock/input_pre_output_{id}_{ch}'.format(
+                self.pre_output_lock = 'input_pre_output_{id}_{ch}'.format(
                     id=self.pre_output_id, ch=self.pre_output_channel_id)
 
                 # Check if Pre Output and channel IDs exists
@@ -331,7 +340,25 @@ class InputController(AbstractController, threading.Thread):
                 'inputs')
 
             if input_loaded:
-                self.measure_input = input_loaded.InputModule(self.input_dev)
+                isolate = (self.input_dev.isolate_process and
+                           not ('listener' in self.dict_inputs[self.device] and
+                                self.dict_inputs[self.device]['listener']))
+                if isolate and not can_isolate(self.interface):
+                    self.logger.warning(
+                        "Inputs with the {} interface can't be run in a separate process, as they "
+                        "share the bus (and its locks) of the daemon. Running in the daemon.".format(
+                            self.interface))
+                    isolate = False
+                if isolate:
+                    # Host the Input module in a worker process
+                    self.measure_input = InputWorker(
+                        self.unique_id,
+                        timeout=max(60, 2 * self.period),
+                        log_file=DAEMON_LOG_FILE)
+                    self.measure_input.start()
+                    self.metrics.worker = self.measure_input
+                else:
+                    self.measure_input = input_loaded.InputModule(self.input_dev)
         else:
             self.device_recognized = False
             self.logger.debug("Device '{device}' not recognized".format(
@@ -368,7 +395,8 @@ class InputController(AbstractController, threading.Thread):
 
         try:
             # Get measurement from input
-            measurements = self.measure_input.next()
+            with self.metrics.timed('sensor_read'):
+                measurements = self.measure_input.next()
             # Reset StopIteration counter on successful read
             if self.stop_iteration_counter:
                 self.stop_iteration_counter = 0
@@ -382,6 +410,8 @@ class InputController(AbstractController, threading.Thread):
                     "StopIteration raised 3 times. Possibly could not read "
                     "input. Ensure it's connected properly and "
                     "detected.")
+        except InputWorkerError as err:
+            self.logger.error("Error while attempting to read input in worker process: {}".format(err))
         except AttributeError:
             self.logger.error(
                 "Mycodo is attempting to acquire measurement(s) from an Input that has already critically errored. "
@@ -447,6 +477,15 @@ class InputController(AbstractController, threading.Thread):
             self.logger.exception(msg)
             return 1, msg
 
+    def function_status(self):
+        if isinstance(self.measure_input, InputWorker):
+            return {
+                'string_status': self.measure_input.status_string(),
+                'worker': self.measure_input.status(),
+                'error': []
+            }
+        return {'string_status': '', 'error': []}
+
     def pre_stop(self):
         # Ensure pre-output is off
         if self.pre_output_setup:
@@ -68,6 +68,7 @@ from mycodo.utils.database import db_retrieve_table_daemon
 from mycodo.utils.influx import add_measurements_influxdb
 from mycodo.utils.influx import read_influxdb_single
 from mycodo.utils.influx import write_influxdb_value
+from mycodo.utils.measurement_events import NewMeasurementTrigger
 from mycodo.utils.method import load_method_handler, parse_db_time
 from mycodo.utils.outputs import parse_output_information
 from mycodo.utils.pid_controller_default import PIDControl
@@ -130,6 +131,7 @@ class PIDController(AbstractController, threading.Thread):
         self.send_lower_as_negative = None
         self.store_lower_as_negative = None
         self.timer = 0
+        self.new_measurement_trigger = None
 
         # Check if a method is set for this PID
         self.method_type = None
@@ -137,12 +139,24 @@ class PIDController(AbstractController, threading.Thread):
         self.method_end_time = None
 
     def loop(self):
-        if time.time() > self.timer:
+        now = time.time()
+        if self.new_measurement_trigger and self.new_measurement_trigger.is_due(now):
+            # New measurement stored, run now and restart the period
+            self.new_measurement_trigger.mark_run(now)
+            self.timer = now + self.period
+            self.attempt_execute(self.check_pid)
+        elif now > self.timer:
+            self.record_deadline(self.timer, now, self.period)
             while time.time() > self.timer:
                 self.timer = self.timer + self.period
+            if self.new_measurement_trigger:
+                self.new_measurement_trigger.mark_run(now)
             self.attempt_execute(self.check_pid)
 
     def run_finally(self):
+        if self.new_measurement_trigger:
+            self.new_measurement_trigger.unsubscribe_all()
+
         # Turn off output used in PID when the controller is deactivated
         if self.raise_output_id and self.PID_Controller.direction in ['raise', 'both']:
             self.control.output_off(
@@ -202,6 +216,23 @@ class PIDController(AbstractController, threading.Thread):
         self.timer = time.time() + self.start_offset
         self.setpoint = pid.setpoint
 
+        # Run when a new measurement is stored, rather than only every period.
+        # The PID (integrator, derivative) and its output (durations and duty
+        # cycles of the Period) are per Period, so it runs at most once per Period.
+        if self.new_measurement_trigger:
+            self.new_measurement_trigger.unsubscribe_all()
+            self.new_measurement_trigger = None
+        if pid.run_on_new_measurement:
+            self.new_measurement_trigger = NewMeasurementTrigger(
+                debounce=pid.new_measurement_debounce,
+                min_interval=max(pid.new_measurement_min_interval or 0, self.period),
+                wake_event=self.loop_wake,
+                not_before=self.timer)
+            device_measurement = get_measurement(self.measurement_id)
+            self.new_measurement_trigger.subscribe(
+                self.device_id,
+                channels=[device_measurement.channel] if device_measurement else None)
+
         # Initialize PID Controller
         if self.PID_Controller is None:
             self.PID_Controller = PIDControl(
@@ -111,6 +111,12 @@ class TriggerController(AbstractController, threading.Thread):
                 self.timer_period < time.time()):
             check_approved = False
 
+            if self.trigger_type in ['trigger_timer_daily_time_span',
+                                     'trigger_timer_duration']:
+                self.record_deadline(self.timer_period, time.time(), self.period)
+            else:
+                self.record_deadline(self.timer_period, time.time())
+
             # Check if the trigger period has elapsed
             if self.trigger_type == 'trigger_sunrise_sunset':
                 while self.running and self.timer_period < time.time():
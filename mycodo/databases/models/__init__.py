@@ -56,6 +56,7 @@ from .method import MethodData
 from .misc import EnergyUsage
 from .misc import Misc
 from .notes import NoteTags
+from .notes import NoteTagAssociation
 from .notes import Notes
 from .output import Output
 from .output import OutputChannel
@@ -34,6 +34,9 @@ class Conditional(CRUDMixin, db.Model):
     start_offset = db.Column(db.Float, default=10.0)
     pyro_timeout = db.Column(db.Float, default=30.0)
     message_include_code = db.Column(db.Boolean, default=False)
+    run_on_new_measurement = db.Column(db.Boolean, default=False)  # Also run when a condition measurement is stored
+    new_measurement_debounce = db.Column(db.Float, default=0.0)
+    new_measurement_min_interval = db.Column(db.Float, default=0.0)
 
     custom_options = db.Column(db.Text, default='')
 
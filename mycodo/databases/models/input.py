@@ -15,6 +15,7 @@ class Input(CRUDMixin, db.Model):
     position_y = db.Column(db.Integer, default=0)
     is_activated = db.Column(db.Boolean, default=False)
     log_level_debug = db.Column(db.Boolean, default=False)
+    isolate_process = db.Column(db.Boolean, default=False)  # Run the Input module in a worker process
     is_preset = db.Column(db.Boolean, default=False)  # Is config saved as a preset?
     preset_name = db.Column(db.Text, default=None)  # Name for preset
     device = db.Column(db.Text, default='')  # Device name, such as DHT11, DHT22, DS18B20
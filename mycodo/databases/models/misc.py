@@ -33,6 +33,8 @@ class Misc(CRUDMixin, db.Model):
     sample_rate_controller_output = db.Column(db.Float, default=0.05)
     sample_rate_controller_pid = db.Column(db.Float, default=0.1)
     sample_rate_controller_widget = db.Column(db.Float, default=0.25)
+    deadline_alert_misses = db.Column(db.Integer, default=0)  # Consecutive missed deadlines to alert (0 disables)
+    deadline_alert_function_id = db.Column(db.String, default='')  # Controller whose Actions are executed on alert
     stats_opt_out = db.Column(db.Boolean, default=False)  # Opt not to send anonymous usage statistics
     enable_upgrade_check = db.Column(db.Boolean, default=True)  # Periodically check for a Mycodo upgrade
     mycodo_upgrade_available = db.Column(db.Boolean, default=False)  # Stores if an upgrade is available
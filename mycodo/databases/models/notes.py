@@ -1,10 +1,17 @@
 # coding=utf-8
 import datetime
+import logging
+
+from sqlalchemy import event
+from sqlalchemy import or_
+from sqlalchemy import select
 
 from mycodo.databases import CRUDMixin
 from mycodo.databases import set_uuid
 from mycodo.mycodo_flask.extensions import db
 
+logger = logging.getLogger("mycodo.notes")
+
 
 class Notes(CRUDMixin, db.Model):
     __tablename__ = "notes"
@@ -32,3 +39,137 @@ class NoteTags(CRUDMixin, db.Model):
 
     def __repr__(self):
         return "<{cls}(id={s.id})>".format(s=self, cls=self.__class__.__name__)
+
+
+class NoteTagAssociation(db.Model):
+    """
+    The tags of each note (from the comma-separated tags of notes), with the note's date/time
+
+    Maintained when notes are added, modified, or deleted, so notes can be
+    looked up by tag and time range with an index instead of scanning notes.
+    """
+    __tablename__ = "note_tag_association"
+    __table_args__ = (
+        db.Index('ix_note_tag_association_tag_id_date_time', 'tag_id', 'date_time'),
+        {'extend_existing': True})
+
+    id = db.Column(db.Integer, unique=True, primary_key=True)
+    note_id = db.Column(db.String, nullable=False, index=True)  # unique_id of the note
+    tag_id = db.Column(db.String, nullable=False)  # unique_id of the tag
+    date_time = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return "<{cls}(id={s.id})>".format(s=self, cls=self.__class__.__name__)
+
+
+#
+# Full-text index of the names and text of notes
+#
+
+# Trigram tokens allow LIKE '%...%' searches of the index (SQLite 3.34+)
+NOTES_FTS_TOKENIZERS = ('trigram', 'unicode61')
+
+NOTES_FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts(rowid, name, note) VALUES (new.id, new.name, new.note);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, name, note) VALUES ('delete', old.id, old.name, old.note);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, name, note) VALUES ('delete', old.id, old.name, old.note);
+        INSERT INTO notes_fts(rowid, name, note) VALUES (new.id, new.name, new.note);
+    END
+    """
+]
+
+
+def create_notes_fts(connection):
+    """
+    Create the full-text index of notes (an FTS5 table kept current by triggers) and fill it
+
+    :return: tokenizer of the index, or None if SQLite doesn't support FTS5
+    """
+    for each_tokenizer in NOTES_FTS_TOKENIZERS:
+        try:
+            connection.exec_driver_sql(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5("
+                "name, note, content='notes', content_rowid='id', tokenize='{}')".format(each_tokenizer))
+            break
+        except Exception:
+            continue
+    else:
+        logger.error("SQLite doesn't support FTS5, notes will be searched without an index")
+        return
+
+    for each_trigger in NOTES_FTS_TRIGGERS:
+        connection.exec_driver_sql(each_trigger)
+    connection.exec_driver_sql("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')")
+    return notes_fts_tokenizer(connection)
+
+
+def notes_fts_tokenizer(connection):
+    """Return the tokenizer of the full-text index of notes, or None if there's no index."""
+    sql = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name='notes_fts'").scalar()
+    if not sql:
+        return
+    for each_tokenizer in NOTES_FTS_TOKENIZERS:
+        if "tokenize='{}'".format(each_tokenizer) in sql:
+            return each_tokenizer
+
+
+@event.listens_for(Notes.__table__, 'after_create')
+def notes_table_created(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        create_notes_fts(connection)
+
+
+#
+# Tag associations
+#
+
+def note_tag_ids(connection, tags):
+    """Return the unique_ids of the tags of a note (tags may be tag unique_ids or names)."""
+    tags = [each_tag for each_tag in (tags or '').split(',') if each_tag]
+    if not tags:
+        return []
+    table = NoteTags.__table__
+    rows = connection.execute(
+        select([table.c.unique_id, table.c.name]).where(
+            or_(table.c.unique_id.in_(tags), table.c.name.in_(tags)))).fetchall()
+    by_id = {row.unique_id: row.unique_id for row in rows}
+    by_name = {row.name: row.unique_id for row in rows}
+    tag_ids = []
+    for each_tag in tags:
+        tag_id = by_id.get(each_tag) or by_name.get(each_tag)
+        if tag_id and tag_id not in tag_ids:
+            tag_ids.append(tag_id)
+    return tag_ids
+
+
+def index_note_tags(connection, note_id, tags, date_time):
+    """Replace the tag associations of a note."""
+    table = NoteTagAssociation.__table__
+    connection.execute(table.delete().where(table.c.note_id == note_id))
+    rows = [{'note_id': note_id, 'tag_id': each_tag_id, 'date_time': date_time}
+            for each_tag_id in note_tag_ids(connection, tags)]
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+@event.listens_for(Notes, 'after_insert')
+@event.listens_for(Notes, 'after_update')
+def note_saved(mapper, connection, target):
+    index_note_tags(connection, target.unique_id, target.tags, target.date_time)
+
+
+@event.listens_for(Notes, 'after_delete')
+def note_deleted(mapper, connection, target):
+    table = NoteTagAssociation.__table__
+    connection.execute(table.delete().where(table.c.note_id == target.unique_id))
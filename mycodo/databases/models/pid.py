@@ -24,6 +24,9 @@ class PID(CRUDMixin, db.Model):
     period = db.Column(db.Float, default=30.0)
     start_offset = db.Column(db.Float, default=30.0)
     max_measure_age = db.Column(db.Float, default=120.0)
+    run_on_new_measurement = db.Column(db.Boolean, default=False)  # Also run when a new measurement is stored
+    new_measurement_debounce = db.Column(db.Float, default=0.0)
+    new_measurement_min_interval = db.Column(db.Float, default=0.0)
     measurement = db.Column(db.Text, default='')  # What condition is the controller regulating?
     direction = db.Column(db.Text, default='raise')  # Direction of regulation (raise, lower, both)
     setpoint = db.Column(db.Float, default=30.0)  # PID setpoint
@@ -12,7 +12,7 @@ from pylibftdi.driver import FtdiError
 sys.path.append(os.path.abspath(os.path.join(os.path.realpath(__file__), '../../..')))
 
 from mycodo.devices.base_atlas import AbstractBaseAtlasScientific
-from mycodo.utils.lockfile import LockFile
+from mycodo.utils.locks import lock_manager
 
 
 class AtlasScientificFTDI(AbstractBaseAtlasScientific, Device):
@@ -23,7 +23,7 @@ class AtlasScientificFTDI(AbstractBaseAtlasScientific, Device):
         super().__init__(interface='FTDI', name=serial_device.replace("/", "_"))
 
         self.lock_timeout = 10
-        self.lock_file = '/var/lock/atlas_FTDI_{}_{}.lock'.format(
+        self.lock_name = 'atlas_FTDI_{}_{}'.format(
             __name__.replace(".", "_"), serial_device)
 
         self.logger = logging.getLogger(
@@ -47,8 +47,7 @@ class AtlasScientificFTDI(AbstractBaseAtlasScientific, Device):
 
     def query(self, query_str):
         """Send command and return reply."""
-        lf = LockFile()
-        if lf.lock_acquire(self.lock_file, timeout=self.lock_timeout):
+        if lock_manager.acquire(self.lock_name, timeout=self.lock_timeout):
             try:
                 self.send_cmd(query_str)
                 time.sleep(1.3)
@@ -60,7 +59,9 @@ class AtlasScientificFTDI(AbstractBaseAtlasScientific, Device):
                     "{err}".format(cls=type(self).__name__, err=err))
                 return 'error', err
             finally:
-                lf.lock_release(self.lock_file)
+                lock_manager.release(self.lock_name)
+        else:
+            return 'error', "Could not acquire lock {}".format(self.lock_name)
 
     def read_line(self, size=0):
         """
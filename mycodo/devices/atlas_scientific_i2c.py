@@ -10,7 +10,8 @@ import io
 sys.path.append(os.path.abspath(os.path.join(os.path.realpath(__file__), '../../..')))
 
 from mycodo.devices.base_atlas import AbstractBaseAtlasScientific
-from mycodo.utils.lockfile import LockFile
+from mycodo.devices.bus_arbiter import BusTimeout
+from mycodo.devices.bus_arbiter import get_bus_arbiter
 
 
 class AtlasScientificI2C(AbstractBaseAtlasScientific):
@@ -25,8 +26,8 @@ class AtlasScientificI2C(AbstractBaseAtlasScientific):
         super().__init__(interface='I2C', name="_{}_{}".format(i2c_address, i2c_bus))
 
         self.lock_timeout = 10
-        self.lock_file = '/var/lock/atlas_{}_{}_{}.lock'.format(
-            __name__.replace(".", "_"), i2c_address, i2c_bus)
+        self.bus_arbiter = get_bus_arbiter('I2C', i2c_bus)
+        self.lock_name = self.bus_arbiter.lock_name
 
         # open two file streams, one for reading and one for writing
         # the specific I2C channel is selected with bus
@@ -89,30 +90,31 @@ class AtlasScientificI2C(AbstractBaseAtlasScientific):
 
     def query(self, query_str):
         """Send command to board and read response"""
-        lf = LockFile()
-        if lf.lock_acquire(self.lock_file, timeout=self.lock_timeout):
-            try:
-                # write a command to the board, wait the correct timeout,
-                # and read the response
-                self.write(query_str)
-
-                # the read and calibration commands require a longer timeout
-                if ((query_str.upper().startswith("R")) or
-                        (query_str.upper().startswith("CAL"))):
-                    time.sleep(self.long_timeout)
-                elif query_str.upper().startswith("SLEEP"):
-                    return "success", "sleep mode"
-                else:
-                    time.sleep(self.short_timeout)
-
-                return self.read()
-            except Exception as err:
-                self.logger.debug(
-                    "{cls} raised an exception when taking a reading: "
-                    "{err}".format(cls=type(self).__name__, err=err))
-                return "error", err
-            finally:
-                lf.lock_release(self.lock_file)
+        # The bus is released while the board processes the command,
+        # allowing other devices on the bus to be communicated with, but
+        # the board is held so other commands to it wait for the response
+        if query_str.upper().startswith("SLEEP"):
+            steps = [(lambda: self.write(query_str), 0),
+                     (lambda: ("success", "sleep mode"), 0)]
+        elif (query_str.upper().startswith("R") or
+                query_str.upper().startswith("CAL")):
+            # the read and calibration commands require a longer timeout
+            steps = [(lambda: self.write(query_str), self.long_timeout),
+                     (self.read, 0)]
+        else:
+            steps = [(lambda: self.write(query_str), self.short_timeout),
+                     (self.read, 0)]
+
+        try:
+            return self.bus_arbiter.transaction(
+                self.current_addr, steps, timeout=self.lock_timeout)
+        except BusTimeout as err:
+            return "error", str(err)
+        except Exception as err:
+            self.logger.debug(
+                "{cls} raised an exception when taking a reading: "
+                "{err}".format(cls=type(self).__name__, err=err))
+            return "error", err
 
     def close(self):
         self.file_read.close()
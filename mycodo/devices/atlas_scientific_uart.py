@@ -11,7 +11,7 @@ from serial.serialutil import SerialTimeoutException
 sys.path.append(os.path.abspath(os.path.join(os.path.realpath(__file__), '../../..')))
 
 from mycodo.devices.base_atlas import AbstractBaseAtlasScientific
-from mycodo.utils.lockfile import LockFile
+from mycodo.utils.locks import lock_manager
 
 
 class AtlasScientificUART(AbstractBaseAtlasScientific):
@@ -21,7 +21,7 @@ class AtlasScientificUART(AbstractBaseAtlasScientific):
         super().__init__(interface='UART', name=serial_device.replace("/", "_"))
 
         self.lock_timeout = 10
-        self.lock_file = '/var/lock/atlas_UART_{}_{}.lock'.format(
+        self.lock_name = 'atlas_UART_{}_{}'.format(
             __name__.replace(".", "_"), serial_device.replace("/", "_"))
 
         self.logger = logging.getLogger(
@@ -76,8 +76,7 @@ class AtlasScientificUART(AbstractBaseAtlasScientific):
 
     def query(self, query_str):
         """Send command and return reply."""
-        lf = LockFile()
-        if lf.lock_acquire(self.lock_file, timeout=self.lock_timeout):
+        if lock_manager.acquire(self.lock_name, timeout=self.lock_timeout):
             try:
                 self.send_cmd(query_str)
                 time.sleep(1.3)
@@ -89,7 +88,9 @@ class AtlasScientificUART(AbstractBaseAtlasScientific):
                     "{err}".format(cls=type(self).__name__, err=err))
                 return "error", err
             finally:
-                lf.lock_release(self.lock_file)
+                lock_manager.release(self.lock_name)
+        else:
+            return "error", "Could not acquire lock {}".format(self.lock_name)
 
     def read_lines(self):
         """
@@ -0,0 +1,208 @@
+# coding=utf-8
+"""
+Arbitration of shared buses (I2C, SPI, UART) between devices
+
+Devices on the same bus submit transactions to the bus's arbiter. A transaction
+is a sequence of steps, each of which is a function that requires exclusive use
+of the bus (e.g. writing a command or reading a response) followed by a delay
+during which the bus is not needed (e.g. the device's conversion time). The bus
+is released during each delay, so the transactions of other devices are able
+to interleave their steps, rather than the bus being idle for the duration of
+every conversion. Waiting devices are granted the bus in the order they
+requested it. Each device is held for the whole of its transaction, so two
+transactions with the same device (e.g. a measurement and a calibration sent
+from another thread) don't interleave their commands and responses.
+
+Bus utilization, the time transactions wait for the bus, and the latency of the
+transactions of each device are recorded, which are returned by the daemon
+(get_bus_stats()).
+
+See mycodo.devices.bus_simulated for a simulated bus to use without hardware.
+"""
+import threading
+import time
+import timeit
+from contextlib import contextmanager
+
+from mycodo.utils.locks import lock_manager
+from mycodo.utils.metrics import OperationStats
+
+
+class BusTimeout(Exception):
+    """The bus could not be acquired within the timeout."""
+    pass
+
+
+class BusArbiter:
+    """Schedules the transactions of all devices on a single bus."""
+    def __init__(self, interface, bus, timeout=30):
+        self.interface = interface
+        self.bus = bus
+        self.timeout = timeout
+        self.name = '{}_{}'.format(interface, bus)
+        self.lock_name = 'bus_{}'.format(self.name)
+
+        self.stats_lock = threading.Lock()
+        self.time_started = timeit.default_timer()
+        self.busy_total = 0.0
+        self.steps = 0
+        self.timeouts = 0
+        self.queue_wait = OperationStats()
+        self.device_latency = {}
+
+    @contextmanager
+    def hold(self, timeout=None):
+        """
+        Hold exclusive use of the bus for the enclosed block
+
+        :param timeout: Maximum duration to wait for the bus (seconds), default self.timeout
+        :raises BusTimeout: if the bus could not be acquired
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        timer_wait = timeit.default_timer()
+        if not lock_manager.acquire(self.lock_name, timeout=timeout):
+            with self.stats_lock:
+                self.timeouts += 1
+            raise BusTimeout("Could not acquire bus {} within {} seconds".format(
+                self.name, timeout))
+        timer_hold = timeit.default_timer()
+
+        try:
+            yield
+        finally:
+            timer_release = timeit.default_timer()
+            lock_manager.release(self.lock_name)
+            with self.stats_lock:
+                self.steps += 1
+                self.busy_total += timer_release - timer_hold
+                self.queue_wait.observe(timer_hold - timer_wait)
+
+    def device_lock_name(self, device):
+        return '{}_device_{}'.format(self.lock_name, device)
+
+    def transaction(self, device, steps, timeout=None):
+        """
+        Execute a transaction with a device on the bus
+
+        :param device: identifies the device (e.g. its address). The device is held
+            for the whole transaction, and its latency is recorded.
+        :param steps: list of (function, delay) tuples. Each function is called while
+            holding the bus, then the bus is released for delay seconds.
+        :param timeout: Maximum duration to wait for the device, and for the bus for
+            each step (seconds)
+        :return: the return value of the last step's function
+        :raises BusTimeout: if the device or bus could not be acquired
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        timer = timeit.default_timer()
+        error = True
+        return_value = None
+        device_lock = self.device_lock_name(device)
+        try:
+            if not lock_manager.acquire(device_lock, timeout=timeout):
+                with self.stats_lock:
+                    self.timeouts += 1
+                raise BusTimeout("Could not acquire device {} on bus {} within {} seconds".format(
+                    device, self.name, timeout))
+            try:
+                for function, delay in steps:
+                    with self.hold(timeout=timeout):
+                        return_value = function()
+                    if delay:
+                        time.sleep(delay)
+            finally:
+                lock_manager.release(device_lock)
+            error = False
+            return return_value
+        finally:
+            with self.stats_lock:
+                if device not in self.device_latency:
+                    self.device_latency[device] = OperationStats()
+                self.device_latency[device].observe(
+                    timeit.default_timer() - timer, error=error)
+
+    def stats(self):
+        elapsed = timeit.default_timer() - self.time_started
+        with self.stats_lock:
+            return {
+                'interface': self.interface,
+                'bus': self.bus,
+                'utilization': self.busy_total / elapsed if elapsed else 0.0,
+                'busy_total': self.busy_total,
+                'steps': self.steps,
+                'timeouts': self.timeouts,
+                'waiting': lock_manager.stats().get(self.lock_name, {}).get('waiting', 0),
+                'queue_wait': self.queue_wait.snapshot(),
+                'devices': {
+                    str(device): stats.snapshot() for device, stats in self.device_latency.items()
+                }
+            }
+
+
+arbiters_lock = threading.Lock()
+arbiters = {}
+
+
+def get_bus_arbiter(interface, bus):
+    """Return the arbiter of a bus, creating it if it doesn't exist."""
+    with arbiters_lock:
+        name = '{}_{}'.format(interface, bus)
+        if name not in arbiters:
+            arbiters[name] = BusArbiter(interface, bus)
+        return arbiters[name]
+
+
+def bus_stats():
+    """Return the stats of all bus arbiters."""
+    with arbiters_lock:
+        return {name: arbiter.stats() for name, arbiter in arbiters.items()}
+
+
+def format_prometheus_buses(stats, prefix='mycodo_bus'):
+    """
+    Format bus stats in the Prometheus text exposition format
+
+    :param stats: dict returned by bus_stats()
+    :param prefix: prefix of the metric names
+    :return: str
+    """
+    def histogram_lines(metric, labels, snapshot):
+        lines = []
+        for upper_bound, count in snapshot['buckets']:
+            lines.append('{}_{}_bucket{{{},le="{}"}} {}'.format(
+                prefix, metric, labels, upper_bound, count))
+        lines.append('{}_{}_bucket{{{},le="+Inf"}} {}'.format(
+            prefix, metric, labels, snapshot['count']))
+        lines.append('{}_{}_sum{{{}}} {}'.format(prefix, metric, labels, snapshot['sum']))
+        lines.append('{}_{}_count{{{}}} {}'.format(prefix, metric, labels, snapshot['count']))
+        return lines
+
+    lines_utilization = []
+    lines_wait = []
+    lines_latency = []
+
+    for name, bus in sorted(stats.items()):
+        labels = 'bus="{}"'.format(name)
+        lines_utilization.append('{}_utilization{{{}}} {}'.format(
+            prefix, labels, bus['utilization']))
+        lines_wait += histogram_lines('queue_wait_seconds', labels, bus['queue_wait'])
+        for device, snapshot in sorted(bus['devices'].items()):
+            lines_latency += histogram_lines(
+                'device_latency_seconds', '{},device="{}"'.format(labels, device), snapshot)
+
+    lines = [
+        '# HELP {}_utilization Fraction of time the bus was in use'.format(prefix),
+        '# TYPE {}_utilization gauge'.format(prefix)
+    ] + lines_utilization + [
+        '# HELP {}_queue_wait_seconds Duration waited to acquire the bus'.format(prefix),
+        '# TYPE {}_queue_wait_seconds histogram'.format(prefix)
+    ] + lines_wait + [
+        '# HELP {}_device_latency_seconds Duration of the transactions of each device'.format(prefix),
+        '# TYPE {}_device_latency_seconds histogram'.format(prefix)
+    ] + lines_latency
+
+    return '\n'.join(lines) + '\n'
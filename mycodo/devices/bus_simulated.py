@@ -0,0 +1,139 @@
+# coding=utf-8
+"""
+Simulated bus and devices, to exercise the bus arbiter without hardware
+
+Each simulated device takes a command, requires a conversion time before its
+response is ready (reading sooner returns a "still processing" status, as Atlas
+Scientific devices do), and each transfer occupies the bus for a short time.
+Overlapping transfers are counted as collisions, which will not occur when all
+access is through a BusArbiter.
+
+Run this module to compare sequential and arbitrated queries of several devices.
+The arbiter is tested with it in mycodo/tests/software_tests/test_devices.
+"""
+import os
+import sys
+import threading
+import time
+import timeit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.realpath(__file__), '../../..')))
+
+from mycodo.devices.bus_arbiter import get_bus_arbiter
+
+STATUS_SUCCESS = 1
+STATUS_PROCESSING = 254
+STATUS_NO_DATA = 255
+
+
+class BusCollision(Exception):
+    """A transfer was started while another transfer was using the bus."""
+    pass
+
+
+class SimulatedDevice:
+    """A device that responds to commands after a conversion time."""
+    def __init__(self, address, conversion_time=0.9, respond=None):
+        self.address = address
+        self.conversion_time = conversion_time
+        self.respond = respond or (lambda command: '{:.2f}'.format(time.time() % 100))
+        self.command = None
+        self.ready_time = None
+
+    def write(self, command):
+        self.command = command
+        self.ready_time = time.time() + self.conversion_time
+
+    def read(self):
+        if self.command is None:
+            return STATUS_NO_DATA, ''
+        if time.time() < self.ready_time:
+            return STATUS_PROCESSING, ''
+        response = self.respond(self.command)
+        self.command = None
+        return STATUS_SUCCESS, response
+
+
+class SimulatedBus:
+    """A bus of simulated devices that detects overlapping transfers."""
+    def __init__(self, transfer_time=0.002):
+        self.transfer_time = transfer_time
+        self.devices = {}
+        self.lock = threading.Lock()
+        self.in_transfer = False
+        self.transfers = 0
+        self.collisions = 0
+
+    def add_device(self, device):
+        self.devices[device.address] = device
+        return device
+
+    def _transfer(self, function):
+        with self.lock:
+            if self.in_transfer:
+                self.collisions += 1
+                raise BusCollision("Bus in use by another transfer")
+            self.in_transfer = True
+        try:
+            time.sleep(self.transfer_time)
+            return function()
+        finally:
+            with self.lock:
+                self.in_transfer = False
+                self.transfers += 1
+
+    def write(self, address, command):
+        return self._transfer(lambda: self.devices[address].write(command))
+
+    def read(self, address):
+        return self._transfer(lambda: self.devices[address].read())
+
+
+def simulated_query(bus, arbiter, address, command='R'):
+    """Query a simulated device through the arbiter, waiting its conversion time."""
+    return arbiter.transaction(address, [
+        (lambda: bus.write(address, command), bus.devices[address].conversion_time),
+        (lambda: bus.read(address), 0)
+    ])
+
+
+def main(number_devices=8, conversion_time=0.9):
+    bus = SimulatedBus()
+    arbiter = get_bus_arbiter('SIMULATED', 0)
+    for address in range(number_devices):
+        bus.add_device(SimulatedDevice(0x60 + address, conversion_time=conversion_time))
+
+    # Holding the bus for the whole transaction (as with a lock per query)
+    timer = timeit.default_timer()
+    for address in bus.devices:
+        with arbiter.hold():
+            bus.write(address, 'R')
+            time.sleep(conversion_time)
+            bus.read(address)
+    print("Sequential: {} devices in {:.2f} seconds".format(
+        number_devices, timeit.default_timer() - timer))
+
+    # Releasing the bus during conversions
+    results = {}
+    threads = []
+    timer = timeit.default_timer()
+    for address in bus.devices:
+        def query(address=address):
+            results[address] = simulated_query(bus, arbiter, address)
+        threads.append(threading.Thread(target=query))
+        threads[-1].start()
+    for each_thread in threads:
+        each_thread.join()
+    print("Arbitrated: {} devices in {:.2f} seconds, {} collisions".format(
+        number_devices, timeit.default_timer() - timer, bus.collisions))
+
+    for address, result in sorted(results.items()):
+        print("  0x{:02X}: {}".format(address, result))
+    stats = arbiter.stats()
+    print("Utilization: {:.1%}, steps: {}, mean queue wait: {:.4f} s".format(
+        stats['utilization'], stats['steps'],
+        stats['queue_wait']['sum'] / stats['queue_wait']['count']))
+
+
+if __name__ == "__main__":
+    main()
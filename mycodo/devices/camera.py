@@ -9,8 +9,13 @@ from mycodo.config import SQL_DATABASE_MYCODO
 from mycodo.databases.models import Camera
 from mycodo.databases.models import OutputChannel
 from mycodo.databases.utils import session_scope
+from mycodo.devices.camera_service import SERVICE_LIBRARIES
+from mycodo.devices.camera_service import capture_still
+from mycodo.devices.camera_service import stop_capture_service
+from mycodo.devices.timelapse_video import timelapse_assembler
 from mycodo.mycodo_client import DaemonControl
 from mycodo.utils.database import db_retrieve_table_daemon
+from mycodo.utils.image_cache import image_cache
 from mycodo.utils.logging_utils import set_log_level
 from mycodo.utils.system_pi import assure_path_exists
 from mycodo.utils.system_pi import cmd_output
@@ -110,7 +115,15 @@ def camera_record(record_type, unique_id, duration_sec=None, tmp_filename=None):
     if settings.output_duration:
         time.sleep(settings.output_duration)
 
-    if settings.library == 'picamera':
+    if settings.library in SERVICE_LIBRARIES:
+        if record_type in ['photo', 'timelapse']:
+            # Stills are saved from the camera's capture service, which keeps the camera open
+            capture_still(settings, path_file)
+        else:
+            # Release the camera for recording video
+            stop_capture_service(settings.unique_id)
+
+    if settings.library == 'picamera' and record_type == 'video':
         try:
             import picamera
 
@@ -140,14 +153,9 @@ def camera_record(record_type, unique_id, duration_sec=None, tmp_filename=None):
                         camera.start_preview()
                         time.sleep(2)  # Camera warm-up time
 
-                        if record_type in ['photo', 'timelapse']:
-                            camera.capture(path_file, use_video_port=False)
-                        elif record_type == 'video':
-                            camera.start_recording(path_file, format='h264', quality=20)
-                            camera.wait_recording(duration_sec)
-                            camera.stop_recording()
-                        else:
-                            return
+                        camera.start_recording(path_file, format='h264', quality=20)
+                        camera.wait_recording(duration_sec)
+                        camera.stop_recording()
                         break
                 except picamera.exc.PiCameraMMALError:
                     logger.error("The camera is already open by picamera. Retrying 4 times.")
@@ -296,91 +304,33 @@ def camera_record(record_type, unique_id, duration_sec=None, tmp_filename=None):
         except:
             logger.exception("libcamera")
 
-    elif settings.library == 'opencv':
+    elif settings.library == 'opencv' and record_type == 'video':
+        # TODO: opencv video recording is currently not working. No idea why. Try to fix later.
         try:
             import cv2
-            import imutils
 
             cap = cv2.VideoCapture(settings.opencv_device)
-            cap.set(cv2.CAP_PROP_FRAME_WIDTH, settings.width)
-            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, settings.height)
-            cap.set(cv2.CAP_PROP_EXPOSURE, settings.exposure)
-            cap.set(cv2.CAP_PROP_GAIN, settings.gain)
-            cap.set(cv2.CAP_PROP_BRIGHTNESS, settings.brightness)
-            cap.set(cv2.CAP_PROP_CONTRAST, settings.contrast)
-            cap.set(cv2.CAP_PROP_HUE, settings.hue)
-            cap.set(cv2.CAP_PROP_SATURATION, settings.saturation)
-
-            # Check if image can be read
-            status, _ = cap.read()
-            if not status:
-                logger.error(
-                    "Cannot detect USB camera with device '{dev}'".format(
-                        dev=settings.opencv_device))
-                return
-
-            # Discard a few frames to allow camera to adjust to settings
-            for _ in range(2):
-                cap.read()
-
-            if record_type in ['photo', 'timelapse']:
-                edited = False
-                status, img_orig = cap.read()
-                cap.release()
-
-                if not status:
-                    logger.error("Could not acquire image")
-                    return
-
-                img_edited = img_orig.copy()
-
-                if any((settings.hflip, settings.vflip, settings.rotation)):
-                    edited = True
-
-                if settings.hflip and settings.vflip:
-                    img_edited = cv2.flip(img_orig, -1)
-                elif settings.hflip:
-                    img_edited = cv2.flip(img_orig, 1)
-                elif settings.vflip:
-                    img_edited = cv2.flip(img_orig, 0)
-
-                if settings.rotation:
-                    img_edited = imutils.rotate_bound(img_orig, settings.rotation)
-
-                if edited:
-                    cv2.imwrite(path_file, img_edited)
+            fourcc = cv2.CV_FOURCC('X', 'V', 'I', 'D')
+            resolution = (settings.width, settings.height)
+            out = cv2.VideoWriter(path_file, fourcc, 20.0, resolution)
+
+            time_end = time.time() + duration_sec
+            while cap.isOpened() and time.time() < time_end:
+                ret, frame = cap.read()
+                if ret:
+                    # write the frame
+                    out.write(frame)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
                 else:
-                    cv2.imwrite(path_file, img_orig)
-
-            elif record_type == 'video':
-                # TODO: opencv video recording is currently not working. No idea why. Try to fix later.
-                try:
-                    cap = cv2.VideoCapture(settings.opencv_device)
-                    fourcc = cv2.CV_FOURCC('X', 'V', 'I', 'D')
-                    resolution = (settings.width, settings.height)
-                    out = cv2.VideoWriter(path_file, fourcc, 20.0, resolution)
-
-                    time_end = time.time() + duration_sec
-                    while cap.isOpened() and time.time() < time_end:
-                        ret, frame = cap.read()
-                        if ret:
-                            # write the frame
-                            out.write(frame)
-                            if cv2.waitKey(1) & 0xFF == ord('q'):
-                                break
-                        else:
-                            break
-                    cap.release()
-                    out.release()
-                    cv2.destroyAllWindows()
-                except Exception as e:
-                    logger.exception(
-                        "Exception raised while recording video: "
-                        "{err}".format(err=e))
-            else:
-                return
-        except:
-            logger.exception("opencv")
+                    break
+            cap.release()
+            out.release()
+            cv2.destroyAllWindows()
+        except Exception as e:
+            logger.exception(
+                "Exception raised while recording video: "
+                "{err}".format(err=e))
 
     elif settings.library == 'http_address':
         try:
@@ -524,6 +474,15 @@ def camera_record(record_type, unique_id, duration_sec=None, tmp_filename=None):
                 mod_camera.timelapse_last_ts = timestamp_date.timestamp()
             new_session.commit()
 
+    # Generate the resized images shown on the camera page, in the background
+    if record_type == 'timelapse' and os.path.isfile(path_file):
+        image_cache.pregenerate(path_file, widths=(640, 1280))
+        # Append the image to the video of its time-lapse set, in the background
+        timelapse_assembler.append(
+            os.path.join(camera_path, 'timelapse_video'),
+            filename.rsplit('-img-', 1)[0],
+            path_file)
+
     try:
         set_user_grp(path_file, 'mycodo', 'mycodo')
         return save_path, filename
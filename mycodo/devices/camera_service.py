@@ -0,0 +1,391 @@
+# coding=utf-8
+"""
+Capture service: one pipeline per camera for live streams, stills, and time-lapses
+
+Rather than each still opening the camera (with a warm-up) and the live stream
+opening it separately (both contending for the device), the daemon runs a
+capture service for each camera that opens the device once and reads frames in
+its own thread. Stream clients are served the latest frame, and stills and
+time-lapse images are saved from the first frame read after they're requested.
+The device is closed when there have been no requests for IDLE_TIMEOUT seconds,
+so it's kept warm between time-lapse captures with short intervals.
+
+The service runs in the daemon. In other processes (the web interface),
+capture_still() and the live stream get their frames from the daemon.
+Only libraries that read frames continuously (SERVICE_LIBRARIES) use the
+service; the others capture each still with a command.
+"""
+import logging
+import os
+import threading
+import time
+
+from mycodo.utils.logging_utils import set_log_level
+
+logger = logging.getLogger("mycodo.camera_service")
+logger.setLevel(set_log_level(logging))
+
+SERVICE_LIBRARIES = ['opencv', 'picamera']
+IDLE_TIMEOUT = 60  # seconds without requests before the device is closed
+STREAM_ACTIVE = 10  # seconds since a stream client requested a frame for it to be active
+IDLE_FRAME_PERIOD = 1.0  # seconds between frames when not streaming
+
+services_lock = threading.Lock()
+services = {}
+service_host = False
+
+
+class OpenCVFrameSource:
+    """Frames from a USB camera, read with OpenCV."""
+    mimetype = 'image/jpeg'
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.cap = None
+
+    def open(self):
+        import cv2
+        self.cap = cv2.VideoCapture(self.settings.opencv_device)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.settings.width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.settings.height)
+        self.cap.set(cv2.CAP_PROP_EXPOSURE, self.settings.exposure)
+        self.cap.set(cv2.CAP_PROP_GAIN, self.settings.gain)
+        self.cap.set(cv2.CAP_PROP_BRIGHTNESS, self.settings.brightness)
+        self.cap.set(cv2.CAP_PROP_CONTRAST, self.settings.contrast)
+        self.cap.set(cv2.CAP_PROP_HUE, self.settings.hue)
+        self.cap.set(cv2.CAP_PROP_SATURATION, self.settings.saturation)
+        if not self.cap.isOpened() or not self.cap.read()[0]:
+            raise IOError("Cannot detect USB camera with device '{dev}'".format(
+                dev=self.settings.opencv_device))
+        # Discard a few frames to allow camera to adjust to settings
+        for _ in range(2):
+            self.cap.read()
+
+    def read(self):
+        status, img = self.cap.read()
+        if not status:
+            raise IOError("Could not acquire image")
+        return img
+
+    def encode(self, frame, width=None, height=None):
+        import cv2
+        if width and height and (frame.shape[1], frame.shape[0]) != (width, height):
+            frame = cv2.resize(frame, (width, height))
+        return cv2.imencode('.jpg', frame)[1].tobytes()
+
+    def save(self, frame, path_file):
+        import cv2
+        import imutils
+        if self.settings.hflip and self.settings.vflip:
+            frame = cv2.flip(frame, -1)
+        elif self.settings.hflip:
+            frame = cv2.flip(frame, 1)
+        elif self.settings.vflip:
+            frame = cv2.flip(frame, 0)
+        if self.settings.rotation:
+            frame = imutils.rotate_bound(frame, self.settings.rotation)
+        cv2.imwrite(path_file, frame)
+
+    def close(self):
+        if self.cap:
+            self.cap.release()
+            self.cap = None
+
+
+class PiCameraFrameSource:
+    """JPEG frames from the Raspberry Pi camera (video port), read with picamera."""
+    mimetype = 'image/jpeg'
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.camera = None
+        self.stream = None
+        self.frames = None
+
+    def open(self):
+        import io
+        import picamera
+
+        settings = self.settings
+        self.camera = picamera.PiCamera()
+        self.camera.resolution = (settings.width, settings.height)
+        self.camera.hflip = settings.hflip
+        self.camera.vflip = settings.vflip
+        self.camera.rotation = settings.rotation
+        self.camera.brightness = int(settings.brightness)
+        self.camera.contrast = int(settings.contrast)
+        self.camera.exposure_compensation = int(settings.exposure)
+        self.camera.saturation = int(settings.saturation)
+        self.camera.shutter_speed = settings.picamera_shutter_speed
+        self.camera.sharpness = settings.picamera_sharpness
+        self.camera.iso = settings.picamera_iso
+        self.camera.awb_mode = settings.picamera_awb
+        if settings.picamera_awb == 'off':
+            self.camera.awb_gains = (settings.picamera_awb_gain_red,
+                                     settings.picamera_awb_gain_blue)
+        self.camera.exposure_mode = settings.picamera_exposure_mode
+        self.camera.meter_mode = settings.picamera_meter_mode
+        self.camera.image_effect = settings.picamera_image_effect
+
+        self.camera.start_preview()
+        time.sleep(2)  # Camera warm-up time
+
+        self.stream = io.BytesIO()
+        self.frames = self.camera.capture_continuous(
+            self.stream, 'jpeg', use_video_port=True)
+
+    def read(self):
+        self.stream.seek(0)
+        self.stream.truncate()
+        next(self.frames)
+        return self.stream.getvalue()
+
+    def encode(self, frame, width=None, height=None):
+        return frame
+
+    def save(self, frame, path_file):
+        with open(path_file, 'wb') as image_file:
+            image_file.write(frame)
+
+    def close(self):
+        if self.frames:
+            self.frames.close()
+            self.frames = None
+        if self.camera:
+            self.camera.close()
+            self.camera = None
+
+
+def frame_source(settings):
+    """Return the frame source for the library of a camera."""
+    if settings.library == 'opencv':
+        return OpenCVFrameSource(settings)
+    elif settings.library == 'picamera':
+        return PiCameraFrameSource(settings)
+    raise ValueError("Camera library '{}' doesn't support a capture service".format(settings.library))
+
+
+class CaptureService:
+    """Reads frames from a camera while they're requested, and serves them to streams and stills."""
+    def __init__(self, settings, source=None, idle_timeout=IDLE_TIMEOUT):
+        self.unique_id = settings.unique_id
+        self.settings = settings
+        self.source = source or frame_source(settings)
+        self.idle_timeout = idle_timeout
+        self.stream_period = 1.0 / settings.stream_fps if settings.stream_fps else 0.1
+
+        self.condition = threading.Condition()
+        self.frame_requested = threading.Event()  # Wakes the reading thread to read a frame now
+        self.thread = None
+        self.running = False
+        self.stopped = False  # Stopped for good (e.g. replaced by a service with new settings)
+        self.error = None
+        self.frame = None
+        self.frame_number = 0
+        self.frame_time = None
+        self.stream_cache = (None, None)  # (frame number, encoded frame)
+        self.time_requested = 0
+        self.time_streamed = 0
+
+        self.opens = 0
+        self.frames = 0
+        self.stills = 0
+        self.stream_frames = 0
+
+    def start(self):
+        """
+        Start reading frames, if not already reading
+
+        :raises IOError: if the service was stopped
+        """
+        with self.condition:
+            if self.stopped:
+                raise IOError("Capture service of camera {} was stopped".format(self.unique_id))
+            self.time_requested = time.time()
+            if self.running:
+                return
+            self.running = True
+            self.error = None
+            self.thread = threading.Thread(
+                target=self.run, name='camera_{}'.format(self.unique_id), daemon=True)
+            self.thread.start()
+
+    def run(self):
+        try:
+            self.source.open()
+            self.opens += 1
+            logger.debug("Camera {} opened".format(self.unique_id))
+            while self.running and not self.stopped:
+                timer = time.time()
+                frame = self.source.read()
+                with self.condition:
+                    self.frame = frame
+                    self.frame_number += 1
+                    self.frame_time = time.time()
+                    self.frames += 1
+                    self.condition.notify_all()
+
+                    if timer - self.time_requested > self.idle_timeout:
+                        logger.debug("Camera {} closing due to inactivity".format(self.unique_id))
+                        break
+                    streaming = timer - self.time_streamed < STREAM_ACTIVE
+
+                period = self.stream_period if streaming else IDLE_FRAME_PERIOD
+                self.frame_requested.wait(max(0.0, period - (time.time() - timer)))
+                self.frame_requested.clear()
+        except Exception as err:
+            logger.error("Camera {} error: {}".format(self.unique_id, err))
+            self.error = str(err)
+        finally:
+            try:
+                self.source.close()
+            except Exception:
+                logger.exception("Closing camera {}".format(self.unique_id))
+            with self.condition:
+                self.running = False
+                self.frame = None
+                self.condition.notify_all()
+
+    def wait_frame(self, after_number=0, after_time=None, timeout=30):
+        """
+        Wait for a frame newer than after_number (and read after after_time)
+
+        :return: (frame number, frame)
+        :raises IOError: if the camera couldn't be read or timeout was exceeded
+        """
+        time_end = time.time() + timeout
+        with self.condition:
+            self.start()
+            if after_time:
+                self.frame_requested.set()  # Read a new frame now, rather than at the next period
+            while (self.frame is None or self.frame_number <= after_number or
+                   (after_time and self.frame_time < after_time)):
+                if not self.running:
+                    if self.stopped:
+                        raise IOError("Capture service of camera {} was stopped".format(self.unique_id))
+                    if self.error:
+                        raise IOError(self.error)
+                    self.start()  # Closed due to inactivity since this request started
+                remaining = time_end - time.time()
+                if remaining <= 0:
+                    raise IOError("No frame from camera {} within {} seconds".format(
+                        self.unique_id, timeout))
+                self.condition.wait(remaining)
+            return self.frame_number, self.frame
+
+    def capture_still(self, path_file, timeout=30):
+        """Save the first frame read after this request to path_file."""
+        _, frame = self.wait_frame(after_time=time.time(), timeout=timeout)
+        self.source.save(frame, path_file)
+        self.stills += 1
+
+    def stream_frame(self, after_number=0, timeout=10):
+        """
+        Return the next frame of the live stream, encoded at the stream resolution
+
+        :return: (frame number, encoded frame)
+        """
+        self.time_streamed = time.time()
+        number, frame = self.wait_frame(after_number=after_number, timeout=timeout)
+        cache_number, encoded = self.stream_cache
+        if cache_number != number:
+            encoded = self.source.encode(
+                frame, self.settings.resolution_stream_width, self.settings.resolution_stream_height)
+            self.stream_cache = (number, encoded)
+            self.stream_frames += 1
+        return number, encoded
+
+    def stop(self):
+        """Stop reading frames, and fail pending and future requests (rather than restarting)."""
+        with self.condition:
+            self.stopped = True
+            self.running = False
+            self.condition.notify_all()
+        self.frame_requested.set()
+        if self.thread:
+            self.thread.join(10)
+
+    def status(self):
+        return {
+            'library': self.settings.library,
+            'open': bool(self.running and self.thread and self.thread.is_alive()),
+            'streaming': time.time() - self.time_streamed < STREAM_ACTIVE,
+            'error': self.error,
+            'opens': self.opens,
+            'frames': self.frames,
+            'stills': self.stills,
+            'stream_frames': self.stream_frames,
+            'last_frame_age': time.time() - self.frame_time if self.frame_time else None
+        }
+
+
+def host_capture_services():
+    """Run capture services in this process (called by the daemon)."""
+    global service_host
+    service_host = True
+
+
+def get_capture_service(settings):
+    """Return the capture service of a camera, creating it if it doesn't exist."""
+    with services_lock:
+        if settings.unique_id not in services:
+            services[settings.unique_id] = CaptureService(settings)
+        return services[settings.unique_id]
+
+
+def stop_capture_service(unique_id):
+    """Stop a camera's capture service (e.g. to apply new settings or to record video)."""
+    with services_lock:
+        service = services.pop(unique_id, None)
+    if service:
+        service.stop()
+
+
+def stop_capture_services():
+    with services_lock:
+        unique_ids = list(services)
+    for each_id in unique_ids:
+        stop_capture_service(each_id)
+
+
+def settings_key(settings):
+    """Values of the camera's settings, excluding its state (e.g. of its time-lapse)."""
+    return tuple(
+        getattr(settings, column.name) for column in settings.__table__.columns
+        if not column.name.startswith(('timelapse_', 'still_last_', 'stream_started')))
+
+
+def refresh_capture_services(cameras):
+    """Stop the capture services of cameras that were deleted or had their settings changed."""
+    cameras = {each_camera.unique_id: each_camera for each_camera in cameras}
+    with services_lock:
+        services_current = list(services.items())
+    for unique_id, service in services_current:
+        if (unique_id not in cameras or
+                settings_key(cameras[unique_id]) != settings_key(service.settings)):
+            stop_capture_service(unique_id)
+
+
+def capture_service_stats():
+    with services_lock:
+        return {unique_id: service.status() for unique_id, service in services.items()}
+
+
+def capture_still(settings, path_file):
+    """
+    Save a still from a camera's capture service
+
+    :return: True if the still was saved
+    """
+    try:
+        if service_host:
+            get_capture_service(settings).capture_still(path_file)
+        else:
+            from mycodo.mycodo_client import DaemonControl
+            error = DaemonControl().camera_capture_still(settings.unique_id, path_file)
+            if error:
+                raise IOError(error)
+    except Exception as err:
+        logger.error("Could not capture still with camera {}: {}".format(settings.unique_id, err))
+        return False
+    return os.path.exists(path_file)
@@ -0,0 +1,136 @@
+# coding=utf-8
+"""
+Simulated camera, to exercise the capture service without hardware
+
+SimulatedFrameSource has the interface of the frame sources of the capture
+service. Opening it takes a warm-up time (as a real camera does) and each frame
+takes a frame time to read. Frames are generated PPM images: a gradient with a
+bar that moves with each frame, so consecutive frames differ. Opening the
+device while it's already open raises an error, as a real camera would.
+
+Run this module to compare opening the camera for every still with serving
+stills and a live stream from one capture service. The capture service is
+tested with it in mycodo/tests/software_tests/test_devices.
+"""
+import os
+import sys
+import threading
+import time
+import timeit
+from types import SimpleNamespace
+
+sys.path.append(os.path.abspath(os.path.join(os.path.realpath(__file__), '../../..')))
+
+from mycodo.devices.camera_service import CaptureService
+
+
+class DeviceBusy(Exception):
+    """The camera was opened while it was already open."""
+    pass
+
+
+class SimulatedFrameSource:
+    """A camera that generates frames."""
+    mimetype = 'image/x-portable-pixmap'
+
+    def __init__(self, width=160, height=120, warmup=2.0, frame_time=0.03):
+        self.width = width
+        self.height = height
+        self.warmup = warmup
+        self.frame_time = frame_time
+        self.lock = threading.Lock()
+        self.is_open = False
+        self.number = 0
+        self.opens = 0
+
+    def open(self):
+        with self.lock:
+            if self.is_open:
+                raise DeviceBusy("Camera is already open")
+            self.is_open = True
+            self.opens += 1
+        time.sleep(self.warmup)
+
+    def read(self):
+        if not self.is_open:
+            raise IOError("Camera is not open")
+        time.sleep(self.frame_time)
+        self.number += 1
+        return self.image(self.number)
+
+    def image(self, number, width=None, height=None):
+        width = width or self.width
+        height = height or self.height
+        bar = number % width
+        rows = []
+        for y in range(height):
+            shade = 255 * y // max(1, height - 1)
+            row = bytearray(bytes((shade, shade // 2, 255 - shade)) * width)
+            row[bar * 3:bar * 3 + 3] = b'\xff\xff\xff'
+            rows.append(bytes(row))
+        return b'P6 %d %d 255\n' % (width, height) + b''.join(rows)
+
+    def encode(self, frame, width=None, height=None):
+        return frame
+
+    def save(self, frame, path_file):
+        with open(path_file, 'wb') as image_file:
+            image_file.write(frame)
+
+    def close(self):
+        with self.lock:
+            self.is_open = False
+
+
+def simulated_settings(unique_id='simulated', stream_fps=10):
+    """Camera settings used by the capture service."""
+    return SimpleNamespace(
+        unique_id=unique_id,
+        library='simulated',
+        stream_fps=stream_fps,
+        resolution_stream_width=None,
+        resolution_stream_height=None)
+
+
+def main(stills=5, warmup=1.0):
+    path = '/tmp/mycodo_camera_simulated'
+    os.makedirs(path, exist_ok=True)
+
+    # Opening the camera for every still
+    source = SimulatedFrameSource(warmup=warmup)
+    timer = timeit.default_timer()
+    for number in range(stills):
+        source.open()
+        source.save(source.read(), os.path.join(path, 'still_{}.ppm'.format(number)))
+        source.close()
+    print("Opened for each still: {} stills in {:.2f} seconds".format(
+        stills, timeit.default_timer() - timer))
+
+    # One capture service, with a live stream client reading at the same time
+    source = SimulatedFrameSource(warmup=warmup)
+    service = CaptureService(simulated_settings(), source=source)
+    streamed = []
+
+    def stream_client():
+        number = 0
+        while len(streamed) < 20:
+            number, frame = service.stream_frame(after_number=number)
+            streamed.append(number)
+
+    client = threading.Thread(target=stream_client)
+    client.start()
+    timer = timeit.default_timer()
+    for number in range(stills):
+        service.capture_still(os.path.join(path, 'service_{}.ppm'.format(number)))
+    print("Capture service: {} stills in {:.2f} seconds (including one warm-up)".format(
+        stills, timeit.default_timer() - timer))
+    client.join()
+    service.stop()
+
+    print("Stream client received {} frames ({} unique), camera opened {} time(s)".format(
+        len(streamed), len(set(streamed)), source.opens))
+    print("Status: {}".format(service.status()))
+
+
+if __name__ == "__main__":
+    main()
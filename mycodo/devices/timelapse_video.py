@@ -0,0 +1,319 @@
+# coding=utf-8
+"""
+Time-lapse videos, assembled from time-lapse images as they're captured
+
+Each time-lapse image is appended, as it's captured, to a Motion JPEG AVI
+video of its time-lapse set, so the images don't need to be encoded into a
+video afterwards. JPEG images are stored as they are (no decoding or
+encoding), and only the frame being appended and the frame index are held in
+memory. A video is split into segments of at most SEGMENT_FRAMES frames or
+SEGMENT_BYTES bytes (AVI 1.0 files are limited in size, and the index is
+rewritten with each frame), and the segments of a set are played one after
+another.
+
+Appending a frame rewrites the index and headers after the frame is written,
+and the frames of a segment are recounted from the file before each append,
+so a segment that was interrupted while a frame was being appended is
+repaired with the next append. Images are appended by a background thread
+with a low CPU priority.
+"""
+import logging
+import os
+import queue
+import re
+import struct
+import threading
+import time
+
+from mycodo.utils.logging_utils import set_log_level
+
+logger = logging.getLogger("mycodo.timelapse_video")
+logger.setLevel(set_log_level(logging))
+
+DEFAULT_FPS = 24
+SEGMENT_FRAMES = 10000
+SEGMENT_BYTES = 1024 * 1024 * 1024
+QUEUE_SIZE = 1000
+EXTENSION = '.avi'
+SEGMENT_FILE = re.compile(r'^(.+)-(\d+){}$'.format(re.escape(EXTENSION)))  # <set name>-<number>.avi
+
+# Offsets of the fixed header written by create_segment()
+OFFSET_AVIH = 32  # avih data
+OFFSET_STRH = 108  # strh data
+OFFSET_MOVI_LIST = 212  # 'LIST' of the movi list
+OFFSET_MOVI = 220  # 'movi', which idx1 offsets are relative to
+OFFSET_FRAMES = 224  # first frame chunk
+
+AVIF_HASINDEX = 0x10
+AVIIF_KEYFRAME = 0x10
+
+
+def jpeg_size(frame):
+    """Return the (width, height) of a JPEG image, or None if it's not a JPEG image."""
+    if frame[:2] != b'\xff\xd8':
+        return
+    index = 2
+    while index + 9 < len(frame):
+        if frame[index] != 0xff:
+            return
+        marker = frame[index + 1]
+        if marker in (0xd8, 0x01) or 0xd0 <= marker <= 0xd7:
+            index += 2
+            continue
+        length = struct.unpack('>H', frame[index + 2:index + 4])[0]
+        if marker in (0xc0, 0xc1, 0xc2, 0xc3, 0xc5, 0xc6, 0xc7, 0xc9, 0xca, 0xcb, 0xcd, 0xce, 0xcf):
+            height, width = struct.unpack('>HH', frame[index + 5:index + 9])
+            return width, height
+        index += 2 + length
+
+
+def create_segment(path_file, width, height, fps=DEFAULT_FPS):
+    """Create an empty Motion JPEG AVI segment."""
+    avih = struct.pack(
+        '<14I', int(1000000 / fps), 0, 0, AVIF_HASINDEX, 0, 0, 1, 0, width, height, 0, 0, 0, 0)
+    strh = struct.pack(
+        '<4s4sIHHIIIIIIIIhhhh', b'vids', b'MJPG', 0, 0, 0, 0, 1, int(fps), 0, 0, 0,
+        0xffffffff, 0, 0, 0, width, height)
+    strf = struct.pack(
+        '<IiiHH4sIiiII', 40, width, height, 1, 24, b'MJPG', width * height * 3, 0, 0, 0, 0)
+    strl = b'strl' + b'strh' + struct.pack('<I', len(strh)) + strh + b'strf' + struct.pack('<I', len(strf)) + strf
+    hdrl = (b'hdrl' + b'avih' + struct.pack('<I', len(avih)) + avih +
+            b'LIST' + struct.pack('<I', len(strl)) + strl)
+    header = (b'RIFF' + struct.pack('<I', 0) + b'AVI ' +
+              b'LIST' + struct.pack('<I', len(hdrl)) + hdrl +
+              b'LIST' + struct.pack('<I', 4) + b'movi')
+    assert len(header) == OFFSET_FRAMES
+    with open(path_file, 'wb') as video_file:
+        video_file.write(header)
+        video_file.write(b'idx1' + struct.pack('<I', 0))
+    with open(path_file, 'r+b') as video_file:
+        video_file.seek(4)
+        video_file.write(struct.pack('<I', os.path.getsize(path_file) - 8))
+
+
+def is_segment(video_file):
+    video_file.seek(0)
+    header = video_file.read(OFFSET_FRAMES)
+    return (len(header) == OFFSET_FRAMES and header[:4] == b'RIFF' and header[8:12] == b'AVI ' and
+            header[OFFSET_MOVI:OFFSET_FRAMES] == b'movi')
+
+
+def scan_frames(video_file):
+    """
+    Return the (offset, size) of each complete frame chunk of a segment
+
+    Frames are counted from the chunks in the file (not from its headers), so
+    a frame that wasn't completely written is excluded.
+    """
+    video_file.seek(0, os.SEEK_END)
+    file_size = video_file.tell()
+    frames = []
+    position = OFFSET_FRAMES
+    while position + 8 <= file_size:
+        video_file.seek(position)
+        chunk_id, size = struct.unpack('<4sI', video_file.read(8))
+        if chunk_id != b'00dc' or position + 8 + size > file_size:
+            break
+        frames.append((position, size))
+        position += 8 + size + (size & 1)
+    return frames
+
+
+def segment_frames(path_file):
+    """Return the number of frames of a segment (from its header)."""
+    with open(path_file, 'rb') as video_file:
+        video_file.seek(OFFSET_AVIH + 16)
+        return struct.unpack('<I', video_file.read(4))[0]
+
+
+def append_frame(path_file, frame, fps=DEFAULT_FPS):
+    """
+    Append a JPEG frame to a segment, creating it if it doesn't exist
+
+    :return: number of frames of the segment
+    """
+    if not os.path.exists(path_file):
+        size = jpeg_size(frame)
+        if not size:
+            raise ValueError("Not a JPEG image")
+        create_segment(path_file, size[0], size[1], fps=fps)
+
+    with open(path_file, 'r+b') as video_file:
+        if not is_segment(video_file):
+            raise ValueError("{} is not a time-lapse video segment".format(path_file))
+        frames = scan_frames(video_file)
+        position = frames[-1][0] + 8 + frames[-1][1] + (frames[-1][1] & 1) if frames else OFFSET_FRAMES
+
+        video_file.seek(position)
+        video_file.write(b'00dc' + struct.pack('<I', len(frame)) + frame)
+        if len(frame) & 1:
+            video_file.write(b'\x00')
+        frames.append((position, len(frame)))
+        end_movi = video_file.tell()
+
+        video_file.write(b'idx1' + struct.pack('<I', 16 * len(frames)))
+        video_file.write(b''.join(
+            struct.pack('<4sIII', b'00dc', AVIIF_KEYFRAME, offset - OFFSET_MOVI, size)
+            for offset, size in frames))
+        video_file.truncate()
+        file_size = video_file.tell()
+
+        max_size = max(size for _, size in frames)
+        video_file.seek(4)
+        video_file.write(struct.pack('<I', file_size - 8))
+        video_file.seek(OFFSET_AVIH + 16)
+        video_file.write(struct.pack('<I', len(frames)))
+        video_file.seek(OFFSET_AVIH + 28)
+        video_file.write(struct.pack('<I', max_size))
+        video_file.seek(OFFSET_STRH + 32)
+        video_file.write(struct.pack('<II', len(frames), max_size))
+        video_file.seek(OFFSET_MOVI_LIST + 4)
+        video_file.write(struct.pack('<I', end_movi - OFFSET_MOVI))
+    return len(frames)
+
+
+def read_frames(path_file):
+    """Yield the JPEG frames of a segment, one at a time."""
+    with open(path_file, 'rb') as video_file:
+        if not is_segment(video_file):
+            return
+        for offset, size in scan_frames(video_file):
+            video_file.seek(offset + 8)
+            yield video_file.read(size)
+
+
+def segment_fps(path_file):
+    """Return the frame rate of a segment."""
+    with open(path_file, 'rb') as video_file:
+        video_file.seek(OFFSET_AVIH)
+        microseconds = struct.unpack('<I', video_file.read(4))[0]
+    return 1000000.0 / microseconds if microseconds else DEFAULT_FPS
+
+
+def parse_segment(filename):
+    """Return the (set name, number) of a segment's file name, or None if it's not a segment."""
+    match = SEGMENT_FILE.match(filename)
+    if match:
+        return match.group(1), int(match.group(2))
+
+
+def segments(video_path, set_name):
+    """Return the paths of the segments of a time-lapse set, in order of their numbers."""
+    if not os.path.isdir(video_path):
+        return []
+    numbered = []
+    for each_file in os.listdir(video_path):
+        segment = parse_segment(each_file)
+        if segment and segment[0] == set_name:
+            numbered.append((segment[1], os.path.join(video_path, each_file)))
+    return [path_file for _, path_file in sorted(numbered)]
+
+
+def video_sets(video_path):
+    """Return the names of the time-lapse sets that have videos."""
+    if not os.path.isdir(video_path):
+        return []
+    names = set()
+    for each_file in os.listdir(video_path):
+        segment = parse_segment(each_file)
+        if segment:
+            names.add(segment[0])
+    return sorted(names)
+
+
+def stream_set(video_path, set_name, fps=None):
+    """Yield the frames of all segments of a time-lapse set, at its frame rate."""
+    for each_segment in segments(video_path, set_name):
+        period = 1.0 / (fps or segment_fps(each_segment))
+        for frame in read_frames(each_segment):
+            timer = time.time()
+            yield frame
+            time.sleep(max(0.0, period - (time.time() - timer)))
+
+
+class TimelapseAssembler:
+    """Appends time-lapse images to the videos of their sets, in a background thread."""
+    def __init__(self, fps=DEFAULT_FPS, queue_size=QUEUE_SIZE):
+        self.fps = fps
+        self.queue = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.thread = None
+
+        self.frames = 0
+        self.segments = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def append(self, video_path, set_name, path_image):
+        """Queue an image to be appended to the video of its time-lapse set."""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name='timelapse_video', daemon=True)
+                self.thread.start()
+        try:
+            self.queue.put_nowait((video_path, set_name, path_image))
+        except queue.Full:
+            self.dropped += 1
+            logger.error("Time-lapse video queue is full, not appending {}".format(path_image))
+
+    def run(self):
+        try:
+            os.nice(19)  # On Linux, this only lowers the priority of this thread
+        except (AttributeError, OSError):
+            pass
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            timer = time.time()
+            try:
+                self.assemble(*item)
+            except Exception as err:
+                self.errors += 1
+                logger.error("Could not append {} to time-lapse video: {}".format(item[2], err))
+            else:
+                logger.debug("Appended {} to time-lapse video in {:.3f} s".format(
+                    item[2], time.time() - timer))
+
+    def assemble(self, video_path, set_name, path_image):
+        with open(path_image, 'rb') as image_file:
+            frame = image_file.read()
+        os.makedirs(video_path, exist_ok=True)
+
+        existing = segments(video_path, set_name)
+        if existing:
+            path_segment = existing[-1]
+            number = parse_segment(os.path.basename(path_segment))[1]
+            if (segment_frames(path_segment) >= SEGMENT_FRAMES or
+                    os.path.getsize(path_segment) + len(frame) > SEGMENT_BYTES):
+                path_segment = None
+                number += 1
+        else:
+            path_segment = None
+            number = 1
+        if path_segment is None:
+            path_segment = os.path.join(video_path, '{}-{:03d}{}'.format(set_name, number, EXTENSION))
+            self.segments += 1
+
+        append_frame(path_segment, frame, fps=self.fps)
+        self.frames += 1
+
+    def stop(self):
+        """Append the queued images, then stop."""
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                self.queue.put(None)
+                self.thread.join(30)
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'frames': self.frames,
+            'segments': self.segments,
+            'dropped': self.dropped,
+            'errors': self.errors
+        }
+
+
+timelapse_assembler = TimelapseAssembler()
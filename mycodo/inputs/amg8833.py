@@ -24,7 +24,7 @@ INPUT_INFORMATION = {
     'input_name_unique': 'AMG8833',
     'input_manufacturer': 'Panasonic',
     'input_name': 'AMG8833',
-    'input_library': 'Adafruit_AMG88xx/Pillow/colour',
+    'input_library': 'Adafruit_AMG88xx/Pillow/numpy',
     'measurements_name': '8x8 Temperature Grid',
     'measurements_dict': measurements_dict,
     'measurements_rescale': True,
@@ -42,7 +42,8 @@ INPUT_INFORMATION = {
     'dependencies_module': [
         ('apt', 'libjpeg-dev', 'libjpeg-dev'),
         ('apt', 'zlib1g-dev', 'zlib1g-dev'),
-        ('pip-pypi', 'colour', 'colour==0.1.5'),
+        ('apt', 'libatlas-base-dev', 'libatlas-base-dev'),
+        ('pip-pypi', 'numpy', 'numpy==1.22.3'),
         ('pip-pypi', 'PIL', 'Pillow==8.1.2'),
         ('pip-pypi', 'Adafruit_AMG88xx', 'git+https://github.com/adafruit/Adafruit_AMG88xx_python.git')
     ],
@@ -13,6 +13,7 @@ import logging
 
 from mycodo.abstract_base_controller import AbstractBaseController
 from mycodo.databases.models import Input
+from mycodo.utils.async_loop import run_coroutine
 
 
 class AbstractInput(AbstractBaseController):
@@ -263,3 +264,31 @@ class AbstractInput(AbstractBaseController):
 
     def delete_custom_option(self, option):
         return self._delete_custom_option(Input, self.unique_id, option)
+
+
+class AbstractInputAsync(AbstractInput):
+    """
+    Base class of Inputs that communicate with their devices using asyncio
+
+    The coroutines of all async Inputs run on the daemon-wide event loop (see
+    mycodo/utils/async_loop.py). Overwrite get_measurement_async() rather than
+    get_measurement(), and use run_async() to run any other coroutine from the
+    Input's (synchronous) methods.
+    """
+    def __init__(self, input_dev, testing=False, name=__name__):
+        super().__init__(input_dev, testing=testing, name=name)
+        self.async_timeout = 60
+
+    def run_async(self, coroutine, timeout=None):
+        """Run a coroutine on the daemon-wide event loop and return its result."""
+        return run_coroutine(coroutine, timeout=timeout or self.async_timeout)
+
+    def get_measurement(self):
+        return self.run_async(self.get_measurement_async())
+
+    async def get_measurement_async(self):
+        self.logger.error(
+            "{cls} did not overwrite the get_measurement_async() method. All "
+            "subclasses of the AbstractInputAsync class are required to overwrite "
+            "this method".format(cls=type(self).__name__))
+        raise NotImplementedError
@@ -4,13 +4,12 @@ import datetime
 from flask_babel import lazy_gettext
 
 from mycodo.config_translations import TRANSLATIONS
-from mycodo.databases.models import Conversion
 from mycodo.databases.models import InputChannel
 from mycodo.inputs.base_input import AbstractInput
 from mycodo.utils.constraints_pass import constraints_pass_positive_value
 from mycodo.utils.database import db_retrieve_table_daemon
-from mycodo.utils.influx import add_measurements_influxdb
 from mycodo.utils.inputs import parse_measurement
+from mycodo.utils.measurement_batch import MeasurementBatcher
 from mycodo.utils.utils import random_alphanumeric
 
 # Measurements
@@ -147,6 +146,8 @@ class InputModule(AbstractInput):
         super().__init__(input_dev, testing=testing, name=__name__)
 
         self.client = None
+        self.batcher = None
+        self.topic_channels = {}
 
         self.mqtt_hostname = None
         self.mqtt_port = None
@@ -171,6 +172,12 @@ class InputModule(AbstractInput):
         self.options_channels = self.setup_custom_channel_options_json(
             INPUT_INFORMATION['custom_channel_options'], input_channels)
 
+        # Look up the channel of each received topic
+        self.topic_channels = {
+            self.options_channels['subscribe_topic'][channel]: channel
+            for channel in self.channels_measurement
+        }
+
         self.client = mqtt.Client(self.mqtt_clientid)
         self.logger.debug("Client created with ID {}".format(self.mqtt_clientid))
         if self.mqtt_login:
@@ -182,6 +189,9 @@ class InputModule(AbstractInput):
             self.client.tls_set()
 
     def listener(self):
+        # Measurements are stored in batches, rather than a write per message
+        self.batcher = MeasurementBatcher(self.unique_id, logger=self.logger)
+        self.batcher.start()
         self.callbacks_connect()
         self.connect()
         self.subscribe()
@@ -246,13 +256,7 @@ class InputModule(AbstractInput):
 
         datetime_utc = datetime.datetime.utcnow()
         measurement = {}
-        channel = None
-        for each_channel in self.channels_measurement:
-            if self.options_channels['subscribe_topic'][each_channel] == msg.topic:
-                self.logger.debug("Found channel {} with topic '{}'".format(
-                    each_channel,
-                    self.options_channels['subscribe_topic'][each_channel]))
-                channel = each_channel
+        channel = self.topic_channels.get(msg.topic)
 
         if channel is None:
             self.logger.error(
@@ -276,29 +280,27 @@ class InputModule(AbstractInput):
     def add_measurement_influxdb(self, channel, measurement):
         # Convert value/unit is conversion_id present and valid
         if self.channels_conversion[channel]:
-            conversion = db_retrieve_table_daemon(
-                Conversion,
-                unique_id=self.channels_measurement[channel].conversion_id)
-            if conversion:
-                meas = parse_measurement(
-                    self.channels_conversion[channel],
-                    self.channels_measurement[channel],
-                    measurement,
-                    channel,
-                    measurement[channel],
-                    timestamp=measurement[channel]['timestamp_utc'])
-
-                measurement[channel]['measurement'] = meas[channel]['measurement']
-                measurement[channel]['unit'] = meas[channel]['unit']
-                measurement[channel]['value'] = meas[channel]['value']
+            meas = parse_measurement(
+                self.channels_conversion[channel],
+                self.channels_measurement[channel],
+                measurement,
+                channel,
+                measurement[channel],
+                timestamp=measurement[channel]['timestamp_utc'])
+
+            measurement[channel]['measurement'] = meas[channel]['measurement']
+            measurement[channel]['unit'] = meas[channel]['unit']
+            measurement[channel]['value'] = meas[channel]['value']
 
         if measurement:
             self.logger.debug(
-                "Adding measurement to influxdb: {}".format(measurement))
-            add_measurements_influxdb(
-                self.unique_id,
-                measurement,
-                use_same_timestamp=INPUT_INFORMATION['measurements_use_same_timestamp'])
+                "Adding measurement to batch: {}".format(measurement))
+            self.batcher.add(
+                channel,
+                measurement[channel]['measurement'],
+                measurement[channel]['unit'],
+                measurement[channel]['value'],
+                measurement[channel]['timestamp_utc'])
 
     def on_disconnect(self, client, userdata, rc=0):
         self.logger.debug("Disconnected. Return code: {}".format(rc))
@@ -308,3 +310,5 @@ class InputModule(AbstractInput):
         self.running = False
         self.client.loop_stop()
         self.client.disconnect()
+        if self.batcher:
+            self.batcher.stop()
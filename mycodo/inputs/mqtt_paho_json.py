@@ -5,13 +5,12 @@ import json
 from flask_babel import lazy_gettext
 
 from mycodo.config_translations import TRANSLATIONS
-from mycodo.databases.models import Conversion
 from mycodo.databases.models import InputChannel
 from mycodo.inputs.base_input import AbstractInput
 from mycodo.utils.constraints_pass import constraints_pass_positive_value
 from mycodo.utils.database import db_retrieve_table_daemon
-from mycodo.utils.influx import add_measurements_influxdb
 from mycodo.utils.inputs import parse_measurement
+from mycodo.utils.measurement_batch import MeasurementBatcher
 from mycodo.utils.utils import random_alphanumeric
 
 # Measurements
@@ -163,7 +162,9 @@ class InputModule(AbstractInput):
         super().__init__(input_dev, testing=testing, name=__name__)
 
         self.client = None
+        self.batcher = None
         self.jmespath = None
+        self.json_expressions = {}
         self.options_channels = None
 
         self.mqtt_hostname = None
@@ -192,6 +193,15 @@ class InputModule(AbstractInput):
         self.options_channels = self.setup_custom_channel_options_json(
             INPUT_INFORMATION['custom_channel_options'], input_channels)
 
+        # Compile the JMESPath expression of each channel once, rather than for every message
+        for channel in self.channels_measurement:
+            json_name = self.options_channels['json_name'][channel]
+            try:
+                self.json_expressions[channel] = self.jmespath.compile(json_name)
+            except Exception as err:
+                self.logger.error("Error compiling JMESPath expression '{}' of channel {}: {}".format(
+                    json_name, channel, err))
+
         self.client = mqtt.Client(self.mqtt_clientid)
         self.logger.debug("Client created with ID {}".format(self.mqtt_clientid))
         if self.mqtt_login:
@@ -203,6 +213,9 @@ class InputModule(AbstractInput):
             self.client.tls_set()
 
     def listener(self):
+        # Measurements are stored in batches, rather than a write per message
+        self.batcher = MeasurementBatcher(self.unique_id, logger=self.logger)
+        self.batcher.start()
         self.callbacks_connect()
         self.connect()
         self.subscribe()
@@ -274,17 +287,16 @@ class InputModule(AbstractInput):
             return
 
         datetime_utc = datetime.datetime.utcnow()
-        measurement = {}
-        for each_channel in self.channels_measurement:
+        for each_channel, jmesexpression in self.json_expressions.items():
             json_name = self.options_channels['json_name'][each_channel]
-            self.logger.debug("Searching JSON for {}".format(json_name))
 
             try:
-                jmesexpression = self.jmespath.compile(json_name)
                 value = jmesexpression.search(json_values)
                 self.logger.debug(
                     "Found key: {}, value: {}".format(json_name, value))
-                measurement[each_channel] = {}
+                if value is None:
+                    continue
+                measurement = {each_channel: {}}
                 measurement[each_channel]['measurement'] = self.channels_measurement[each_channel].measurement
                 measurement[each_channel]['unit'] = self.channels_measurement[each_channel].unit
                 measurement[each_channel]['value'] = value
@@ -298,29 +310,27 @@ class InputModule(AbstractInput):
     def add_measurement_influxdb(self, channel, measurement):
         # Convert value/unit is conversion_id present and valid
         if self.channels_conversion[channel]:
-            conversion = db_retrieve_table_daemon(
-                Conversion,
-                unique_id=self.channels_measurement[channel].conversion_id)
-            if conversion:
-                meas = parse_measurement(
-                    self.channels_conversion[channel],
-                    self.channels_measurement[channel],
-                    measurement,
-                    channel,
-                    measurement[channel],
-                    timestamp=measurement[channel]['timestamp_utc'])
-
-                measurement[channel]['measurement'] = meas[channel]['measurement']
-                measurement[channel]['unit'] = meas[channel]['unit']
-                measurement[channel]['value'] = meas[channel]['value']
+            meas = parse_measurement(
+                self.channels_conversion[channel],
+                self.channels_measurement[channel],
+                measurement,
+                channel,
+                measurement[channel],
+                timestamp=measurement[channel]['timestamp_utc'])
+
+            measurement[channel]['measurement'] = meas[channel]['measurement']
+            measurement[channel]['unit'] = meas[channel]['unit']
+            measurement[channel]['value'] = meas[channel]['value']
 
         if measurement:
             self.logger.debug(
-                "Adding measurement to influxdb: {}".format(measurement))
-            add_measurements_influxdb(
-                self.unique_id,
-                measurement,
-                use_same_timestamp=INPUT_INFORMATION['measurements_use_same_timestamp'])
+                "Adding measurement to batch: {}".format(measurement))
+            self.batcher.add(
+                channel,
+                measurement[channel]['measurement'],
+                measurement[channel]['unit'],
+                measurement[channel]['value'],
+                measurement[channel]['timestamp_utc'])
 
     def on_disconnect(self, client, userdata, rc=0):
         self.logger.debug("Disconnected. Return code: {}".format(rc))
@@ -330,3 +340,5 @@ class InputModule(AbstractInput):
         self.running = False
         self.client.loop_stop()
         self.client.disconnect()
+        if self.batcher:
+            self.batcher.stop()
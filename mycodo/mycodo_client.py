@@ -30,6 +30,7 @@ import traceback
 
 import Pyro5.errors
 import requests
+import serpent
 from Pyro5.api import Proxy
 from influxdb import InfluxDBClient
 
@@ -119,6 +120,21 @@ class DaemonControl:
     def daemon_status(self):
         return self.proxy().daemon_status()
 
+    def get_controller_metrics(self):
+        return self.proxy().get_controller_metrics()
+
+    def get_bus_stats(self):
+        return self.proxy().get_bus_stats()
+
+    def get_lock_stats(self):
+        return self.proxy().get_lock_stats()
+
+    def get_mqtt_stats(self):
+        return self.proxy().get_mqtt_stats()
+
+    def get_notification_stats(self):
+        return self.proxy().get_notification_stats()
+
     def is_in_virtualenv(self):
         return self.proxy().is_in_virtualenv()
 
@@ -138,9 +154,26 @@ class DaemonControl:
     def refresh_daemon_camera_settings(self):
         return self.proxy().refresh_daemon_camera_settings()
 
+    def camera_capture_still(self, unique_id, path_file):
+        return self.proxy().camera_capture_still(unique_id, path_file)
+
+    def camera_stream(self, unique_id):
+        """Generator of the frames of a camera's live stream, using one connection to the daemon."""
+        proxy = self.proxy()
+        number = 0
+        while True:
+            number, frame = proxy.camera_stream_frame(unique_id, number)
+            yield serpent.tobytes(frame)  # bytes are transferred base64-encoded
+
+    def get_camera_stats(self):
+        return self.proxy().get_camera_stats()
+
     def refresh_daemon_conditional_settings(self, unique_id):
         return self.proxy().refresh_daemon_conditional_settings(unique_id)
 
+    def refresh_daemon_method_settings(self, method_id=None):
+        return self.proxy().refresh_daemon_method_settings(method_id)
+
     def refresh_daemon_misc_settings(self):
         return self.proxy().refresh_daemon_misc_settings()
 
@@ -270,6 +303,12 @@ class DaemonControl:
     def function_status(self, function_id):
         return self.proxy().function_status(function_id)
 
+    def profile_controller(self, unique_id, seconds):
+        proxy = self.proxy()
+        # Allow the daemon enough time to sample before returning
+        proxy._pyroTimeout = self.pyro_timeout + float(seconds)
+        return proxy.profile_controller(unique_id, seconds)
+
     #
     # Miscellaneous
     #
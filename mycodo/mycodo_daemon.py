@@ -35,6 +35,7 @@ import resource
 import threading
 import time
 import timeit
+from concurrent.futures import ThreadPoolExecutor
 
 from Pyro5.api import Proxy
 from Pyro5.api import expose
@@ -68,14 +69,29 @@ from mycodo.databases.models import Misc
 from mycodo.databases.models import PID
 from mycodo.databases.models import Trigger
 from mycodo.databases.utils import session_scope
+from mycodo.devices.bus_arbiter import bus_stats
 from mycodo.devices.camera import camera_record
+from mycodo.devices.camera_service import capture_service_stats
+from mycodo.devices.camera_service import get_capture_service
+from mycodo.devices.camera_service import host_capture_services
+from mycodo.devices.camera_service import refresh_capture_services
+from mycodo.devices.camera_service import stop_capture_services
+from mycodo.devices.timelapse_video import timelapse_assembler
 from mycodo.utils.database import db_retrieve_table_daemon
 from mycodo.utils.actions import get_condition_value
 from mycodo.utils.actions import get_condition_value_dict
 from mycodo.utils.actions import parse_action_information
 from mycodo.utils.actions import trigger_action
 from mycodo.utils.actions import trigger_controller_actions
+from mycodo.utils.async_loop import stop_event_loop
 from mycodo.utils.github_release_info import MycodoRelease
+from mycodo.utils.method import invalidate_method_handler
+from mycodo.utils.locks import lock_manager
+from mycodo.utils.metrics import controller_metrics
+from mycodo.utils.mqtt_connections import close_connections
+from mycodo.utils.mqtt_connections import mqtt_stats
+from mycodo.utils.notifications import notification_dispatcher
+from mycodo.utils.profiler import profile_threads
 from mycodo.utils.stats import add_update_csv
 from mycodo.utils.stats import recreate_stat_file
 from mycodo.utils.stats import return_stat_file_dict
@@ -85,6 +101,9 @@ from mycodo.utils.tools import next_schedule
 
 MYCODO_DB_PATH = 'sqlite:///' + SQL_DATABASE_MYCODO
 
+# Maximum number of controllers to activate or deactivate at the same time
+MAX_CONCURRENT_CONTROLLER_STARTS = 10
+
 
 class DaemonController:
     """Mycodo daemon."""
@@ -119,7 +138,6 @@ class DaemonController:
         }
 
         # Controllers that may launch multiple threads
-        # Order matters for starting and shutting down
         self.cont_types = [
             'Conditional',
             'Trigger',
@@ -130,6 +148,15 @@ class DaemonController:
             'Function'
         ]
 
+        # Controllers are started in stages, after the Output controller has started.
+        # Controllers within a stage are started concurrently, and controllers may depend
+        # on those of previous stages. Controllers are shut down in the reverse order.
+        self.cont_stages = [
+            ['Input'],
+            ['Conditional', 'Trigger', 'Math', 'PID', 'LCD', 'Function']
+        ]
+        self.activation_times = []  # (controller type, unique ID, seconds) of startup
+
         # Dashboard widgets
         self.dashboard_widget = {}
 
@@ -142,6 +169,8 @@ class DaemonController:
 
         # Update camera settings
         self.camera = []
+        self.timelapse_threads = {}
+        host_capture_services()
         self.refresh_daemon_camera_settings()
 
         # Update Misc settings
@@ -161,7 +190,8 @@ class DaemonController:
         self.load_actions()
         self.start_all_controllers(self.debug)
         self.daemon_startup_time = timeit.default_timer() - self.startup_timer
-        self.logger.info("Mycodo daemon started in {sec:.3f} seconds".format(sec=self.daemon_startup_time))
+        self.logger.info("Mycodo daemon started in {sec:.3f} seconds. {times}".format(
+            sec=self.daemon_startup_time, times=self.activation_times_str()))
         self.startup_stats()
 
         # loop until daemon is instructed to shut down
@@ -240,7 +270,7 @@ class DaemonController:
             if db_tables[each_type]:
                 return each_type
 
-    def controller_activate(self, cont_id):
+    def controller_activate(self, cont_id, cont_type=None):
         """
         Activate currently-inactive controller
 
@@ -249,8 +279,11 @@ class DaemonController:
 
         :param cont_id: Unique ID for controller
         :type cont_id: str
+        :param cont_type: Type of controller (determined from the database if None)
+        :type cont_type: str or None
         """
-        cont_type = self.determine_controller_type(cont_id)
+        if cont_type is None:
+            cont_type = self.determine_controller_type(cont_id)
         try:
             if cont_id in self.controller[cont_type]:
                 if self.controller[cont_type][cont_id].is_running():
@@ -297,7 +330,7 @@ class DaemonController:
                         type=cont_type, id=cont_id)
                     self.logger.error(message)
                     return 1, message
-                else:  # set as active in SQL database
+                elif not mod_cont.is_activated:  # set as active in SQL database
                     mod_cont.is_activated = True
                     new_session.commit()
 
@@ -519,23 +552,59 @@ class DaemonController:
             return 1, message
 
     def function_status(self, function_id):
-        if function_id in self.controller["Function"]:
-            try:
-                return self.controller["Function"][function_id].function_status()
-            except Exception as err:
-                return {'error': ["Error getting Function status: {}".format(err)]}
-        elif function_id in self.controller["Conditional"]:
-            try:
-                return self.controller["Conditional"][function_id].function_status()
-            except Exception as err:
-                return {'error': ["Error getting Function status: {}".format(err)]}
-        elif function_id in self.controller["PID"]:
+        for cont_type in ["Function", "Conditional", "PID", "Input", "Trigger"]:
+            if function_id not in self.controller[cont_type]:
+                continue
+            controller = self.controller[cont_type][function_id]
             try:
-                return self.controller["PID"][function_id].function_status()
+                if hasattr(controller, 'function_status'):
+                    status = controller.function_status()
+                else:
+                    status = {'string_status': '', 'error': []}
             except Exception as err:
                 return {'error': ["Error getting Function status: {}".format(err)]}
+
+            # Include the timeliness of periodic runs
+            if controller.deadline and isinstance(status, dict):
+                status['deadline'] = controller.deadline.status()
+                if isinstance(status.get('string_status'), str):
+                    status['string_status'] = "\n".join(filter(None, [
+                        status['string_status'], controller.deadline.status_string()]))
+            return status
+        return {'error': ["Function ID not found"]}
+
+    def profile_controller(self, unique_id, seconds):
+        """
+        Sample the stack of a running controller's thread for a duration
+
+        :return: status (0 for success), collapsed stacks or error message
+        :rtype: int, str
+
+        :param unique_id: ID of the controller to profile ('Output' or 'Widget' for those controllers)
+        :type unique_id: str
+        :param seconds: How long to sample for
+        :type seconds: float
+        """
+        controller = None
+        if unique_id in ['Output', 'Widget']:
+            controller = self.controller[unique_id]
         else:
-            return {'error': ["Function ID not found"]}
+            for cont_type in self.cont_types:
+                if unique_id in self.controller[cont_type]:
+                    controller = self.controller[cont_type][unique_id]
+                    break
+
+        if not controller or not controller.is_running():
+            return 1, "Controller with ID {} is not active".format(unique_id)
+
+        try:
+            self.logger.info("Profiling controller {id} for {sec} seconds".format(
+                id=unique_id, sec=seconds))
+            return 0, profile_threads([controller], float(seconds))
+        except Exception as except_msg:
+            message = "Could not profile controller: {err}".format(err=except_msg)
+            self.logger.exception(message)
+            return 1, message
 
     def lcd_reset(self, lcd_id):
         """
@@ -723,10 +792,32 @@ class DaemonController:
             message = "Could not set PID {opt}: {e}".format(opt=setting, e=except_msg)
             self.logger.exception(message)
 
+    def camera_settings(self, unique_id):
+        for each_camera in self.camera:
+            if each_camera.unique_id == unique_id:
+                return each_camera
+        return db_retrieve_table_daemon(Camera, unique_id=unique_id)
+
+    def camera_capture_still(self, unique_id, path_file):
+        """Save a still from a camera's capture service, returning an error message on failure."""
+        try:
+            get_capture_service(self.camera_settings(unique_id)).capture_still(path_file)
+        except Exception as except_msg:
+            message = "Could not capture still: {err}".format(err=except_msg)
+            self.logger.exception(message)
+            return message
+
+    def camera_stream_frame(self, unique_id, after_number=0):
+        """Return the next (frame number, frame) of a camera's live stream."""
+        return get_capture_service(self.camera_settings(unique_id)).stream_frame(
+            after_number=after_number)
+
     def refresh_daemon_camera_settings(self):
         try:
             self.logger.debug("Refreshing camera settings")
             self.camera = db_retrieve_table_daemon(Camera, entry='all')
+            # Reopen cameras with changed settings
+            refresh_capture_services(self.camera)
         except Exception as except_msg:
             self.camera = []
             message = "Could not read camera table: {err}".format(err=except_msg)
@@ -739,6 +830,15 @@ class DaemonController:
             message = "Could not refresh conditional settings: {e}".format(e=except_msg)
             self.logger.exception(message)
 
+    def refresh_daemon_method_settings(self, method_id=None):
+        """Discard cached method handlers so the next use reloads the method from the database."""
+        try:
+            self.logger.debug("Refreshing method settings")
+            invalidate_method_handler(method_id)
+        except Exception as except_msg:
+            message = "Could not refresh method settings: {e}".format(e=except_msg)
+            self.logger.exception(message)
+
     def refresh_daemon_misc_settings(self):
         old_time = self.output_usage_report_next_gen
         self.output_usage_report_next_gen = next_schedule(
@@ -895,9 +995,14 @@ class DaemonController:
         """
         Start all activated controllers
 
+        The Output controller is started first, then each stage of controllers
+        (see self.cont_stages), activating the controllers of a stage concurrently,
+        and lastly the Widget controller.
+
         See the files named controller_[name].py for details of what each
         controller does.
         """
+        self.activation_times = []
         try:
             # Obtain database configuration options
             db_tables = {
@@ -911,89 +1016,126 @@ class DaemonController:
             }
 
             self.logger.debug("Starting Output Controller")
-            ready = threading.Event()
-            self.controller['Output'] = OutputController(ready, debug)
-            self.controller['Output'].daemon = True
-            self.controller['Output'].start()
-            ready.wait()  # wait for thread to return ready
-
-            # Ensure Output controller has started before continuing
-            time.sleep(0.5)
-            output_controller_timout = time.time() + 60
-            while not self.controller['Output'].is_running():
-                if time.time() > output_controller_timout:
-                    self.logger.error("Output Controller timed out")
-                    break
-                time.sleep(0.1)
+            self.start_single_controller('Output', OutputController, debug)
             self.logger.debug("Output Controller fully started")
 
-            for each_controller in self.cont_types:
-                self.logger.debug("Starting all activated {type} controllers".format(type=each_controller))
-                for each_entry in db_tables[each_controller]:
-                    if each_entry.is_activated:
-                        self.controller_activate(each_entry.unique_id)
-                self.logger.info("All activated {type} controllers started".format(type=each_controller))
+            for each_stage in self.cont_stages:
+                self.logger.debug("Starting all activated {types} controllers".format(
+                    types=", ".join(each_stage)))
+                self.activate_controllers([
+                    (each_type, each_entry.unique_id)
+                    for each_type in each_stage
+                    for each_entry in db_tables[each_type]
+                    if each_entry.is_activated
+                ])
+                self.logger.info("All activated {types} controllers started".format(
+                    types=", ".join(each_stage)))
 
             self.logger.debug("Starting Widget Controller")
-            ready = threading.Event()
-            self.controller['Widget'] = WidgetController(ready, debug)
-            self.controller['Widget'].daemon = True
-            self.controller['Widget'].start()
-            ready.wait()  # wait for thread to return ready
-
-            # Ensure Widget controller has started before continuing
-            time.sleep(0.5)
-            widget_controller_timout = time.time() + 60
-            while not self.controller['Widget'].is_running():
-                if time.time() > widget_controller_timout:
-                    self.logger.error("Widget Controller timed out")
-                    break
-                time.sleep(0.1)
+            self.start_single_controller('Widget', WidgetController, debug)
             self.logger.debug("Widget Controller fully started")
 
-            time.sleep(0.5)
-
         except Exception as except_msg:
             message = "Could not start all controllers: {err}".format(err=except_msg)
             self.logger.exception(message)
 
+    def start_single_controller(self, cont_type, controller_class, debug):
+        """Start a controller that only has a single thread (Output, Widget)."""
+        timer = timeit.default_timer()
+        ready = threading.Event()
+        self.controller[cont_type] = controller_class(ready, debug)
+        self.controller[cont_type].daemon = True
+        self.controller[cont_type].start()
+        if not ready.wait(60):  # wait for thread to return ready
+            self.logger.error("{type} Controller timed out".format(type=cont_type))
+        self.activation_times.append((cont_type, None, timeit.default_timer() - timer))
+
+    def activate_controllers(self, controllers):
+        """
+        Activate controllers concurrently and wait for them to start
+
+        :param controllers: list of (controller type, unique ID)
+        """
+        def activate(cont_type_id):
+            cont_type, cont_id = cont_type_id
+            timer = timeit.default_timer()
+            self.controller_activate(cont_id, cont_type=cont_type)
+            return cont_type, cont_id, timeit.default_timer() - timer
+
+        if not controllers:
+            return
+        with ThreadPoolExecutor(max_workers=min(
+                MAX_CONCURRENT_CONTROLLER_STARTS, len(controllers))) as executor:
+            self.activation_times.extend(executor.map(activate, controllers))
+
+    def activation_times_str(self):
+        """Summarize how long each controller took to activate, slowest first."""
+        times = {}
+        for cont_type, cont_id, seconds in self.activation_times:
+            times.setdefault(cont_type, []).append((cont_id, seconds))
+
+        summaries = []
+        for cont_type, cont_times in times.items():
+            if cont_times[0][0] is None:  # Single-thread controller
+                summaries.append("{type} {sec:.3f}".format(type=cont_type, sec=cont_times[0][1]))
+            else:
+                summaries.append("{type}: {times}".format(
+                    type=cont_type,
+                    times=", ".join("{id} {sec:.3f}".format(id=cont_id.split('-')[0], sec=seconds)
+                                    for cont_id, seconds in sorted(cont_times, key=lambda x: -x[1]))))
+        return "Controller activation times (seconds): {}".format("; ".join(summaries))
+
     def stop_all_controllers(self):
-        """Stop all running controllers."""
-        controller_running = {}
-
-        # Reverse the list to shut down each controller in the
-        # reverse order they were started in
-        for each_controller in list(reversed(self.cont_types)):
-            controller_running[each_controller] = []
-            for cont_id in self.controller[each_controller]:
+        """Stop all running controllers, concurrently, in the reverse order of the stages they were started in."""
+        for each_stage in reversed(self.cont_stages):
+            controller_running = []
+            for each_type in each_stage:
+                for cont_id in self.controller[each_type]:
+                    try:
+                        if self.controller[each_type][cont_id].is_running():
+                            controller_running.append((each_type, cont_id))
+                    except Exception as err:
+                        self.logger.info("{type} controller {id} thread had an issue stopping: {err}".format(
+                            type=each_type, id=cont_id, err=err))
+
+            # Signal every controller of the stage to stop, then wait for them,
+            # so the stage takes as long as its slowest controller to stop
+            for cont_type, cont_id in controller_running:
                 try:
-                    if self.controller[each_controller][cont_id].is_running():
-                        self.controller[each_controller][cont_id].stop_controller()
-                        controller_running[each_controller].append(cont_id)
+                    self.controller[cont_type][cont_id].stop_controller()
                 except Exception as err:
                     self.logger.info("{type} controller {id} thread had an issue stopping: {err}".format(
-                        type=each_controller, id=cont_id, err=err))
-
-        for each_controller in list(reversed(self.cont_types)):
-            for cont_id in controller_running[each_controller]:
+                        type=cont_type, id=cont_id, err=err))
+            for cont_type, cont_id in controller_running:
                 try:
-                    self.controller[each_controller][cont_id].join()
+                    self.controller[cont_type][cont_id].join()
                 except Exception as err:
                     self.logger.info("{type} controller {id} thread had an issue being joined: {err}".format(
-                        type=each_controller, id=cont_id, err=err))
-            self.logger.info("All {type} controllers stopped".format(type=each_controller))
+                        type=cont_type, id=cont_id, err=err))
+            self.logger.info("All {types} controllers stopped".format(types=", ".join(each_stage)))
 
-        try:
-            self.controller['Output'].stop_controller()
-            self.controller['Output'].join(15)  # Give each thread 15 seconds to stop
-        except Exception as err:
-            self.logger.info("Output controller had an issue stopping: {err}".format(err=err))
+        for each_type in ['Widget', 'Output']:
+            try:
+                self.controller[each_type].stop_controller()
+                self.controller[each_type].join(15)  # Give each thread 15 seconds to stop
+            except Exception as err:
+                self.logger.info("{type} controller had an issue stopping: {err}".format(
+                    type=each_type, err=err))
 
-        try:
-            self.controller['Widget'].stop_controller()
-            self.controller['Widget'].join(15)  # Give each thread 15 seconds to stop
-        except Exception as err:
-            self.logger.info("Widget controller had an issue stopping: {err}".format(err=err))
+        # Stop the event loop of async Inputs and Outputs, after they've stopped
+        stop_event_loop()
+
+        # Disconnect from the MQTT brokers of MQTT Actions and Outputs
+        close_connections()
+
+        # Close the cameras of capture services
+        stop_capture_services()
+
+        # Append any queued time-lapse images to their videos
+        timelapse_assembler.stop()
+
+        # Deliver any queued notifications (emails and webhooks) and stop their workers
+        notification_dispatcher.stop()
 
     def trigger_action(self, action_id, value=None, message='', debug=False):
         try:
@@ -1108,9 +1250,18 @@ class DaemonController:
                     mod_camera.timelapse_capture_number = capture_number
                     new_session.commit()
                 self.refresh_daemon_camera_settings()
+                # Capture image, in a thread so the capture doesn't hold up the daemon's loop
+                if (camera.unique_id in self.timelapse_threads and
+                        self.timelapse_threads[camera.unique_id].is_alive()):
+                    self.logger.error(
+                        "Camera {id}: Previous time-lapse image is still being captured, "
+                        "skipping capture".format(id=camera.id))
+                    return
                 self.logger.debug("Camera {id}: Capturing time-lapse image".format(id=camera.id))
-                # Capture image
-                camera_record('timelapse', camera.unique_id)
+                self.timelapse_threads[camera.unique_id] = threading.Thread(
+                    target=camera_record, args=('timelapse', camera.unique_id),
+                    name='timelapse_{}'.format(camera.unique_id), daemon=True)
+                self.timelapse_threads[camera.unique_id].start()
         except Exception as except_msg:
             message = "Could not execute timelapse: {err}".format(err=except_msg)
             self.logger.exception(message)
@@ -1218,6 +1369,23 @@ class PyroServer(object):
         """Set PID setting."""
         return self.mycodo.pid_set(pid_id, setting, value)
 
+    def profile_controller(self, unique_id, seconds):
+        """Sample the stack of a controller's thread and return collapsed stacks."""
+        return self.mycodo.profile_controller(unique_id, seconds)
+
+    def camera_capture_still(self, unique_id, path_file):
+        """Save a still from a camera's capture service."""
+        return self.mycodo.camera_capture_still(unique_id, path_file)
+
+    def camera_stream_frame(self, unique_id, after_number=0):
+        """Return the next frame of a camera's live stream."""
+        return self.mycodo.camera_stream_frame(unique_id, after_number)
+
+    @staticmethod
+    def get_camera_stats():
+        """Return the status of the capture services of cameras."""
+        return capture_service_stats()
+
     def refresh_daemon_camera_settings(self, ):
         """Instruct the daemon to refresh the camera settings."""
         return self.mycodo.refresh_daemon_camera_settings()
@@ -1226,6 +1394,10 @@ class PyroServer(object):
         """Instruct the daemon to refresh a conditional's settings."""
         return self.mycodo.refresh_daemon_conditional_settings(unique_id)
 
+    def refresh_daemon_method_settings(self, method_id=None):
+        """Instruct the daemon to refresh a method's settings (all methods if None)."""
+        return self.mycodo.refresh_daemon_method_settings(method_id)
+
     def refresh_daemon_misc_settings(self):
         """Instruct the daemon to refresh the misc settings."""
         return self.mycodo.refresh_daemon_misc_settings()
@@ -1311,6 +1483,31 @@ class PyroServer(object):
         """
         return 'alive'
 
+    @staticmethod
+    def get_controller_metrics():
+        """Return the timing metrics of the operations of all running controllers."""
+        return controller_metrics.snapshot()
+
+    @staticmethod
+    def get_bus_stats():
+        """Return the utilization, queue wait, and device latency stats of the shared buses."""
+        return bus_stats()
+
+    @staticmethod
+    def get_lock_stats():
+        """Return the contention statistics of the daemon's named locks."""
+        return lock_manager.stats()
+
+    @staticmethod
+    def get_mqtt_stats():
+        """Return the stats of the daemon's shared MQTT connections."""
+        return mqtt_stats()
+
+    @staticmethod
+    def get_notification_stats():
+        """Return the delivery stats of notifications (emails and webhooks)."""
+        return notification_dispatcher.stats()
+
     @staticmethod
     def is_in_virtualenv():
         """Returns True if this script is running in a virtualenv."""
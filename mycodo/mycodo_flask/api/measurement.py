@@ -1,9 +1,13 @@
 # coding=utf-8
 import datetime
 import logging
+import math
+import time
 import traceback
 
 import flask_login
+from flask import Response
+from flask import request
 from flask_accept import accept
 from flask_restx import Resource
 from flask_restx import abort
@@ -13,10 +17,28 @@ from mycodo.databases.models import Unit
 from mycodo.mycodo_flask.api import api
 from mycodo.mycodo_flask.api import default_responses
 from mycodo.mycodo_flask.utils import utils_general
+from mycodo.mycodo_flask.utils.utils_render_context import get_render_context
 from mycodo.utils.influx import read_influxdb_list
 from mycodo.utils.influx import read_influxdb_single
 from mycodo.utils.influx import valid_date_str
 from mycodo.utils.influx import write_influxdb_value
+from mycodo.utils.measurement_batch import ingest_writer
+from mycodo.utils.measurement_history import ENCODERS
+from mycodo.utils.measurement_history import FORMATS
+from mycodo.utils.measurement_history import FUNCTIONS
+from mycodo.utils.measurement_history import HistoryError
+from mycodo.utils.measurement_history import MAX_PAGE_SIZE
+from mycodo.utils.measurement_history import MAX_SERIES
+from mycodo.utils.measurement_history import PAGE_SIZE
+from mycodo.utils.measurement_history import PRECISIONS
+from mycodo.utils.measurement_history import measurement_series
+from mycodo.utils.measurement_history import read_page
+from mycodo.utils.measurement_ingest import IngestError
+from mycodo.utils.measurement_ingest import MAX_POINTS
+from mycodo.utils.measurement_ingest import measurement_channels
+from mycodo.utils.measurement_ingest import parse_json_points
+from mycodo.utils.measurement_ingest import parse_line_protocol
+from mycodo.utils.measurement_ingest import prepare_points
 from mycodo.utils.system_pi import add_custom_units
 
 logger = logging.getLogger(__name__)
@@ -33,6 +55,30 @@ measurement_create_fields = ns_measurement.model('Measurement Create Fields', {
         required=False)
 })
 
+measurement_ingest_point_fields = ns_measurement.model('Measurement Ingest Point Fields', {
+    'device_id': fields.String(
+        description='The unique ID of the device of the measurement', required=True),
+    'channel': fields.Integer(
+        description='The channel of the measurement', required=True),
+    'value': fields.Float(
+        description='The value of the measurement', required=True),
+    'unit': fields.String(
+        description='The unit of the measurement (Optional; must match the unit of the channel)',
+        required=False),
+    'measurement': fields.String(
+        description='The measurement (Optional; must match the measurement of the channel)',
+        required=False),
+    'timestamp': fields.String(
+        description='The timestamp of the measurement, as epoch seconds or in '
+                    '%Y-%m-%dT%H:%M:%S.%fZ format (Optional; exclude to create a '
+                    'measurement with a timestamp of the current time)',
+        required=False)
+})
+
+measurement_ingest_fields = ns_measurement.model('Measurement Ingest Fields', {
+    'points': fields.List(fields.Nested(measurement_ingest_point_fields))
+})
+
 measurement_fields = ns_measurement.model('Measurement Fields', {
     'time': fields.DateTime(dt_format='iso8601'),
     'value': fields.Float,
@@ -103,6 +149,67 @@ class MeasurementsCreate(Resource):
                   error=traceback.format_exc())
 
 
+@ns_measurement.route('/ingest')
+@ns_measurement.doc(
+    security='apikey',
+    responses=default_responses,
+    params={
+        'precision': 'The precision of line protocol timestamps: ns (default), u, ms, or s'
+    }
+)
+class MeasurementsIngest(Resource):
+    """Stores measurements in bulk."""
+
+    @accept('application/vnd.mycodo.v1+json')
+    @ns_measurement.expect(measurement_ingest_fields)
+    @flask_login.login_required
+    def post(self):
+        """
+        Create measurements of any devices in bulk.
+
+        Post a JSON array of points (or an object with a points array) or, with
+        a Content-Type of text/plain, InfluxDB line protocol with a line for each
+        point (e.g. "C,device_id=ID,channel=0 value=22.5 1618510020000000000").
+        Each point must be of the channel of a device measurement. Returns the
+        status of each point: "queued" if it will be stored, or why it won't be.
+        """
+        if not utils_general.user_has_permission('edit_controllers'):
+            abort(403)
+
+        try:
+            if request.mimetype == 'text/plain':
+                points = parse_line_protocol(
+                    request.get_data(as_text=True),
+                    precision=request.args.get('precision', 'ns'))
+            else:
+                points = parse_json_points(request.get_json(silent=True))
+        except IngestError as err:
+            abort(422, custom=str(err))
+        if len(points) > MAX_POINTS:
+            abort(422, custom='Too many points. A maximum of {} points may be posted at once'.format(
+                MAX_POINTS))
+
+        try:
+            context = get_render_context()
+            channels = context.cached(
+                'measurement_channels', measurement_channels, context.device_measurements)
+            statuses, valid = prepare_points(points, channels)
+
+            accepted = ingest_writer.add_points([each_point for _, each_point in valid])
+            for index, _ in valid[accepted:]:
+                statuses[index] = 'Not stored: too many measurements are waiting to be stored'
+
+            return {
+                'accepted': accepted,
+                'rejected': len(points) - accepted,
+                'status': statuses
+            }, 200
+        except Exception:
+            abort(500,
+                  message='An exception occurred',
+                  error=traceback.format_exc())
+
+
 @ns_measurement.route('/historical/<string:unique_id>/<string:unit>/<int:channel>/<int:epoch_start>/<int:epoch_end>')
 @ns_measurement.doc(
     security='apikey',
@@ -168,6 +275,113 @@ class MeasurementsHistorical(Resource):
                   error=traceback.format_exc())
 
 
+@ns_measurement.route('/history')
+@ns_measurement.doc(
+    security='apikey',
+    responses=default_responses,
+    params={
+        'measurement_id': 'The unique ID of a measurement. Repeat (or separate with commas) '
+                          'for several measurements (maximum {}).'.format(MAX_SERIES),
+        'start': 'The start time, as epoch seconds.',
+        'end': 'The end time, as epoch seconds (Optional; default: now).',
+        'cursor': 'The next_cursor of the previous page (Optional; exclude for the first page).',
+        'page_size': 'The maximum number of points of all measurements of a page '
+                     '(Optional; default: {}, maximum: {}).'.format(PAGE_SIZE, MAX_PAGE_SIZE),
+        'function': 'Aggregate the measurements with a function: {} '
+                    '(Optional; default: none).'.format(', '.join(FUNCTIONS)),
+        'interval': 'Aggregate each interval of seconds, rather than the whole time range '
+                    '(Optional; requires function).',
+        'format': 'The format of the response: {} (Optional; default: json).'.format(
+            ', '.join(FORMATS)),
+        'precision': 'The precision of timestamps: {} (Optional; default: ms).'.format(
+            ', '.join(PRECISIONS))
+    }
+)
+class MeasurementsHistory(Resource):
+    """Reads the history of measurements in pages."""
+
+    @accept('application/vnd.mycodo.v1+json')
+    @flask_login.login_required
+    def get(self):
+        """
+        Return a page of the measurements of several devices found within a time range
+
+        Each measurement is returned as a column of times and a column of values
+        (or a row for each point, in CSV). Request the next page with the cursor
+        of the page (next_cursor, and the X-Next-Cursor header), until it's null.
+        """
+        if not utils_general.user_has_permission('view_settings'):
+            abort(403)
+
+        measurement_ids = []
+        for each_arg in request.args.getlist('measurement_id'):
+            measurement_ids.extend(each_id for each_id in each_arg.split(',') if each_id)
+        if not measurement_ids:
+            abort(422, custom='measurement_id is required')
+        if len(measurement_ids) > MAX_SERIES:
+            abort(422, custom='A maximum of {} measurements may be read at once'.format(MAX_SERIES))
+
+        try:
+            start = float(request.args['start'])
+            end = float(request.args.get('end', time.time()))
+            page_size = int(request.args.get('page_size', PAGE_SIZE))
+            interval = request.args.get('interval', type=float)
+            if 'interval' in request.args and interval is None:
+                raise ValueError
+            if not all(math.isfinite(each) for each in (start, end, interval or 0)):
+                raise ValueError
+        except (KeyError, ValueError):
+            abort(422, custom='start (required), end, and interval must be numbers, and page_size an integer')
+        if start < 0 or end < start:
+            abort(422, custom='start must be >= 0 and end must be >= start')
+        if not 1 <= page_size <= MAX_PAGE_SIZE:
+            abort(422, custom='page_size must be from 1 to {}'.format(MAX_PAGE_SIZE))
+
+        function = request.args.get('function')
+        if function:
+            function = function.upper()
+            if function not in FUNCTIONS:
+                abort(422, custom='function must be one of {}'.format(', '.join(FUNCTIONS)))
+        if interval is not None and (not function or interval < 1 or interval != int(interval)):
+            abort(422, custom='interval must be an integer >= 1, and requires function')
+
+        output_format = request.args.get('format', 'json')
+        if output_format not in FORMATS:
+            abort(422, custom='format must be one of {}'.format(', '.join(FORMATS)))
+        precision = request.args.get('precision', 'ms')
+        if precision not in PRECISIONS:
+            abort(422, custom='precision must be one of {}'.format(', '.join(PRECISIONS)))
+
+        context = get_render_context()
+        series_by_id = context.cached(
+            'measurement_series', measurement_series, context.device_measurements)
+        unknown_ids = [each_id for each_id in measurement_ids if each_id not in series_by_id]
+        if unknown_ids:
+            abort(422, custom='Measurement ID not found: {}'.format(', '.join(unknown_ids)))
+
+        try:
+            page, next_cursor = read_page(
+                [series_by_id[each_id] for each_id in measurement_ids],
+                int(start * 1e9), int(end * 1e9),
+                cursor=request.args.get('cursor'),
+                page_size=page_size,
+                function=function,
+                interval=int(interval) if interval else None)
+        except HistoryError as err:
+            abort(422, custom=str(err))
+        except Exception:
+            abort(500,
+                  message='An exception occurred',
+                  error=traceback.format_exc())
+
+        response = Response(
+            ENCODERS[output_format](page, next_cursor, precision),
+            mimetype=FORMATS[output_format])
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+
+
 @ns_measurement.route('/last/<string:unique_id>/<string:unit>/<int:channel>/<int:past_seconds>')
 @ns_measurement.doc(
     security='apikey',
@@ -187,6 +187,9 @@ pid_fields = api.model('PID Settings Fields', {
     'period': fields.Float,
     'start_offset': fields.Float,
     'max_measure_age': fields.Float,
+    'run_on_new_measurement': fields.Boolean,
+    'new_measurement_debounce': fields.Float,
+    'new_measurement_min_interval': fields.Float,
     'measurement': fields.String,
     'direction': fields.String,
     'setpoint': fields.Float,
@@ -22,7 +22,6 @@ from flask_talisman import Talisman
 from mycodo.config import LANGUAGES
 from mycodo.config import ProdConfig
 from mycodo.databases.models import Misc
-from mycodo.databases.models import User
 from mycodo.databases.models import populate_db
 from mycodo.databases.utils import session_scope
 from mycodo.mycodo_flask import routes_admin
@@ -43,6 +42,10 @@ from mycodo.mycodo_flask.api import init_api
 from mycodo.mycodo_flask.extensions import db
 from mycodo.mycodo_flask.utils.utils_dashboard import register_widget_endpoints
 from mycodo.mycodo_flask.utils.utils_general import get_ip_address
+from mycodo.mycodo_flask.utils.utils_permissions import principal_by_api_key
+from mycodo.mycodo_flask.utils.utils_permissions import principal_by_id
+from mycodo.utils.dependency_status import dependency_status
+from mycodo.utils.system_info import system_info_collector
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +66,10 @@ def create_app(config=ProdConfig):
 
     register_widget_endpoints(app)
 
+    if not app.config['TESTING']:
+        system_info_collector.start()  # Sample for the history graphs of the Info page
+        dependency_status.start()  # Check dependencies of devices in the background
+
     return app
 
 
@@ -122,9 +129,8 @@ def extension_babel(app):
     @babel.localeselector
     def get_locale():
         try:
-            user = User.query.filter(
-                User.id == flask_login.current_user.id).first()
-            if user and user.language != '':
+            user = flask_login.current_user
+            if user.language != '':
                 for key in LANGUAGES:
                     if key == user.language:
                         return key
@@ -167,19 +173,19 @@ def extension_login_manager(app):
 
     @login_manager.user_loader
     def user_loader(user_id):
-        user = User.query.filter(User.id == user_id).first()
-        if not user:
+        principal = principal_by_id(user_id)
+        if not principal:
             return
-        return user
+        return principal.user
 
     @login_manager.request_loader
     def load_user_from_request(req):
         try:  # first, try to login using the api_key url arg
             api_key = req.args.get('api_key').replace(' ', '+')
             api_key = base64.b64decode(api_key)
-            user = User.query.filter_by(api_key=api_key).first()
-            if user:
-                return user
+            principal = principal_by_api_key(api_key)
+            if principal:
+                return principal.user
         except:
             pass
 
@@ -187,18 +193,18 @@ def extension_login_manager(app):
             api_key = req.headers.get('Authorization')
             api_key = api_key.replace('Basic ', '', 1)
             api_key = base64.b64decode(api_key)
-            user = User.query.filter_by(api_key=api_key).first()
-            if user:
-                return user
+            principal = principal_by_api_key(api_key)
+            if principal:
+                return principal.user
         except:
             pass
 
         try:  # next, try to login using X-API-KEY
             api_key = req.headers.get('X-API-KEY')
             api_key = base64.b64decode(api_key)
-            user = User.query.filter_by(api_key=api_key).first()
-            if user:
-                return user
+            principal = principal_by_api_key(api_key)
+            if principal:
+                return principal.user
         except:
             pass
 
@@ -11,7 +11,9 @@ from wtforms import IntegerField
 from wtforms import SelectField
 from wtforms import StringField
 from wtforms import SubmitField
+from wtforms import validators
 from wtforms import widgets
+from wtforms.validators import Optional
 from wtforms.widgets import NumberInput
 
 from mycodo.config import CONDITIONAL_CONDITIONS
@@ -44,6 +46,16 @@ class Conditional(FlaskForm):
     pyro_timeout = DecimalField(
         lazy_gettext('Timeout (seconds)'),
         widget=NumberInput(step='any'))
+    run_on_new_measurement = BooleanField(
+        TRANSLATIONS['run_on_new_measurement']['title'])
+    new_measurement_debounce = DecimalField(
+        TRANSLATIONS['new_measurement_debounce']['title'],
+        validators=[Optional(), validators.NumberRange(min=0)],
+        widget=NumberInput(step='any'))
+    new_measurement_min_interval = DecimalField(
+        TRANSLATIONS['new_measurement_min_interval']['title'],
+        validators=[Optional(), validators.NumberRange(min=0)],
+        widget=NumberInput(step='any'))
     condition_type = SelectField(
         choices=[('', TRANSLATIONS['select_one']['title'])] + CONDITIONAL_CONDITIONS)
     add_condition = SubmitField(lazy_gettext('Add'))
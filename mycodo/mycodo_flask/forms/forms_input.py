@@ -85,6 +85,7 @@ class InputMod(FlaskForm):
         widget=NumberInput(step='any')
     )
     log_level_debug = BooleanField(TRANSLATIONS['log_level_debug']['title'])
+    isolate_process = BooleanField(TRANSLATIONS['isolate_process']['title'])
     num_channels = IntegerField(lazy_gettext('Number of Measurements'), widget=NumberInput())
     location = StringField(lazy_gettext('Location'))
     ftdi_location = StringField(TRANSLATIONS['ftdi_location']['title'])
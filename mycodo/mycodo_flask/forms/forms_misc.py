@@ -93,6 +93,8 @@ class LogView(FlaskForm):
     )
 
     log = StringField(lazy_gettext('Log'))
+    controller = StringField(lazy_gettext('Controller ID'))
+    level = StringField(lazy_gettext('Level'))
     log_view = SubmitField(lazy_gettext('View Log'))
 
 
@@ -58,6 +58,16 @@ class PIDModBase(FlaskForm):
         )],
         widget=NumberInput(step='any')
     )
+    run_on_new_measurement = BooleanField(
+        TRANSLATIONS['run_on_new_measurement']['title'])
+    new_measurement_debounce = DecimalField(
+        TRANSLATIONS['new_measurement_debounce']['title'],
+        validators=[Optional(), validators.NumberRange(min=0)],
+        widget=NumberInput(step='any'))
+    new_measurement_min_interval = DecimalField(
+        TRANSLATIONS['new_measurement_min_interval']['title'],
+        validators=[Optional(), validators.NumberRange(min=0)],
+        widget=NumberInput(step='any'))
     setpoint = DecimalField(
         TRANSLATIONS['setpoint']['title'],
         validators=[validators.NumberRange(
@@ -412,6 +412,13 @@ class SettingsPi(FlaskForm):
         widget=NumberInput(step='any'))
     save_sample_rates = SubmitField(lazy_gettext('Save Sample Rates'))
 
+    deadline_alert_misses = IntegerField(
+        lazy_gettext('Alert After Consecutive Missed Deadlines'),
+        validators=[Optional(), validators.NumberRange(min=0)],
+        widget=NumberInput())
+    deadline_alert_function_id = StringField(lazy_gettext('Alert Actions'))
+    save_deadline_alert = SubmitField(lazy_gettext('Save Deadline Alert'))
+
 
 #
 # Settings (Diagnostic)
@@ -49,6 +49,7 @@ from mycodo.mycodo_flask.forms import forms_misc
 from mycodo.mycodo_flask.routes_static import inject_variables
 from mycodo.mycodo_flask.utils import utils_general
 from mycodo.utils.actions import parse_action_information
+from mycodo.utils.dependency_status import dependency_status
 from mycodo.utils.functions import parse_function_information
 from mycodo.utils.github_release_info import MycodoRelease
 from mycodo.utils.inputs import parse_input_information
@@ -234,6 +235,8 @@ def install_dependencies(dependencies):
     with open(DEPENDENCY_INIT_FILE, 'w') as f:
         f.write('0')
 
+    dependency_status.refresh()
+
     cmd = "{pth}/mycodo/scripts/mycodo_wrapper daemon_restart" \
           " | ts '[%Y-%m-%d %H:%M:%S]' >> {log}  2>&1".format(
             pth=INSTALL_DIRECTORY,
@@ -20,27 +20,23 @@ from mycodo.databases.models import Dashboard
 from mycodo.databases.models import DeviceMeasurements
 from mycodo.databases.models import Input
 from mycodo.databases.models import Math
-from mycodo.databases.models import Measurement
 from mycodo.databases.models import Method
 from mycodo.databases.models import Misc
 from mycodo.databases.models import NoteTags
 from mycodo.databases.models import Output
 from mycodo.databases.models import OutputChannel
 from mycodo.databases.models import PID
-from mycodo.databases.models import Unit
 from mycodo.databases.models import Widget
 from mycodo.mycodo_flask.extensions import db
 from mycodo.mycodo_flask.forms import forms_dashboard
 from mycodo.mycodo_flask.routes_static import inject_variables
 from mycodo.mycodo_flask.utils import utils_dashboard
 from mycodo.mycodo_flask.utils import utils_general
+from mycodo.mycodo_flask.utils.utils_render_context import get_render_context
 from mycodo.utils.outputs import output_types
 from mycodo.utils.outputs import parse_output_information
-from mycodo.utils.system_pi import add_custom_measurements
-from mycodo.utils.system_pi import add_custom_units
 from mycodo.utils.system_pi import parse_custom_option_values_json
 from mycodo.utils.system_pi import parse_custom_option_values_output_channels_json
-from mycodo.utils.system_pi import return_measurement_info
 from mycodo.utils.widgets import parse_widget_information
 
 logger = logging.getLogger('mycodo.mycodo_flask.routes_dashboard')
@@ -102,20 +98,14 @@ def page_dashboard_add():
 def page_dashboard(dashboard_id):
     """Generate custom dashboard with various data."""
     # Retrieve tables from SQL database
+    context = get_render_context()
     camera = Camera.query.all()
     conditional = Conditional.query.all()
-    function = CustomController.query.all()
     widget = Widget.query.all()
     this_dashboard = Dashboard.query.filter(
         Dashboard.unique_id == dashboard_id).first()
-    input_dev = Input.query.all()
-    device_measurements = DeviceMeasurements.query.all()
-    math = Math.query.all()
     method = Method.query.all()
     misc = Misc.query.first()
-    output = Output.query.all()
-    output_channel = OutputChannel.query.all()
-    pid = PID.query.all()
     tags = NoteTags.query.all()
 
     # Create form objects
@@ -156,43 +146,18 @@ def page_dashboard(dashboard_id):
             'routes_dashboard.page_dashboard', dashboard_id=dashboard_id))
 
     # Generate all measurement and units used
-    dict_measurements = add_custom_measurements(Measurement.query.all())
-    dict_units = add_custom_units(Unit.query.all())
-
-    # Generate dictionary of each measurement ID with the correct measurement/unit used with it
-    dict_measure_measurements = {}
-    dict_measure_units = {}
-
-    for each_measurement in device_measurements:
-        # If the measurement is a PID setpoint, set unit to PID measurement.
-        measurement = None
-        unit = None
-        if each_measurement.measurement_type == 'setpoint':
-            setpoint_pid = PID.query.filter(PID.unique_id == each_measurement.device_id).first()
-            if setpoint_pid and ',' in setpoint_pid.measurement:
-                pid_measurement = setpoint_pid.measurement.split(',')[1]
-                setpoint_measurement = DeviceMeasurements.query.filter(
-                    DeviceMeasurements.unique_id == pid_measurement).first()
-                if setpoint_measurement:
-                    conversion = Conversion.query.filter(
-                        Conversion.unique_id == setpoint_measurement.conversion_id).first()
-                    _, unit, measurement = return_measurement_info(setpoint_measurement, conversion)
-        else:
-            conversion = Conversion.query.filter(
-                Conversion.unique_id == each_measurement.conversion_id).first()
-            _, unit, measurement = return_measurement_info(each_measurement, conversion)
-        if unit:
-            dict_measure_measurements[each_measurement.unique_id] = measurement
-            dict_measure_units[each_measurement.unique_id] = unit
-
-    dict_outputs = parse_output_information()
-    dict_widgets = parse_widget_information()
+    dict_measurements = context.dict_measurements
+    dict_units = context.dict_units
+
+    dict_outputs = context.cached('dict_outputs', parse_output_information)
+    dict_widgets = context.cached('dict_widgets', parse_widget_information)
 
     custom_options_values_widgets = parse_custom_option_values_json(
         widget, dict_controller=dict_widgets)
 
-    custom_options_values_output_channels = parse_custom_option_values_output_channels_json(
-        output_channel, dict_controller=dict_outputs, key_name='custom_channel_options')
+    custom_options_values_output_channels = context.cached(
+        'custom_options_values_output_channels', parse_custom_option_values_output_channels_json,
+        context.output_channel, dict_controller=dict_outputs, key_name='custom_channel_options')
 
     widget_types_on_dashboard = []
     custom_widget_variables = {}
@@ -254,40 +219,48 @@ def page_dashboard(dashboard_id):
 
     # Retrieve all choices to populate form drop-down menu
     choices_camera = utils_general.choices_id_name(camera)
-    choices_function = utils_general.choices_functions(
-        function, dict_units, dict_measurements)
-    choices_input = utils_general.choices_inputs(
-        input_dev, dict_units, dict_measurements)
-    choices_math = utils_general.choices_maths(
-        math, dict_units, dict_measurements)
+    choices_function = context.cached(
+        'choices_function', utils_general.choices_functions,
+        context.function, dict_units, dict_measurements)
+    choices_input = context.cached(
+        'choices_input', utils_general.choices_inputs,
+        context.input_dev, dict_units, dict_measurements)
+    choices_math = context.cached(
+        'choices_math', utils_general.choices_maths,
+        context.math, dict_units, dict_measurements)
     choices_method = utils_general.choices_methods(method)
-    choices_output = utils_general.choices_outputs(
-        output, dict_units, dict_measurements)
-    choices_output_channels = utils_general.choices_outputs_channels(
-        output, output_channel, dict_outputs)
-    choices_output_channels_measurements = utils_general.choices_outputs_channels_measurements(
-        output, OutputChannel, dict_outputs, dict_units, dict_measurements)
-    choices_output_pwm = utils_general.choices_outputs_pwm(
-        output, dict_units, dict_measurements, dict_outputs)
-    choices_pid = utils_general.choices_pids(
-        pid, dict_units, dict_measurements)
-    choices_pid_devices = utils_general.choices_pids_devices(pid)
+    choices_output = context.cached(
+        'choices_output', utils_general.choices_outputs,
+        context.output, dict_units, dict_measurements)
+    choices_output_channels = context.cached(
+        'choices_output_channels', utils_general.choices_outputs_channels,
+        context.output, context.output_channel, dict_outputs)
+    choices_output_channels_measurements = context.cached(
+        'choices_output_channels_measurements', utils_general.choices_outputs_channels_measurements,
+        context.output, OutputChannel, dict_outputs, dict_units, dict_measurements)
+    choices_output_pwm = context.cached(
+        'choices_output_pwm', utils_general.choices_outputs_pwm,
+        context.output, dict_units, dict_measurements, dict_outputs)
+    choices_pid = context.cached(
+        'choices_pid', utils_general.choices_pids,
+        context.pid, dict_units, dict_measurements)
+    choices_pid_devices = utils_general.choices_pids_devices(context.pid)
     choices_tag = utils_general.choices_tags(tags)
 
-    device_measurements_dict = {}
-    for meas in device_measurements:
-        device_measurements_dict[meas.unique_id] = meas
-
-    # Get what each measurement uses for a unit
-    use_unit = utils_general.use_unit_generate(
-        device_measurements, input_dev, output, math, function)
-
     return render_template('pages/dashboard.html',
                            and_=and_,
                            conditional=conditional,
                            custom_options_values_output_channels=custom_options_values_output_channels,
                            custom_options_values_widgets=custom_options_values_widgets,
                            custom_widget_variables=custom_widget_variables,
+                           conversion_dict=context.conversion_dict,
+                           function_dict=context.function_dict,
+                           input_dict=context.input_dict,
+                           math_dict=context.math_dict,
+                           measurements_by_device=context.measurements_by_device,
+                           output_dict=context.output_dict,
+                           output_channel_dict=context.output_channel_dict,
+                           pid_dict=context.pid_dict,
                            table_conversion=Conversion,
                            table_function=CustomController,
                            table_widget=Widget,
@@ -310,9 +283,9 @@ def page_dashboard(dashboard_id):
                            choices_pid_devices=choices_pid_devices,
                            choices_tag=choices_tag,
                            dashboard_id=dashboard_id,
-                           device_measurements_dict=device_measurements_dict,
-                           dict_measure_measurements=dict_measure_measurements,
-                           dict_measure_units=dict_measure_units,
+                           device_measurements_dict=context.device_measurements_dict,
+                           dict_measure_measurements=context.dict_measure_measurements,
+                           dict_measure_units=context.dict_measure_units,
                            dict_measurements=dict_measurements,
                            dict_outputs=dict_outputs,
                            dict_units=dict_units,
@@ -325,16 +298,16 @@ def page_dashboard(dashboard_id):
                            list_html_files_js_ready=list_html_files_js_ready,
                            list_html_files_js_ready_end=list_html_files_js_ready_end,
                            camera=camera,
-                           function=function,
-                           math=math,
+                           function=context.function,
+                           math=context.math,
                            misc=misc,
-                           pid=pid,
-                           output=output,
-                           output_types=output_types(),
-                           input=input_dev,
+                           pid=context.pid,
+                           output=context.output,
+                           output_types=context.cached('output_types', output_types),
+                           input=context.input_dev,
                            tags=tags,
                            this_dashboard=this_dashboard,
-                           use_unit=use_unit,
+                           use_unit=context.use_unit,
                            form_base=form_base,
                            form_dashboard=form_dashboard,
                            widget=widget)
@@ -2,10 +2,10 @@
 import calendar
 import csv
 import datetime
+import io
 import logging
 import os
 import subprocess
-import time
 from importlib import import_module
 from io import StringIO
 
@@ -15,43 +15,55 @@ from flask import Response
 from flask import flash
 from flask import jsonify
 from flask import redirect
+from flask import request
 from flask import send_file
 from flask import send_from_directory
 from flask import url_for
 from flask.blueprints import Blueprint
 from flask_babel import gettext
 from flask_limiter import Limiter
-from sqlalchemy import and_
 
 from mycodo.config import DOCKER_CONTAINER
 from mycodo.config import INSTALL_DIRECTORY
 from mycodo.config import LOG_PATH
 from mycodo.config import PATH_CAMERAS
+from mycodo.config import PATH_IMAGE_CACHE
 from mycodo.config import PATH_NOTE_ATTACHMENTS
 from mycodo.databases.models import Camera
 from mycodo.databases.models import Conversion
 from mycodo.databases.models import DeviceMeasurements
 from mycodo.databases.models import Input
 from mycodo.databases.models import Math
-from mycodo.databases.models import NoteTags
-from mycodo.databases.models import Notes
 from mycodo.databases.models import Output
 from mycodo.databases.models import OutputChannel
 from mycodo.databases.models import PID
+from mycodo.devices.bus_arbiter import format_prometheus_buses
 from mycodo.devices.camera import camera_record
+from mycodo.devices.camera_service import SERVICE_LIBRARIES
+from mycodo.devices.timelapse_video import stream_set
+from mycodo.devices.timelapse_video import video_sets
 from mycodo.mycodo_client import DaemonControl
 from mycodo.mycodo_flask.routes_authentication import clear_cookie_auth
 from mycodo.mycodo_flask.utils import utils_general
 from mycodo.mycodo_flask.utils.utils_general import get_ip_address
+from mycodo.mycodo_flask.utils.utils_notes import notes_with_tag
 from mycodo.mycodo_flask.utils.utils_output import get_all_output_states
 from mycodo.utils.database import db_retrieve_table
-from mycodo.utils.image import generate_thermal_image_from_pixels
 from mycodo.utils.influx import influx_time_str_to_milliseconds
 from mycodo.utils.influx import query_string
+from mycodo.utils.image_cache import MAX_AGE
+from mycodo.utils.image_cache import image_cache
+from mycodo.utils.locks import format_prometheus_locks
+from mycodo.utils.metrics import format_prometheus
+from mycodo.utils.mqtt_connections import format_prometheus_mqtt
+from mycodo.utils.notifications import format_prometheus_notifications
+from mycodo.utils.profiler import MAX_PROFILE_SECONDS
 from mycodo.utils.system_pi import assure_path_exists
 from mycodo.utils.system_pi import is_int
 from mycodo.utils.system_pi import return_measurement_info
 from mycodo.utils.system_pi import str_is_float
+from mycodo.utils.thermal import thermal_image
+from mycodo.utils.thermal import thermal_video
 
 blueprint = Blueprint('routes_general',
                       __name__,
@@ -106,6 +118,34 @@ def page_settings():
     return redirect('settings/general')
 
 
+def resized_image(path_file):
+    """
+    If a width was requested (e.g. ?width=320), redirect to a resized variant of an image
+
+    The variant's URL changes when the source image changes, so it may be cached indefinitely.
+    """
+    width = request.args.get('width', type=int)
+    if width and width > 0:
+        path_variant = image_cache.get(path_file, width)
+        if path_variant:
+            return redirect(url_for(
+                'routes_general.image_cache_return', filename=os.path.basename(path_variant)))
+
+
+@blueprint.route('/image_cache/<filename>')
+@flask_login.login_required
+def image_cache_return(filename):
+    """Return a resized image from the image cache."""
+    path_file = os.path.join(PATH_IMAGE_CACHE, filename)
+    if os.path.abspath(path_file).startswith(PATH_IMAGE_CACHE) and os.path.isfile(path_file):
+        response = send_file(path_file, mimetype='image/jpeg', max_age=MAX_AGE)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.immutable = True
+        return response
+    return "Image not found", 404
+
+
 @blueprint.route('/note_attachment/<filename>')
 @flask_login.login_required
 def send_note_attachment(filename):
@@ -114,7 +154,8 @@ def send_note_attachment(filename):
     if file_path is not None:
         try:
             if os.path.abspath(file_path).startswith(PATH_NOTE_ATTACHMENTS):
-                return send_file(file_path, as_attachment=True)
+                return (resized_image(file_path) or
+                        send_file(file_path, as_attachment=True))
         except Exception:
             logger.exception("Send note attachment")
 
@@ -147,7 +188,8 @@ def camera_img_return_path(camera_unique_id, img_type, filename):
     if filename in files:
         path_file = os.path.join(path, filename)
         if os.path.abspath(path_file).startswith(path):
-            return send_file(path_file, mimetype='image/jpeg')
+            return (resized_image(path_file) or
+                    send_file(path_file, mimetype='image/jpeg'))
 
     return "Image not found"
 
@@ -197,22 +239,57 @@ def camera_img_latest_timelapse(camera_unique_id, max_age):
     return Response(return_values, mimetype='text/json')
 
 
-def gen(camera):
+def gen(frames):
     """Video streaming generator function."""
-    while True:
-        frame = camera.get_frame()
+    for frame in frames:
         yield (b'--frame\r\n'
                b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
 
 
+@blueprint.route('/timelapse_video/<camera_unique_id>/<set_name>')
+@flask_login.login_required
+def timelapse_video_stream(camera_unique_id, set_name):
+    """Stream the video of a time-lapse set (all its segments). Put this in the src attribute of an img tag."""
+    if not Camera.query.filter(Camera.unique_id == camera_unique_id).count():
+        return "Camera not found"
+    video_path = os.path.join(PATH_CAMERAS, camera_unique_id, 'timelapse_video')
+    if set_name not in video_sets(video_path):
+        return "Video not found"
+    fps = request.args.get('fps', default=None, type=float)
+    return Response(gen(stream_set(video_path, set_name, fps=fps)),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
+@blueprint.route('/timelapse_video_file/<camera_unique_id>/<filename>')
+@flask_login.login_required
+def timelapse_video_file(camera_unique_id, filename):
+    """Return a segment of the video of a time-lapse set (Motion JPEG AVI)."""
+    if not Camera.query.filter(Camera.unique_id == camera_unique_id).count():
+        return "Camera not found"
+    video_path = os.path.join(PATH_CAMERAS, camera_unique_id, 'timelapse_video')
+    if os.path.isdir(video_path) and filename in os.listdir(video_path):
+        return send_file(os.path.join(video_path, filename),
+                         mimetype='video/x-msvideo', as_attachment=True)
+    return "Video not found"
+
+
+def gen_camera(camera):
+    while True:
+        yield camera.get_frame()
+
+
 @blueprint.route('/video_feed/<unique_id>')
 @flask_login.login_required
 def video_feed(unique_id):
     """Video streaming route. Put this in the src attribute of an img tag."""
     camera_options = Camera.query.filter(Camera.unique_id == unique_id).first()
+    if camera_options.library in SERVICE_LIBRARIES:
+        # Frames are served by the camera's capture service in the daemon
+        return Response(gen(DaemonControl().camera_stream(unique_id)),
+                        mimetype='multipart/x-mixed-replace; boundary=frame')
     camera_stream = import_module('mycodo.mycodo_flask.camera.camera_' + camera_options.library).Camera
     camera_stream.set_camera_options(camera_options)
-    return Response(gen(camera_stream(unique_id=unique_id)),
+    return Response(gen(gen_camera(camera_stream(unique_id=unique_id))),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
@@ -335,14 +412,12 @@ def past_data(unique_id, measure_type, measurement_id, past_seconds):
     if measure_type == 'tag':
         notes_list = []
 
-        tag = NoteTags.query.filter(NoteTags.unique_id == unique_id).first()
-        notes = Notes.query.filter(
-            Notes.date_time >= (datetime.datetime.utcnow() - datetime.timedelta(seconds=int(past_seconds)))).all()
+        notes = notes_with_tag(
+            unique_id, datetime.datetime.utcnow() - datetime.timedelta(seconds=int(past_seconds)))
 
         for each_note in notes:
-            if tag.unique_id in each_note.tags.split(','):
-                notes_list.append(
-                    [each_note.date_time.strftime("%Y-%m-%dT%H:%M:%S.000000000Z"), each_note.name, each_note.note])
+            notes_list.append(
+                [each_note.date_time.strftime("%Y-%m-%dT%H:%M:%S.000000000Z"), each_note.name, each_note.note])
 
         if notes_list:
             return jsonify(notes_list)
@@ -399,47 +474,43 @@ def past_data(unique_id, measure_type, measurement_id, past_seconds):
 @blueprint.route('/generate_thermal_image/<unique_id>/<timestamp>')
 @flask_login.login_required
 def generate_thermal_image_from_timestamp(unique_id, timestamp):
-    """Return a file from the note attachment directory."""
-    ts_now = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-    camera_path = assure_path_exists(
-        os.path.join(PATH_CAMERAS, '{uid}'.format(uid=unique_id)))
-    filename = 'Still-{uid}-{ts}.jpg'.format(
-        uid=unique_id,
-        ts=ts_now).replace(" ", "_")
-    save_path = assure_path_exists(os.path.join(camera_path, 'thermal'))
-    assure_path_exists(save_path)
-    path_file = os.path.join(save_path, filename)
-
-    input_dev = Input.query.filter(Input.unique_id == unique_id).first()
-    pixels = []
-    success = True
-
-    start = int(int(timestamp) / 1000.0)  # Round down
-    end = start + 1  # Round up
-
-    start_timestamp = time.strftime('%Y-%m-%dT%H:%M:%S.000000000Z', time.gmtime(start))
-    end_timestamp = time.strftime('%Y-%m-%dT%H:%M:%S.000000000Z', time.gmtime(end))
-
-    for each_channel in range(input_dev.channels):
-        measurement = 'channel_{chan}'.format(
-            chan=each_channel)
-        data = query_string(measurement, unique_id,
-                                 start_str=start_timestamp,
-                                 end_str=end_timestamp)
+    """Return the thermal image an Input measured in the second of a timestamp (ms)."""
+    try:
+        image = thermal_image(unique_id, int(timestamp))
+    except Exception as err:
+        logger.error("Could not generate thermal image: {}".format(err))
+        image = None
+    if not image:
+        return "Could not generate image"
+    return send_file(io.BytesIO(image), mimetype='image/jpeg')
 
-        if not data:
-            logger.error('No measurements to export in this time period')
-            success = False
-        else:
-            pixels.append(data[0][1])
 
-    # logger.error("generate_thermal_image_from_timestamp: success: {}, pixels: {}".format(success, pixels))
+@blueprint.route('/generate_thermal_video/<unique_id>/<start_seconds>/<end_seconds>')
+@flask_login.login_required
+def generate_thermal_video(unique_id, start_seconds, end_seconds):
+    """Return the thermal images an Input measured from start_seconds to end_seconds as an animated GIF."""
+    fps = request.args.get('fps', default=4, type=float)
+    try:
+        start_seconds = int(start_seconds)
+        end_seconds = int(end_seconds)
+    except ValueError:
+        return "start_seconds and end_seconds must be integers", 400
+    if fps is None or not 0 < fps <= 100:
+        return "fps must be a number from 0 to 100", 400
+    if end_seconds < start_seconds:
+        return "end_seconds must be >= start_seconds", 400
+    if not Input.query.filter(Input.unique_id == unique_id).count():
+        return "Input not found", 404
 
-    if success:
-        generate_thermal_image_from_pixels(pixels, 8, 8, path_file)
-        return send_file(path_file, mimetype='image/jpeg')
-    else:
-        return "Could not generate image"
+    try:
+        video = thermal_video(
+            unique_id, start_seconds * 1000, end_seconds * 1000, fps=fps)
+    except Exception as err:
+        logger.error("Could not generate thermal video: {}".format(err))
+        video = None
+    if not video:
+        return "Could not generate video"
+    return send_file(io.BytesIO(video), mimetype='image/gif')
 
 
 @blueprint.route('/export_data/<unique_id>/<measurement_id>/<start_seconds>/<end_seconds>')
@@ -528,7 +599,6 @@ def async_data(device_id, device_type, measurement_id, start_seconds, end_second
 
     if device_type == 'tag':
         notes_list = []
-        tag = NoteTags.query.filter(NoteTags.unique_id == device_id).first()
 
         start = datetime.datetime.utcfromtimestamp(float(start_seconds))
         if end_seconds == '0':
@@ -536,12 +606,9 @@ def async_data(device_id, device_type, measurement_id, start_seconds, end_second
         else:
             end = datetime.datetime.utcfromtimestamp(float(end_seconds))
 
-        notes = Notes.query.filter(
-            and_(Notes.date_time >= start, Notes.date_time <= end)).all()
-        for each_note in notes:
-            if tag.unique_id in each_note.tags.split(','):
-                notes_list.append(
-                    [each_note.date_time.strftime("%Y-%m-%dT%H:%M:%S.000000000Z"), each_note.name, each_note.note])
+        for each_note in notes_with_tag(device_id, start, end):
+            notes_list.append(
+                [each_note.date_time.strftime("%Y-%m-%dT%H:%M:%S.000000000Z"), each_note.name, each_note.note])
 
         if notes_list:
             return jsonify(notes_list)
@@ -934,6 +1001,55 @@ def daemon_active():
         return '0'
 
 
+@blueprint.route('/metrics')
+@flask_login.login_required
+def controller_metrics():
+    """Return the timing metrics of the daemon's controllers in the Prometheus text format."""
+    try:
+        control = DaemonControl()
+        metrics = control.get_controller_metrics()
+        lock_stats = control.get_lock_stats()
+        bus_stats = control.get_bus_stats()
+        mqtt_stats = control.get_mqtt_stats()
+        notification_stats = control.get_notification_stats()
+    except Exception as e:
+        logger.error("URL for 'controller_metrics' raised and error: "
+                     "{err}".format(err=e))
+        return 'Could not retrieve metrics from the daemon', 503
+    return Response(format_prometheus(metrics) +
+                    format_prometheus_locks(lock_stats) +
+                    format_prometheus_buses(bus_stats) +
+                    format_prometheus_mqtt(mqtt_stats) +
+                    format_prometheus_notifications(notification_stats),
+                    mimetype='text/plain; version=0.0.4')
+
+
+@blueprint.route('/profile_controller/<unique_id>/<seconds>')
+@flask_login.login_required
+def profile_controller(unique_id, seconds):
+    """Sample a running controller's stack and return a collapsed stack file (for flame graphs)."""
+    if not utils_general.user_has_permission('edit_controllers'):
+        return redirect(url_for('routes_general.home'))
+
+    if not str_is_float(seconds) or not 0 < float(seconds) <= MAX_PROFILE_SECONDS:
+        return 'Seconds must be greater than 0 and no more than {}'.format(MAX_PROFILE_SECONDS), 400
+
+    try:
+        control = DaemonControl()
+        status, profile = control.profile_controller(unique_id, float(seconds))
+    except Exception as e:
+        logger.error("URL for 'profile_controller' raised and error: "
+                     "{err}".format(err=e))
+        return 'Could not profile the controller: {}'.format(e), 503
+    if status:
+        return profile, 400
+
+    response = Response(profile, mimetype='text/plain')
+    response.headers['Content-Disposition'] = 'attachment; filename="profile_{id}_{ts}.collapsed"'.format(
+        id=unique_id.split('-')[0], ts=datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S'))
+    return response
+
+
 @blueprint.route('/systemctl/<action>')
 @flask_login.login_required
 def computer_command(action):
@@ -46,6 +46,7 @@ from mycodo.mycodo_flask.utils import utils_input
 from mycodo.mycodo_flask.utils import utils_math
 from mycodo.mycodo_flask.utils.utils_general import generate_form_action_list
 from mycodo.utils.actions import parse_action_information
+from mycodo.utils.input_worker import can_isolate
 from mycodo.utils.inputs import parse_input_information
 from mycodo.utils.outputs import output_types
 from mycodo.utils.outputs import parse_output_information
@@ -425,6 +426,7 @@ def page_input():
         return render_template('pages/input.html',
                                and_=and_,
                                action=action,
+                               can_isolate=can_isolate,
                                choices_actions=choices_actions,
                                choices_function=choices_function,
                                choices_input=choices_input,
@@ -483,6 +485,7 @@ def page_input():
         return render_template('pages/data_options/input_entry.html',
                                and_=and_,
                                action=action,
+                               can_isolate=can_isolate,
                                choices_actions=choices_actions,
                                choices_function=choices_function,
                                choices_input=choices_input,
@@ -541,6 +544,7 @@ def page_input():
         return render_template('pages/data_options/input_options.html',
                                and_=and_,
                                action=action,
+                               can_isolate=can_isolate,
                                choices_actions=choices_actions,
                                choices_function=choices_function,
                                choices_input=choices_input,
@@ -125,6 +125,7 @@ def method_builder(method_id):
                 form_fail = utils_method.method_add(form_add_method)
             elif form_name in ['modMethod', 'renameMethod']:
                 form_fail = utils_method.method_mod(form_mod_method)
+            utils_method.method_refresh_daemon(method.unique_id)
             if (form_name in ['addMethod', 'modMethod', 'renameMethod'] and
                     not form_fail):
                 return redirect('/method-build/{method_id}'.format(
@@ -191,6 +192,7 @@ def method_builder(method_id):
                 form_fail = utils_method.method_add(form_add_method)
             elif form_name in ['modMethod', 'renameMethod']:
                 form_fail = utils_method.method_mod(form_mod_method)
+            utils_method.method_refresh_daemon(method.unique_id)
             if (form_name in ['addMethod', 'modMethod', 'renameMethod'] and
                     not form_fail):
                 return redirect('/method-build/{method_id}'.format(
@@ -238,6 +240,7 @@ def method_delete(method_id):
         display_order.remove(method_id)
         DisplayOrder.query.first().method = list_to_csv(display_order)
         db.session.commit()
+        utils_method.method_refresh_daemon(method_id)
         flash("Success: {action}".format(action=action), "success")
     except Exception as except_msg:
         flash("Error: {action}: {err}".format(action=action,
@@ -2,7 +2,6 @@
 """collection of Page endpoints."""
 import calendar
 import datetime
-import glob
 import logging
 import os
 import resource
@@ -24,15 +23,12 @@ from flask import send_file
 from flask import url_for
 from flask.blueprints import Blueprint
 from flask_babel import gettext
-from sqlalchemy import and_
 
 from mycodo.config import ALEMBIC_VERSION
 from mycodo.config import BACKUP_LOG_FILE
 from mycodo.config import CAMERA_INFO
 from mycodo.config import DAEMON_LOG_FILE
-from mycodo.config import DAEMON_PID_FILE
 from mycodo.config import DEPENDENCY_LOG_FILE
-from mycodo.config import FRONTEND_PID_FILE
 from mycodo.config import HTTP_ACCESS_LOG_FILE
 from mycodo.config import HTTP_ERROR_LOG_FILE
 from mycodo.config import KEEPUP_LOG_FILE
@@ -65,6 +61,7 @@ from mycodo.databases.models import PID
 from mycodo.databases.models import Unit
 from mycodo.databases.models import Widget
 from mycodo.devices.camera import camera_record
+from mycodo.devices.camera_service import SERVICE_LIBRARIES
 from mycodo.mycodo_client import DaemonControl
 from mycodo.mycodo_client import daemon_active
 from mycodo.mycodo_flask.extensions import db
@@ -81,11 +78,16 @@ from mycodo.mycodo_flask.utils import utils_lcd
 from mycodo.mycodo_flask.utils import utils_misc
 from mycodo.mycodo_flask.utils import utils_notes
 from mycodo.mycodo_flask.utils.utils_general import return_dependencies
+from mycodo.mycodo_flask.utils.utils_render_context import get_render_context
 from mycodo.utils.functions import parse_function_information
 from mycodo.utils.inputs import list_analog_to_digital_converters
 from mycodo.utils.inputs import parse_input_information
+from mycodo.utils.log_reader import follow
+from mycodo.utils.log_reader import read_lines
 from mycodo.utils.outputs import output_types
 from mycodo.utils.outputs import parse_output_information
+from mycodo.utils.system_info import format_process
+from mycodo.utils.system_info import system_info_collector
 from mycodo.utils.system_pi import add_custom_measurements
 from mycodo.utils.system_pi import add_custom_units
 from mycodo.utils.system_pi import csv_to_list_of_str
@@ -103,6 +105,26 @@ blueprint = Blueprint('routes_page',
                       static_folder='../static',
                       template_folder='../templates')
 
+# Logs that can be viewed: log field: (log file, phrase lines must contain)
+LOG_FILES = {
+    'log_backup': (BACKUP_LOG_FILE, None),
+    'log_daemon': (DAEMON_LOG_FILE, None),
+    'log_dependency': (DEPENDENCY_LOG_FILE, None),
+    'log_http_access': (HTTP_ACCESS_LOG_FILE, None),
+    'log_http_error': (HTTP_ERROR_LOG_FILE, None),
+    'log_keepup': (KEEPUP_LOG_FILE, None),
+    'log_login': (LOGIN_LOG_FILE, None),
+    'log_pid_settings': (DAEMON_LOG_FILE, 'PID Settings'),
+    'log_restore': (RESTORE_LOG_FILE, None),
+    'log_upgrade': (UPGRADE_LOG_FILE, None)
+}
+
+# Logs of services, read with journalctl: log field: service
+LOG_SERVICES = {
+    'log_flask': 'mycodoflask',
+    'log_nginx': 'nginx'
+}
+
 
 @blueprint.context_processor
 @flask_login.login_required
@@ -223,8 +245,9 @@ def page_camera():
         if form_camera.camera_add.data:
             unmet_dependencies = utils_camera.camera_add(form_camera)
         elif form_camera.capture_still.data:
-            # If a stream is active, stop the stream to take a photo
-            if mod_camera.stream_started:
+            # If a stream is active, stop the stream to take a photo (unless
+            # both are served by the camera's capture service)
+            if mod_camera.stream_started and mod_camera.library not in SERVICE_LIBRARIES:
                 camera_stream = import_module(
                     'mycodo.mycodo_flask.camera.camera_{lib}'.format(
                         lib=mod_camera.library)).Camera
@@ -233,7 +256,7 @@ def page_camera():
                 time.sleep(2)
             camera_record('photo', mod_camera.unique_id)
         elif form_camera.start_timelapse.data:
-            if mod_camera.stream_started:
+            if mod_camera.stream_started and mod_camera.library not in SERVICE_LIBRARIES:
                 flash(gettext("Cannot start time-lapse if stream is active."), "error")
                 return redirect(url_for('routes_page.page_camera'))
             now = time.time()
@@ -266,7 +289,7 @@ def page_camera():
             db.session.commit()
             control.refresh_daemon_camera_settings()
         elif form_camera.start_stream.data:
-            if mod_camera.timelapse_started:
+            if mod_camera.timelapse_started and mod_camera.library not in SERVICE_LIBRARIES:
                 flash(gettext(
                     "Cannot start stream if time-lapse is active."), "error")
                 return redirect(url_for('routes_page.page_camera'))
@@ -274,11 +297,12 @@ def page_camera():
                 mod_camera.stream_started = True
                 db.session.commit()
         elif form_camera.stop_stream.data:
-            camera_stream = import_module(
-                'mycodo.mycodo_flask.camera.camera_{lib}'.format(
-                    lib=mod_camera.library)).Camera
-            if camera_stream(unique_id=mod_camera.unique_id).is_running(mod_camera.unique_id):
-                camera_stream(unique_id=mod_camera.unique_id).stop(mod_camera.unique_id)
+            if mod_camera.library not in SERVICE_LIBRARIES:
+                camera_stream = import_module(
+                    'mycodo.mycodo_flask.camera.camera_{lib}'.format(
+                        lib=mod_camera.library)).Camera
+                if camera_stream(unique_id=mod_camera.unique_id).is_running(mod_camera.unique_id):
+                    camera_stream(unique_id=mod_camera.unique_id).stop(mod_camera.unique_id)
             mod_camera.stream_started = False
             db.session.commit()
 
@@ -318,6 +342,7 @@ def page_camera():
                            output=output,
                            pi_camera_enabled=pi_camera_enabled,
                            time_lapse_imgs=time_lapse_imgs,
+                           time_lapse_videos=utils_general.get_camera_timelapse_videos(),
                            time_now=time_now)
 
 
@@ -658,87 +683,11 @@ def page_info():
 
     virtualenv_flask = False
     virtualenv_daemon = False
-    daemon_pid = None
-    pstree_daemon_output = None
-    top_daemon_output = None
-    frontend_pid = None
-    pstree_frontend_output = None
-    top_frontend_output = None
-
-    uptime = subprocess.Popen(
-        "uptime", stdout=subprocess.PIPE, shell=True)
-    (uptime_output, _) = uptime.communicate()
-    uptime.wait()
-    if uptime_output:
-        uptime_output = uptime_output.decode("latin1")
-
-    uname = subprocess.Popen(
-        "uname -a", stdout=subprocess.PIPE, shell=True)
-    (uname_output, _) = uname.communicate()
-    uname.wait()
-    if uname_output:
-        uname_output = uname_output.decode("latin1")
-
-    if not current_app.config['TESTING']:
-        gpio = subprocess.Popen(
-            "gpio readall", stdout=subprocess.PIPE, shell=True)
-        (gpio_output, _) = gpio.communicate()
-        gpio.wait()
-        if gpio_output:
-            gpio_output = gpio_output.decode("latin1")
-    else:
-        gpio_output = ''
 
-        # Search for /dev/i2c- devices and compile a sorted dictionary of each
-    # device's integer device number and the corresponding 'i2cdetect -y ID'
-    # output for display on the info page
-    i2c_devices_sorted = {}
+    # Sampled in the background, so the page doesn't wait for commands to run
     if not current_app.config['TESTING']:
-        try:
-            i2c_devices = glob.glob("/dev/i2c-*")
-            i2c_devices_sorted = OrderedDict()
-            for each_dev in i2c_devices:
-                device_int = int(each_dev.replace("/dev/i2c-", ""))
-                i2cdetect = subprocess.Popen(
-                    "i2cdetect -y {dev}".format(dev=device_int),
-                    stdout=subprocess.PIPE,
-                    shell=True)
-                (i2cdetect_out, _) = i2cdetect.communicate()
-                i2cdetect.wait()
-                if i2cdetect_out:
-                    i2c_devices_sorted[device_int] = i2cdetect_out.decode("latin1")
-        except Exception as er:
-            flash("Error detecting I2C devices: {er}".format(er=er), "error")
-        finally:
-            i2c_devices_sorted = OrderedDict(sorted(i2c_devices_sorted.items()))
-
-    df = subprocess.Popen(
-        "df -h", stdout=subprocess.PIPE, shell=True)
-    (df_output, _) = df.communicate()
-    df.wait()
-    if df_output:
-        df_output = df_output.decode("latin1")
-
-    free = subprocess.Popen(
-        "free -h", stdout=subprocess.PIPE, shell=True)
-    (free_output, _) = free.communicate()
-    free.wait()
-    if free_output:
-        free_output = free_output.decode("latin1")
-
-    dmesg = subprocess.Popen(
-        "dmesg | tail -n 20", stdout=subprocess.PIPE, shell=True)
-    (dmesg_output, _) = dmesg.communicate()
-    dmesg.wait()
-    if dmesg_output:
-        dmesg_output = dmesg_output.decode("latin1")
-
-    ifconfig = subprocess.Popen(
-        "ifconfig -a", stdout=subprocess.PIPE, shell=True)
-    (ifconfig_output, _) = ifconfig.communicate()
-    ifconfig.wait()
-    if ifconfig_output:
-        ifconfig_output = ifconfig_output.decode("latin1")
+        system_info_collector.start()
+    system_info = system_info_collector.get_snapshot()
 
     database_version = AlembicVersion.query.first().version_num
     correct_database_version = ALEMBIC_VERSION
@@ -746,10 +695,6 @@ def page_info():
     if hasattr(sys, 'real_prefix') or sys.base_prefix != sys.prefix:
         virtualenv_flask = True
 
-    if os.path.exists(DAEMON_PID_FILE):
-        with open(DAEMON_PID_FILE, 'r') as pid_file:
-            daemon_pid = int(pid_file.read())
-
     if not current_app.config['TESTING']:
         daemon_up = daemon_active()
     else:
@@ -759,17 +704,15 @@ def page_info():
         control = DaemonControl()
         ram_use_daemon = control.ram_use()
         virtualenv_daemon = control.is_in_virtualenv()
-
-        pstree_daemon_output, top_daemon_output = output_pstree_top(daemon_pid)
     else:
         ram_use_daemon = 0
 
-    if os.path.exists(FRONTEND_PID_FILE):
-        with open(FRONTEND_PID_FILE, 'r') as pid_file:
-            frontend_pid = int(pid_file.read())
-
-    if frontend_pid:
-        pstree_frontend_output, top_frontend_output = output_pstree_top(frontend_pid)
+    processes_daemon = None
+    processes_frontend = None
+    if system_info['daemon']:
+        processes_daemon = format_process(system_info['daemon'])
+    if system_info['frontend']:
+        processes_frontend = format_process(system_info['frontend'])
 
     ram_use_flask = resource.getrusage(
         resource.RUSAGE_SELF).ru_maxrss / float(1000)
@@ -777,66 +720,45 @@ def page_info():
     python_version = sys.version
 
     return render_template('pages/info.html',
-                           daemon_pid=daemon_pid,
+                           daemon_pid=system_info['daemon']['pid'] if system_info['daemon'] else None,
                            daemon_up=daemon_up,
-                           gpio_readall=gpio_output,
+                           gpio_readall=system_info['gpio_readall'],
                            database_version=database_version,
                            correct_database_version=correct_database_version,
-                           df=df_output,
-                           dmesg_output=dmesg_output,
-                           free=free_output,
-                           frontend_pid=frontend_pid,
-                           i2c_devices_sorted=i2c_devices_sorted,
-                           ifconfig=ifconfig_output,
-                           pstree_daemon=pstree_daemon_output,
-                           pstree_frontend=pstree_frontend_output,
+                           df=system_info['df'],
+                           dmesg_output=system_info['dmesg'],
+                           free=system_info['free'],
+                           frontend_pid=system_info['frontend']['pid'] if system_info['frontend'] else None,
+                           history=system_info_collector.get_history(),
+                           i2c_devices_sorted=system_info['i2c_devices'],
+                           ifconfig=system_info['ifconfig'],
+                           processes_daemon=processes_daemon,
+                           processes_frontend=processes_frontend,
                            python_version=python_version,
                            ram_use_daemon=ram_use_daemon,
                            ram_use_flask=ram_use_flask,
-                           top_daemon=top_daemon_output,
-                           top_frontend=top_frontend_output,
-                           uname=uname_output,
-                           uptime=uptime_output,
+                           system_info_time=datetime.datetime.fromtimestamp(
+                               system_info['time']).strftime('%Y-%m-%d %H:%M:%S'),
+                           uname=system_info['uname'],
+                           uptime=system_info['uptime'],
                            virtualenv_daemon=virtualenv_daemon,
                            virtualenv_flask=virtualenv_flask)
 
 
-def output_pstree_top(pid):
-    pstree = subprocess.Popen(
-        "pstree -p {pid}".format(pid=pid), stdout=subprocess.PIPE, shell=True)
-    (pstree_output, _) = pstree.communicate()
-    pstree.wait()
-    if pstree_output:
-        pstree_output = pstree_output.decode("latin1")
-
-    top = subprocess.Popen(
-        "top -bH -n 1 -p {pid}".format(pid=pid), stdout=subprocess.PIPE, shell=True)
-    (top_output, _) = top.communicate()
-    top.wait()
-    if top_output:
-        top_output = top_output.decode("latin1")
-
-    return pstree_output, top_output
-
-
 @blueprint.route('/lcd', methods=('GET', 'POST'))
 @flask_login.login_required
 def page_lcd():
     """Display LCD output settings."""
+    context = get_render_context()
     lcd = LCD.query.all()
     lcd_data = LCDData.query.all()
-    math = Math.query.all()
-    pid = PID.query.all()
-    output = Output.query.all()
-    input_dev = Input.query.all()
-
-    display_order = csv_to_list_of_str(DisplayOrder.query.first().lcd)
 
-    dict_units = add_custom_units(Unit.query.all())
-    dict_measurements = add_custom_measurements(Measurement.query.all())
+    display_order = csv_to_list_of_str(context.display_order.lcd)
 
-    choices_lcd = utils_general.choices_lcd(
-        input_dev, math, pid, output, dict_units, dict_measurements)
+    choices_lcd = context.cached(
+        'choices_lcd', utils_general.choices_lcd,
+        context.input_dev, context.math, context.pid, context.output,
+        context.dict_units, context.dict_measurements)
 
     form_lcd_add = forms_lcd.LCDAdd()
     form_lcd_mod = forms_lcd.LCDMod()
@@ -883,11 +805,11 @@ def page_lcd():
                            lcd=lcd,
                            lcd_data=lcd_data,
                            lcd_info=LCD_INFO,
-                           math=math,
-                           measurements=parse_input_information(),
-                           pid=pid,
-                           output=output,
-                           sensor=input_dev,
+                           math=context.math,
+                           measurements=context.cached('dict_inputs', parse_input_information),
+                           pid=context.pid,
+                           output=context.output,
+                           sensor=context.input_dev,
                            display_order=display_order,
                            form_lcd_add=form_lcd_add,
                            form_lcd_mod=form_lcd_mod,
@@ -898,59 +820,40 @@ def page_lcd():
 @flask_login.login_required
 def page_live():
     """Page of recent and updating input data."""
-    # Get what each measurement uses for a unit
-    function = CustomController.query.all()
-    device_measurements = DeviceMeasurements.query.all()
-    input_dev = Input.query.all()
-    output = Output.query.all()
-    math = Math.query.all()
+    context = get_render_context()
 
-    activated_inputs = Input.query.filter(Input.is_activated).count()
-    activated_functions = CustomController.query.filter(CustomController.is_activated).count()
-
-    use_unit = utils_general.use_unit_generate(
-        device_measurements, input_dev, output, math, function)
+    activated_inputs = sorted(
+        [each_input for each_input in context.input_dev if each_input.is_activated],
+        key=lambda each_input: each_input.position_y or 0)
+    activated_functions = sorted(
+        [each_function for each_function in context.function if each_function.is_activated],
+        key=lambda each_function: each_function.position_y or 0)
 
     # Display orders
-    display_order_input = csv_to_list_of_str(DisplayOrder.query.first().inputs)
-    display_order_function = csv_to_list_of_str(DisplayOrder.query.first().function)
-
-    # Generate all measurement and units used
-    dict_measurements = add_custom_measurements(Measurement.query.all())
-    dict_units = add_custom_units(Unit.query.all())
-
-    dict_controllers = parse_function_information()
+    display_order_input = csv_to_list_of_str(context.display_order.inputs)
+    display_order_function = csv_to_list_of_str(context.display_order.function)
 
-    custom_options_values_controllers = parse_custom_option_values(
-        function, dict_controller=dict_controllers)
+    dict_controllers = context.cached('dict_controllers', parse_function_information)
 
-    dict_measure_measurements = {}
-    dict_measure_units = {}
-
-    for each_measurement in device_measurements:
-        conversion = Conversion.query.filter(
-            Conversion.unique_id == each_measurement.conversion_id).first()
-        _, unit, measurement = return_measurement_info(each_measurement, conversion)
-        dict_measure_measurements[each_measurement.unique_id] = measurement
-        dict_measure_units[each_measurement.unique_id] = unit
+    custom_options_values_controllers = context.cached(
+        'custom_options_values_controllers', parse_custom_option_values,
+        context.function, dict_controller=dict_controllers)
 
     return render_template('pages/live.html',
-                           and_=and_,
                            activated_inputs=activated_inputs,
                            activated_functions=activated_functions,
                            custom_options_values_controllers=custom_options_values_controllers,
-                           table_device_measurements=DeviceMeasurements,
-                           table_input=Input,
-                           table_function=CustomController,
-                           dict_measurements=dict_measurements,
-                           dict_units=dict_units,
-                           dict_measure_measurements=dict_measure_measurements,
-                           dict_measure_units=dict_measure_units,
+                           measurements_by_device=context.measurements_by_device,
+                           dict_measurements=context.dict_measurements,
+                           dict_units=context.dict_units,
+                           dict_measure_measurements=context.dict_measure_measurements,
+                           dict_measure_units=context.dict_measure_units,
                            display_order_input=display_order_input,
                            display_order_function=display_order_function,
-                           list_devices_adc=list_analog_to_digital_converters(),
+                           list_devices_adc=context.cached(
+                               'list_devices_adc', list_analog_to_digital_converters),
                            measurement_units=MEASUREMENTS,
-                           use_unit=use_unit)
+                           use_unit=context.use_unit)
 
 
 @blueprint.route('/logview', methods=('GET', 'POST'))
@@ -971,62 +874,27 @@ def page_logview():
 
         # Log fie requested
         if form_log_view.log_view.data:
-            command = None
             log_field = form_log_view.log.data
 
-            # Find which log file was requested, generate command to execute
-            if form_log_view.log.data == 'log_pid_settings':
-                logfile = DAEMON_LOG_FILE
-                logrotate_file = logfile + '.1'
-                if (logrotate_file and os.path.exists(logrotate_file) and
-                        logfile and os.path.isfile(logfile)):
-                    command = 'cat {lrlog} {log} | grep -a "PID Settings" | tail -n {lines}'.format(
-                        lrlog=logrotate_file, log=logfile, lines=lines)
-                else:
-                    command = 'grep -a "PID Settings" {log} | tail -n {lines}'.format(
-                        lines=lines, log=logfile)
-            elif form_log_view.log.data == 'log_nginx':
-                command = 'journalctl -u nginx | tail -n {lines}'.format(
-                    lines=lines)
-            elif form_log_view.log.data == 'log_flask':
-                command = 'journalctl -u mycodoflask | tail -n {lines}'.format(
-                    lines=lines)
-            else:
-                if form_log_view.log.data == 'log_login':
-                    logfile = LOGIN_LOG_FILE
-                elif form_log_view.log.data == 'log_http_access':
-                    logfile = HTTP_ACCESS_LOG_FILE
-                elif form_log_view.log.data == 'log_http_error':
-                    logfile = HTTP_ERROR_LOG_FILE
-                elif form_log_view.log.data == 'log_daemon':
-                    logfile = DAEMON_LOG_FILE
-                elif form_log_view.log.data == 'log_dependency':
-                    logfile = DEPENDENCY_LOG_FILE
-                elif form_log_view.log.data == 'log_keepup':
-                    logfile = KEEPUP_LOG_FILE
-                elif form_log_view.log.data == 'log_backup':
-                    logfile = BACKUP_LOG_FILE
-                elif form_log_view.log.data == 'log_restore':
-                    logfile = RESTORE_LOG_FILE
-                elif form_log_view.log.data == 'log_upgrade':
-                    logfile = UPGRADE_LOG_FILE
-
-                logrotate_file = logfile + '.1'
-                if (logrotate_file and os.path.exists(logrotate_file) and
-                        logfile and os.path.isfile(logfile)):
-                    command = 'cat {lrlog} {log} | tail -n {lines}'.format(
-                        lrlog=logrotate_file, log=logfile, lines=lines)
-                elif os.path.isfile(logfile):
-                    command = 'tail -n {lines} {log}'.format(lines=lines,
-                                                             log=logfile)
-
-            # Execute command and generate the output to display to the user
-            if command:
+            if log_field in LOG_SERVICES:
                 log = subprocess.Popen(
-                    command, stdout=subprocess.PIPE, shell=True)
+                    ['journalctl', '-u', LOG_SERVICES[log_field], '-n', str(lines), '--no-pager'],
+                    stdout=subprocess.PIPE)
                 (log_output, _) = log.communicate()
                 log.wait()
                 log_output = str(log_output, 'latin-1')
+            elif log_field in LOG_FILES:
+                logfile, phrase = LOG_FILES[log_field]
+                log_lines = read_lines(
+                    logfile, lines,
+                    controller=form_log_view.controller.data,
+                    level=form_log_view.level.data,
+                    phrase=phrase)
+                if log_lines is None:
+                    log_output = 404
+                else:
+                    log_output = ''.join(
+                        '{}\n'.format(str(each_line, 'latin-1')) for each_line in log_lines)
             else:
                 log_output = 404
 
@@ -1038,6 +906,30 @@ def page_logview():
                            log_output=log_output)
 
 
+@blueprint.route('/logview_follow')
+@flask_login.login_required
+def page_logview_follow():
+    """Return the lines added to a log file since the offset of the last request (to follow the log)."""
+    if not utils_general.user_has_permission('view_logs'):
+        return '', 403
+    log_field = request.args.get('log')
+    if log_field not in LOG_FILES:
+        return '', 404
+    logfile, phrase = LOG_FILES[log_field]
+    log_lines, offset, inode = follow(
+        logfile,
+        offset=request.args.get('offset', default=None, type=int),
+        inode=request.args.get('inode', default=None, type=int),
+        controller=request.args.get('controller'),
+        level=request.args.get('level'),
+        phrase=phrase)
+    return jsonify({
+        'lines': [str(each_line, 'latin-1') for each_line in log_lines],
+        'offset': offset,
+        'inode': inode
+    })
+
+
 @blueprint.route('/usage', methods=('GET', 'POST'))
 @flask_login.login_required
 def page_usage():
@@ -18,11 +18,14 @@ from mycodo.config import PATH_INPUTS_CUSTOM
 from mycodo.config import PATH_OUTPUTS_CUSTOM
 from mycodo.config import PATH_WIDGETS_CUSTOM
 from mycodo.config import THEMES
+from mycodo.databases.models import Conditional
 from mycodo.databases.models import Conversion
+from mycodo.databases.models import CustomController
 from mycodo.databases.models import Measurement
 from mycodo.databases.models import Misc
 from mycodo.databases.models import Role
 from mycodo.databases.models import SMTP
+from mycodo.databases.models import Trigger
 from mycodo.databases.models import Unit
 from mycodo.databases.models import User
 from mycodo.mycodo_flask.forms import forms_settings
@@ -589,6 +592,16 @@ def settings_pi():
     elif os.path.exists('/etc/systemd/system/pigpiod.service'):
         pigpiod_sample_rate = 'low'
 
+    # Controllers whose Actions may be executed when deadlines are missed
+    deadline_alert_controllers = []
+    for each_table, each_type in [(Conditional, 'Conditional'),
+                                  (Trigger, 'Trigger'),
+                                  (CustomController, 'Function')]:
+        for each_controller in each_table.query.all():
+            deadline_alert_controllers.append((
+                each_controller.unique_id,
+                '[{}] {}'.format(each_type, each_controller.name)))
+
     if request.method == 'POST':
         if not utils_general.user_has_permission('edit_settings'):
             return redirect(url_for('routes_general.home'))
@@ -599,6 +612,7 @@ def settings_pi():
         return redirect(url_for('routes_settings.settings_pi'))
 
     return render_template('settings/pi.html',
+                           deadline_alert_controllers=deadline_alert_controllers,
                            misc=misc,
                            pi_settings=pi_settings,
                            pigpiod_sample_rate=pigpiod_sample_rate,
@@ -66,6 +66,9 @@ def conditional_mod(form):
         cond_mod.message_include_code = form.message_include_code.data
         cond_mod.start_offset = form.start_offset.data
         cond_mod.pyro_timeout = form.pyro_timeout.data
+        cond_mod.run_on_new_measurement = form.run_on_new_measurement.data
+        cond_mod.new_measurement_debounce = form.new_measurement_debounce.data or 0
+        cond_mod.new_measurement_min_interval = form.new_measurement_min_interval.data or 0
 
         if cmd_status:
             messages["warning"].append("pylint returned with status: {}".format(cmd_status))
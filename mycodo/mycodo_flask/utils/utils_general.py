@@ -1,25 +1,18 @@
 # -*- coding: utf-8 -*-
-import importlib
 import json
 import logging
 import os
 from collections import OrderedDict
 from datetime import datetime
 
-import flask_login
 import sqlalchemy
 from flask import flash
 from flask import redirect
 from flask import request
 from flask_babel import gettext
 from sqlalchemy import and_
+from sqlalchemy.orm import joinedload
 
-from mycodo.config import CAMERA_INFO
-from mycodo.config import DEPENDENCIES_GENERAL
-from mycodo.config import FUNCTION_INFO
-from mycodo.config import LCD_INFO
-from mycodo.config import MATH_INFO
-from mycodo.config import METHOD_INFO
 from mycodo.config import PATH_CAMERAS
 from mycodo.config_devices_units import MEASUREMENTS
 from mycodo.config_devices_units import UNITS
@@ -36,23 +29,20 @@ from mycodo.databases.models import Math
 from mycodo.databases.models import Output
 from mycodo.databases.models import OutputChannel
 from mycodo.databases.models import PID
-from mycodo.databases.models import Role
 from mycodo.databases.models import Trigger
-from mycodo.databases.models import User
 from mycodo.databases.models import Widget
+from mycodo.devices.timelapse_video import segments
+from mycodo.devices.timelapse_video import video_sets
 from mycodo.mycodo_client import DaemonControl
 from mycodo.mycodo_flask.extensions import db
-from mycodo.utils.actions import parse_action_information
+from mycodo.mycodo_flask.utils.utils_permissions import current_principal
+from mycodo.utils.dependency_status import dependency_status
 from mycodo.utils.functions import parse_function_information
-from mycodo.utils.inputs import parse_input_information
-from mycodo.utils.outputs import parse_output_information
 from mycodo.utils.system_pi import add_custom_measurements
 from mycodo.utils.system_pi import add_custom_units
-from mycodo.utils.system_pi import dpkg_package_exists
 from mycodo.utils.system_pi import is_int
 from mycodo.utils.system_pi import return_measurement_info
 from mycodo.utils.system_pi import str_is_float
-from mycodo.utils.widgets import parse_widget_information
 
 logger = logging.getLogger(__name__)
 
@@ -920,12 +910,12 @@ def choices_units(units):
 
 
 def form_input_choices(choices, each_input, dict_units, dict_measurements):
-    device_measurements = DeviceMeasurements.query.filter(
+    device_measurements = DeviceMeasurements.query.options(
+        joinedload(DeviceMeasurements.conversion)).filter(
         DeviceMeasurements.device_id == each_input.unique_id).all()
 
     for each_measure in device_measurements:
-        conversion = Conversion.query.filter(
-            Conversion.unique_id == each_measure.conversion_id).first()
+        conversion = each_measure.conversion
         channel, unit, measurement = return_measurement_info(
             each_measure, conversion)
 
@@ -980,12 +970,12 @@ def form_input_choices_devices(choices, each_input):
 
 
 def form_math_choices(choices, each_math, dict_units, dict_measurements):
-    device_measurements = DeviceMeasurements.query.filter(
+    device_measurements = DeviceMeasurements.query.options(
+        joinedload(DeviceMeasurements.conversion)).filter(
         DeviceMeasurements.device_id == each_math.unique_id).all()
 
     for each_measure in device_measurements:
-        conversion = Conversion.query.filter(
-            Conversion.unique_id == each_measure.conversion_id).first()
+        conversion = each_measure.conversion
         channel, unit, measurement = return_measurement_info(
             each_measure, conversion)
 
@@ -1025,12 +1015,12 @@ def form_math_choices(choices, each_math, dict_units, dict_measurements):
 
 
 def form_function_choices(choices, each_function, dict_units, dict_measurements):
-    device_measurements = DeviceMeasurements.query.filter(
+    device_measurements = DeviceMeasurements.query.options(
+        joinedload(DeviceMeasurements.conversion)).filter(
         DeviceMeasurements.device_id == each_function.unique_id).all()
 
     for each_measure in device_measurements:
-        conversion = Conversion.query.filter(
-            Conversion.unique_id == each_measure.conversion_id).first()
+        conversion = each_measure.conversion
         channel, unit, measurement = return_measurement_info(
             each_measure, conversion)
 
@@ -1070,12 +1060,12 @@ def form_function_choices(choices, each_function, dict_units, dict_measurements)
 
 
 def form_output_choices(choices, each_output, dict_units, dict_measurements):
-    device_measurements = DeviceMeasurements.query.filter(
+    device_measurements = DeviceMeasurements.query.options(
+        joinedload(DeviceMeasurements.conversion)).filter(
         DeviceMeasurements.device_id == each_output.unique_id).all()
 
     for each_measure in device_measurements:
-        conversion = Conversion.query.filter(
-            Conversion.unique_id == each_measure.conversion_id).first()
+        conversion = each_measure.conversion
         channel, unit, measurement = return_measurement_info(
             each_measure, conversion)
 
@@ -1138,12 +1128,12 @@ def form_output_channel_measurement_choices(
     for each_channel in output_channels:
         measurement_channels = dict_outputs[each_output.output_type]['channels_dict'][each_channel.channel]['measurements']
         for measurement_channel in measurement_channels:
-            device_measurement = DeviceMeasurements.query.filter(
+            device_measurement = DeviceMeasurements.query.options(
+                joinedload(DeviceMeasurements.conversion)).filter(
                 and_(DeviceMeasurements.device_id == each_output.unique_id,
                      DeviceMeasurements.channel == measurement_channel)).first()
 
-            conversion = Conversion.query.filter(
-                Conversion.unique_id == device_measurement.conversion_id).first()
+            conversion = device_measurement.conversion
             channel, unit, measurement = return_measurement_info(
                 device_measurement, conversion)
 
@@ -1237,12 +1227,12 @@ def form_output_choices_devices(choices, each_output):
 
 
 def form_pid_choices(choices, each_pid, dict_units, dict_measurements):
-    device_measurements = DeviceMeasurements.query.filter(
+    device_measurements = DeviceMeasurements.query.options(
+        joinedload(DeviceMeasurements.conversion)).filter(
         DeviceMeasurements.device_id == each_pid.unique_id).all()
 
     for each_measure in device_measurements:
-        conversion = Conversion.query.filter(
-            Conversion.unique_id == each_measure.conversion_id).first()
+        conversion = each_measure.conversion
         channel, unit, measurement = return_measurement_info(
             each_measure, conversion)
 
@@ -1340,17 +1330,12 @@ def user_has_permission(permission, silent=False):
     """
     Determine if the currently-logged-in user has permission to perform a
     specific action.
+
+    The permissions of the user's role are loaded once per request (and
+    cached for a few seconds) by current_principal().
     """
-    user = User.query.filter(User.name == flask_login.current_user.name).first()
-    role = Role.query.filter(Role.id == user.role_id).first()
-    if ((permission == 'edit_settings' and role.edit_settings) or
-            (permission == 'edit_controllers' and role.edit_controllers) or
-            (permission == 'edit_users' and role.edit_users) or
-            (permission == 'view_settings' and role.view_settings) or
-            (permission == 'view_camera' and role.view_camera) or
-            (permission == 'view_stats' and role.view_stats) or
-            (permission == 'view_logs' and role.view_logs) or
-            (permission == 'reset_password' and role.reset_password)):
+    principal = current_principal()
+    if principal is not None and permission in principal.permissions:
         return True
     if not silent:
         flash("Insufficient permissions: {}".format(permission), "error")
@@ -1578,6 +1563,17 @@ def get_camera_paths(camera):
     return still_path, tl_path
 
 
+def get_camera_timelapse_videos():
+    """Retrieve the time-lapse sets of each camera that have videos, and the files of their segments."""
+    timelapse_videos = {}
+    for each_camera in Camera.query.all():
+        video_path = os.path.join(PATH_CAMERAS, each_camera.unique_id, 'timelapse_video')
+        timelapse_videos[each_camera.unique_id] = [
+            (each_set, [os.path.basename(each_segment) for each_segment in segments(video_path, each_set)])
+            for each_set in video_sets(video_path)]
+    return timelapse_videos
+
+
 def bytes2human(n, fmt='%(value).1f %(symbol)s', symbols='customary'):
     """
     Convert n bytes into a human-readable string based on fmt.
@@ -1676,98 +1672,11 @@ def get_camera_image_info():
 
 
 def return_dependencies(device_type):
-    unmet_deps = []
-    met_deps = False
-    dep_message = ''
-
-    list_dependencies = [
-        parse_function_information(),
-        parse_action_information(),
-        parse_input_information(),
-        parse_output_information(),
-        parse_widget_information(),
-        CAMERA_INFO,
-        FUNCTION_INFO,
-        LCD_INFO,
-        MATH_INFO,
-        METHOD_INFO,
-        DEPENDENCIES_GENERAL
-    ]
-
-    for each_section in list_dependencies:
-        if device_type in each_section:
-            if "dependencies_message" in each_section[device_type]:
-                dep_message = each_section[device_type]["dependencies_message"]
-
-            for each_device, each_dict in each_section[device_type].items():
-                if not each_dict:
-                    met_deps = True
-                elif each_device == 'dependencies_module':
-                    for (install_type, package, install_id) in each_dict:
-                        entry = (
-                            package, '{0} {1}'.format(install_type, install_id),
-                            install_type,
-                            install_id
-                        )
-                        if install_type in ['pip-pypi', 'pip-git']:
-                            try:
-                                module = importlib.util.find_spec(package)
-                                if module is None:
-                                    if entry not in unmet_deps:
-                                        unmet_deps.append(entry)
-                                else:
-                                    met_deps = True
-                            except ImportError:
-                                if entry not in unmet_deps:
-                                    unmet_deps.append(entry)
-                        elif install_type == 'apt':
-                            if (not dpkg_package_exists(package) and
-                                    entry not in unmet_deps):
-                                unmet_deps.append(entry)
-                            else:
-                                met_deps = True
-                        elif install_type == 'bash-commands':
-                            files_not_found = []
-                            for each_file in package:
-                                if not os.path.isfile(each_file):
-                                    files_not_found.append(each_file.split('/')[-1])
-                            if files_not_found:
-                                if entry not in unmet_deps:
-                                    unmet_deps.append((
-                                        ", ".join(files_not_found),
-                                        install_type,
-                                        install_id
-                                    ))
-                                else:
-                                    met_deps = True
-                        elif install_type == 'internal':
-                            if package.startswith('file-exists'):
-                                filepath = package.split(' ', 1)[1]
-                                if not os.path.isfile(filepath):
-                                    if entry not in unmet_deps:
-                                        unmet_deps.append(entry)
-                                    else:
-                                        met_deps = True
-                            elif package.startswith('pip-exists'):
-                                py_module = package.split(' ', 1)[1]
-                                try:
-                                    module = importlib.util.find_spec(py_module)
-                                    if module is None:
-                                        if entry not in unmet_deps:
-                                            unmet_deps.append(entry)
-                                    else:
-                                        met_deps = True
-                                except ImportError:
-                                    if entry not in unmet_deps:
-                                        unmet_deps.append(entry)
-                            elif package.startswith('apt'):
-                                if (not dpkg_package_exists(package) and
-                                        entry not in unmet_deps):
-                                    unmet_deps.append(entry)
-                                else:
-                                    met_deps = True
-
-    return unmet_deps, met_deps, dep_message
+    """
+    Return the unmet dependencies of a device, whether a dependency is met,
+    and the dependencies message, from the registry of dependency statuses.
+    """
+    return dependency_status.get(device_type)
 
 
 def use_unit_generate(device_measurements, input_dev, output, math, function):
@@ -1779,17 +1688,20 @@ def use_unit_generate(device_measurements, input_dev, output, math, function):
         input_dev, math, function
     ]
 
+    measurements_by_device = {}
+    for each_meas in device_measurements:
+        measurements_by_device.setdefault(each_meas.device_id, []).append(each_meas)
+
     for devices in list_devices_with_measurements:
         for each_device in devices:
             use_unit[each_device.unique_id] = {}
 
-            for each_meas in device_measurements:
-                if each_meas.device_id == each_device.unique_id:
-                    if each_meas.measurement not in use_unit[each_device.unique_id]:
-                        use_unit[each_device.unique_id][each_meas.measurement] = {}
-                    if each_meas.unit not in use_unit[each_device.unique_id][each_meas.measurement]:
-                        use_unit[each_device.unique_id][each_meas.measurement][each_meas.unit] = OrderedDict()
-                    use_unit[each_device.unique_id][each_meas.measurement][each_meas.unit][each_meas.channel] = None
+            for each_meas in measurements_by_device.get(each_device.unique_id, []):
+                if each_meas.measurement not in use_unit[each_device.unique_id]:
+                    use_unit[each_device.unique_id][each_meas.measurement] = {}
+                if each_meas.unit not in use_unit[each_device.unique_id][each_meas.measurement]:
+                    use_unit[each_device.unique_id][each_meas.measurement][each_meas.unit] = OrderedDict()
+                use_unit[each_device.unique_id][each_meas.measurement][each_meas.unit][each_meas.channel] = None
 
     for each_output in output:
         use_unit[each_output.unique_id] = {}
@@ -26,6 +26,7 @@ from mycodo.mycodo_flask.utils.utils_general import custom_options_return_json
 from mycodo.mycodo_flask.utils.utils_general import delete_entry_with_id
 from mycodo.mycodo_flask.utils.utils_general import return_dependencies
 from mycodo.utils.actions import parse_action_information
+from mycodo.utils.input_worker import can_isolate
 from mycodo.utils.inputs import parse_input_information
 from mycodo.utils.system_pi import parse_custom_option_values
 
@@ -408,6 +409,12 @@ def input_mod(form_mod, request_form):
                 form_mod.gpio_location.data is None):
             messages["error"].append(gettext("Pin (GPIO) must be set"))
 
+        if form_mod.isolate_process.data and not can_isolate(mod_input.interface):
+            messages["error"].append(gettext(
+                "Inputs with the %(interface)s interface can't be run in a separate process, "
+                "as they share the bus and device locks of the daemon",
+                interface=mod_input.interface))
+
         mod_input.name = form_mod.name.data
         messages["name"] = form_mod.name.data
 
@@ -443,6 +450,7 @@ def input_mod(form_mod, request_form):
                     each_measurement.is_enabled = False
 
         mod_input.log_level_debug = form_mod.log_level_debug.data
+        mod_input.isolate_process = form_mod.isolate_process.data
         mod_input.i2c_bus = form_mod.i2c_bus.data
         mod_input.baud_rate = form_mod.baud_rate.data
         mod_input.pre_output_duration = form_mod.pre_output_duration.data
@@ -10,6 +10,7 @@ from mycodo.config_translations import TRANSLATIONS
 from mycodo.databases.models import DisplayOrder
 from mycodo.databases.models import Method
 from mycodo.databases.models import MethodData
+from mycodo.mycodo_client import DaemonControl
 from mycodo.mycodo_flask.extensions import db
 from mycodo.mycodo_flask.utils.utils_general import add_display_order
 from mycodo.mycodo_flask.utils.utils_general import delete_entry_with_id
@@ -24,6 +25,15 @@ logger = logging.getLogger(__name__)
 # Method Development
 #
 
+def method_refresh_daemon(method_id):
+    """Instruct the daemon to discard its cached handler for this method."""
+    try:
+        control = DaemonControl()
+        control.refresh_daemon_method_settings(method_id)
+    except Exception:
+        logger.exception("Could not refresh daemon method settings")
+
+
 def is_positive_integer(number_string):
     try:
         if int(number_string) < 0:
@@ -434,6 +444,7 @@ def method_del(method_id):
     try:
         delete_entry_with_id(Method,
                              method_id)
+        method_refresh_daemon(method_id)
     except Exception as except_msg:
         error.append(except_msg)
     flash_success_errors(error, action, url_for('routes_method.method_list'))
@@ -14,14 +14,18 @@ from datetime import datetime
 from flask import flash
 from flask import url_for
 from flask_babel import gettext
+from sqlalchemy import select
+from sqlalchemy import text
 from werkzeug.utils import secure_filename
 
 from mycodo.config import INSTALL_DIRECTORY
 from mycodo.config import PATH_NOTE_ATTACHMENTS
 from mycodo.config_translations import TRANSLATIONS
 from mycodo.databases import set_uuid
+from mycodo.databases.models import NoteTagAssociation
 from mycodo.databases.models import NoteTags
 from mycodo.databases.models import Notes
+from mycodo.databases.models.notes import notes_fts_tokenizer
 from mycodo.mycodo_flask.extensions import db
 from mycodo.mycodo_flask.utils.utils_general import delete_entry_with_id
 from mycodo.mycodo_flask.utils.utils_general import flash_success_errors
@@ -29,6 +33,8 @@ from mycodo.utils.system_pi import assure_path_exists
 
 logger = logging.getLogger(__name__)
 
+notes_fts_tokenizers = {}
+
 #
 # Tags
 #
@@ -88,7 +94,8 @@ def tag_del(form):
         controller=TRANSLATIONS['tag']['title'])
     error = []
 
-    if Notes.query.filter(Notes.tags.ilike("%{0}%".format(form.tag_unique_id.data))).first():
+    if NoteTagAssociation.query.filter(
+            NoteTagAssociation.tag_id == form.tag_unique_id.data).first():
         error.append("Cannot delete tag because it's currently assicuated with at least one note")
 
     if not error:
@@ -311,16 +318,56 @@ def note_del(form):
     flash_success_errors(error, action, url_for('routes_page.page_notes'))
 
 
+def notes_fts_indexed():
+    """Return whether the full-text index of notes can be searched with LIKE patterns."""
+    url = str(db.engine.url)
+    if url not in notes_fts_tokenizers:
+        try:
+            with db.engine.connect() as connection:
+                notes_fts_tokenizers[url] = notes_fts_tokenizer(connection)
+        except Exception:
+            logger.exception("Checking full-text index of notes")
+            notes_fts_tokenizers[url] = None
+    return notes_fts_tokenizers[url] == 'trigram'
+
+
+def filter_text(notes, column, search):
+    """
+    Filter notes by text in a column (name or note), with * and ? wildcards
+
+    The full-text index of notes (trigram tokens) is used when it exists, so
+    searches don't need to scan the text of every note.
+    """
+    if '*' in search or '_' in search:
+        looking_for = search.replace('_', '__') \
+            .replace('*', '%') \
+            .replace('?', '_')
+    else:
+        looking_for = '%{0}%'.format(search)
+
+    if notes_fts_indexed():
+        param = 'search_{}'.format(column)
+        return notes.filter(text(
+            "notes.id IN (SELECT rowid FROM notes_fts WHERE notes_fts.{column} LIKE :{param})".format(
+                column=column, param=param))).params(**{param: looking_for})
+    return notes.filter(getattr(Notes, column).like(looking_for))
+
+
+def notes_with_tag(tag_unique_id, start, end=None):
+    """Return the notes with a tag from start to end (UTC datetimes), oldest first."""
+    notes = Notes.query.join(
+        NoteTagAssociation, NoteTagAssociation.note_id == Notes.unique_id).filter(
+        NoteTagAssociation.tag_id == tag_unique_id,
+        NoteTagAssociation.date_time >= start)
+    if end:
+        notes = notes.filter(NoteTagAssociation.date_time <= end)
+    return notes.order_by(NoteTagAssociation.date_time.asc()).all()
+
+
 def notes_filter(error, form):
     notes = Notes.query
     if form.filter_names.data:
-        if '*' in form.filter_names.data or '_' in form.filter_names.data:
-            looking_for = form.filter_names.data.replace('_', '__') \
-                .replace('*', '%') \
-                .replace('?', '_')
-        else:
-            looking_for = '%{0}%'.format(form.filter_names.data)
-        notes = notes.filter(Notes.note.like(looking_for))
+        notes = filter_text(notes, 'name', form.filter_names.data)
 
     if form.filter_tags.data:
         unique_ids_of_tags = []
@@ -330,19 +377,15 @@ def notes_filter(error, form):
                 unique_ids_of_tags.append(tag.unique_id)
 
         for each_tag_unique_id in unique_ids_of_tags:
-            notes = notes.filter(Notes.tags.like('%{0}%'.format(each_tag_unique_id)))
+            notes = notes.filter(Notes.unique_id.in_(
+                select(NoteTagAssociation.note_id).where(
+                    NoteTagAssociation.tag_id == each_tag_unique_id)))
 
     if form.filter_files.data:
         notes = notes.filter(Notes.tags.in_(form.filter_files.data.split(',')))
 
     if form.filter_notes.data:
-        if '*' in form.filter_notes.data or '_' in form.filter_notes.data:
-            looking_for = form.filter_notes.data.replace('_', '__') \
-                .replace('*', '%') \
-                .replace('?', '_')
-        else:
-            looking_for = '%{0}%'.format(form.filter_notes.data)
-        notes = notes.filter(Notes.note.like(looking_for))
+        notes = filter_text(notes, 'note', form.filter_notes.data)
 
     if form.sort_direction.data == 'desc':
         if form.sort_by.data == 'id':
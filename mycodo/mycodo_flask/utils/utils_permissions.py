@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Users that make requests, loaded with the permissions of their roles
+
+Every request loads its user (by the ID in its session, or by its API key),
+and routes and templates check the permissions of the user's role several
+times per request. Each user is loaded once, with the permissions of its
+role, into a principal that's kept for the request (in flask.g) and by the
+process for PRINCIPAL_TTL seconds. All principals are discarded when a User
+or Role is added, modified, or deleted, so edits take effect immediately
+(and within PRINCIPAL_TTL if they're made by another process).
+"""
+import logging
+import threading
+import time
+
+import flask_login
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import object_session
+
+from mycodo.databases.models import Role
+from mycodo.databases.models import User
+from mycodo.mycodo_flask.extensions import db
+
+logger = logging.getLogger(__name__)
+
+PERMISSIONS = (
+    'edit_controllers',
+    'edit_settings',
+    'edit_users',
+    'reset_password',
+    'view_camera',
+    'view_logs',
+    'view_settings',
+    'view_stats'
+)
+PRINCIPAL_TTL = 10  # seconds
+
+principals_lock = threading.Lock()
+principals = {}
+principals_generation = 0  # Incremented when principals are discarded
+
+
+class Principal:
+    """A user (detached from any session, so it's only read) and the permissions of its role."""
+    def __init__(self, user, role):
+        self.user = user
+        self.permissions = frozenset(
+            each_permission for each_permission in PERMISSIONS
+            if role is not None and getattr(role, each_permission))
+        self.time_loaded = time.time()
+
+
+def discard_principals():
+    """Discard all cached principals (e.g. after users or roles are edited)."""
+    global principals_generation
+    with principals_lock:
+        principals_generation += 1
+        principals.clear()
+
+
+def load_principal(key, criterion):
+    """Return the cached principal of key, or load the user that matches criterion."""
+    with principals_lock:
+        principal = principals.get(key)
+        generation = principals_generation
+    if principal and time.time() - principal.time_loaded < PRINCIPAL_TTL:
+        return principal
+
+    session = Session(bind=db.engine, expire_on_commit=False)
+    try:
+        user = session.query(User).filter(criterion).first()
+        if not user:
+            return
+        role = session.query(Role).filter(Role.id == user.role_id).first()
+    finally:
+        session.close()
+
+    principal = Principal(user, role)
+    with principals_lock:
+        if generation == principals_generation:  # Not loaded before an edit was committed
+            principals[key] = principal
+    return principal
+
+
+def principal_by_id(user_id):
+    """Return the principal of the user with an ID, and use it for the rest of the request."""
+    principal = load_principal(('id', str(user_id)), User.id == user_id)
+    g.principal = principal
+    return principal
+
+
+def principal_by_api_key(api_key):
+    """Return the principal of the user with an API key, and use it for the rest of the request."""
+    principal = load_principal(('api_key', api_key), User.api_key == api_key)
+    g.principal = principal
+    return principal
+
+
+def current_principal():
+    """Return the principal of the currently-logged-in user, or None."""
+    user_id = flask_login.current_user.get_id()
+    if user_id is None:
+        return
+    principal = g.get('principal')
+    if principal is not None and str(principal.user.id) == str(user_id):
+        return principal
+    return principal_by_id(user_id)
+
+
+#
+# Discard principals when users or roles are edited
+#
+
+def user_or_role_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['principals_changed'] = True
+    discard_principals()
+
+
+def session_committed(session):
+    # Also discard principals that were loaded between the flush and the commit
+    if session.info.pop('principals_changed', False):
+        discard_principals()
+
+
+for each_model in (User, Role):
+    for each_event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(each_model, each_event, user_or_role_changed)
+event.listen(Session, 'after_commit', session_committed)
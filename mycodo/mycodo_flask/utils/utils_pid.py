@@ -60,6 +60,9 @@ def pid_mod(form_mod_pid_base,
     mod_pid.log_level_debug = form_mod_pid_base.log_level_debug.data
     mod_pid.start_offset = form_mod_pid_base.start_offset.data
     mod_pid.max_measure_age = form_mod_pid_base.max_measure_age.data
+    mod_pid.run_on_new_measurement = form_mod_pid_base.run_on_new_measurement.data
+    mod_pid.new_measurement_debounce = form_mod_pid_base.new_measurement_debounce.data or 0
+    mod_pid.new_measurement_min_interval = form_mod_pid_base.new_measurement_min_interval.data or 0
     mod_pid.setpoint = form_mod_pid_base.setpoint.data
     mod_pid.band = abs(form_mod_pid_base.band.data)
     mod_pid.send_lower_as_negative = form_mod_pid_base.send_lower_as_negative.data
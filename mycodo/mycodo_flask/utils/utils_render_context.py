@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Settings that pages are rendered with, loaded once per revision of the settings database
+
+Pages such as Live, LCD, and Dashboards show every Input, Function, Math,
+Output, and PID with their measurements, and looking up the measurements,
+conversions, and units of each device while rendering takes queries for every
+measurement. Instead, each table is loaded with one query into dictionaries
+keyed by unique_id, lookups derived from them (measurements of each device,
+units of each measurement, form choices) are generated once, and all of it is
+reused until the settings database changes.
+
+The revision of the settings database is SQLite's data_version, which changes
+when any connection (of the frontend, the daemon, or another process) commits
+a change, so cached settings are never served after they change.
+"""
+import logging
+import sqlite3
+import threading
+
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import joinedload
+
+from mycodo.databases.models import CustomController
+from mycodo.databases.models import DeviceMeasurements
+from mycodo.databases.models import DisplayOrder
+from mycodo.databases.models import Input
+from mycodo.databases.models import Math
+from mycodo.databases.models import Measurement
+from mycodo.databases.models import Output
+from mycodo.databases.models import OutputChannel
+from mycodo.databases.models import PID
+from mycodo.databases.models import Unit
+from mycodo.mycodo_flask.extensions import db
+from mycodo.mycodo_flask.utils.utils_general import use_unit_generate
+from mycodo.utils.system_pi import add_custom_measurements
+from mycodo.utils.system_pi import add_custom_units
+from mycodo.utils.system_pi import return_measurement_info
+
+logger = logging.getLogger(__name__)
+
+
+class SettingsRevision:
+    """Revision of the settings database, which changes when any connection commits a change."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path_db = None
+        self.connection = None
+
+    def get(self):
+        """Return the revision, or None if it can't be determined (settings shouldn't be cached)."""
+        path_db = db.engine.url.database
+        if db.engine.url.get_backend_name() != 'sqlite' or not path_db or path_db == ':memory:':
+            return
+        with self.lock:
+            try:
+                if self.connection is None or self.path_db != path_db:
+                    if self.connection is not None:
+                        self.connection.close()
+                    # This connection never writes, so every commit is by another connection
+                    self.connection = sqlite3.connect(
+                        path_db, check_same_thread=False, isolation_level=None)
+                    self.path_db = path_db
+                data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+                return path_db, id(self.connection), data_version
+            except sqlite3.Error:
+                logger.exception("Getting revision of settings database")
+                self.connection = None
+
+
+class RenderContext:
+    """Rows of the settings tables, keyed by unique_id, and lookups generated from them."""
+    def __init__(self, revision):
+        self.revision = revision
+        self.lock = threading.Lock()
+        self.values = {}
+
+        session = Session(bind=db.engine, expire_on_commit=False)
+        try:
+            self.input_dev = session.query(Input).all()
+            self.function = session.query(CustomController).all()
+            self.math = session.query(Math).all()
+            self.output = session.query(Output).all()
+            self.output_channel = session.query(OutputChannel).all()
+            self.pid = session.query(PID).all()
+            self.device_measurements = session.query(DeviceMeasurements).options(
+                joinedload(DeviceMeasurements.conversion)).order_by(DeviceMeasurements.id).all()
+            self.display_order = session.query(DisplayOrder).first()
+            measurements = session.query(Measurement).all()
+            units = session.query(Unit).all()
+        finally:
+            session.close()  # Rows stay loaded (detached) and are only read from now on
+
+        self.input_dict = {each.unique_id: each for each in self.input_dev}
+        self.function_dict = {each.unique_id: each for each in self.function}
+        self.math_dict = {each.unique_id: each for each in self.math}
+        self.output_dict = {each.unique_id: each for each in self.output}
+        self.output_channel_dict = {each.unique_id: each for each in self.output_channel}
+        self.pid_dict = {each.unique_id: each for each in self.pid}
+        self.device_measurements_dict = {each.unique_id: each for each in self.device_measurements}
+        self.conversion_dict = {
+            each.conversion.unique_id: each.conversion
+            for each in self.device_measurements if each.conversion}
+
+        self.measurements_by_device = {}
+        for each_measurement in self.device_measurements:
+            self.measurements_by_device.setdefault(each_measurement.device_id, []).append(each_measurement)
+
+        self.dict_measurements = add_custom_measurements(measurements)
+        self.dict_units = add_custom_units(units)
+
+        # The measurement and unit of each measurement (of the measurement of its PID, for setpoints)
+        self.dict_measure_measurements = {}
+        self.dict_measure_units = {}
+        for each_measurement in self.device_measurements:
+            measurement = None
+            unit = None
+            if each_measurement.measurement_type == 'setpoint':
+                setpoint_pid = self.pid_dict.get(each_measurement.device_id)
+                if setpoint_pid and ',' in setpoint_pid.measurement:
+                    setpoint_measurement = self.device_measurements_dict.get(
+                        setpoint_pid.measurement.split(',')[1])
+                    if setpoint_measurement:
+                        _, unit, measurement = return_measurement_info(
+                            setpoint_measurement, setpoint_measurement.conversion)
+            else:
+                _, unit, measurement = return_measurement_info(
+                    each_measurement, each_measurement.conversion)
+            if unit:
+                self.dict_measure_measurements[each_measurement.unique_id] = measurement
+                self.dict_measure_units[each_measurement.unique_id] = unit
+
+        self.use_unit = use_unit_generate(
+            self.device_measurements, self.input_dev, self.output, self.math, self.function)
+
+    def cached(self, key, generate, *args, **kwargs):
+        """
+        Return a value generated from the settings (e.g. form choices), generated once per revision
+
+        Cached values are shared by all requests, so they must only be read.
+        """
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = generate(*args, **kwargs)
+            return self.values[key]
+
+
+settings_revision = SettingsRevision()
+render_context_lock = threading.Lock()
+render_context = None
+
+
+def get_render_context():
+    """Return the render context of the current revision of the settings database."""
+    global render_context
+    revision = settings_revision.get()  # Before loading, so changes made while loading are reloaded
+    with render_context_lock:
+        context = render_context
+        if context is None or revision is None or context.revision != revision:
+            context = RenderContext(revision)
+            render_context = context if revision is not None else None
+    return context
@@ -1551,6 +1551,11 @@ def settings_pi_mod(form):
         mod_misc.sample_rate_controller_pid = form.sample_rate_controller_pid.data
         mod_misc.sample_rate_controller_widget = form.sample_rate_controller_widget.data
         db.session.commit()
+    elif form.save_deadline_alert.data:
+        mod_misc = Misc.query.first()
+        mod_misc.deadline_alert_misses = form.deadline_alert_misses.data or 0
+        mod_misc.deadline_alert_function_id = form.deadline_alert_function_id.data or ''
+        db.session.commit()
     elif form.enable_i2c.data:
         _, _, status = cmd_output("raspi-config nonint do_i2c 0", user='root')
         action_str = "Enable I2C"
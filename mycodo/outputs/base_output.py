@@ -22,6 +22,8 @@ from mycodo.databases.models import Output
 from mycodo.databases.models import OutputChannel
 from mycodo.databases.models import Trigger
 from mycodo.mycodo_client import DaemonControl
+from mycodo.utils.async_loop import run_coroutine
+from mycodo.utils.async_loop import submit
 from mycodo.utils.database import db_retrieve_table_daemon
 from mycodo.utils.influx import write_influxdb_value
 from mycodo.utils.outputs import output_types
@@ -692,3 +694,42 @@ class AbstractOutput(AbstractBaseController):
 
     def delete_custom_option(self, option):
         return self._delete_custom_option(Output, self.unique_id, option)
+
+
+class AbstractOutputAsync(AbstractOutput):
+    """
+    Base class of Outputs that communicate with their devices using asyncio
+
+    The coroutines of all async Outputs run on the daemon-wide event loop (see
+    mycodo/utils/async_loop.py). Overwrite output_switch_async() rather than
+    output_switch(), use run_async() to run any other coroutine from the Output's
+    (synchronous) methods, and create_task() for coroutines that run in the
+    background (e.g. periodically polling the device's state).
+    """
+    def __init__(self, output, testing=False, name=__name__):
+        super().__init__(output, testing=testing, name=name)
+        self.async_timeout = 60
+
+    def run_async(self, coroutine, timeout=None):
+        """Run a coroutine on the daemon-wide event loop and return its result."""
+        return run_coroutine(coroutine, timeout=timeout or self.async_timeout)
+
+    @staticmethod
+    def create_task(coroutine):
+        """Run a coroutine on the daemon-wide event loop without waiting for it."""
+        return submit(coroutine)
+
+    def output_switch(self, state, output_type=None, amount=None, duty_cycle=None, output_channel=None):
+        return self.run_async(self.output_switch_async(
+            state,
+            output_type=output_type,
+            amount=amount,
+            duty_cycle=duty_cycle,
+            output_channel=output_channel))
+
+    async def output_switch_async(self, state, output_type=None, amount=None, duty_cycle=None, output_channel=None):
+        self.logger.error(
+            "{cls} did not overwrite the output_switch_async() method. All "
+            "subclasses of the AbstractOutputAsync class are required to overwrite "
+            "this method".format(cls=type(self).__name__))
+        raise NotImplementedError
@@ -3,14 +3,12 @@
 # kp303.py - Output for KP303
 #
 import asyncio
-import threading
-import time
 
 from flask_babel import lazy_gettext
 
 from mycodo.config_translations import TRANSLATIONS
 from mycodo.databases.models import OutputChannel
-from mycodo.outputs.base_output import AbstractOutput
+from mycodo.outputs.base_output import AbstractOutputAsync
 from mycodo.utils.constraints_pass import constraints_pass_positive_value
 from mycodo.utils.database import db_retrieve_table_daemon
 
@@ -155,16 +153,14 @@ OUTPUT_INFORMATION = {
 }
 
 
-class OutputModule(AbstractOutput):
+class OutputModule(AbstractOutputAsync):
     """An output support class that operates an output."""
     def __init__(self, output, testing=False):
         super().__init__(output, testing=testing, name=__name__)
 
         self.strip = None
-        self.outlet_switching = False
-        self.status_thread = None
-        self.outlet_status_checking = False
-        self.timer_status_check = time.time()
+        self.strip_lock = None
+        self.status_task = None
         self.first_connect = True
 
         self.plug_address = None
@@ -186,10 +182,10 @@ class OutputModule(AbstractOutput):
             return
 
         try:
-            self.try_connect()
+            self.run_async(self.try_connect())
 
-            self.status_thread = threading.Thread(target=self.status_update)
-            self.status_thread.start()
+            # Poll the state of the outlets on the daemon's event loop
+            self.status_task = self.create_task(self.status_update())
 
             if self.output_setup:
                 self.logger.debug('Strip setup: {}'.format(self.strip.hw_info))
@@ -202,12 +198,19 @@ class OutputModule(AbstractOutput):
         except Exception as e:
             self.logger.error("setup_output() Error: {err}".format(err=e))
 
-    def try_connect(self):
+    def get_strip_lock(self):
+        # Created on the event loop, the only place it's used
+        if self.strip_lock is None:
+            self.strip_lock = asyncio.Lock()
+        return self.strip_lock
+
+    async def try_connect(self):
         try:
             from kasa import SmartStrip
 
-            self.strip = SmartStrip(self.plug_address)
-            asyncio.run(self.strip.update())
+            async with self.get_strip_lock():
+                self.strip = SmartStrip(self.plug_address)
+                await self.strip.update()
             self.output_setup = True
         except Exception as e:
             if self.first_connect:
@@ -216,30 +219,28 @@ class OutputModule(AbstractOutput):
             else:
                 self.logger.debug("Output was unable to be setup: {err}".format(err=e))
 
-    def output_switch(self, state, output_type=None, amount=None, output_channel=None):
+    def output_switch(self, state, output_type=None, amount=None, duty_cycle=None, output_channel=None):
         if not self.is_setup():
             msg = "Error 101: Device not set up. See https://kizniche.github.io/Mycodo/Error-Codes#error-101 for more info."
             self.logger.error(msg)
             return msg
+        return super().output_switch(
+            state, output_type=output_type, amount=amount, duty_cycle=duty_cycle, output_channel=output_channel)
 
-        while self.outlet_status_checking and self.running:
-            time.sleep(0.1)
-
+    async def output_switch_async(self, state, output_type=None, amount=None, duty_cycle=None, output_channel=None):
         try:
-            self.outlet_switching = True
-            if state == 'on':
-                asyncio.run(self.strip.children[output_channel].turn_on())
-                self.output_states[output_channel] = True
-            elif state == 'off':
-                asyncio.run(self.strip.children[output_channel].turn_off())
-                self.output_states[output_channel] = False
+            async with self.get_strip_lock():
+                if state == 'on':
+                    await self.strip.children[output_channel].turn_on()
+                    self.output_states[output_channel] = True
+                elif state == 'off':
+                    await self.strip.children[output_channel].turn_off()
+                    self.output_states[output_channel] = False
             msg = 'success'
         except Exception as e:
             msg = "State change error: {}".format(e)
             self.logger.error(msg)
             self.output_setup = False
-        finally:
-            self.outlet_switching = False
         return msg
 
     def is_on(self, output_channel=None):
@@ -261,36 +262,29 @@ class OutputModule(AbstractOutput):
                 elif self.options_channels['state_shutdown'][channel] == 0:
                     self.output_switch('off', output_channel=channel)
         self.running = False
+        if self.status_task:
+            self.status_task.cancel()
 
-    def status_update(self):
+    async def status_update(self):
         while self.running:
-            if self.timer_status_check < time.time():
-
-                while self.timer_status_check < time.time():
-                    self.timer_status_check += self.status_update_period
-
-                while self.outlet_switching and self.running:
-                    time.sleep(0.1)
-                self.outlet_status_checking = True
-                self.logger.debug("Checking state of outlets")
+            self.logger.debug("Checking state of outlets")
 
+            if not self.output_setup:
+                await self.try_connect()
                 if not self.output_setup:
-                    self.try_connect()
-                    if not self.output_setup:
-                        self.logger.debug("Could not connect to power strip")
-
-                try:
-                    if self.output_setup:
-                        asyncio.run(self.strip.update())
-                        for channel in channels_dict:
-                            if self.strip.children[channel].is_on:
-                                self.output_states[channel] = True
-                            else:
-                                self.output_states[channel] = False
-                except Exception as e:
-                    self.logger.debug("Could not query power strip status: {}".format(e))
-                    self.output_setup = False
-                finally:
-                    self.outlet_status_checking = False
-
-            time.sleep(1)
+                    self.logger.debug("Could not connect to power strip")
+
+            try:
+                if self.output_setup:
+                    async with self.get_strip_lock():
+                        await self.strip.update()
+                    for channel in channels_dict:
+                        if self.strip.children[channel].is_on:
+                            self.output_states[channel] = True
+                        else:
+                            self.output_states[channel] = False
+            except Exception as e:
+                self.logger.debug("Could not query power strip status: {}".format(e))
+                self.output_setup = False
+
+            await asyncio.sleep(self.status_update_period)
@@ -183,7 +183,7 @@ class OutputModule(AbstractOutput):
             OUTPUT_INFORMATION['custom_channel_options'], output_channels)
 
     def setup_output(self):
-        import paho.mqtt.publish as publish
+        from mycodo.utils import mqtt_connections as publish
 
         self.publish = publish
 
@@ -214,7 +214,8 @@ class OutputModule(AbstractOutput):
                     port=self.options_channels['port'][0],
                     client_id=self.options_channels['clientid'][0],
                     keepalive=self.options_channels['keepalive'][0],
-                    auth=auth_dict)
+                    auth=auth_dict,
+                    owner=self.unique_id)
                 self.output_states[output_channel] = True
             elif state == 'off':
                 self.publish.single(
@@ -224,7 +225,8 @@ class OutputModule(AbstractOutput):
                     port=self.options_channels['port'][0],
                     client_id=self.options_channels['clientid'][0],
                     keepalive=self.options_channels['keepalive'][0],
-                    auth=auth_dict)
+                    auth=auth_dict,
+                    owner=self.unique_id)
                 self.output_states[output_channel] = False
         except Exception as e:
             self.logger.error("State change error: {}".format(e))
@@ -138,7 +138,7 @@ class OutputModule(AbstractOutput):
             OUTPUT_INFORMATION['custom_channel_options'], output_channels)
 
     def setup_output(self):
-        import paho.mqtt.publish as publish
+        from mycodo.utils import mqtt_connections as publish
 
         self.publish = publish
 
@@ -166,7 +166,8 @@ class OutputModule(AbstractOutput):
                     port=self.options_channels['port'][0],
                     client_id=self.options_channels['clientid'][0],
                     keepalive=self.options_channels['keepalive'][0],
-                    auth=auth_dict)
+                    auth=auth_dict,
+                    owner=self.unique_id)
                 self.output_states[output_channel] = amount
                 measure_dict[0]['value'] = amount
             elif state == 'off':
@@ -177,7 +178,8 @@ class OutputModule(AbstractOutput):
                     port=self.options_channels['port'][0],
                     client_id=self.options_channels['clientid'][0],
                     keepalive=self.options_channels['keepalive'][0],
-                    auth=auth_dict)
+                    auth=auth_dict,
+                    owner=self.unique_id)
                 self.output_states[output_channel] = False
                 measure_dict[0]['value'] = self.options_channels['off_value'][0]
         except Exception as e:
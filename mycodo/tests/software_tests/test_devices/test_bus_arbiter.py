@@ -0,0 +1,131 @@
+# coding=utf-8
+"""Tests for the bus arbiter, with a simulated bus."""
+import threading
+import time
+
+import pytest
+
+from mycodo.devices.bus_arbiter import BusArbiter
+from mycodo.devices.bus_arbiter import BusTimeout
+from mycodo.devices.bus_simulated import SimulatedBus
+from mycodo.devices.bus_simulated import SimulatedDevice
+from mycodo.devices.bus_simulated import simulated_query
+from mycodo.utils.locks import lock_manager
+
+
+def wait_for_waiters(lock_name, number, timeout=5):
+    """Wait until a number of threads are waiting for a lock."""
+    end = time.time() + timeout
+    while lock_manager.stats().get(lock_name, {}).get('waiting', 0) < number:
+        assert time.time() < end, "Threads didn't wait for lock {}".format(lock_name)
+        time.sleep(0.001)
+
+
+def test_bus_handed_off_in_order_requested():
+    """Verify the bus is granted to waiting devices in the order they requested it."""
+    arbiter = BusArbiter('TEST', 'fifo')
+    order = []
+    threads = []
+
+    def hold(number):
+        with arbiter.hold():
+            order.append(number)
+
+    with arbiter.hold():
+        for number in range(5):
+            threads.append(threading.Thread(target=hold, args=(number,)))
+            threads[-1].start()
+            wait_for_waiters(arbiter.lock_name, number + 1)
+    for each_thread in threads:
+        each_thread.join()
+
+    assert order == list(range(5))
+    assert arbiter.stats()['steps'] == 6
+
+
+def test_bus_timeout():
+    """Verify waiting for the bus times out, rather than waiting indefinitely."""
+    arbiter = BusArbiter('TEST', 'timeout')
+    result = []
+
+    def hold():
+        try:
+            with arbiter.hold(timeout=0.05):
+                result.append('held')
+        except BusTimeout:
+            result.append('timeout')
+
+    with arbiter.hold():
+        thread = threading.Thread(target=hold)
+        thread.start()
+        thread.join()
+
+    assert result == ['timeout']
+    assert arbiter.stats()['timeouts'] == 1
+
+
+def test_transactions_of_devices_interleave():
+    """Verify the bus is released during conversions, without transfers colliding."""
+    arbiter = BusArbiter('TEST', 'interleave')
+    bus = SimulatedBus()
+    conversion_time = 0.2
+    for address in range(4):
+        bus.add_device(SimulatedDevice(
+            address, conversion_time=conversion_time,
+            respond=lambda command, address=address: '{}-{}'.format(address, command)))
+
+    results = {}
+
+    def query(address):
+        results[address] = simulated_query(bus, arbiter, address)
+
+    threads = [threading.Thread(target=query, args=(address,)) for address in bus.devices]
+    time_start = time.time()
+    for each_thread in threads:
+        each_thread.start()
+    for each_thread in threads:
+        each_thread.join()
+
+    assert time.time() - time_start < conversion_time * len(threads)
+    assert bus.collisions == 0
+    assert results == {address: (1, '{}-R'.format(address)) for address in bus.devices}
+
+
+def test_transactions_of_same_device_exclusive():
+    """Verify concurrent commands to the same device each receive their own response."""
+    arbiter = BusArbiter('TEST', 'exclusive')
+    bus = SimulatedBus()
+    bus.add_device(SimulatedDevice(
+        0x63, conversion_time=0.1, respond=lambda command: 'resp-to-{}'.format(command)))
+
+    commands = ['R', 'Cal,mid,7', 'R', 'I']
+    results = {}
+
+    def query(number):
+        results[number] = simulated_query(bus, arbiter, 0x63, command=commands[number])
+
+    threads = [threading.Thread(target=query, args=(number,)) for number in range(len(commands))]
+    for each_thread in threads:
+        each_thread.start()
+    for each_thread in threads:
+        each_thread.join()
+
+    assert bus.collisions == 0
+    assert results == {
+        number: (1, 'resp-to-{}'.format(command)) for number, command in enumerate(commands)}
+
+
+def test_device_timeout():
+    """Verify waiting for a device that's in a transaction times out."""
+    arbiter = BusArbiter('TEST', 'device_timeout')
+    started = threading.Event()
+
+    def slow_transaction():
+        arbiter.transaction(0x63, [(started.set, 0.3), (lambda: None, 0)])
+
+    thread = threading.Thread(target=slow_transaction)
+    thread.start()
+    started.wait(5)
+    with pytest.raises(BusTimeout):
+        arbiter.transaction(0x63, [(lambda: None, 0)], timeout=0.05)
+    thread.join()
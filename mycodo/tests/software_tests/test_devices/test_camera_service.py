@@ -0,0 +1,81 @@
+# coding=utf-8
+"""Tests for the camera capture service, with a simulated camera."""
+import threading
+import time
+
+import pytest
+
+from mycodo.devices.camera_service import CaptureService
+from mycodo.devices.camera_simulated import SimulatedFrameSource
+from mycodo.devices.camera_simulated import simulated_settings
+
+
+def wait_until(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end, "Condition not met within {} seconds".format(timeout)
+        time.sleep(0.01)
+
+
+def test_still_after_stream(tmp_path):
+    """Verify a still is taken from a frame read after the request, without opening the camera again."""
+    source = SimulatedFrameSource(warmup=0.1)
+    service = CaptureService(simulated_settings(), source=source)
+    try:
+        number = 0
+        for _ in range(3):
+            number, frame = service.stream_frame(after_number=number)
+            assert frame.startswith(b'P6 160 120 255\n')
+
+        path_still = tmp_path / 'still.ppm'
+        service.capture_still(str(path_still))
+
+        assert path_still.read_bytes().startswith(b'P6 160 120 255\n')
+        assert service.frame_number > number
+        assert source.opens == 1
+        assert service.status()['stills'] == 1
+    finally:
+        service.stop()
+    assert not source.is_open
+
+
+def test_close_after_idle_timeout(tmp_path):
+    """Verify the camera is closed when idle, and opened again by the next request."""
+    source = SimulatedFrameSource(warmup=0.1)
+    service = CaptureService(simulated_settings(), source=source, idle_timeout=0.2)
+    try:
+        service.capture_still(str(tmp_path / 'still_1.ppm'))
+        assert source.is_open
+
+        wait_until(lambda: not source.is_open and not service.status()['open'])
+
+        service.capture_still(str(tmp_path / 'still_2.ppm'))
+        assert source.opens == 2
+    finally:
+        service.stop()
+
+
+def test_stop_during_pending_wait():
+    """Verify stopping the service fails a pending request, rather than restarting the camera."""
+    source = SimulatedFrameSource(warmup=0.5)
+    service = CaptureService(simulated_settings(), source=source)
+    errors = []
+
+    def request_frame():
+        try:
+            service.wait_frame(timeout=10)
+        except IOError as err:
+            errors.append(str(err))
+
+    waiter = threading.Thread(target=request_frame)
+    waiter.start()
+    wait_until(lambda: source.is_open)  # Warming up
+    service.stop()
+    waiter.join(10)
+
+    assert not waiter.is_alive()
+    assert len(errors) == 1 and 'was stopped' in errors[0]
+    assert source.opens == 1
+    assert not source.is_open
+    with pytest.raises(IOError):
+        service.start()
@@ -28,6 +28,7 @@ from mycodo.mycodo_client import DaemonControl
 from mycodo.utils.database import db_retrieve_table_daemon
 from mycodo.utils.influx import get_last_measurement
 from mycodo.utils.influx import get_past_measurements
+from mycodo.utils.metrics import controller_metrics
 from mycodo.utils.modules import load_module_from_file
 from mycodo.utils.system_pi import return_measurement_info
 
@@ -344,7 +345,8 @@ def trigger_action(
             if function_action_loaded:
                 run_function_action = function_action_loaded.ActionModule(action)
 
-            message = run_function_action.run_action(message, dict_vars)
+            with controller_metrics.timed(action.function_id, 'trigger_action'):
+                message = run_function_action.run_action(message, dict_vars)
         except:
             message += " Exception executing action: {}".format(traceback.print_exc())
 
@@ -0,0 +1,96 @@
+# coding=utf-8
+"""
+Daemon-wide asyncio event loop
+
+Network-bound Inputs and Outputs (see AbstractInputAsync and AbstractOutputAsync)
+run their coroutines on a single event loop, running in its own thread, rather
+than each creating a new event loop (e.g. with asyncio.run()) for every call.
+Connections (e.g. sessions and transports) may be kept open on the loop between
+calls, and the I/O of all of these devices proceeds concurrently.
+"""
+import asyncio
+import logging
+import threading
+
+from mycodo.utils.logging_utils import set_log_level
+
+logger = logging.getLogger("mycodo.async_loop")
+logger.setLevel(set_log_level(logging))
+
+loop_lock = threading.Lock()
+loop = None
+loop_thread = None
+
+
+def get_event_loop():
+    """Return the daemon-wide event loop, starting it if it isn't running."""
+    global loop, loop_thread
+    with loop_lock:
+        if loop is None or loop_thread is None or not loop_thread.is_alive():
+            loop = asyncio.new_event_loop()
+            loop_thread = threading.Thread(
+                target=run_loop, args=(loop,), name='async_loop', daemon=True)
+            loop_thread.start()
+        return loop
+
+
+def run_loop(event_loop):
+    asyncio.set_event_loop(event_loop)
+    try:
+        event_loop.run_forever()
+    finally:
+        event_loop.close()
+
+
+def submit(coroutine):
+    """
+    Schedule a coroutine on the daemon-wide loop, without waiting for it
+
+    :return: concurrent.futures.Future of the coroutine's result
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, get_event_loop())
+
+
+def run_coroutine(coroutine, timeout=None):
+    """
+    Run a coroutine on the daemon-wide loop and wait for its result
+
+    This must not be called from a coroutine running on the loop (await instead).
+
+    :param coroutine: the coroutine to run
+    :param timeout: Maximum duration to wait for the result (seconds), the
+        coroutine is cancelled if exceeded
+    :return: the return value of the coroutine
+    :raises concurrent.futures.TimeoutError: if the timeout is exceeded
+    """
+    if loop_thread is not None and threading.current_thread() is loop_thread:
+        raise RuntimeError("run_coroutine() called from the event loop's thread")
+    future = submit(coroutine)
+    try:
+        return future.result(timeout)
+    except Exception:
+        future.cancel()
+        raise
+
+
+async def cancel_tasks():
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for each_task in tasks:
+        each_task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def stop_event_loop():
+    """Cancel any remaining tasks and stop the daemon-wide loop (called when the daemon stops)."""
+    global loop, loop_thread
+    with loop_lock:
+        if loop is not None and loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(cancel_tasks(), loop).result(5)
+            except Exception:
+                logger.exception("Cancelling tasks of the event loop")
+            loop.call_soon_threadsafe(loop.stop)
+        if loop_thread is not None:
+            loop_thread.join(5)
+        loop = None
+        loop_thread = None
@@ -1,12 +1,14 @@
 # coding=utf-8
 import logging
 import time
+import timeit
 from sqlite3 import OperationalError
 
 import sqlalchemy
 
 from mycodo.config import SQL_DATABASE_MYCODO
 from mycodo.databases.utils import session_scope
+from mycodo.utils.metrics import controller_metrics
 
 MYCODO_DB_PATH = 'sqlite:///' + SQL_DATABASE_MYCODO
 
@@ -52,6 +54,7 @@ def db_retrieve_table_daemon(
     If device_id is set, the first entry with that device ID is returned.
     Otherwise, the table object is returned.
     """
+    timer = timeit.default_timer()
     tries = 5
     while tries > 0:
         try:
@@ -75,6 +78,7 @@ def db_retrieve_table_daemon(
 
                 new_session.expunge_all()
                 new_session.close()
+            controller_metrics.observe_current('db_query', timeit.default_timer() - timer)
             return return_table
         except OperationalError:
             pass
@@ -93,3 +97,5 @@ def db_retrieve_table_daemon(
 
         time.sleep(1)
         tries -= 1
+
+    controller_metrics.observe_current('db_query', timeit.default_timer() - timer, error=True)
@@ -0,0 +1,325 @@
+# coding=utf-8
+"""
+Registry of whether the dependencies of each device are installed
+
+Checking the dependencies of a device parses the information of every Input,
+Output, Function, Action, and Widget module, and then probes each dependency
+(importlib for pip packages, dpkg for apt packages, and files). Instead, the
+dependencies of all devices are checked at once (each probe only once), and
+pages look up the status of a device in the registry.
+
+The registry is saved with a fingerprint of the module files and of the
+installed pip and apt packages (the modification times of site-packages and
+of the dpkg status), and it's loaded at startup if the fingerprint hasn't
+changed. A background thread checks the fingerprint every CHECK_PERIOD
+seconds, and checks all dependencies again when it changes (e.g. after
+dependencies are installed or a custom module is imported), when refresh()
+is called, or every REFRESH_PERIOD seconds (for dependencies that are files).
+"""
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import site
+import sysconfig
+import threading
+import time
+
+from mycodo.config import CAMERA_INFO
+from mycodo.config import DEPENDENCIES_GENERAL
+from mycodo.config import DEPENDENCY_STATUS_FILE
+from mycodo.config import FUNCTION_INFO
+from mycodo.config import LCD_INFO
+from mycodo.config import MATH_INFO
+from mycodo.config import METHOD_INFO
+from mycodo.config import PATH_ACTIONS
+from mycodo.config import PATH_ACTIONS_CUSTOM
+from mycodo.config import PATH_FUNCTIONS
+from mycodo.config import PATH_FUNCTIONS_CUSTOM
+from mycodo.config import PATH_INPUTS
+from mycodo.config import PATH_INPUTS_CUSTOM
+from mycodo.config import PATH_OUTPUTS
+from mycodo.config import PATH_OUTPUTS_CUSTOM
+from mycodo.config import PATH_WIDGETS
+from mycodo.config import PATH_WIDGETS_CUSTOM
+from mycodo.utils.actions import parse_action_information
+from mycodo.utils.functions import parse_function_information
+from mycodo.utils.inputs import parse_input_information
+from mycodo.utils.logging_utils import set_log_level
+from mycodo.utils.outputs import parse_output_information
+from mycodo.utils.system_pi import dpkg_package_exists
+from mycodo.utils.widgets import parse_widget_information
+
+logger = logging.getLogger("mycodo.dependency_status")
+logger.setLevel(set_log_level(logging))
+
+CHECK_PERIOD = 60  # seconds between checks of the fingerprint
+REFRESH_PERIOD = 3600  # seconds between checks of all dependencies
+PATH_DPKG_STATUS = '/var/lib/dpkg/status'
+MODULE_PATHS = [
+    PATH_ACTIONS, PATH_ACTIONS_CUSTOM,
+    PATH_FUNCTIONS, PATH_FUNCTIONS_CUSTOM,
+    PATH_INPUTS, PATH_INPUTS_CUSTOM,
+    PATH_OUTPUTS, PATH_OUTPUTS_CUSTOM,
+    PATH_WIDGETS, PATH_WIDGETS_CUSTOM
+]
+
+
+def dependency_sections():
+    """Return the information of all devices that may have dependencies."""
+    return [
+        parse_function_information(),
+        parse_action_information(),
+        parse_input_information(),
+        parse_output_information(),
+        parse_widget_information(),
+        CAMERA_INFO,
+        FUNCTION_INFO,
+        LCD_INFO,
+        MATH_INFO,
+        METHOD_INFO,
+        DEPENDENCIES_GENERAL
+    ]
+
+
+def package_paths():
+    """Return the directories that pip packages are installed in."""
+    paths = set(site.getsitepackages()) if hasattr(site, 'getsitepackages') else set()
+    paths.add(sysconfig.get_paths()['purelib'])
+    paths.add(sysconfig.get_paths()['platlib'])
+    return sorted(paths)
+
+
+def environment_fingerprint():
+    """Return a hash of the module files and of the installed pip and apt packages."""
+    fingerprint = hashlib.sha1()
+    for each_path in MODULE_PATHS:
+        try:
+            entries = sorted(os.scandir(each_path), key=lambda entry: entry.name)
+        except OSError:
+            continue
+        for each_entry in entries:
+            if each_entry.name.endswith('.py') and each_entry.is_file():
+                stat = each_entry.stat()
+                fingerprint.update('{} {} {}\n'.format(
+                    each_entry.path, stat.st_size, stat.st_mtime_ns).encode())
+    # A directory is modified when a package is added, removed, or upgraded (its dist-info is renamed)
+    for each_path in package_paths() + [PATH_DPKG_STATUS]:
+        try:
+            fingerprint.update('{} {}\n'.format(each_path, os.stat(each_path).st_mtime_ns).encode())
+        except OSError:
+            pass
+    return fingerprint.hexdigest()
+
+
+def find_spec_exists(package, probes):
+    key = ('find_spec', package)
+    if key not in probes:
+        try:
+            probes[key] = importlib.util.find_spec(package) is not None
+        except (ImportError, ValueError):
+            probes[key] = False
+    return probes[key]
+
+
+def dpkg_exists(package, probes):
+    key = ('dpkg', package)
+    if key not in probes:
+        probes[key] = bool(dpkg_package_exists(package))
+    return probes[key]
+
+
+def check_dependencies(device_type, sections, probes=None):
+    """
+    Check the dependencies of a device
+
+    :param sections: the information of all devices, from dependency_sections()
+    :param probes: dict of the results of probes (e.g. whether a pip package is
+        installed), so each is only probed once when checking several devices
+    :return: (list of unmet dependencies, whether a dependency is met, dependencies message)
+    """
+    if probes is None:
+        probes = {}
+    unmet_deps = []
+    met_deps = False
+    dep_message = ''
+
+    for each_section in sections:
+        if device_type in each_section:
+            if "dependencies_message" in each_section[device_type]:
+                dep_message = each_section[device_type]["dependencies_message"]
+
+            for each_device, each_dict in each_section[device_type].items():
+                if not each_dict:
+                    met_deps = True
+                elif each_device == 'dependencies_module':
+                    for (install_type, package, install_id) in each_dict:
+                        entry = (
+                            package, '{0} {1}'.format(install_type, install_id),
+                            install_type,
+                            install_id
+                        )
+                        if install_type in ['pip-pypi', 'pip-git']:
+                            if not find_spec_exists(package, probes):
+                                if entry not in unmet_deps:
+                                    unmet_deps.append(entry)
+                            else:
+                                met_deps = True
+                        elif install_type == 'apt':
+                            if (not dpkg_exists(package, probes) and
+                                    entry not in unmet_deps):
+                                unmet_deps.append(entry)
+                            else:
+                                met_deps = True
+                        elif install_type == 'bash-commands':
+                            files_not_found = []
+                            for each_file in package:
+                                if not os.path.isfile(each_file):
+                                    files_not_found.append(each_file.split('/')[-1])
+                            if files_not_found:
+                                if entry not in unmet_deps:
+                                    unmet_deps.append((
+                                        ", ".join(files_not_found),
+                                        install_type,
+                                        install_id
+                                    ))
+                                else:
+                                    met_deps = True
+                        elif install_type == 'internal':
+                            if package.startswith('file-exists'):
+                                filepath = package.split(' ', 1)[1]
+                                if not os.path.isfile(filepath):
+                                    if entry not in unmet_deps:
+                                        unmet_deps.append(entry)
+                                    else:
+                                        met_deps = True
+                            elif package.startswith('pip-exists'):
+                                py_module = package.split(' ', 1)[1]
+                                if not find_spec_exists(py_module, probes):
+                                    if entry not in unmet_deps:
+                                        unmet_deps.append(entry)
+                                else:
+                                    met_deps = True
+                            elif package.startswith('apt'):
+                                if (not dpkg_exists(package, probes) and
+                                        entry not in unmet_deps):
+                                    unmet_deps.append(entry)
+                                else:
+                                    met_deps = True
+
+    return unmet_deps, met_deps, dep_message
+
+
+class DependencyStatus:
+    """The dependency status of every device, checked in a background thread."""
+    def __init__(self, path_file=DEPENDENCY_STATUS_FILE):
+        self.path_file = path_file
+        self.lock = threading.Lock()
+        self.thread = None
+        self.refresh_requested = threading.Event()
+
+        self.statuses = None  # device: (unmet dependencies, met, message)
+        self.fingerprint = None
+        self.time_checked = 0
+
+    def start(self):
+        """Load the saved registry (if it's current) and start checking in the background."""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(
+                target=self.run, name='dependency_status', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        try:
+            os.nice(19)  # On Linux, this only lowers the priority of this thread
+        except (AttributeError, OSError):
+            pass
+        if self.statuses is None:
+            self.load()
+        while True:
+            try:
+                fingerprint = environment_fingerprint()
+                if (self.statuses is None or
+                        fingerprint != self.fingerprint or
+                        self.refresh_requested.is_set() or
+                        time.time() - self.time_checked > REFRESH_PERIOD):
+                    self.refresh_requested.clear()
+                    self.check_all(fingerprint)
+            except Exception:
+                logger.exception("Checking dependencies")
+            self.refresh_requested.wait(CHECK_PERIOD)
+
+    def refresh(self):
+        """Check all dependencies again (e.g. after dependencies were installed)."""
+        self.refresh_requested.set()
+
+    def check_all(self, fingerprint):
+        """Check the dependencies of all devices, and save them."""
+        timer = time.time()
+        sections = dependency_sections()
+        probes = {}
+        statuses = {}
+        for each_section in sections:
+            for each_device in each_section:
+                if each_device not in statuses:
+                    statuses[each_device] = check_dependencies(each_device, sections, probes)
+        with self.lock:
+            self.statuses = statuses
+            self.fingerprint = fingerprint
+            self.time_checked = time.time()
+        logger.debug("Checked dependencies of {} devices in {:.1f} s".format(
+            len(statuses), time.time() - timer))
+        self.save()
+
+    def save(self):
+        with self.lock:
+            registry = {
+                'fingerprint': self.fingerprint,
+                'time_checked': self.time_checked,
+                'statuses': self.statuses
+            }
+        try:
+            path_tmp = '{}.{}.tmp'.format(self.path_file, os.getpid())
+            with open(path_tmp, 'w') as status_file:
+                json.dump(registry, status_file)
+            os.replace(path_tmp, self.path_file)
+        except (OSError, TypeError, ValueError) as err:
+            logger.debug("Could not save dependency status: {}".format(err))
+
+    def load(self):
+        """Load the saved registry, if the modules and packages haven't changed since it was saved."""
+        try:
+            with open(self.path_file) as status_file:
+                registry = json.load(status_file)
+            if registry['fingerprint'] != environment_fingerprint():
+                return
+            statuses = {
+                device: ([tuple(each_dep) for each_dep in unmet], met, message)
+                for device, (unmet, met, message) in registry['statuses'].items()
+            }
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        with self.lock:
+            self.statuses = statuses
+            self.fingerprint = registry['fingerprint']
+            self.time_checked = registry['time_checked']
+
+    def get(self, device_type):
+        """
+        Return the dependency status of a device
+
+        :return: (list of unmet dependencies, whether a dependency is met, dependencies message)
+        """
+        with self.lock:
+            status = self.statuses.get(device_type) if self.statuses is not None else None
+        if status is None:
+            # Not checked yet (or a module that was just added), check it now
+            return check_dependencies(device_type, dependency_sections())
+        unmet_deps, met_deps, dep_message = status
+        return list(unmet_deps), met_deps, dep_message
+
+
+dependency_status = DependencyStatus()
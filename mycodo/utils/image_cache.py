@@ -0,0 +1,194 @@
+# coding=utf-8
+"""
+On-disk cache of resized images (e.g. thumbnails of camera images)
+
+Resized, re-encoded (JPEG) variants of an image are generated on demand and
+stored in PATH_IMAGE_CACHE, keyed by the path, modification time, and size of
+the source image and the width of the variant, so a variant is regenerated if
+its source changes. Widths are rounded up to one of WIDTHS to limit the number
+of variants. When the cache exceeds its size limit, the least recently used
+variants are removed (the modification time of a variant is updated when it's
+used).
+
+Resizing requires Pillow. If it isn't installed (or the source isn't an image
+Pillow can read), no variant is returned and the source should be served.
+"""
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+
+from mycodo.config import PATH_IMAGE_CACHE
+from mycodo.utils.logging_utils import set_log_level
+
+logger = logging.getLogger("mycodo.image_cache")
+logger.setLevel(set_log_level(logging))
+
+WIDTHS = (160, 320, 640, 800, 1280, 1920)
+DEFAULT_WIDTH = 800
+QUALITY = 75
+MAX_BYTES = 256 * 1024 * 1024  # Size limit of the cache
+MAX_AGE = 31536000  # seconds that browsers may cache a variant (its URL changes with its source)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff', '.webp')
+
+
+def is_image(path_file):
+    return path_file.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def variant_width(width):
+    """Round a requested width up to one of WIDTHS."""
+    for each_width in WIDTHS:
+        if width <= each_width:
+            return each_width
+    return WIDTHS[-1]
+
+
+class ImageCache:
+    """Resized variants of images, stored on disk with a least recently used size limit."""
+    def __init__(self, path=PATH_IMAGE_CACHE, max_bytes=MAX_BYTES, quality=QUALITY):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.lock = threading.Lock()
+        self.generating = {}  # variant filename: lock, so a variant is only generated once
+        self.total_bytes = None  # Determined when first needed
+        self.queue = None
+        self.thread = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def variant_path(self, source_path, width):
+        stat = os.stat(source_path)
+        key = '{}|{}|{}|{}|{}'.format(
+            os.path.abspath(source_path), stat.st_mtime_ns, stat.st_size, width, self.quality)
+        return os.path.join(self.path, '{}.jpg'.format(hashlib.sha1(key.encode()).hexdigest()))
+
+    def get(self, source_path, width=DEFAULT_WIDTH):
+        """
+        Return the path of a variant of an image, generating it if it's not cached
+
+        :param source_path: path of the source image
+        :param width: maximum width of the variant (rounded up to one of WIDTHS)
+        :return: path of the variant, or None if it couldn't be generated
+        """
+        if not is_image(source_path) or not os.path.isfile(source_path):
+            return
+        width = variant_width(width)
+        try:
+            path_variant = self.variant_path(source_path, width)
+        except OSError:
+            return
+
+        with self.lock:
+            lock_variant = self.generating.setdefault(path_variant, threading.Lock())
+        try:
+            with lock_variant:
+                if os.path.exists(path_variant):
+                    os.utime(path_variant)  # Most recently used
+                    self.hits += 1
+                    return path_variant
+                self.misses += 1
+                if self.generate(source_path, path_variant, width):
+                    return path_variant
+        finally:
+            with self.lock:
+                self.generating.pop(path_variant, None)
+
+    def generate(self, source_path, path_variant, width):
+        try:
+            from PIL import Image
+        except ImportError:
+            return False
+
+        os.makedirs(self.path, exist_ok=True)
+        path_tmp = '{}.{}.tmp'.format(path_variant, threading.get_ident())
+        try:
+            with Image.open(source_path) as image:
+                image.draft('RGB', (width, width))  # Faster decoding of JPEGs at a reduced size
+                image = image.convert('RGB')
+                if image.width > width:
+                    image = image.resize(
+                        (width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+                image.save(path_tmp, 'JPEG', quality=self.quality, optimize=True)
+            os.replace(path_tmp, path_variant)
+        except Exception as err:
+            logger.error("Could not resize image {}: {}".format(source_path, err))
+            try:
+                os.remove(path_tmp)
+            except OSError:
+                pass
+            return False
+
+        self.added(os.path.getsize(path_variant))
+        return True
+
+    def added(self, size):
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(
+                    os.path.getsize(os.path.join(self.path, each_file))
+                    for each_file in os.listdir(self.path))
+            else:
+                self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Remove the least recently used variants until the cache is at 90% of its limit."""
+        variants = []
+        for each_file in os.listdir(self.path):
+            try:
+                stat = os.stat(os.path.join(self.path, each_file))
+                variants.append((stat.st_mtime, stat.st_size, each_file))
+            except OSError:
+                pass
+        variants.sort()
+        self.total_bytes = sum(size for _, size, _ in variants)
+        for _, size, each_file in variants:
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(os.path.join(self.path, each_file))
+                self.total_bytes -= size
+                self.evictions += 1
+            except OSError:
+                pass
+
+    def pregenerate(self, source_path, widths=(DEFAULT_WIDTH,)):
+        """Generate variants of an image in the background (e.g. of a new time-lapse image)."""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.queue = queue.Queue(1000)
+                self.thread = threading.Thread(
+                    target=self.run_pregenerate, name='image_cache', daemon=True)
+                self.thread.start()
+        for each_width in widths:
+            try:
+                self.queue.put_nowait((source_path, each_width))
+            except queue.Full:
+                pass
+
+    def run_pregenerate(self):
+        while True:
+            source_path, width = self.queue.get()
+            timer = time.time()
+            self.get(source_path, width)
+            logger.debug("Generated {} px variant of {} in {:.3f} s".format(
+                width, source_path, time.time() - timer))
+
+    def stats(self):
+        return {
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+image_cache = ImageCache()
@@ -19,6 +19,8 @@ from mycodo.databases.models import Output
 from mycodo.mycodo_client import DaemonControl
 from mycodo.utils.database import db_retrieve_table_daemon
 from mycodo.utils.logging_utils import set_log_level
+from mycodo.utils.measurement_events import publish_measurements
+from mycodo.utils.metrics import controller_metrics
 from mycodo.utils.system_pi import return_measurement_info
 
 logger = logging.getLogger("mycodo.influx")
@@ -52,9 +54,11 @@ def write_influxdb_data(unique_id, measurements, use_same_timestamp=True):
     :return:
     """
     data = []
+    channels = []
 
     for each_channel, each_measurement in measurements.items():
         if 'value' in each_measurement and each_measurement['value'] is not None:
+            channels.append(each_channel)
 
             if use_same_timestamp:
                 # influxdb will create the timestamp when the data is stored
@@ -74,7 +78,66 @@ def write_influxdb_data(unique_id, measurements, use_same_timestamp=True):
         client = InfluxDBClient(
             INFLUXDB_HOST, INFLUXDB_PORT, INFLUXDB_USER, INFLUXDB_PASSWORD,
             INFLUXDB_DATABASE, timeout=5)
+        with controller_metrics.timed(unique_id, 'influxdb_write'):
+            client.write_points(data)
+        publish_measurements(unique_id, channels)
+
+
+def write_influxdb_points(unique_id, points):
+    """
+    Write a batch of measurements of a device in a single request (raises on failure)
+    :param unique_id: Unique ID of device
+    :param points: list of dicts with the keys channel, measurement, unit, value, and timestamp
+    :return:
+    """
+    data = []
+    channels = set()
+
+    for each_point in points:
+        channels.add(each_point['channel'])
+        data.append(format_influxdb_data(
+            unique_id,
+            each_point['unit'],
+            each_point['value'],
+            channel=each_point['channel'],
+            measure=each_point['measurement'],
+            timestamp=each_point['timestamp']))
+
+    if data:
+        client = InfluxDBClient(
+            INFLUXDB_HOST, INFLUXDB_PORT, INFLUXDB_USER, INFLUXDB_PASSWORD,
+            INFLUXDB_DATABASE, timeout=5)
+        with controller_metrics.timed(unique_id, 'influxdb_write'):
+            client.write_points(data)
+        publish_measurements(unique_id, channels)
+
+
+def write_influxdb_batch(points):
+    """
+    Write a batch of measurements of any devices in a single request (raises on failure)
+    :param points: list of dicts with the keys device_id, channel, measurement, unit, value, and timestamp
+    :return:
+    """
+    data = []
+    channels = {}
+
+    for each_point in points:
+        channels.setdefault(each_point['device_id'], set()).add(each_point['channel'])
+        data.append(format_influxdb_data(
+            each_point['device_id'],
+            each_point['unit'],
+            each_point['value'],
+            channel=each_point['channel'],
+            measure=each_point['measurement'],
+            timestamp=each_point['timestamp']))
+
+    if data:
+        client = InfluxDBClient(
+            INFLUXDB_HOST, INFLUXDB_PORT, INFLUXDB_USER, INFLUXDB_PASSWORD,
+            INFLUXDB_DATABASE, timeout=30)
         client.write_points(data)
+        for each_device_id, each_channels in channels.items():
+            publish_measurements(each_device_id, each_channels)
 
 
 def write_influxdb_value(unique_id, unit, value, measure=None, channel=None, timestamp=None):
@@ -115,16 +178,20 @@ def write_influxdb_value(unique_id, unit, value, measure=None, channel=None, tim
     ]
 
     try:
-        client.write_points(data)
+        with controller_metrics.timed(unique_id, 'influxdb_write'):
+            client.write_points(data)
+        publish_measurements(unique_id, [channel])
         return 0
     except Exception as except_msg:
         logger.debug("Failed to write measurements to influxdb with ID {}. "
                      "Retrying in 30 seconds.".format(unique_id))
         time.sleep(30)
         try:
-            client.write_points(data)
+            with controller_metrics.timed(unique_id, 'influxdb_write'):
+                client.write_points(data)
             logger.debug("Successfully wrote measurements to influxdb after "
                          "30-second wait.")
+            publish_measurements(unique_id, [channel])
             return 0
         except:
             logger.debug(
@@ -179,11 +246,99 @@ def query_string(unit, unique_id,
     if limit:
         query += " GROUP BY * LIMIT {lim}".format(lim=limit)
 
-    raw_data = dbcon.query(query).raw
+    with controller_metrics.timed_current('influxdb_query'):
+        raw_data = dbcon.query(query).raw
+
+    if 'series' not in raw_data or not raw_data['series']:
+        return None
+
+    return raw_data['series'][0]['values']
+
+
+def query_channels(unit, unique_id, measure=None, start_ms=None, end_ms=None, group_ms=None):
+    """
+    Query the values of all channels of a measurement with one query
+
+    :param group_ms: if set, only the first value of each channel in each interval of this
+        many ms is returned (timestamped with the start of the interval). Requires start_ms.
+    :return: dict of channel: list of [epoch ms, value], or None if there are no values
+    """
+    dbcon = InfluxDBClient(
+        INFLUXDB_HOST,
+        INFLUXDB_PORT,
+        INFLUXDB_USER,
+        INFLUXDB_PASSWORD,
+        INFLUXDB_DATABASE)
+
+    query = "SELECT {value} FROM {unit} WHERE device_id='{id}'".format(
+        value='FIRST(value)' if group_ms else 'value', unit=unit, id=unique_id)
+    if measure:
+        query += " AND measure='{measure}'".format(measure=measure)
+    if start_ms is not None:
+        query += " AND time >= {start}ms".format(start=int(start_ms))
+    if end_ms is not None:
+        query += " AND time <= {end}ms".format(end=int(end_ms))
+    if group_ms:
+        query += " GROUP BY time({group}ms), channel fill(none)".format(group=int(group_ms))
+    else:
+        query += " GROUP BY channel"
+
+    with controller_metrics.timed_current('influxdb_query'):
+        raw_data = dbcon.query(query, epoch='ms').raw
 
     if 'series' not in raw_data or not raw_data['series']:
         return None
 
+    channels = {}
+    for each_series in raw_data['series']:
+        try:
+            channel = int(each_series['tags']['channel'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        channels[channel] = each_series['values']
+    return channels
+
+
+def query_series(unit, unique_id, channel=None, measure=None, start_ns=None, end_ns=None,
+                 function=None, group_sec=None, limit=None):
+    """
+    Query the values (or aggregates) of a measurement within a time range, in ascending order of time
+
+    :param function: aggregate function (e.g. MEAN), of all values or of each group_sec interval
+    :param limit: maximum number of values (or intervals) to return
+    :return: list of [epoch ns, value]
+    """
+    dbcon = InfluxDBClient(
+        INFLUXDB_HOST,
+        INFLUXDB_PORT,
+        INFLUXDB_USER,
+        INFLUXDB_PASSWORD,
+        INFLUXDB_DATABASE)
+
+    if function:
+        query = "SELECT {func}(value)".format(func=function)
+    else:
+        query = "SELECT value"
+    query += " FROM {unit} WHERE device_id='{id}'".format(unit=unit, id=unique_id)
+    if channel is not None:
+        query += " AND channel='{channel}'".format(channel=channel)
+    if measure:
+        query += " AND measure='{measure}'".format(measure=measure)
+    if start_ns is not None:
+        query += " AND time >= {start}".format(start=int(start_ns))
+    if end_ns is not None:
+        query += " AND time <= {end}".format(end=int(end_ns))
+    if function and group_sec:
+        query += " GROUP BY time({sec}s) fill(none)".format(sec=int(group_sec))
+    if limit:
+        query += " LIMIT {lim}".format(lim=int(limit))
+
+    with controller_metrics.timed_current('influxdb_query'):
+        raw_data = dbcon.query(query, epoch='ns').raw
+
+    if 'series' not in raw_data or not raw_data['series']:
+        return []
+
     return raw_data['series'][0]['values']
 
 
@@ -0,0 +1,296 @@
+# coding=utf-8
+"""
+Process-isolated Input modules
+
+An Input controller may host its Input module in a separate worker process,
+rather than in its own thread of the daemon, so a CPU-heavy module doesn't
+compete with the daemon's controllers for the GIL, and a module that crashes
+(e.g. in a C library) only takes down its worker.
+
+The controller communicates with the worker over a pipe: a request is a tuple of
+(method name, args), and the response is a tuple of ('ok', return value) or
+('error', message) (or ('stop_iteration', None) if the method raised
+StopIteration, which is raised again by the controller). InputWorker acts in place of the Input module, supervises the
+worker (restarting it if it exits or stops responding), and reports its CPU and
+memory (RSS) usage.
+
+Measurement events published in the worker (by modules that store their own
+measurements) are sent with each response, and published by the controller,
+so PIDs and Conditionals of the daemon receive them (as of the next request).
+Locks and bus arbiters are only shared by the threads of a process, so Inputs
+on a shared bus (SHARED_BUS_INTERFACES) aren't isolated, as they rely on the
+daemon's bus arbiters and device locks (e.g. Atlas Scientific boards).
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+
+from mycodo.utils.logging_utils import set_log_level
+from mycodo.utils.measurement_events import measurement_events
+
+logger = logging.getLogger("mycodo.input_worker")
+logger.setLevel(set_log_level(logging))
+
+# Spawn (rather than fork) workers, as the daemon has many running threads
+mp_context = multiprocessing.get_context('spawn')
+
+# Interfaces of buses that are arbitrated (and devices that are locked) by the daemon
+SHARED_BUS_INTERFACES = ('I2C', 'UART', 'FTDI')
+
+
+class InputWorkerError(Exception):
+    """The worker raised an error, exited, or didn't respond."""
+    pass
+
+
+def process_usage(pid):
+    """
+    Return the CPU time and memory usage of a process, from /proc
+
+    :param pid: process ID
+    :return: (cpu seconds (user + system), resident set size in bytes), or (None, None)
+    """
+    try:
+        with open('/proc/{}/stat'.format(pid)) as stat_file:
+            # The command name (2nd field) may contain spaces, fields after it are fixed
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        rss_bytes = int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+        return cpu_seconds, rss_bytes
+    except (IOError, IndexError, ValueError):
+        return None, None
+
+
+def can_isolate(interface):
+    """Return whether an Input with an interface can be run in a worker process."""
+    return interface not in SHARED_BUS_INTERFACES
+
+
+def worker_main(input_id, conn, log_file=None):
+    """Entry point of the worker process: load the Input module and serve requests."""
+    from mycodo.databases.models import Input
+    from mycodo.utils.database import db_retrieve_table_daemon
+    from mycodo.utils.inputs import parse_input_information
+    from mycodo.utils.modules import load_module_from_file
+
+    if log_file:
+        logger_mycodo = logging.getLogger('mycodo')
+        logger_mycodo.setLevel(logging.DEBUG)
+        logger_mycodo.propagate = False
+        fh = logging.FileHandler(log_file, 'a')
+        fh.setFormatter(logging.Formatter(
+            "%(asctime)s - %(levelname)s - %(name)s - %(message)s"))
+        logger_mycodo.addHandler(fh)
+
+    # Send measurement events to the daemon with the responses
+    events = []
+    measurement_events.forward = lambda device_id, channels, timestamp: events.append(
+        (device_id, list(channels), timestamp))
+
+    try:
+        input_dev = db_retrieve_table_daemon(Input, unique_id=input_id)
+        dict_inputs = parse_input_information()
+        input_loaded = load_module_from_file(
+            dict_inputs[input_dev.device]['file_path'], 'inputs')
+        measure_input = input_loaded.InputModule(input_dev)
+    except Exception:
+        conn.send(('error', traceback.format_exc(), take_events(events)))
+        return
+
+    conn.send(('ok', os.getpid(), take_events(events)))
+    serve_requests(measure_input, conn, events)
+
+
+def take_events(events):
+    """Remove and return the events that have been published (by any thread of the worker)."""
+    taken = events[:]
+    del events[:len(taken)]
+    return taken
+
+
+def serve_requests(measure_input, conn, events):
+    """Call the methods of the Input module requested by the controller, until stopped."""
+    while True:
+        try:
+            method, args = conn.recv()
+        except (EOFError, OSError):
+            break  # The controller (or daemon) has gone away
+
+        try:
+            response = ('ok', getattr(measure_input, method)(*args))
+        except StopIteration:
+            response = ('stop_iteration', None)
+        except Exception:
+            response = ('error', traceback.format_exc())
+        conn.send(response + (take_events(events),))
+
+        if method == 'stop_input':
+            break
+
+
+class InputWorker:
+    """Runs an Input module in a worker process, in place of the module itself."""
+    def __init__(self, input_id, timeout=60, log_file=None):
+        self.input_id = input_id
+        self.timeout = timeout
+        self.log_file = log_file
+        self.lock = threading.RLock()
+        self.process = None
+        self.conn = None
+
+        self.starts = 0
+        self.restarts = 0
+        self.time_started = None
+        self.last_exitcode = None
+        self.last_error = None
+        self.usage_last = (None, None)  # (time, cpu seconds) of the previous status()
+
+    def start(self):
+        """Start the worker process and wait for the Input module to initialize."""
+        with self.lock:
+            conn_parent, conn_child = mp_context.Pipe()
+            self.process = mp_context.Process(
+                target=worker_main,
+                args=(self.input_id, conn_child, self.log_file),
+                name='input_worker_{}'.format(self.input_id),
+                daemon=True)
+            self.process.start()
+            conn_child.close()
+            self.conn = conn_parent
+            self.starts += 1
+            self.time_started = time.time()
+            self.usage_last = (None, None)
+
+            status, value = self._receive(self.timeout)
+            if status != 'ok':
+                self._kill()
+                raise InputWorkerError("Input worker failed to initialize: {}".format(value))
+            logger.debug("Input worker for {} started with PID {}".format(
+                self.input_id, value))
+
+    def _kill(self):
+        if self.process:
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(5)
+                if self.process.is_alive():
+                    self.process.kill()
+                    self.process.join(5)
+            self.last_exitcode = self.process.exitcode
+        if self.conn:
+            self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def _receive(self, timeout):
+        try:
+            if not self.conn.poll(timeout):
+                raise InputWorkerError("Input worker didn't respond within {} seconds".format(timeout))
+            status, value, events = self.conn.recv()
+        except (EOFError, OSError):
+            if self.process:
+                self.process.join(1)
+            raise InputWorkerError("Input worker exited with code {}".format(
+                self.process.exitcode if self.process else None))
+
+        for device_id, channels, timestamp in events:
+            measurement_events.publish(device_id, channels, timestamp=timestamp)
+        return status, value
+
+    def call(self, method, *args, timeout=None):
+        """
+        Call a method of the Input module in the worker
+
+        The worker is restarted if it has exited. If it exits or doesn't respond
+        during the call, it's killed (to be restarted by the next call).
+
+        :raises InputWorkerError: if the worker exited, didn't respond, or the method raised
+        """
+        with self.lock:
+            if not self.process or not self.process.is_alive():
+                if self.starts:
+                    self.restarts += 1
+                    logger.error("Input worker for {} is not running (exit code {}), restarting".format(
+                        self.input_id, self.process.exitcode if self.process else self.last_exitcode))
+                self._kill()
+                self.start()
+
+            try:
+                self.conn.send((method, args))
+                status, value = self._receive(timeout or self.timeout)
+            except (InputWorkerError, OSError) as err:
+                self.last_error = str(err)
+                self._kill()
+                raise InputWorkerError(str(err))
+
+            if status == 'stop_iteration':
+                raise StopIteration
+            elif status != 'ok':
+                self.last_error = value
+                raise InputWorkerError(value)
+            return value
+
+    def next(self):
+        return self.call('next')
+
+    def stop_input(self):
+        """Stop the Input module and the worker."""
+        with self.lock:
+            if self.process and self.process.is_alive():
+                try:
+                    self.call('stop_input', timeout=10)
+                except InputWorkerError:
+                    pass
+                if self.process:
+                    self.process.join(5)
+            self._kill()
+
+    def __getattr__(self, name):
+        # Methods of the Input module, e.g. custom commands (called with args_dict)
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args: self.call(name, *args)
+
+    def status(self):
+        """Return the state and resource usage of the worker."""
+        now = time.time()
+        pid = self.process.pid if self.process else None
+        alive = bool(self.process and self.process.is_alive())
+        cpu_seconds, rss_bytes = process_usage(pid) if alive else (None, None)
+
+        cpu_percent = None
+        time_last, cpu_last = self.usage_last
+        if cpu_seconds is not None and cpu_last is not None and now > time_last:
+            cpu_percent = 100 * (cpu_seconds - cpu_last) / (now - time_last)
+        if cpu_seconds is not None:
+            self.usage_last = (now, cpu_seconds)
+
+        return {
+            'pid': pid,
+            'alive': alive,
+            'restarts': self.restarts,
+            'uptime': now - self.time_started if alive and self.time_started else None,
+            'cpu_seconds': cpu_seconds,
+            'cpu_percent': cpu_percent,
+            'rss_bytes': rss_bytes,
+            'last_exitcode': self.last_exitcode,
+            'last_error': self.last_error
+        }
+
+    def status_string(self):
+        status = self.status()
+        if not status['alive']:
+            return "Worker process: not running ({} restarts, last exit code {})".format(
+                status['restarts'], status['last_exitcode'])
+        if status['cpu_percent'] is not None:
+            cpu = '{:.1f} %'.format(status['cpu_percent'])
+        else:
+            cpu = '{:.1f} s'.format(status['cpu_seconds'] or 0)
+        return "Worker process: PID {pid}, CPU {cpu}, RSS {rss:.1f} MB, {restarts} restarts".format(
+            pid=status['pid'],
+            cpu=cpu,
+            rss=(status['rss_bytes'] or 0) / 1048576.0,
+            restarts=status['restarts'])
@@ -0,0 +1,197 @@
+# coding=utf-8
+"""
+Named in-process locks for the daemon
+
+Controllers that need exclusive access to a shared resource (e.g. a pre-output
+shared by Inputs, or an Atlas Scientific board) acquire a lock by name. Waiters
+are granted the lock in the order they requested it (FIFO), may time out, and
+contention statistics are kept for each lock.
+
+These locks only provide exclusion between threads of the same process. Use
+mycodo.utils.lockfile.LockFile when exclusion across processes is required.
+"""
+import logging
+import threading
+import timeit
+from collections import deque
+
+from mycodo.utils.logging_utils import set_log_level
+
+logger = logging.getLogger("mycodo.locks")
+logger.setLevel(set_log_level(logging))
+
+
+class NamedLock:
+    """A FIFO lock with an owner and contention statistics."""
+    def __init__(self, name):
+        self.name = name
+        self.owner = None
+        self.held = False
+        self.held_since = None
+        self.waiters = deque()  # threading.Event of each waiter, in order of request
+
+        self.acquisitions = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+
+    def stats(self):
+        return {
+            'held': self.held,
+            'waiting': len(self.waiters),
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'timeouts': self.timeouts,
+            'wait_total': self.wait_total,
+            'wait_max': self.wait_max,
+            'hold_total': self.hold_total,
+            'hold_max': self.hold_max
+        }
+
+
+class LockManager:
+    """Creates, grants, and tracks named locks."""
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.locks = {}
+
+    def _get_lock(self, name):
+        if name not in self.locks:
+            self.locks[name] = NamedLock(name)
+        return self.locks[name]
+
+    def _grant(self, lock, owner, waited):
+        lock.held = True
+        lock.owner = owner
+        lock.held_since = timeit.default_timer()
+        lock.acquisitions += 1
+        lock.wait_total += waited
+        if waited > lock.wait_max:
+            lock.wait_max = waited
+
+    def acquire(self, name, timeout=None, owner=None):
+        """
+        Acquire a lock, waiting behind any earlier requests
+
+        :param name: Name of the lock
+        :param timeout: Maximum duration to wait (seconds), or None to wait indefinitely
+        :param owner: Identifies the holder of the lock (default: the calling thread)
+        :return: True if the lock was acquired, False if timed out
+        """
+        if owner is None:
+            owner = threading.get_ident()
+        timer = timeit.default_timer()
+
+        with self.mutex:
+            lock = self._get_lock(name)
+            if not lock.held and not lock.waiters:
+                self._grant(lock, owner, 0.0)
+                return True
+            lock.contended += 1
+            granted = threading.Event()
+            granted.owner = owner
+            lock.waiters.append(granted)
+
+        logger.debug("Waiting for lock {} ({} waiting)".format(name, len(lock.waiters)))
+        granted.wait(timeout)
+
+        with self.mutex:
+            if granted.is_set():  # Ownership was handed over by release()
+                waited = timeit.default_timer() - timer
+                lock.wait_total += waited
+                if waited > lock.wait_max:
+                    lock.wait_max = waited
+                logger.debug("Lock {} acquired in {:.3f} seconds".format(name, waited))
+                return True
+            lock.waiters.remove(granted)
+            lock.timeouts += 1
+
+        logger.debug("Lock {} unable to be acquired after {:.3f} seconds".format(name, timeout))
+        return False
+
+    def release(self, name, owner=None):
+        """
+        Release a lock, handing it to the next waiter (if any)
+
+        :param name: Name of the lock
+        :param owner: Holder of the lock (default: the calling thread)
+        :return: True if the lock was released, False if not held by owner
+        """
+        if owner is None:
+            owner = threading.get_ident()
+
+        with self.mutex:
+            lock = self.locks.get(name)
+            if not lock or not lock.held or lock.owner != owner:
+                logger.error("Cannot release lock {}: not held by {}".format(name, owner))
+                return False
+
+            held = timeit.default_timer() - lock.held_since
+            lock.hold_total += held
+            if held > lock.hold_max:
+                lock.hold_max = held
+
+            if lock.waiters:
+                granted = lock.waiters.popleft()
+                lock.owner = granted.owner
+                lock.held_since = timeit.default_timer()
+                lock.acquisitions += 1
+                granted.set()
+            else:
+                lock.held = False
+                lock.owner = None
+                lock.held_since = None
+        return True
+
+    def held_by(self, name, owner=None):
+        """Return True if the lock is held by owner (default: the calling thread)."""
+        if owner is None:
+            owner = threading.get_ident()
+        lock = self.locks.get(name)
+        return bool(lock and lock.held and lock.owner == owner)
+
+    def locked(self, name):
+        """Return True if the lock is held by anyone."""
+        lock = self.locks.get(name)
+        return bool(lock and lock.held)
+
+    def stats(self):
+        """Return the contention statistics of all locks."""
+        with self.mutex:
+            return {name: lock.stats() for name, lock in self.locks.items()}
+
+
+lock_manager = LockManager()
+
+
+def format_prometheus_locks(stats, prefix='mycodo_lock'):
+    """
+    Format lock statistics in the Prometheus text exposition format
+
+    :param stats: dict returned by LockManager.stats()
+    :param prefix: prefix of the metric names
+    :return: str
+    """
+    metrics = [
+        ('acquisitions_total', 'counter', 'acquisitions', 'Number of times the lock was acquired'),
+        ('contended_total', 'counter', 'contended', 'Number of acquisitions that had to wait for the lock'),
+        ('timeouts_total', 'counter', 'timeouts', 'Number of acquisitions that timed out'),
+        ('wait_seconds_total', 'counter', 'wait_total', 'Total duration spent waiting for the lock'),
+        ('wait_max_seconds', 'gauge', 'wait_max', 'Longest duration spent waiting for the lock'),
+        ('hold_seconds_total', 'counter', 'hold_total', 'Total duration the lock was held'),
+        ('hold_max_seconds', 'gauge', 'hold_max', 'Longest duration the lock was held'),
+        ('waiting', 'gauge', 'waiting', 'Number of threads currently waiting for the lock')
+    ]
+
+    lines = []
+    for name, metric_type, key, description in metrics:
+        lines.append('# HELP {}_{} {}'.format(prefix, name, description))
+        lines.append('# TYPE {}_{} {}'.format(prefix, name, metric_type))
+        for lock_name, lock_stats in sorted(stats.items()):
+            lines.append('{}_{}{{lock="{}"}} {}'.format(
+                prefix, name, lock_name.replace('\\', '\\\\').replace('"', '\\"'), lock_stats[key]))
+
+    return '\n'.join(lines) + '\n'
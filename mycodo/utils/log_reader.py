@@ -0,0 +1,311 @@
+# coding=utf-8
+"""
+Reading the end of log files, filtered by controller, level, or phrase
+
+The last lines of a log are read by seeking backwards from the end of the
+file, so reading them takes the same time regardless of the size of the log.
+Filtered lines (e.g. of one controller) can be sparse, so rather than
+searching the whole log for them, the byte offsets of the lines of each
+controller (by the ID prefix in its logger name), of each level, and of
+INDEX_PHRASES are kept in an index. The index is updated with the lines added
+since it was last updated, and it's saved in a sidecar file (keyed by the
+inode of the log, which a log keeps when it's rotated to .1), so it's only
+built once for each log file.
+
+Logs are "followed" by reading the lines added after a byte offset, which
+continues in the rotated log if the log was rotated since the offset was read.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from array import array
+
+from mycodo.config import PATH_LOG_INDEX
+from mycodo.utils.logging_utils import set_log_level
+
+logger = logging.getLogger("mycodo.log_reader")
+logger.setLevel(set_log_level(logging))
+
+# "<date> <time> - <level> - <logger name> - <message>", the format of the daemon log
+LINE_PATTERN = re.compile(rb'^\S+ \S+ - ([A-Z]+) - (\S+) - ')
+CONTROLLER_PATTERN = re.compile(rb'_([0-9a-f]{8})$')
+INDEX_PHRASES = (b'PID Settings',)
+MAX_OFFSETS = 100000  # Offsets kept for each key (the most recent)
+BLOCK_SIZE = 65536
+MAX_FOLLOW_BYTES = 1024 * 1024  # Bytes returned by one follow request
+SAVE_PERIOD = 60  # Minimum seconds between saves of the sidecar file of an index
+MAX_INDEXES = 20  # Indexes kept in memory
+MAX_INDEX_AGE = 7 * 86400  # seconds since a sidecar file was updated before it's removed
+
+indexes_lock = threading.Lock()
+indexes = {}
+
+
+def controller_prefix(controller_id):
+    """Return the ID prefix that's in the logger name of a controller (the part before the first '-')."""
+    return controller_id.strip().lower().split('-')[0][:8]
+
+
+def line_keys(line):
+    """Return the index keys of a line of the log."""
+    keys = []
+    match = LINE_PATTERN.match(line)
+    if match:
+        keys.append(b'level:' + match.group(1))
+        controller = CONTROLLER_PATTERN.search(match.group(2))
+        if controller:
+            keys.append(b'controller:' + controller.group(1))
+    for each_phrase in INDEX_PHRASES:
+        if each_phrase in line:
+            keys.append(b'phrase:' + each_phrase)
+    return keys
+
+
+def line_matches(line, controller=None, level=None, phrase=None):
+    """Return whether a line of the log is of the controller (ID prefix) and level, and contains the phrase."""
+    if phrase and phrase.encode() not in line:
+        return False
+    if controller or level:
+        match = LINE_PATTERN.match(line)
+        if not match:
+            return False
+        if level and match.group(1) != level.encode():
+            return False
+        if controller and not match.group(2).endswith(b'_' + controller.encode()):
+            return False
+    return True
+
+
+class LogIndex:
+    """Byte offsets of the lines of a log file, by controller, level, and phrase."""
+    def __init__(self, stat, head):
+        self.inode = stat.st_ino
+        self.head = head  # Beginning of the log, to detect a new file with a reused inode
+        self.size = 0  # Bytes of the log that are indexed
+        self.offsets = {}
+        self.lock = threading.Lock()
+        self.time_saved = 0
+        self.path_index = os.path.join(PATH_LOG_INDEX, '{}.idx'.format(self.inode))
+
+    def update(self, log_file, file_size):
+        """Index the lines added since the last update."""
+        if file_size <= self.size:
+            return
+        updated = False
+        log_file.seek(self.size)
+        while self.size < file_size:
+            block = log_file.read(min(BLOCK_SIZE * 16, file_size - self.size))
+            end = block.rfind(b'\n') + 1
+            if not end:
+                if len(block) < BLOCK_SIZE * 16:
+                    break  # The last line is incomplete, index it when it's complete
+                end = len(block)  # A very long line
+            position = self.size
+            for each_line in block[:end].split(b'\n')[:-1]:
+                for each_key in line_keys(each_line):
+                    self.offsets.setdefault(each_key, array('Q')).append(position)
+                position += len(each_line) + 1
+            self.size += end
+            log_file.seek(self.size)
+            updated = True
+
+        for each_key, offsets in self.offsets.items():
+            if len(offsets) > MAX_OFFSETS * 2:
+                self.offsets[each_key] = offsets[-MAX_OFFSETS:]
+        if updated and time.time() - self.time_saved > SAVE_PERIOD:
+            self.save()
+
+    def save(self):
+        """Save the index to its sidecar file."""
+        self.time_saved = time.time()
+        keys = list(self.offsets)
+        header = {
+            'inode': self.inode,
+            'head': self.head.hex(),
+            'size': self.size,
+            'keys': [[each_key.decode('latin-1'), len(self.offsets[each_key])] for each_key in keys]
+        }
+        try:
+            os.makedirs(PATH_LOG_INDEX, exist_ok=True)
+            path_tmp = '{}.{}.tmp'.format(self.path_index, threading.get_ident())
+            with open(path_tmp, 'wb') as index_file:
+                index_file.write(json.dumps(header).encode() + b'\n')
+                for each_key in keys:
+                    self.offsets[each_key].tofile(index_file)
+            os.replace(path_tmp, self.path_index)
+        except OSError as err:
+            logger.debug("Could not save log index {}: {}".format(self.path_index, err))
+
+    def load(self):
+        """Load the index from its sidecar file, if it's of the same log."""
+        try:
+            with open(self.path_index, 'rb') as index_file:
+                header = json.loads(index_file.readline())
+                head = bytes.fromhex(header['head'])
+                if header['inode'] != self.inode or self.head[:len(head)] != head:
+                    return
+                offsets = {}
+                for each_key, count in header['keys']:
+                    offsets[each_key.encode('latin-1')] = array('Q')
+                    offsets[each_key.encode('latin-1')].fromfile(index_file, count)
+            self.offsets = offsets
+            self.size = header['size']
+        except (OSError, ValueError, KeyError, EOFError):
+            pass
+
+
+def get_index(path_log, log_file):
+    """Return the updated index of an open log file."""
+    stat = os.fstat(log_file.fileno())
+    log_file.seek(0)
+    head = log_file.read(256)
+    key = (stat.st_dev, stat.st_ino)
+    with indexes_lock:
+        index = indexes.get(key)
+        if index is None or index.head != head[:len(index.head)] or stat.st_size < index.size:
+            index = LogIndex(stat, head)
+            index.load()
+            indexes.pop(key, None)
+            indexes[key] = index
+            while len(indexes) > MAX_INDEXES:
+                indexes.pop(next(iter(indexes)))
+            remove_old_indexes()
+    with index.lock:
+        index.update(log_file, stat.st_size)
+    return index
+
+
+def remove_old_indexes():
+    """Remove the sidecar files of logs that haven't been read for MAX_INDEX_AGE (e.g. deleted logs)."""
+    try:
+        for each_file in os.listdir(PATH_LOG_INDEX):
+            path_file = os.path.join(PATH_LOG_INDEX, each_file)
+            if time.time() - os.path.getmtime(path_file) > MAX_INDEX_AGE:
+                os.remove(path_file)
+    except OSError:
+        pass
+
+
+def read_backwards(log_file, file_size):
+    """Yield the lines of a log file, from the last to the first."""
+    position = file_size
+    remainder = b''
+    while position > 0:
+        read_size = min(BLOCK_SIZE, position)
+        position -= read_size
+        log_file.seek(position)
+        block = log_file.read(read_size) + remainder
+        lines = block.split(b'\n')
+        remainder = lines.pop(0)
+        for each_line in reversed(lines):
+            yield each_line
+    yield remainder
+
+
+def read_lines(path_log, lines, controller=None, level=None, phrase=None):
+    """
+    Return the last lines of a log file, newest last
+
+    :param lines: number of lines to return
+    :param controller: only return lines of the controller with this ID (or ID prefix)
+    :param level: only return lines of this level (e.g. 'ERROR')
+    :param phrase: only return lines that contain this phrase
+    :return: list of lines (bytes), or None if the log file doesn't exist
+    """
+    if not os.path.isfile(path_log):
+        return
+    controller = controller_prefix(controller) if controller else None
+    level = level.upper() if level else None
+
+    if controller:
+        key = b'controller:' + controller.encode()
+    elif phrase and phrase.encode() in INDEX_PHRASES:
+        key = b'phrase:' + phrase.encode()
+    elif level:
+        key = b'level:' + level.encode()
+    else:
+        key = None
+
+    found = []
+    for each_path in (path_log, path_log + '.1'):  # The log, then the log it was rotated to
+        if len(found) >= lines:
+            break
+        try:
+            with open(each_path, 'rb') as log_file:
+                if key:
+                    # Read only the lines with the key, from the index
+                    index = get_index(each_path, log_file)
+                    offsets = index.offsets.get(key, ())
+                    for each_index in range(len(offsets) - 1, -1, -1):
+                        log_file.seek(offsets[each_index])
+                        line = log_file.readline().rstrip(b'\n')
+                        if line_matches(line, controller=controller, level=level, phrase=phrase):
+                            found.append(line)
+                            if len(found) >= lines:
+                                break
+                else:
+                    file_size = os.fstat(log_file.fileno()).st_size
+                    log_file.seek(max(0, file_size - 1))
+                    end = file_size - 1 if log_file.read(1) == b'\n' else file_size
+                    for line in read_backwards(log_file, end):
+                        if line_matches(line, phrase=phrase):
+                            found.append(line)
+                            if len(found) >= lines:
+                                break
+        except FileNotFoundError:
+            continue
+    found.reverse()
+    return found
+
+
+def follow(path_log, offset=None, inode=None, controller=None, level=None, phrase=None):
+    """
+    Return the lines added to a log file since offset
+
+    :param offset: byte offset that was returned by the last call (None to start at the end of the log)
+    :param inode: inode that was returned by the last call
+    :return: (list of lines, offset, inode) to pass to the next call
+    """
+    try:
+        stat = os.stat(path_log)
+    except OSError:
+        return [], None, None
+    controller = controller_prefix(controller) if controller else None
+    level = level.upper() if level else None
+
+    paths = []
+    if offset is None:
+        offset = stat.st_size
+    elif inode != stat.st_ino:
+        # The log was rotated since the last call, read the rest of the old log first
+        try:
+            if os.stat(path_log + '.1').st_ino == inode:
+                paths.append((path_log + '.1', offset))
+        except OSError:
+            pass
+        offset = 0
+    elif offset > stat.st_size:
+        offset = 0  # The log was truncated
+    paths.append((path_log, offset))
+
+    found = []
+    for each_path, each_offset in paths:
+        with open(each_path, 'rb') as log_file:
+            log_file.seek(each_offset)
+            block = log_file.read(MAX_FOLLOW_BYTES)
+        if each_path != path_log and len(block) < MAX_FOLLOW_BYTES:
+            end = len(block)  # The rotated log won't be appended to, so its last line is complete
+        else:
+            end = block.rfind(b'\n') + 1
+            if len(block) == MAX_FOLLOW_BYTES and not end:
+                end = len(block)
+        for each_line in block[:end].rstrip(b'\n').split(b'\n') if end else []:
+            if line_matches(each_line, controller=controller, level=level, phrase=phrase):
+                found.append(each_line)
+        offset = each_offset + end
+        if each_path != path_log and len(block) == MAX_FOLLOW_BYTES:
+            return found, offset, inode  # Continue in the rotated log with the next call
+    return found, offset, stat.st_ino
@@ -0,0 +1,269 @@
+# coding=utf-8
+"""
+Batched storage of measurements from high-rate listener Inputs
+
+Rather than writing each measurement to the database as it arrives (a thread
+and an HTTP request per measurement), a listener Input adds measurements to a
+bounded buffer that is flushed to the database in a single write every flush
+interval. When the buffer is full, the oldest measurements are dropped. The
+number of measurements received, written, and dropped, and how long they waited
+in the buffer (lag), are included in the Input's metrics.
+
+Measurements of any devices that are posted to the REST API in bulk are
+buffered by the IngestWriter of the frontend, which writes them in batches of
+at most BATCH_SIZE measurements. Rather than dropping the oldest measurements
+when its buffer is full, it doesn't accept more, so the API can report which
+measurements weren't stored. A batch that InfluxDB rejects (a 4xx response)
+is dropped, rather than blocking the measurements behind it. A batch that
+couldn't be written for another reason (e.g. InfluxDB isn't running) is
+retried, waiting longer after each failure, and dropped after
+MAX_WRITE_ATTEMPTS attempts.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from influxdb.exceptions import InfluxDBClientError
+
+from mycodo.utils.influx import write_influxdb_batch
+from mycodo.utils.influx import write_influxdb_points
+from mycodo.utils.metrics import controller_metrics
+
+FLUSH_INTERVAL = 1.0  # seconds
+BUFFER_CAPACITY = 10000  # measurements
+INGEST_CAPACITY = 100000  # measurements
+BATCH_SIZE = 5000  # measurements written in one request
+MAX_WRITE_ATTEMPTS = 8  # attempts to write a batch before it's dropped
+MAX_RETRY_DELAY = 60  # seconds
+
+
+class MeasurementBatcher:
+    """Buffers the measurements of an Input and writes them in batches."""
+    def __init__(self, unique_id, flush_interval=FLUSH_INTERVAL, capacity=BUFFER_CAPACITY, logger=None):
+        self.unique_id = unique_id
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.logger = logger or logging.getLogger("mycodo.measurement_batch")
+
+        self.lock = threading.Lock()
+        self.buffer = deque()  # (time added, channel, measurement, unit, value, timestamp)
+        self.running = False
+        self.wake = threading.Event()
+        self.thread = None
+
+        self.received = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.write_errors = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+
+        metrics = controller_metrics.controllers.get(unique_id)
+        if metrics:
+            metrics.ingest = self
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(
+            target=self.flush_loop, name='batch_{}'.format(self.unique_id))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop, writing any buffered measurements."""
+        self.running = False
+        self.wake.set()
+        if self.thread:
+            self.thread.join(10)
+
+    def add(self, channel, measurement, unit, value, timestamp):
+        """
+        Add a measurement to be stored (returns immediately)
+
+        :param channel: measurement channel
+        :param measurement: measurement name (e.g. 'temperature')
+        :param unit: measurement unit (e.g. 'C')
+        :param value: measurement value (int, float, or str representing a float)
+        :param timestamp: datetime (UTC) of the measurement
+        """
+        value = float(value)  # Raises ValueError here rather than failing the batch
+        with self.lock:
+            if len(self.buffer) >= self.capacity:
+                self.buffer.popleft()
+                self.dropped += 1
+            self.buffer.append((time.time(), channel, measurement, unit, value, timestamp))
+            self.received += 1
+
+    def flush_loop(self):
+        while self.running:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.buffer:
+                return
+            batch = list(self.buffer)
+            self.buffer.clear()
+
+        now = time.time()
+        points = [{
+            'channel': channel,
+            'measurement': measurement,
+            'unit': unit,
+            'value': value,
+            'timestamp': timestamp
+        } for _, channel, measurement, unit, value, timestamp in batch]
+
+        try:
+            write_influxdb_points(self.unique_id, points)
+        except Exception as err:
+            self.write_errors += 1
+            self.logger.error("Error writing {} measurements: {}".format(len(batch), err))
+            with self.lock:
+                # Retry with the next flush, dropping the oldest if there isn't room
+                space = self.capacity - len(self.buffer)
+                if space < len(batch):
+                    self.dropped += len(batch) - max(0, space)
+                    batch = batch[len(batch) - max(0, space):]
+                self.buffer.extendleft(reversed(batch))
+            return
+
+        self.batches += 1
+        self.written += len(batch)
+        self.lag_last = now - batch[0][0]
+        if self.lag_last > self.lag_max:
+            self.lag_max = self.lag_last
+
+    def status(self):
+        return {
+            'buffered': len(self.buffer),
+            'received': self.received,
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'write_errors': self.write_errors,
+            'lag_last': self.lag_last,
+            'lag_max': self.lag_max
+        }
+
+
+class IngestWriter:
+    """Buffers measurements of any devices (posted to the REST API) and writes them in batches."""
+    def __init__(self, flush_interval=FLUSH_INTERVAL, capacity=INGEST_CAPACITY, batch_size=BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.logger = logging.getLogger("mycodo.measurement_batch")
+
+        self.lock = threading.Lock()
+        self.buffer = deque()  # (time added, point)
+        self.wake = threading.Event()
+        self.thread = None
+
+        self.received = 0
+        self.written = 0
+        self.rejected = 0
+        self.batches = 0
+        self.write_errors = 0
+        self.write_failures = 0  # consecutive failures to write the first batch of the buffer
+        self.dropped = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+
+    def add_points(self, points):
+        """
+        Add measurements to be stored (returns immediately)
+
+        :param points: list of dicts with the keys device_id, channel,
+            measurement, unit, value (float), and timestamp (datetime, UTC, or None)
+        :return: number of points that were added, from the start of the list
+            (the rest weren't added because the buffer is full)
+        """
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.flush_loop, name='measurement_ingest', daemon=True)
+                self.thread.start()
+            accepted = max(0, min(len(points), self.capacity - len(self.buffer)))
+            now = time.time()
+            self.buffer.extend((now, each_point) for each_point in points[:accepted])
+            self.received += accepted
+            self.rejected += len(points) - accepted
+        if accepted:
+            self.wake.set()
+        return accepted
+
+    def flush_loop(self):
+        while True:
+            if self.write_failures:
+                # Wait to retry, regardless of new measurements
+                time.sleep(min(MAX_RETRY_DELAY, self.flush_interval * 2 ** self.write_failures))
+            else:
+                self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            while self.flush():
+                pass
+
+    def flush(self):
+        """Write a batch of buffered measurements, returning whether more are buffered."""
+        with self.lock:
+            if not self.buffer:
+                return False
+            batch = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+
+        now = time.time()
+        try:
+            write_influxdb_batch([each_point for _, each_point in batch])
+        except Exception as err:
+            self.write_errors += 1
+            self.write_failures += 1
+            if isinstance(err, InfluxDBClientError) and err.code and 400 <= err.code < 500:
+                # Rejected by InfluxDB, so retrying won't succeed
+                self.drop(batch, "they were rejected: {}".format(err))
+            elif self.write_failures >= MAX_WRITE_ATTEMPTS:
+                self.drop(batch, "they couldn't be written in {} attempts: {}".format(
+                    self.write_failures, err))
+            else:
+                self.logger.error("Error writing {} measurements (attempt {}), retrying: {}".format(
+                    len(batch), self.write_failures, err))
+                with self.lock:
+                    # Retry with the next flush (the buffer may only exceed capacity by this batch)
+                    self.buffer.extendleft(reversed(batch))
+                return False
+            with self.lock:
+                return bool(self.buffer)
+
+        self.write_failures = 0
+        self.batches += 1
+        self.written += len(batch)
+        self.lag_last = now - batch[0][0]
+        if self.lag_last > self.lag_max:
+            self.lag_max = self.lag_last
+        with self.lock:
+            return bool(self.buffer)
+
+    def status(self):
+        return {
+            'buffered': len(self.buffer),
+            'received': self.received,
+            'written': self.written,
+            'rejected': self.rejected,
+            'batches': self.batches,
+            'write_errors': self.write_errors,
+            'dropped': self.dropped,
+            'lag_last': self.lag_last,
+            'lag_max': self.lag_max
+        }
+
+    def drop(self, batch, reason):
+        self.write_failures = 0
+        self.dropped += len(batch)
+        self.logger.error("Dropped {} measurements, as {}".format(len(batch), reason))
+
+
+ingest_writer = IngestWriter()
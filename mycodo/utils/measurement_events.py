@@ -0,0 +1,142 @@
+# coding=utf-8
+"""
+In-daemon notification of newly-stored measurements
+
+Writers of measurements (Inputs, Maths, Functions) publish an event once their
+measurements have been stored, and controllers (PIDs, Conditionals) may subscribe
+to be notified when a measurement they depend on has been updated, rather than
+only relying on a fixed period to query for new data.
+"""
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger("mycodo.measurement_events")
+
+
+class MeasurementEventBus:
+    """Dispatches new-measurement events to callbacks subscribed to a device."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}  # device_id: {token: (channels, callback)}
+        self.tokens = {}  # token: device_id
+        self.counter = itertools.count(1)
+        self.forward = None  # function(device_id, channels, timestamp), e.g. to the daemon from a worker process
+
+    def subscribe(self, device_id, callback, channels=None):
+        """
+        Subscribe to new measurements of a device
+
+        :param device_id: Unique ID of the device that stores the measurements
+        :param callback: function(device_id, channels, timestamp), called from the
+            writing thread, so it should return quickly
+        :param channels: iterable of channels to be notified of (None for all channels)
+        :return: token to pass to unsubscribe()
+        """
+        if channels is not None:
+            channels = set(channels)
+        with self.lock:
+            token = next(self.counter)
+            self.subscribers.setdefault(device_id, {})[token] = (channels, callback)
+            self.tokens[token] = device_id
+        return token
+
+    def unsubscribe(self, token):
+        with self.lock:
+            device_id = self.tokens.pop(token, None)
+            if device_id in self.subscribers:
+                self.subscribers[device_id].pop(token, None)
+                if not self.subscribers[device_id]:
+                    del self.subscribers[device_id]
+
+    def publish(self, device_id, channels, timestamp=None):
+        """
+        Notify subscribers that measurements of a device have been stored
+
+        :param device_id: Unique ID of the device the measurements belong to
+        :param channels: iterable of channels that received new measurements
+        :param timestamp: epoch time of the measurements (now if None)
+        """
+        if self.forward is not None:
+            channels = set(channels)
+            self.forward(device_id, channels, timestamp if timestamp is not None else time.time())
+
+        if device_id not in self.subscribers:
+            return  # Fast path: no locking when nothing is subscribed
+
+        if timestamp is None:
+            timestamp = time.time()
+        channels = set(channels)
+
+        with self.lock:
+            subscribers = list(self.subscribers.get(device_id, {}).values())
+
+        for subscribed_channels, callback in subscribers:
+            if subscribed_channels is not None and not subscribed_channels & channels:
+                continue
+            try:
+                callback(device_id, channels, timestamp)
+            except Exception:
+                logger.exception("Measurement event callback error")
+
+
+class NewMeasurementTrigger:
+    """
+    Determines when a controller should run in response to new measurements
+
+    The controller runs debounce seconds after the first new measurement arrives (allowing
+    measurements that arrive together to be processed in one run), but no sooner than
+    min_interval seconds after the previous run.
+    """
+    def __init__(self, debounce=0.0, min_interval=0.0, wake_event=None, not_before=0):
+        self.debounce = debounce or 0.0
+        self.min_interval = min_interval or 0.0
+        self.wake_event = wake_event
+        self.not_before = not_before  # e.g. to honor a controller's start offset
+        self.lock = threading.Lock()
+        self.pending_since = None
+        self.last_run = 0
+        self.event_count = 0
+        self.run_count = 0
+        self.tokens = []
+
+    def subscribe(self, device_id, channels=None):
+        self.tokens.append(measurement_events.subscribe(
+            device_id, self.notify, channels=channels))
+
+    def unsubscribe_all(self):
+        for each_token in self.tokens:
+            measurement_events.unsubscribe(each_token)
+        self.tokens = []
+
+    def notify(self, device_id, channels, timestamp):
+        with self.lock:
+            self.event_count += 1
+            if self.pending_since is None:
+                self.pending_since = time.time()
+        if self.wake_event:
+            self.wake_event.set()
+
+    def is_due(self, now=None):
+        if self.pending_since is None:
+            return False
+        if now is None:
+            now = time.time()
+        return now >= max(self.pending_since + self.debounce,
+                          self.last_run + self.min_interval,
+                          self.not_before)
+
+    def mark_run(self, now=None):
+        """Record that the controller has run, clearing any pending events."""
+        with self.lock:
+            self.pending_since = None
+            self.last_run = now if now is not None else time.time()
+            self.run_count += 1
+
+
+measurement_events = MeasurementEventBus()
+
+
+def publish_measurements(device_id, channels, timestamp=None):
+    measurement_events.publish(device_id, channels, timestamp=timestamp)
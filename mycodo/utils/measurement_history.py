@@ -0,0 +1,203 @@
+# coding=utf-8
+"""
+Paged reads of the measurements of several devices, for the REST API
+
+The measurements of a time range are read in pages of at most a number of
+points (across all measurements that are requested), so a long history is
+never loaded at once. Each page returns a cursor to request the next page
+with, which is where the page ended (the measurement and the time of its
+next point). A page is returned as columns (an array of times and an array
+of values for each measurement), encoded as JSON, MessagePack, or CSV, and
+streamed as it's encoded. Measurements may be aggregated (e.g. the mean of
+each interval) by InfluxDB, so only the aggregates are read.
+"""
+import base64
+import csv
+import json
+from io import StringIO
+
+import msgpack
+
+from mycodo.utils.influx import query_series
+from mycodo.utils.system_pi import return_measurement_info
+
+PAGE_SIZE = 10000  # default points per page
+MAX_PAGE_SIZE = 100000  # points per page
+MAX_SERIES = 100  # measurements per request
+PRECISIONS = {  # nanoseconds per unit of time
+    'ns': 1,
+    'u': 1000,
+    'ms': 1000000,
+    's': 1000000000
+}
+FUNCTIONS = ('COUNT', 'FIRST', 'LAST', 'MAX', 'MEAN', 'MEDIAN', 'MIN', 'SPREAD', 'STDDEV', 'SUM')
+FORMATS = {
+    'json': 'application/json',
+    'msgpack': 'application/x-msgpack',
+    'csv': 'text/csv'
+}
+
+
+class HistoryError(Exception):
+    """The parameters of a read aren't valid."""
+    pass
+
+
+class Series:
+    """A measurement that's read, and where it's stored."""
+    def __init__(self, measurement_id, device_id, channel, unit, measurement):
+        self.measurement_id = measurement_id
+        self.device_id = device_id
+        self.channel = channel
+        self.unit = unit
+        self.measurement = measurement
+
+    def info(self):
+        return {
+            'measurement_id': self.measurement_id,
+            'device_id': self.device_id,
+            'channel': self.channel,
+            'unit': self.unit,
+            'measurement': self.measurement
+        }
+
+
+def measurement_series(device_measurements):
+    """
+    Return where each device measurement is stored
+
+    :param device_measurements: DeviceMeasurements, with their conversions loaded
+    :return: dict of measurement unique_id: Series
+    """
+    series = {}
+    for each_measurement in device_measurements:
+        channel, unit, measurement = return_measurement_info(
+            each_measurement, each_measurement.conversion)
+        if unit:
+            series[each_measurement.unique_id] = Series(
+                each_measurement.unique_id, each_measurement.device_id, channel, unit, measurement)
+    return series
+
+
+def encode_cursor(index, time_ns):
+    """Return the cursor of a page that starts at a time of the series at index."""
+    return base64.urlsafe_b64encode('{}:{}'.format(index, time_ns).encode()).decode()
+
+
+def decode_cursor(cursor, number_series):
+    """
+    Return the series index and time (ns) that a page starts at
+
+    :raises HistoryError: if the cursor isn't one of these series
+    """
+    try:
+        index, time_ns = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        index = int(index)
+        time_ns = int(time_ns)
+    except ValueError:  # Also binascii.Error and UnicodeDecodeError
+        raise HistoryError("cursor is invalid")
+    if not 0 <= index < number_series:
+        raise HistoryError("cursor is invalid for these measurements")
+    return index, time_ns
+
+
+def read_page(series, start_ns, end_ns, cursor=None, page_size=PAGE_SIZE,
+              function=None, interval=None):
+    """
+    Read a page of the measurements of several series
+
+    The series are read in order, each from the start of the time range (or
+    from the cursor), until page_size points have been read.
+
+    :param series: list of Series
+    :param cursor: the cursor of the page, from the previous page (None for the first page)
+    :param function: aggregate function, of all values of each series or of each interval
+    :param interval: seconds of each aggregate
+    :return: (list of (Series, list of [epoch ns, value]), cursor of the next page or None)
+    """
+    index, page_start_ns = 0, start_ns
+    if cursor:
+        index, page_start_ns = decode_cursor(cursor, len(series))
+        page_start_ns = max(page_start_ns, start_ns)
+
+    page = []
+    remaining = page_size
+    while index < len(series):
+        if not remaining:
+            return page, encode_cursor(index, start_ns)
+        each_series = series[index]
+        # One more than the page holds, to know where the next page starts
+        values = query_series(
+            each_series.unit, each_series.device_id,
+            channel=each_series.channel,
+            measure=each_series.measurement,
+            start_ns=page_start_ns,
+            end_ns=end_ns,
+            function=function,
+            group_sec=interval,
+            limit=remaining + 1)
+        if len(values) > remaining:
+            page.append((each_series, values[:remaining]))
+            return page, encode_cursor(index, values[remaining][0])
+        page.append((each_series, values))
+        remaining -= len(values)
+        index += 1
+        page_start_ns = start_ns
+    return page, None
+
+
+def columns(values, precision):
+    """Return the times (in units of precision) and values of a series, as two lists."""
+    scale = PRECISIONS[precision]
+    return [each[0] // scale for each in values], [each[1] for each in values]
+
+
+def encode_json(page, cursor, precision):
+    """Encode a page as JSON, a series at a time."""
+    yield '{"series": ['
+    for number, (each_series, values) in enumerate(page):
+        times, column_values = columns(values, precision)
+        series_dict = each_series.info()
+        series_dict['time'] = times
+        series_dict['value'] = column_values
+        yield '{}{}'.format(', ' if number else '', json.dumps(series_dict))
+    yield '], "next_cursor": {}}}'.format(json.dumps(cursor))
+
+
+def encode_msgpack(page, cursor, precision):
+    """Encode a page as MessagePack (the same structure as JSON), a series at a time."""
+    packer = msgpack.Packer()
+    yield packer.pack_map_header(2)
+    yield packer.pack('series')
+    yield packer.pack_array_header(len(page))
+    for each_series, values in page:
+        times, column_values = columns(values, precision)
+        series_dict = each_series.info()
+        series_dict['time'] = times
+        series_dict['value'] = column_values
+        yield packer.pack(series_dict)
+    yield packer.pack('next_cursor')
+    yield packer.pack(cursor)
+
+
+def encode_csv(page, cursor, precision):
+    """Encode a page as CSV, with a row for each point (the cursor is only returned in a header)."""
+    line = StringIO()
+    writer = csv.writer(line)
+    writer.writerow(['measurement_id', 'time', 'value'])
+    for each_series, values in page:
+        times, column_values = columns(values, precision)
+        for each_time, each_value in zip(times, column_values):
+            writer.writerow([each_series.measurement_id, each_time, each_value])
+            if line.tell() > 65536:
+                yield line.getvalue()
+                line.seek(0)
+                line.truncate(0)
+    yield line.getvalue()
+
+
+ENCODERS = {
+    'json': encode_json,
+    'msgpack': encode_msgpack,
+    'csv': encode_csv
+}
@@ -0,0 +1,280 @@
+# coding=utf-8
+"""
+Parsing and validation of measurements that are posted to the REST API in bulk
+
+Measurements may be posted as a JSON array of points, or as InfluxDB line
+protocol (the schema measurements are stored with: the unit as the
+measurement name, and the device_id, channel, and measure tags). Each point
+is validated against the device measurements (a device and channel that
+exist, and the unit they're stored with), and a status is returned for each
+point, so the points that are valid are stored even if others aren't.
+"""
+import datetime
+import math
+
+from mycodo.utils.system_pi import return_measurement_info
+
+MAX_POINTS = 10000  # points per request
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+PRECISIONS = {
+    'ns': 1e-9,
+    'u': 1e-6,
+    'ms': 1e-3,
+    's': 1
+}
+STATUS_QUEUED = 'queued'
+# The range of timestamps InfluxDB can store (int64 nanoseconds since the epoch)
+TIMESTAMP_MIN = datetime.datetime(1677, 9, 21, 0, 12, 43, 145225)
+TIMESTAMP_MAX = datetime.datetime(2262, 4, 11, 23, 47, 16, 854775)
+
+
+class IngestError(Exception):
+    """A point can't be stored."""
+    pass
+
+
+def measurement_channels(device_measurements):
+    """
+    Return the unit and measurement that each channel of each device is stored with
+
+    :param device_measurements: DeviceMeasurements, with their conversions loaded
+    :return: dict of (device_id, channel): (unit, measurement)
+    """
+    channels = {}
+    for each_measurement in device_measurements:
+        channel, unit, measurement = return_measurement_info(
+            each_measurement, each_measurement.conversion)
+        if channel is not None and unit:
+            channels[(each_measurement.device_id, channel)] = (
+                unit, measurement or each_measurement.measurement)
+    return channels
+
+
+def parse_timestamp(timestamp, scale=1):
+    """
+    Return a timestamp as a datetime (UTC)
+
+    :param timestamp: None, an epoch time (in units of scale seconds), or a string
+        in %Y-%m-%dT%H:%M:%S.%fZ (or another ISO 8601) format
+    """
+    if timestamp is None:
+        return
+    if isinstance(timestamp, bool):
+        raise IngestError("timestamp must be an epoch time or an ISO 8601 string")
+    if isinstance(timestamp, (int, float)):
+        try:
+            # Integers are divided exactly, as nanoseconds don't fit in a float
+            if isinstance(timestamp, int) and scale < 1:
+                seconds, fraction = divmod(timestamp, round(1 / scale))
+                return (datetime.datetime(1970, 1, 1) +
+                        datetime.timedelta(seconds=seconds, microseconds=fraction * scale * 1e6))
+            return datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=timestamp * scale)
+        except (OverflowError, ValueError):
+            raise IngestError("timestamp is out of range")
+    if isinstance(timestamp, str):
+        try:
+            return datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+        except ValueError:
+            pass
+        try:
+            parsed = datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        except ValueError:
+            raise IngestError("timestamp must be an epoch time or an ISO 8601 string")
+        if parsed.tzinfo:
+            parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return parsed
+    raise IngestError("timestamp must be an epoch time or an ISO 8601 string")
+
+
+def validate_point(point, channels):
+    """
+    Return a point that's ready to be stored, with the unit and measurement of its channel
+
+    :param point: dict with the keys device_id, channel, value, and optionally
+        unit, measurement, and timestamp (a datetime, or anything parse_timestamp()
+        accepts; the current time if it's not set)
+    :param channels: dict from measurement_channels()
+    :raises IngestError: if the point can't be stored
+    """
+    if not isinstance(point, dict):
+        raise IngestError("point must be an object")
+
+    device_id = point.get('device_id')
+    if not device_id or not isinstance(device_id, str):
+        raise IngestError("device_id is required")
+
+    channel = point.get('channel')
+    if isinstance(channel, str) and channel.isdigit():
+        channel = int(channel)
+    if not isinstance(channel, int) or isinstance(channel, bool) or channel < 0:
+        raise IngestError("channel must be an integer >= 0")
+
+    if (device_id, channel) not in channels:
+        raise IngestError("no measurement with device_id {} and channel {}".format(device_id, channel))
+    unit, measurement = channels[(device_id, channel)]
+
+    if point.get('unit') not in (None, '', unit):
+        raise IngestError("unit {} doesn't match the unit of the measurement ({})".format(
+            point['unit'], unit))
+    if point.get('measurement') not in (None, '', measurement):
+        raise IngestError("measurement {} doesn't match the measurement ({})".format(
+            point['measurement'], measurement))
+
+    value = point.get('value')
+    if isinstance(value, bool):
+        raise IngestError("value must be a number")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise IngestError("value must be a number")
+    if not math.isfinite(value):
+        raise IngestError("value must be finite")
+
+    timestamp = point.get('timestamp')
+    if not isinstance(timestamp, datetime.datetime):
+        timestamp = parse_timestamp(timestamp)
+    if timestamp is None:
+        # The time it was received, rather than when it's written (which may be retried)
+        timestamp = datetime.datetime.utcnow()
+    elif not TIMESTAMP_MIN <= timestamp <= TIMESTAMP_MAX:
+        raise IngestError("timestamp is out of range ({:%Y-%m-%d} to {:%Y-%m-%d})".format(
+            TIMESTAMP_MIN, TIMESTAMP_MAX))
+
+    return {
+        'device_id': device_id,
+        'channel': channel,
+        'measurement': measurement,
+        'unit': unit,
+        'value': value,
+        'timestamp': timestamp
+    }
+
+
+def parse_json_points(payload):
+    """
+    Return the points of a JSON payload: an array of points, or an object with an array of points
+
+    :raises IngestError: if the payload isn't an array of points
+    """
+    if isinstance(payload, dict):
+        payload = payload.get('points')
+    if not isinstance(payload, list):
+        raise IngestError("Payload must be an array of points, or an object with a 'points' array")
+    return payload
+
+
+def split_unescaped(text, separator, quotes=False):
+    """Split line protocol at separators that aren't escaped (or quoted), keeping escapes."""
+    parts = []
+    current = []
+    escaped = False
+    quoted = False
+    for char in text:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == '\\':
+            current.append(char)
+            escaped = True
+        elif quotes and char == '"':
+            current.append(char)
+            quoted = not quoted
+        elif char == separator and not quoted:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append(''.join(current))
+    return parts
+
+
+def unescape(text):
+    for each_char in ('\\\\', '\\,', '\\ ', '\\=', '\\"'):
+        text = text.replace(each_char, each_char[1])
+    return text
+
+
+def parse_line(line, precision='ns'):
+    """
+    Return the point of a line of InfluxDB line protocol
+
+    e.g. "C,device_id=<ID>,channel=0 value=22.5 1618510020000000000", where the
+    unit (C) is the measurement name, and the measure tag and timestamp are optional
+
+    :raises IngestError: if the line isn't valid line protocol
+    """
+    sections = [each for each in split_unescaped(line, ' ', quotes=True) if each]
+    if len(sections) not in (2, 3):
+        raise IngestError("line must be formatted as <unit>,device_id=<ID>,channel=<channel> "
+                          "value=<value> [timestamp]")
+
+    point = {}
+    key = split_unescaped(sections[0], ',')
+    point['unit'] = unescape(key[0])
+    for each_tag in key[1:]:
+        tag, _, tag_value = each_tag.partition('=')
+        tag = unescape(tag)
+        if tag in ('device_id', 'channel'):
+            point[tag] = unescape(tag_value)
+        elif tag == 'measure':
+            point['measurement'] = unescape(tag_value)
+
+    for each_field in split_unescaped(sections[1], ',', quotes=True):
+        field, _, field_value = each_field.partition('=')
+        if unescape(field) == 'value':
+            if field_value.endswith(('i', 'u')):  # Integer field
+                field_value = field_value[:-1]
+            try:
+                point['value'] = float(field_value)
+            except ValueError:
+                raise IngestError("value field must be a number")
+    if 'value' not in point:
+        raise IngestError("value field is required")
+
+    if len(sections) == 3:
+        try:
+            point['timestamp'] = parse_timestamp(int(sections[2]), scale=PRECISIONS[precision])
+        except ValueError:
+            raise IngestError("timestamp must be an integer")
+    return point
+
+
+def parse_line_protocol(text, precision='ns'):
+    """
+    Return the points (or the IngestError of each line that isn't valid) of InfluxDB line protocol
+
+    Empty lines and comments (lines starting with #) are skipped.
+    """
+    if precision not in PRECISIONS:
+        raise IngestError("precision must be one of {}".format(', '.join(PRECISIONS)))
+    points = []
+    for each_line in text.splitlines():
+        each_line = each_line.strip()
+        if not each_line or each_line.startswith('#'):
+            continue
+        try:
+            points.append(parse_line(each_line, precision=precision))
+        except IngestError as err:
+            points.append(err)
+    return points
+
+
+def prepare_points(points, channels):
+    """
+    Validate points
+
+    :param points: list of points (or the IngestError of points that couldn't be parsed)
+    :param channels: dict from measurement_channels()
+    :return: (list of the status of each point, list of (index, point) of the valid points)
+    """
+    statuses = []
+    valid = []
+    for index, each_point in enumerate(points):
+        try:
+            if isinstance(each_point, IngestError):
+                raise each_point
+            valid.append((index, validate_point(each_point, channels)))
+            statuses.append(STATUS_QUEUED)
+        except IngestError as err:
+            statuses.append(str(err))
+    return statuses, valid
@@ -1,7 +1,11 @@
 # coding=utf-8
+import copy
 import datetime
 import logging
+import threading
 import time
+from bisect import bisect_left
+from bisect import bisect_right
 from math import sin, radians
 
 from mycodo.databases.models import Method
@@ -11,6 +15,11 @@ from mycodo.utils.system_pi import get_sec
 
 logger = logging.getLogger(__name__)
 
+# Method handlers cached per method unique_id. Entries are invalidated
+# explicitly (see invalidate_method_handler()) when a method is edited.
+_method_handler_cache = {}
+_method_handler_lock = threading.Lock()
+
 
 def parse_db_time(time_string, default=None):
     try:
@@ -47,6 +56,24 @@ class AbstractMethod(object):
         self.method_data_first = self.method_data.filter(MethodData.output_id.is_(None)).first()
         self.method_data_repeat = self.method_data.filter(MethodData.duration_sec == 0).first()
 
+        self.compile()
+
+    def compile(self):
+        """
+        Called once after the method data has been loaded to precompute anything
+        needed by calculate_setpoint(), so repeated calls don't need to parse rows
+        """
+        pass
+
+    def with_logger(self, logger):
+        """
+        Returns a shallow copy of this handler that logs to the given logger.
+        Precompiled data is shared with the original handler.
+        """
+        handler = copy.copy(self)
+        handler.logger = logger
+        return handler
+
     def determine_end_time(self, method_start_time):
         """
         Called to determine desired end time of this method
@@ -84,52 +111,68 @@ class DateMethod(AbstractMethod):
         """
         return False
 
+    def compile(self):
+        # Parse the time spans once and sort them by start time for bisection
+        if self.ignore_date():
+            time_format = '%H:%M:%S'
+        else:
+            time_format = '%Y-%m-%d %H:%M:%S'
+
+        timeline = []
+        for each_method in self.method_data_all:
+            if each_method.time_start is None or each_method.time_end is None:
+                continue
+            if each_method.setpoint_end is not None:
+                setpoint_end = each_method.setpoint_end
+            else:
+                setpoint_end = each_method.setpoint_start
+            timeline.append((
+                datetime.datetime.strptime(each_method.time_start, time_format),
+                datetime.datetime.strptime(each_method.time_end, time_format),
+                each_method.setpoint_start,
+                setpoint_end))
+
+        timeline.sort(key=lambda span: span[0])
+        self.timeline = timeline
+        self.timeline_starts = [span[0] for span in timeline]
+
     def calculate_setpoint(self, now, method_start_time=None):
         # Calculate where the current time/date is within the time/date method
 
         if self.ignore_date():
             now = datetime.datetime.strptime(str(now.strftime('%H:%M:%S')), '%H:%M:%S')
 
-        for each_method in self.method_data_all:
-            if self.ignore_date():
-                start_time = datetime.datetime.strptime(each_method.time_start, '%H:%M:%S')
-                end_time = datetime.datetime.strptime(each_method.time_end, '%H:%M:%S')
-            else:
-                start_time = datetime.datetime.strptime(each_method.time_start, '%Y-%m-%d %H:%M:%S')
-                end_time = datetime.datetime.strptime(each_method.time_end, '%Y-%m-%d %H:%M:%S')
+        # Find the last span that starts before now
+        index = bisect_left(self.timeline_starts, now) - 1
 
-            if start_time < now < end_time:
-                setpoint_start = each_method.setpoint_start
-                if each_method.setpoint_end is not None:
-                    setpoint_end = each_method.setpoint_end
-                else:
-                    setpoint_end = each_method.setpoint_start
+        if index >= 0 and now < self.timeline[index][1]:
+            start_time, end_time, setpoint_start, setpoint_end = self.timeline[index]
 
-                setpoint_diff = abs(setpoint_end - setpoint_start)
-                total_seconds = (end_time - start_time).total_seconds()
-                part_seconds = (now - start_time).total_seconds()
-                percent_total = part_seconds / total_seconds
+            setpoint_diff = abs(setpoint_end - setpoint_start)
+            total_seconds = (end_time - start_time).total_seconds()
+            part_seconds = (now - start_time).total_seconds()
+            percent_total = part_seconds / total_seconds
 
-                if setpoint_start < setpoint_end:
-                    new_setpoint = setpoint_start + (setpoint_diff * percent_total)
-                else:
-                    new_setpoint = setpoint_start - (setpoint_diff * percent_total)
+            if setpoint_start < setpoint_end:
+                new_setpoint = setpoint_start + (setpoint_diff * percent_total)
+            else:
+                new_setpoint = setpoint_start - (setpoint_diff * percent_total)
 
-                if self.logger:
-                    if self.ignore_date():
-                        self.logger.debug("[Method] Start: {start} End: {end}".format(
-                            start=start_time.strftime('%H:%M:%S'),
-                            end=end_time.strftime('%H:%M:%S')))
-                    else:
-                        self.logger.debug("[Method] Start: {start} End: {end}".format(
-                            start=start_time, end=end_time))
+            if self.logger:
+                if self.ignore_date():
                     self.logger.debug("[Method] Start: {start} End: {end}".format(
-                        start=setpoint_start, end=setpoint_end))
-                    self.logger.debug("[Method] Total: {tot} Part total: {par} ({per}%)".format(
-                        tot=total_seconds, par=part_seconds, per=percent_total))
-                    self.logger.debug("[Method] New Setpoint: {sp}".format(
-                        sp=new_setpoint))
-                return new_setpoint, False
+                        start=start_time.strftime('%H:%M:%S'),
+                        end=end_time.strftime('%H:%M:%S')))
+                else:
+                    self.logger.debug("[Method] Start: {start} End: {end}".format(
+                        start=start_time, end=end_time))
+                self.logger.debug("[Method] Start: {start} End: {end}".format(
+                    start=setpoint_start, end=setpoint_end))
+                self.logger.debug("[Method] Total: {tot} Part total: {par} ({per}%)".format(
+                    tot=total_seconds, par=part_seconds, per=percent_total))
+                self.logger.debug("[Method] New Setpoint: {sp}".format(
+                    sp=new_setpoint))
+            return new_setpoint, False
 
         # Setpoint not needing to be calculated, use default setpoint
         return None, False
@@ -203,6 +246,25 @@ class AbstractDailyFormulaMethod(AbstractMethod):
     """
 
     def get_plot(self, max_points_x=700):
+        if self.method_data_first is None:
+            return []
+
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+
+        if not np:
+            return self.get_plot_iterative(max_points_x)
+
+        seconds_in_day = 60 * 60 * 24
+        percent = np.arange(max_points_x) / float(max_points_x)
+        # calculate_setpoint() only resolves whole seconds of the day
+        seconds = np.floor(percent * seconds_in_day)
+        y = self.calculate_setpoint_array(np, seconds)
+        return np.column_stack((percent * seconds_in_day * 1000, y)).tolist()
+
+    def get_plot_iterative(self, max_points_x=700):
         result = []
 
         seconds_in_day = 60 * 60 * 24
@@ -216,6 +278,15 @@ class AbstractDailyFormulaMethod(AbstractMethod):
 
         return result
 
+    def calculate_setpoint_array(self, np, seconds):
+        """
+        Vectorized counterpart of calculate_setpoint()
+        :param np: the numpy module
+        :param seconds: numpy array of seconds of the day
+        :return: numpy array of setpoints
+        """
+        raise NotImplementedError
+
 
 class DailySineMethod(AbstractDailyFormulaMethod):
     """
@@ -238,6 +309,13 @@ class DailySineMethod(AbstractDailyFormulaMethod):
                                        angle)
         return new_setpoint, False
 
+    def calculate_setpoint_array(self, np, seconds):
+        angle = seconds / (24 * 60 * 60) * 360
+        return (self.method_data_first.amplitude *
+                np.sin(np.radians(self.method_data_first.frequency *
+                                  (angle - self.method_data_first.shift_angle))) +
+                self.method_data_first.shift_y)
+
 
 class DailyBezierMethod(AbstractDailyFormulaMethod):
     def calculate_setpoint(self, now, method_start_time=None):
@@ -257,6 +335,16 @@ class DailyBezierMethod(AbstractDailyFormulaMethod):
 
         return new_setpoint, False
 
+    def calculate_setpoint_array(self, np, seconds):
+        return bezier_curve_y_out_array(
+            np,
+            self.method_data_first.shift_angle,
+            (self.method_data_first.x0, self.method_data_first.y0),
+            (self.method_data_first.x1, self.method_data_first.y1),
+            (self.method_data_first.x2, self.method_data_first.y2),
+            (self.method_data_first.x3, self.method_data_first.y3),
+            seconds)
+
 
 class DurationMethod(AbstractMethod):
     """
@@ -265,6 +353,31 @@ class DurationMethod(AbstractMethod):
     24-hour period and this method will repeat daily.
     """
 
+    def compile(self):
+        # Cumulative end time (seconds from the start of the cycle) of each row,
+        # so the active row can be found by bisection
+        self.duration_rows = []
+        self.duration_ends = []
+        self.total_duration = 0
+        self.total_repeat = None
+
+        for each_method in self.method_data_all:
+            if each_method.duration_sec == 0:
+                if self.total_repeat is None:
+                    self.total_repeat = each_method.duration_end or 0
+                continue
+
+            if each_method.setpoint_end is not None:
+                setpoint_end = each_method.setpoint_end
+            else:
+                setpoint_end = each_method.setpoint_start
+
+            start_sec = self.total_duration
+            self.total_duration += each_method.duration_sec
+            self.duration_rows.append((
+                start_sec, each_method.duration_sec, each_method.setpoint_start, setpoint_end))
+            self.duration_ends.append(self.total_duration)
+
     def calculate_setpoint(self, now, method_start_time=None):
         # Calculate the duration in the method based on self.method_start_time
 
@@ -285,54 +398,39 @@ class DurationMethod(AbstractMethod):
                 # still repeated
                 seconds_from_start = seconds_from_start % duration_in_seconds
 
-        total_sec = 0
-        previous_total_sec = 0
-        for each_method in self.method_data_all:
-            total_sec += each_method.duration_sec
-            if previous_total_sec <= seconds_from_start < total_sec:
-                row_since_start_sec = seconds_from_start - previous_total_sec
-                percent_row = row_since_start_sec / each_method.duration_sec
-
-                setpoint_start = each_method.setpoint_start
-                if each_method.setpoint_end is not None:
-                    setpoint_end = each_method.setpoint_end
-                else:
-                    setpoint_end = each_method.setpoint_start
-                setpoint_diff = abs(setpoint_end - setpoint_start)
-                if setpoint_start < setpoint_end:
-                    new_setpoint = setpoint_start + (setpoint_diff * percent_row)
-                else:
-                    new_setpoint = setpoint_start - (setpoint_diff * percent_row)
+        # Find the first row that ends after seconds_from_start
+        index = bisect_right(self.duration_ends, seconds_from_start)
 
-                if self.logger:
-                    self.logger.debug(
-                        "[Method] {sec_method:.1f}s/{sec_cycle:.1f}s/{sec_row:.1f}s "
-                        "since start of method/cycle/row".format(
-                            sec_method=(now - start_time).total_seconds(),
-                            sec_cycle=seconds_from_start,
-                            sec_row=row_since_start_sec))
-                    self.logger.debug(
-                        "[Method] Percent of row: {per:.2f}, new Setpoint {sp:.2f}".format(
-                            per=percent_row, sp=new_setpoint))
-                return new_setpoint, False
+        if seconds_from_start >= 0 and index < len(self.duration_rows):
+            start_sec, duration_sec, setpoint_start, setpoint_end = self.duration_rows[index]
+            row_since_start_sec = seconds_from_start - start_sec
+            percent_row = row_since_start_sec / duration_sec
 
-            previous_total_sec = total_sec
+            setpoint_diff = abs(setpoint_end - setpoint_start)
+            if setpoint_start < setpoint_end:
+                new_setpoint = setpoint_start + (setpoint_diff * percent_row)
+            else:
+                new_setpoint = setpoint_start - (setpoint_diff * percent_row)
 
-        return previous_total_sec, False
+            if self.logger:
+                self.logger.debug(
+                    "[Method] {sec_method:.1f}s/{sec_cycle:.1f}s/{sec_row:.1f}s "
+                    "since start of method/cycle/row".format(
+                        sec_method=(now - start_time).total_seconds(),
+                        sec_cycle=seconds_from_start,
+                        sec_row=row_since_start_sec))
+                self.logger.debug(
+                    "[Method] Percent of row: {per:.2f}, new Setpoint {sp:.2f}".format(
+                        per=percent_row, sp=new_setpoint))
+            return new_setpoint, False
+
+        return self.total_duration, False
 
     def cycle_duration(self):
-        total_sec = 0
-        for each_method in self.method_data_all:
-            total_sec += each_method.duration_sec
-
-        return total_sec
+        return self.total_duration
 
     def repeat_duration(self):
-        for each_method in self.method_data_all:
-            if each_method.duration_sec == 0:
-                return each_method.duration_end or 0
-
-        return None
+        return self.total_repeat
 
     def determine_end_time(self, method_start_time):
         method_start_time = parse_db_time(method_start_time, datetime.datetime.min)
@@ -435,7 +533,7 @@ def create_method_handler(method, method_data, logger=None):
 
     method_class = globals().get(method.method_type+"Method")
     if not method_class or not issubclass(method_class, AbstractMethod):
-        logger.error("Method {} is unknown.".format(method.method_type))
+        (logger or logging.getLogger(__name__)).error("Method {} is unknown.".format(method.method_type))
         method_class = AbstractMethod
 
     return method_class(method, method_data, logger)
@@ -443,16 +541,41 @@ def create_method_handler(method, method_data, logger=None):
 
 def load_method_handler(method_id, logger=None):
     """
-    Loads method type and data from database for the given method_id. Then uses method_by_type to create an instance.
+    Returns the method handler for the given method_id. On first use, the method type and data are loaded
+    from the database and the handler (with its precompiled data) is cached until invalidate_method_handler()
+    is called for that method.
     """
 
-    method = db_retrieve_table_daemon(Method).filter(Method.unique_id == method_id).first()
-    if not method:
-        return None
+    with _method_handler_lock:
+        handler = _method_handler_cache.get(method_id)
+
+    if handler is None:
+        method = db_retrieve_table_daemon(Method).filter(Method.unique_id == method_id).first()
+        if not method:
+            return None
+
+        method_data = db_retrieve_table_daemon(MethodData).filter(MethodData.method_id == method_id)
+
+        handler = create_method_handler(method, method_data)
+
+        with _method_handler_lock:
+            _method_handler_cache[method_id] = handler
+
+    return handler.with_logger(logger)
 
-    method_data = db_retrieve_table_daemon(MethodData).filter(MethodData.method_id == method_id)
 
-    return create_method_handler(method, method_data, logger)
+def invalidate_method_handler(method_id=None):
+    """
+    Removes the cached handler of method_id, or all cached handlers if method_id is None.
+    Cascade methods load their linked methods through the cache, so invalidating a linked
+    method is sufficient for cascades to pick up its changes.
+    """
+
+    with _method_handler_lock:
+        if method_id is None:
+            _method_handler_cache.clear()
+        else:
+            _method_handler_cache.pop(method_id, None)
 
 
 def sine_wave_y_out(amplitude, frequency, shift_angle,
@@ -535,3 +658,49 @@ def bezier_curve_y_out(shift_angle, P0, P1, P2, P3, second_of_day):
     # Typecast y from np.complex128 to float64
     y = y.real
     return y
+
+
+def bezier_curve_y_out_array(np, shift_angle, P0, P1, P2, P3, second_of_day):
+    """
+    Vectorized counterpart of bezier_curve_y_out() for a numpy array of seconds of the day.
+
+    Rather than finding the polynomial roots for every x-value, the curve is sampled densely in t,
+    t is interpolated from x, then refined with a few Newton iterations.
+    """
+    seconds_per_day = 24*60*60
+
+    seconds = np.asarray(second_of_day, dtype=float)
+    if shift_angle:
+        angle_seconds = shift_angle/360*seconds_per_day
+        seconds_shifted = seconds + angle_seconds
+        seconds_shifted = np.where(
+            seconds_shifted > seconds_per_day, seconds_shifted - seconds_per_day, seconds_shifted)
+        percent_of_day = seconds_shifted/seconds_per_day
+    else:
+        percent_of_day = seconds/seconds_per_day
+
+    x = percent_of_day*(P0[0]-P3[0])
+
+    def cubic(t, p0, p1, p2, p3):
+        return (1-t)**3*p0 + 3*(1-t)**2*t*p1 + 3*(1-t)*t**2*p2 + t**3*p3
+
+    def cubic_derivative(t, p0, p1, p2, p3):
+        return 3*(1-t)**2*(p1-p0) + 6*(1-t)*t*(p2-p1) + 3*t**2*(p3-p2)
+
+    samples_t = np.linspace(0, 1, 4097)
+    samples_x = cubic(samples_t, P0[0], P1[0], P2[0], P3[0])
+    order = np.argsort(samples_x)
+    param_t = np.interp(x, samples_x[order], samples_t[order])
+
+    for _ in range(3):
+        derivative = cubic_derivative(param_t, P0[0], P1[0], P2[0], P3[0])
+        error = cubic(param_t, P0[0], P1[0], P2[0], P3[0]) - x
+        step = np.divide(error, derivative, out=np.zeros_like(error), where=derivative != 0)
+        param_t = np.clip(param_t - step, 0, 1)
+
+    y = cubic(param_t, P0[1], P1[1], P2[1], P3[1])
+
+    # Same as bezier_curve_y_out(), x-values outside the curve have no valid root
+    tolerance = 1e-9 * max(abs(P0[0] - P3[0]), 1)
+    valid = (x >= samples_x.min() - tolerance) & (x <= samples_x.max() + tolerance)
+    return np.where(valid, y, 0)
@@ -0,0 +1,399 @@
+# coding=utf-8
+"""
+Lightweight timing metrics of daemon controllers
+
+Each controller registers itself when it starts, and the duration (and whether
+an error occurred) of its operations are recorded, such as the duration of each
+loop(), reading an Input, executing an Action, or querying the databases.
+Operations are grouped into histograms per controller, which are returned by the
+daemon (get_controller_metrics()) and may be formatted for scraping by Prometheus
+or Telegraf with format_prometheus().
+
+Periodic controllers (Inputs, PIDs, Triggers, Conditionals) also record when each
+run was scheduled and when it actually started with a DeadlineMonitor. The CPU
+and memory usage of Inputs that run in a worker process, and the counters of
+listener Inputs that store measurements in batches, are also included.
+"""
+import bisect
+import math
+import threading
+from collections import deque
+import timeit
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class OperationStats:
+    """Histogram of the durations of a single operation."""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.errors = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, seconds, error=False):
+        index = bisect.bisect_left(self.buckets, seconds)
+        if index < len(self.bucket_counts):
+            self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+        if error:
+            self.errors += 1
+
+    def snapshot(self):
+        cumulative = 0
+        buckets = []
+        for upper_bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            cumulative += bucket_count
+            buckets.append([upper_bound, cumulative])
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'sum': self.sum,
+            'max': self.max,
+            'last': self.last,
+            'buckets': buckets  # Cumulative, the +Inf bucket is equal to count
+        }
+
+
+class DeadlineMonitor:
+    """
+    Scheduled vs. actual start times of the runs of a periodic controller
+
+    The lateness (jitter) of each run is recorded. A run that starts a full period
+    or more after it was scheduled has missed its deadline (at least one period
+    was skipped). When alert_misses consecutive deadlines have been missed,
+    alert_callback(consecutive_misses, lateness) is called once.
+    """
+    def __init__(self, alert_misses=0, alert_callback=None, history=1000):
+        self.alert_misses = alert_misses or 0
+        self.alert_callback = alert_callback
+        self.lock = threading.Lock()
+        self.lateness = deque(maxlen=history)
+        self.runs = 0
+        self.misses = 0
+        self.periods_skipped = 0
+        self.consecutive_misses = 0
+        self.alerts = 0
+        self.lateness_max = 0.0
+        self.last_scheduled = None
+        self.last_started = None
+
+    def record(self, scheduled, started, period=None):
+        """
+        Record a run of the controller
+
+        :param scheduled: epoch time the run was scheduled to start
+        :param started: epoch time the run started
+        :param period: the controller's period (seconds), if it has one
+        :return: True if the deadline was missed
+        """
+        lateness = max(0.0, started - scheduled)
+        missed = bool(period) and lateness >= period
+        with self.lock:
+            self.runs += 1
+            self.lateness.append(lateness)
+            self.last_scheduled = scheduled
+            self.last_started = started
+            if lateness > self.lateness_max:
+                self.lateness_max = lateness
+            if missed:
+                self.misses += 1
+                self.periods_skipped += int(lateness // period)
+                self.consecutive_misses += 1
+            else:
+                self.consecutive_misses = 0
+            alert = bool(self.alert_misses) and self.consecutive_misses == self.alert_misses
+            if alert:
+                self.alerts += 1
+
+        if alert and self.alert_callback:
+            self.alert_callback(self.consecutive_misses, lateness)
+        return missed
+
+    def percentiles(self, percents=(50, 90, 99)):
+        """Return the lateness (seconds) at each percentile of the recent runs (nearest rank)."""
+        with self.lock:
+            values = sorted(self.lateness)
+        if not values:
+            return {percent: None for percent in percents}
+        return {
+            percent: values[max(0, int(math.ceil(percent / 100.0 * len(values))) - 1)]
+            for percent in percents
+        }
+
+    def status(self):
+        percentiles = self.percentiles()
+        return {
+            'runs': self.runs,
+            'misses': self.misses,
+            'periods_skipped': self.periods_skipped,
+            'consecutive_misses': self.consecutive_misses,
+            'alerts': self.alerts,
+            'lateness_last': self.lateness[-1] if self.lateness else None,
+            'lateness_max': self.lateness_max,
+            'lateness_p50': percentiles[50],
+            'lateness_p90': percentiles[90],
+            'lateness_p99': percentiles[99]
+        }
+
+    def status_string(self):
+        status = self.status()
+        if not status['runs']:
+            return "Deadlines: no scheduled runs yet"
+        return ("Deadlines: {runs} runs, {misses} missed ({skipped} periods skipped), "
+                "{consecutive} consecutive misses"
+                "\nStart lateness (s): p50 {p50:.3f}, p90 {p90:.3f}, p99 {p99:.3f}, max {max:.3f}").format(
+            runs=status['runs'],
+            misses=status['misses'],
+            skipped=status['periods_skipped'],
+            consecutive=status['consecutive_misses'],
+            p50=status['lateness_p50'],
+            p90=status['lateness_p90'],
+            p99=status['lateness_p99'],
+            max=status['lateness_max'])
+
+
+class ControllerMetrics:
+    """Operation metrics of a single controller."""
+    def __init__(self, controller_id, controller_type):
+        self.controller_id = controller_id
+        self.controller_type = controller_type
+        self.lock = threading.Lock()
+        self.operations = {}
+        self.deadline = None  # DeadlineMonitor of periodic controllers
+        self.worker = None  # InputWorker of Inputs run in a worker process
+        self.ingest = None  # MeasurementBatcher of listener Inputs
+
+    def observe(self, operation, seconds, error=False):
+        with self.lock:
+            if operation not in self.operations:
+                self.operations[operation] = OperationStats()
+            self.operations[operation].observe(seconds, error=error)
+
+    @contextmanager
+    def timed(self, operation):
+        """Record the duration of the enclosed block, counting an error if it raises."""
+        timer = timeit.default_timer()
+        try:
+            yield
+        except Exception:
+            self.observe(operation, timeit.default_timer() - timer, error=True)
+            raise
+        self.observe(operation, timeit.default_timer() - timer)
+
+    def snapshot(self):
+        with self.lock:
+            snapshot = {
+                'type': self.controller_type,
+                'operations': {
+                    name: stats.snapshot() for name, stats in self.operations.items()
+                }
+            }
+        if self.deadline:
+            snapshot['deadline'] = self.deadline.status()
+        if self.worker:
+            snapshot['worker'] = self.worker.status()
+        if self.ingest:
+            snapshot['ingest'] = self.ingest.status()
+        return snapshot
+
+
+class MetricsRegistry:
+    """Metrics of all running controllers."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.controllers = {}
+        self.local = threading.local()
+
+    def register(self, controller_id, controller_type):
+        metrics = ControllerMetrics(controller_id, controller_type)
+        with self.lock:
+            self.controllers[controller_id] = metrics
+        return metrics
+
+    def unregister(self, controller_id, metrics=None):
+        """Remove a controller's metrics, unless metrics is set and they have since been replaced."""
+        with self.lock:
+            if metrics is None or self.controllers.get(controller_id) is metrics:
+                self.controllers.pop(controller_id, None)
+
+    def set_current(self, controller_id):
+        """Associate the calling thread with a controller (see observe_current())."""
+        self.local.controller_id = controller_id
+
+    def current(self):
+        controller_id = getattr(self.local, 'controller_id', None)
+        if controller_id is not None:
+            return self.controllers.get(controller_id)
+
+    def observe(self, controller_id, operation, seconds, error=False):
+        """Record an operation of a controller, ignored if the controller isn't registered."""
+        metrics = self.controllers.get(controller_id)
+        if metrics:
+            metrics.observe(operation, seconds, error=error)
+
+    def observe_current(self, operation, seconds, error=False):
+        """Record an operation of the controller running in the calling thread, if any."""
+        metrics = self.current()
+        if metrics:
+            metrics.observe(operation, seconds, error=error)
+
+    @contextmanager
+    def timed(self, controller_id, operation):
+        """Record the duration of the enclosed block as an operation of a controller."""
+        metrics = self.controllers.get(controller_id)
+        if metrics:
+            with metrics.timed(operation):
+                yield
+        else:
+            yield
+
+    @contextmanager
+    def timed_current(self, operation):
+        """Record the duration of the enclosed block as an operation of the calling thread's controller."""
+        metrics = self.current()
+        if metrics:
+            with metrics.timed(operation):
+                yield
+        else:
+            yield
+
+    def snapshot(self):
+        with self.lock:
+            controllers = list(self.controllers.values())
+        return {each_cont.controller_id: each_cont.snapshot() for each_cont in controllers}
+
+
+controller_metrics = MetricsRegistry()
+
+
+def format_prometheus(snapshot, prefix='mycodo_controller'):
+    """
+    Format a metrics snapshot in the Prometheus text exposition format
+
+    :param snapshot: dict returned by MetricsRegistry.snapshot()
+    :param prefix: prefix of the metric names
+    :return: str
+    """
+    def label_str(**labels):
+        return ','.join('{}="{}"'.format(
+            key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+            for key, value in labels.items())
+
+    lines_seconds = []
+    lines_errors = []
+    lines_max = []
+    lines_lateness = []
+    lines_misses = []
+    lines_worker_cpu = []
+    lines_worker_rss = []
+    lines_worker_restarts = []
+    lines_ingest = {'received': [], 'written': [], 'dropped': [], 'buffered': [], 'lag_last': []}
+
+    for controller_id, controller in sorted(snapshot.items()):
+        for operation, stats in sorted(controller['operations'].items()):
+            labels = label_str(
+                controller_id=controller_id,
+                controller_type=controller['type'],
+                operation=operation)
+            for upper_bound, count in stats['buckets']:
+                lines_seconds.append('{}_operation_seconds_bucket{{{},le="{}"}} {}'.format(
+                    prefix, labels, upper_bound, count))
+            lines_seconds.append('{}_operation_seconds_bucket{{{},le="+Inf"}} {}'.format(
+                prefix, labels, stats['count']))
+            lines_seconds.append('{}_operation_seconds_sum{{{}}} {}'.format(
+                prefix, labels, stats['sum']))
+            lines_seconds.append('{}_operation_seconds_count{{{}}} {}'.format(
+                prefix, labels, stats['count']))
+            lines_errors.append('{}_operation_errors_total{{{}}} {}'.format(
+                prefix, labels, stats['errors']))
+            lines_max.append('{}_operation_max_seconds{{{}}} {}'.format(
+                prefix, labels, stats['max']))
+
+        deadline = controller.get('deadline')
+        if deadline and deadline['runs']:
+            labels = label_str(
+                controller_id=controller_id,
+                controller_type=controller['type'])
+            for quantile, key in [('0.5', 'lateness_p50'), ('0.9', 'lateness_p90'), ('0.99', 'lateness_p99')]:
+                lines_lateness.append('{}_start_lateness_seconds{{{},quantile="{}"}} {}'.format(
+                    prefix, labels, quantile, deadline[key]))
+            lines_misses.append('{}_deadline_misses_total{{{}}} {}'.format(
+                prefix, labels, deadline['misses']))
+
+        worker = controller.get('worker')
+        if worker and worker['alive']:
+            labels = label_str(
+                controller_id=controller_id,
+                controller_type=controller['type'])
+            lines_worker_cpu.append('{}_worker_cpu_seconds_total{{{}}} {}'.format(
+                prefix, labels, worker['cpu_seconds']))
+            lines_worker_rss.append('{}_worker_rss_bytes{{{}}} {}'.format(
+                prefix, labels, worker['rss_bytes']))
+            lines_worker_restarts.append('{}_worker_restarts_total{{{}}} {}'.format(
+                prefix, labels, worker['restarts']))
+
+        ingest = controller.get('ingest')
+        if ingest:
+            labels = label_str(
+                controller_id=controller_id,
+                controller_type=controller['type'])
+            for key, name in [('received', 'ingest_received_total'),
+                              ('written', 'ingest_written_total'),
+                              ('dropped', 'ingest_dropped_total'),
+                              ('buffered', 'ingest_buffered'),
+                              ('lag_last', 'ingest_lag_seconds')]:
+                lines_ingest[key].append('{}_{}{{{}}} {}'.format(
+                    prefix, name, labels, ingest[key]))
+
+    lines = [
+        '# HELP {}_operation_seconds Duration of controller operations'.format(prefix),
+        '# TYPE {}_operation_seconds histogram'.format(prefix)
+    ] + lines_seconds + [
+        '# HELP {}_operation_errors_total Number of controller operations that raised an error'.format(prefix),
+        '# TYPE {}_operation_errors_total counter'.format(prefix)
+    ] + lines_errors + [
+        '# HELP {}_operation_max_seconds Longest duration of controller operations'.format(prefix),
+        '# TYPE {}_operation_max_seconds gauge'.format(prefix)
+    ] + lines_max + [
+        '# HELP {}_start_lateness_seconds How late periodic runs started, of the recent runs'.format(prefix),
+        '# TYPE {}_start_lateness_seconds gauge'.format(prefix)
+    ] + lines_lateness + [
+        '# HELP {}_deadline_misses_total Number of periodic runs that started a period or more late'.format(prefix),
+        '# TYPE {}_deadline_misses_total counter'.format(prefix)
+    ] + lines_misses + [
+        '# HELP {}_worker_cpu_seconds_total CPU time used by the worker process of an Input'.format(prefix),
+        '# TYPE {}_worker_cpu_seconds_total counter'.format(prefix)
+    ] + lines_worker_cpu + [
+        '# HELP {}_worker_rss_bytes Resident memory of the worker process of an Input'.format(prefix),
+        '# TYPE {}_worker_rss_bytes gauge'.format(prefix)
+    ] + lines_worker_rss + [
+        '# HELP {}_worker_restarts_total Number of times the worker process of an Input was restarted'.format(prefix),
+        '# TYPE {}_worker_restarts_total counter'.format(prefix)
+    ] + lines_worker_restarts + [
+        '# HELP {}_ingest_received_total Number of measurements received by a listener Input'.format(prefix),
+        '# TYPE {}_ingest_received_total counter'.format(prefix)
+    ] + lines_ingest['received'] + [
+        '# HELP {}_ingest_written_total Number of measurements of a listener Input written in batches'.format(prefix),
+        '# TYPE {}_ingest_written_total counter'.format(prefix)
+    ] + lines_ingest['written'] + [
+        '# HELP {}_ingest_dropped_total Number of measurements of a listener Input dropped (buffer full)'.format(prefix),
+        '# TYPE {}_ingest_dropped_total counter'.format(prefix)
+    ] + lines_ingest['dropped'] + [
+        '# HELP {}_ingest_buffered Number of measurements of a listener Input waiting to be written'.format(prefix),
+        '# TYPE {}_ingest_buffered gauge'.format(prefix)
+    ] + lines_ingest['buffered'] + [
+        '# HELP {}_ingest_lag_seconds Age of the oldest measurement of the last batch when written'.format(prefix),
+        '# TYPE {}_ingest_lag_seconds gauge'.format(prefix)
+    ] + lines_ingest['lag_last']
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,247 @@
+# coding=utf-8
+"""
+Shared, persistent MQTT client connections
+
+Rather than opening a connection to the broker for every message (as the
+paho.mqtt.publish helpers do), MQTT Actions and Outputs publish through a
+connection that's kept open by the daemon. Connections are shared by all
+publishers with the same broker, port, credentials, and client ID, and
+reconnect automatically. Messages published while a connection is down are
+queued (up to QUEUE_CAPACITY, dropping the oldest) and sent when it's restored.
+
+Publishers identify themselves as the owner of their connection (e.g. the
+unique ID of the Action or Output). When an owner publishes with different
+settings (e.g. its broker or password was edited), it's moved to a connection
+with the new settings, and its previous connection is closed if it has no
+other owners, so a stale client doesn't keep reconnecting (or share its
+client ID with the new one). Connections that haven't been used for
+IDLE_TIMEOUT seconds (e.g. of a deleted Output) are closed.
+
+single() takes the same arguments as paho.mqtt.publish.single() (and owner),
+but returns as soon as the message is queued.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from mycodo.utils.logging_utils import set_log_level
+
+logger = logging.getLogger("mycodo.mqtt_connections")
+logger.setLevel(set_log_level(logging))
+
+QUEUE_CAPACITY = 1000  # messages, per connection
+IDLE_TIMEOUT = 900  # seconds without being used before a connection is closed
+IDLE_CHECK_PERIOD = 60  # seconds between checks for idle connections
+
+connections_lock = threading.Lock()
+connections = {}  # settings key: MQTTConnection
+owners = {}  # owner: settings key of its connection
+idle_thread = None
+
+
+class MQTTConnection:
+    """A client connection to an MQTT broker, kept open in paho's network thread."""
+    def __init__(self, hostname, port=1883, client_id="", keepalive=60, auth=None):
+        import paho.mqtt.client as mqtt
+
+        self.hostname = hostname
+        self.port = port
+        self.client_id = client_id or ""
+        self.lock = threading.Lock()
+        self.queue = deque()  # (topic, payload, qos, retain)
+        self.connected = False
+        self.owners = set()
+        self.time_used = time.time()
+
+        self.published = 0
+        self.queued = 0
+        self.dropped = 0
+        self.connects = 0
+        self.disconnects = 0
+        self.time_connected = None
+
+        self.client = mqtt.Client(self.client_id)
+        if auth:
+            self.client.username_pw_set(auth.get('username'), auth.get('password'))
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.reconnect_delay_set(min_delay=1, max_delay=60)
+        self.client.connect_async(hostname, port=port, keepalive=keepalive)
+        self.client.loop_start()  # Connects, and reconnects when disconnected
+
+    @property
+    def name(self):
+        return "{}:{}{}".format(
+            self.hostname, self.port, " ({})".format(self.client_id) if self.client_id else "")
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            logger.error("Could not connect to {}: return code {}".format(self.name, rc))
+            return
+        logger.debug("Connected to {}".format(self.name))
+        with self.lock:
+            self.connected = True
+            self.connects += 1
+            self.time_connected = time.time()
+            queued = list(self.queue)
+            self.queue.clear()
+        for each_message in queued:
+            self.publish(*each_message)
+
+    def on_disconnect(self, client, userdata, rc=0):
+        with self.lock:
+            self.connected = False
+            self.disconnects += 1
+        if rc != 0:
+            logger.error("Disconnected from {} (return code {}), reconnecting".format(self.name, rc))
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        """Publish a message, or queue it if not connected."""
+        self.time_used = time.time()
+        if self.connected:
+            info = self.client.publish(topic, payload=payload, qos=qos, retain=retain)
+            if info.rc == 0:
+                self.published += 1
+                return
+        with self.lock:
+            if len(self.queue) >= QUEUE_CAPACITY:
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append((topic, payload, qos, retain))
+            self.queued += 1
+
+    def close(self):
+        try:
+            self.client.disconnect()
+            self.client.loop_stop()
+        except Exception:
+            logger.exception("Closing connection to {}".format(self.name))
+
+    def stats(self):
+        return {
+            'connected': self.connected,
+            'uptime': time.time() - self.time_connected if self.connected and self.time_connected else None,
+            'published': self.published,
+            'queued': self.queued,
+            'queue_length': len(self.queue),
+            'dropped': self.dropped,
+            'connects': self.connects,
+            'disconnects': self.disconnects
+        }
+
+
+def get_connection(hostname, port=1883, client_id="", keepalive=60, auth=None, owner=None):
+    """
+    Return the shared connection to a broker, opening it if it isn't open
+
+    :param owner: identifies the publisher (e.g. the unique ID of an Output). If its
+        previous connection had other settings, it's closed when it has no other owners.
+    """
+    global idle_thread
+    username = auth.get('username') if auth else None
+    password = auth.get('password') if auth else None
+    key = (hostname, port, username, password, client_id or "")
+    stale = None
+    with connections_lock:
+        if owner is not None and owners.get(owner, key) != key:
+            previous = connections.get(owners[owner])
+            if previous:
+                previous.owners.discard(owner)
+                if not previous.owners:
+                    stale = connections.pop(owners[owner])
+        if key not in connections:
+            connections[key] = MQTTConnection(
+                hostname, port=port, client_id=client_id, keepalive=keepalive, auth=auth)
+        connection = connections[key]
+        connection.time_used = time.time()  # So it isn't closed as idle before it's published to
+        if owner is not None:
+            owners[owner] = key
+            connection.owners.add(owner)
+        if idle_thread is None or not idle_thread.is_alive():
+            idle_thread = threading.Thread(
+                target=close_idle_connections, name='mqtt_idle_connections', daemon=True)
+            idle_thread.start()
+
+    if stale:
+        logger.info("Settings of {} changed, closing its previous connection to {}".format(
+            owner, stale.name))
+        stale.close()
+    return connection
+
+
+def single(topic, payload=None, qos=0, retain=False, hostname="localhost",
+           port=1883, client_id="", keepalive=60, auth=None, owner=None):
+    """Publish a single message through the shared connection to the broker."""
+    get_connection(
+        hostname, port=port, client_id=client_id, keepalive=keepalive, auth=auth, owner=owner
+    ).publish(topic, payload=payload, qos=qos, retain=retain)
+
+
+def remove_connections(idle_timeout=None):
+    """
+    Remove connections and return them, to be closed
+
+    :param idle_timeout: only remove connections that haven't been used for this many
+        seconds (None to remove all connections)
+    """
+    now = time.time()
+    removed = []
+    with connections_lock:
+        for key, each_connection in list(connections.items()):
+            if idle_timeout is None or now - each_connection.time_used > idle_timeout:
+                removed.append(connections.pop(key))
+                for each_owner in each_connection.owners:
+                    if owners.get(each_owner) == key:
+                        del owners[each_owner]
+    return removed
+
+
+def close_idle_connections():
+    """Periodically close connections that haven't been used for IDLE_TIMEOUT seconds."""
+    while True:
+        time.sleep(IDLE_CHECK_PERIOD)
+        for each_connection in remove_connections(idle_timeout=IDLE_TIMEOUT):
+            logger.debug("Closing idle connection to {}".format(each_connection.name))
+            each_connection.close()
+
+
+def close_connections():
+    """Disconnect all connections (called when the daemon stops)."""
+    for each_connection in remove_connections():
+        each_connection.close()
+
+
+def mqtt_stats():
+    """Return the stats of all connections, keyed by broker (and client ID)."""
+    with connections_lock:
+        return {each_connection.name: each_connection.stats()
+                for each_connection in connections.values()}
+
+
+def format_prometheus_mqtt(stats, prefix='mycodo_mqtt'):
+    """
+    Format MQTT connection statistics in the Prometheus text exposition format
+
+    :param stats: dict returned by mqtt_stats()
+    :param prefix: prefix of the metric names
+    :return: str
+    """
+    metrics = [
+        ('connected', 'gauge', 'connected', 'Whether the connection to the broker is open'),
+        ('published_total', 'counter', 'published', 'Number of messages published'),
+        ('queued_total', 'counter', 'queued', 'Number of messages queued while disconnected'),
+        ('queue_length', 'gauge', 'queue_length', 'Number of messages waiting to be published'),
+        ('dropped_total', 'counter', 'dropped', 'Number of queued messages dropped because the queue was full'),
+        ('connects_total', 'counter', 'connects', 'Number of connections (and reconnections) to the broker')
+    ]
+
+    lines = []
+    for name, metric_type, key, description in metrics:
+        lines.append('# HELP {}_{} {}'.format(prefix, name, description))
+        lines.append('# TYPE {}_{} {}'.format(prefix, name, metric_type))
+        for broker, broker_stats in sorted(stats.items()):
+            lines.append('{}_{}{{broker="{}"}} {}'.format(
+                prefix, name, broker.replace('\\', '\\\\').replace('"', '\\"'), int(broker_stats[key])))
+
+    return '\n'.join(lines) + '\n'
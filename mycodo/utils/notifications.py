@@ -0,0 +1,273 @@
+# coding=utf-8
+"""
+Background delivery of notifications (emails and webhooks)
+
+Actions that send notifications queue them with the daemon-wide dispatcher
+rather than sending them from the calling Conditional, Trigger, or Input thread,
+so a slow or unreachable server doesn't stall the controller. Worker threads
+deliver queued notifications, reusing logged-in email server connections and
+HTTP sessions (with keep-alive), and retry failed deliveries with exponential
+backoff. The delivery latency (from queueing to delivery) of each kind of
+notification is recorded.
+"""
+import logging
+import queue
+import threading
+import time
+
+import requests
+
+from mycodo.utils.logging_utils import set_log_level
+from mycodo.utils.metrics import OperationStats
+from mycodo.utils.send_data import SMTPPool
+from mycodo.utils.send_data import send_email
+
+logger = logging.getLogger("mycodo.notifications")
+logger.setLevel(set_log_level(logging))
+
+WORKERS = 2
+QUEUE_CAPACITY = 1000  # notifications
+RETRIES = 3
+RETRY_BACKOFF = 5  # seconds, doubled for every retry
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+smtp_pool = SMTPPool()
+http_sessions = threading.local()
+
+
+class NotificationError(Exception):
+    """A notification could not be delivered."""
+    pass
+
+
+def http_session():
+    """Return the HTTP session of the current worker (connections are kept alive in its pool)."""
+    if not hasattr(http_sessions, 'session'):
+        http_sessions.session = requests.Session()
+    return http_sessions.session
+
+
+def deliver_email(*args, **kwargs):
+    """Send an email with send_email(), using a pooled server connection."""
+    if send_email(*args, pool=smtp_pool, **kwargs):
+        raise NotificationError("Could not send email")
+
+
+def deliver_webhook(method, url, headers=None, body=None, timeout=30):
+    """Make an HTTP request, raising an error if the response isn't successful (2xx)."""
+    response = http_session().request(
+        method, url, headers=headers, data=body.encode('utf-8') if body else None, timeout=timeout)
+    logger.debug("Webhook {} {}: HTTP {}: {}".format(method, url, response.status_code, response.text))
+    if not 200 <= response.status_code < 300:
+        raise NotificationError("Got HTTP {} response.".format(response.status_code))
+
+
+class Notification:
+    def __init__(self, kind, function, args, kwargs, description):
+        self.kind = kind
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.description = description
+        self.time_queued = time.time()
+        self.attempts = 0
+
+
+class NotificationDispatcher:
+    """Queue of notifications, delivered by a pool of worker threads."""
+    def __init__(self, workers=WORKERS, capacity=QUEUE_CAPACITY, retries=RETRIES, backoff=RETRY_BACKOFF):
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.queue = queue.Queue(capacity)
+        self.lock = threading.Lock()
+        self.threads = []
+        self.timers = set()  # Retries waiting for their backoff
+        self.stopped = False  # Stopped for good (when the daemon stops)
+        self.kinds = {}
+
+    def kind_stats(self, kind):
+        with self.lock:
+            if kind not in self.kinds:
+                self.kinds[kind] = {
+                    'queued': 0,
+                    'delivered': 0,
+                    'retries': 0,
+                    'failed': 0,
+                    'dropped': 0,
+                    'latency': OperationStats(buckets=LATENCY_BUCKETS)
+                }
+            return self.kinds[kind]
+
+    def start(self):
+        """Start the workers that aren't running, unless the dispatcher was stopped."""
+        with self.lock:
+            if self.stopped:
+                return
+            self.threads = [thread for thread in self.threads if thread.is_alive()]
+            for index in range(len(self.threads), self.workers):
+                thread = threading.Thread(
+                    target=self.run, name='notifications_{}'.format(index), daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def dispatch(self, kind, function, *args, description=None, **kwargs):
+        """
+        Queue a notification to be delivered in the background (returns immediately)
+
+        :param kind: kind of notification, for the stats (e.g. 'email')
+        :param function: called with args and kwargs to deliver the notification,
+            and raises an exception if it couldn't be delivered
+        :param description: describes the notification in log messages
+        :return: True if queued, False if the queue is full or the dispatcher was stopped
+        """
+        self.start()
+        stats = self.kind_stats(kind)
+        if self.stopped:
+            stats['dropped'] += 1
+            logger.error("Notifications were stopped, dropping {}".format(description or kind))
+            return False
+        try:
+            self.queue.put_nowait(Notification(
+                kind, function, args, kwargs, description or kind))
+        except queue.Full:
+            stats['dropped'] += 1
+            logger.error("Notification queue is full, dropping {}".format(description or kind))
+            return False
+        stats['queued'] += 1
+        return True
+
+    def run(self):
+        while True:
+            notification = self.queue.get()
+            if notification is None:
+                break
+            self.deliver(notification)
+
+    def deliver(self, notification):
+        stats = self.kind_stats(notification.kind)
+        notification.attempts += 1
+        try:
+            notification.function(*notification.args, **notification.kwargs)
+        except Exception as err:
+            if notification.attempts <= self.retries:
+                delay = self.backoff * 2 ** (notification.attempts - 1)
+                stats['retries'] += 1
+                logger.error("Could not deliver {} (attempt {}), retrying in {} seconds: {}".format(
+                    notification.description, notification.attempts, delay, err))
+                with self.lock:
+                    if not self.stopped:
+                        timer = threading.Timer(delay, self.retry, args=(notification,))
+                        timer.daemon = True
+                        self.timers.add(timer)
+                        timer.start()
+                        return
+                self.cancel(notification)
+            else:
+                stats['failed'] += 1
+                stats['latency'].observe(time.time() - notification.time_queued, error=True)
+                logger.error("Could not deliver {} after {} attempts: {}".format(
+                    notification.description, notification.attempts, err))
+            return
+
+        stats['delivered'] += 1
+        stats['latency'].observe(time.time() - notification.time_queued)
+
+    def retry(self, notification):
+        """Queue a notification again, when the backoff of its retry has elapsed (in its Timer)."""
+        try:
+            with self.lock:  # Queued before stop() queues the workers' stop signals
+                if threading.current_thread() not in self.timers:
+                    return  # Cancelled by stop()
+                self.timers.discard(threading.current_thread())
+                self.queue.put_nowait(notification)
+        except queue.Full:
+            stats = self.kind_stats(notification.kind)
+            stats['dropped'] += 1
+            logger.error("Notification queue is full, dropping retry of {}".format(
+                notification.description))
+
+    def cancel(self, notification):
+        """Fail a notification that was to be retried after the dispatcher was stopped."""
+        stats = self.kind_stats(notification.kind)
+        stats['failed'] += 1
+        stats['latency'].observe(time.time() - notification.time_queued, error=True)
+        logger.error("Notifications were stopped, not retrying {}".format(notification.description))
+
+    def stop(self):
+        """
+        Stop the workers, after the notifications that are queued have been delivered (once)
+
+        Retries that are waiting for their backoff are cancelled, and the dispatcher
+        isn't started again (notifications dispatched after it's stopped are dropped).
+        """
+        with self.lock:
+            self.stopped = True
+            threads = self.threads
+            self.threads = []
+            timers = list(self.timers)
+            self.timers.clear()
+        for each_timer in timers:
+            each_timer.cancel()
+            self.cancel(each_timer.args[0])
+        for _ in threads:
+            self.queue.put(None)
+        for each_thread in threads:
+            each_thread.join(30)
+        smtp_pool.close()
+
+    def stats(self):
+        with self.lock:
+            kinds = dict(self.kinds)
+        return {
+            'queue_length': self.queue.qsize(),
+            'kinds': {
+                kind: dict(stats, latency=stats['latency'].snapshot())
+                for kind, stats in kinds.items()
+            }
+        }
+
+
+def format_prometheus_notifications(stats, prefix='mycodo_notification'):
+    """
+    Format notification statistics in the Prometheus text exposition format
+
+    :param stats: dict returned by NotificationDispatcher.stats()
+    :param prefix: prefix of the metric names
+    :return: str
+    """
+    metrics = [
+        ('queued_total', 'counter', 'queued', 'Number of notifications queued'),
+        ('delivered_total', 'counter', 'delivered', 'Number of notifications delivered'),
+        ('retries_total', 'counter', 'retries', 'Number of delivery attempts that failed and were retried'),
+        ('failed_total', 'counter', 'failed', 'Number of notifications that could not be delivered'),
+        ('dropped_total', 'counter', 'dropped', 'Number of notifications dropped because the queue was full')
+    ]
+
+    lines = [
+        '# HELP {}_queue_length Number of notifications waiting to be delivered'.format(prefix),
+        '# TYPE {}_queue_length gauge'.format(prefix),
+        '{}_queue_length {}'.format(prefix, stats['queue_length'])
+    ]
+    for name, metric_type, key, description in metrics:
+        lines.append('# HELP {}_{} {}'.format(prefix, name, description))
+        lines.append('# TYPE {}_{} {}'.format(prefix, name, metric_type))
+        for kind, kind_stats in sorted(stats['kinds'].items()):
+            lines.append('{}_{}{{kind="{}"}} {}'.format(prefix, name, kind, kind_stats[key]))
+
+    lines.append('# HELP {}_latency_seconds Duration from queueing to delivery'.format(prefix))
+    lines.append('# TYPE {}_latency_seconds histogram'.format(prefix))
+    for kind, kind_stats in sorted(stats['kinds'].items()):
+        latency = kind_stats['latency']
+        for upper_bound, count in latency['buckets']:
+            lines.append('{}_latency_seconds_bucket{{kind="{}",le="{}"}} {}'.format(
+                prefix, kind, upper_bound, count))
+        lines.append('{}_latency_seconds_bucket{{kind="{}",le="+Inf"}} {}'.format(
+            prefix, kind, latency['count']))
+        lines.append('{}_latency_seconds_sum{{kind="{}"}} {}'.format(prefix, kind, latency['sum']))
+        lines.append('{}_latency_seconds_count{{kind="{}"}} {}'.format(prefix, kind, latency['count']))
+
+    return '\n'.join(lines) + '\n'
+
+
+notification_dispatcher = NotificationDispatcher()
@@ -0,0 +1,82 @@
+# coding=utf-8
+"""
+Sampling profiler for threads of a running process
+
+The stack of a thread is periodically sampled (with sys._current_frames()) while
+the thread, and every other thread, continues to run. The samples are returned in
+the collapsed (folded) stack format, one line per unique stack with the frames
+separated by semicolons followed by the number of times it was sampled, which
+may be used to generate a flame graph (e.g. with flamegraph.pl or speedscope).
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_PROFILE_SECONDS = 300
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return "{func} ({file}:{line})".format(
+        func=code.co_name,
+        file=os.path.basename(code.co_filename),
+        line=code.co_firstlineno)
+
+
+def collapse_stack(frame):
+    """Return the stack of a frame as a collapsed stack string, outermost frame first."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def sample_thread_stacks(thread_ids, seconds, interval=0.01):
+    """
+    Sample the stacks of threads for a duration
+
+    :param thread_ids: list of thread identifiers (threading.Thread.ident) to sample
+    :param seconds: duration to sample (seconds)
+    :param interval: duration between samples (seconds)
+    :return: Counter of {collapsed stack: number of samples}
+    """
+    samples = Counter()
+    thread_ids = set(thread_ids)
+    sampler_id = threading.get_ident()
+    end_time = time.time() + min(seconds, MAX_PROFILE_SECONDS)
+
+    while time.time() < end_time:
+        frames = sys._current_frames()
+        if not thread_ids.intersection(frames):
+            break  # All threads have ended
+        for thread_id in thread_ids:
+            if thread_id in frames and thread_id != sampler_id:
+                samples[collapse_stack(frames[thread_id])] += 1
+        del frames
+        time.sleep(interval)
+
+    return samples
+
+
+def format_collapsed(samples):
+    """Format samples as collapsed stack lines, most sampled first."""
+    return "".join(
+        "{} {}\n".format(stack, count) for stack, count in samples.most_common())
+
+
+def profile_threads(threads, seconds, interval=0.01):
+    """
+    Profile threads for a duration
+
+    :param threads: list of threading.Thread objects
+    :param seconds: duration to sample (seconds)
+    :param interval: duration between samples (seconds)
+    :return: collapsed stack str
+    """
+    return format_collapsed(sample_thread_stacks(
+        [each_thread.ident for each_thread in threads if each_thread.ident],
+        seconds,
+        interval=interval))
@@ -3,6 +3,9 @@ import logging
 import smtplib
 import socket
 import sys
+import threading
+import time
+from contextlib import contextmanager
 from email import encoders
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
@@ -17,9 +20,93 @@ logger = logging.getLogger("mycodo.notification")
 # Email notification
 #
 
+def smtp_connect(smtp_host, smtp_protocol, port, smtp_user, smtp_pass):
+    """Open a connection to an email server and log in."""
+    response_login = None
+    if smtp_protocol == 'ssl':
+        server = smtplib.SMTP_SSL(smtp_host, port)
+        response_login = server.login(smtp_user, smtp_pass)
+    elif smtp_protocol == 'tls':
+        server = smtplib.SMTP(smtp_host, port)
+        server.starttls()
+        response_login = server.login(smtp_user, smtp_pass)
+    elif smtp_protocol == 'unencrypted':
+        server = smtplib.SMTP(smtp_host, port)
+        response_login = server.login(smtp_user, smtp_pass)
+    elif smtp_protocol == 'unencrypted_no_login':
+        server = smtplib.SMTP(smtp_host, port)
+    else:
+        raise ValueError("Unrecognized protocol: {}".format(smtp_protocol))
+
+    if response_login:
+        logger.debug("Email login response: {}".format(response_login))
+
+    return server
+
+
+class SMTPPool:
+    """
+    Logged-in email server connections, reused between emails
+
+    A connection is used by one sender at a time, and is checked (with NOOP)
+    before it's reused. Connections idle for longer than idle_timeout are closed
+    rather than reused, as servers typically drop idle clients.
+    """
+    def __init__(self, idle_timeout=60):
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.connections = {}  # (host, protocol, port, user, password): [(server, time last used)]
+
+    @staticmethod
+    def close_server(server):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def reusable(self, server, time_last_used):
+        if time.time() - time_last_used > self.idle_timeout:
+            return False
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @contextmanager
+    def connection(self, smtp_host, smtp_protocol, port, smtp_user, smtp_pass):
+        """Yield a logged-in connection to the server, opening one if there's none to reuse."""
+        key = (smtp_host, smtp_protocol, port, smtp_user, smtp_pass)
+        server = None
+        while server is None:
+            with self.lock:
+                idle = self.connections.get(key)
+                entry = idle.pop() if idle else None
+            if entry is None:
+                server = smtp_connect(smtp_host, smtp_protocol, port, smtp_user, smtp_pass)
+            elif self.reusable(*entry):
+                server = entry[0]
+            else:
+                self.close_server(entry[0])
+
+        try:
+            yield server
+        except Exception:
+            self.close_server(server)
+            raise
+
+        with self.lock:
+            self.connections.setdefault(key, []).append((server, time.time()))
+
+    def close(self):
+        with self.lock:
+            connections = [server for idle in self.connections.values() for server, _ in idle]
+            self.connections.clear()
+        for each_server in connections:
+            self.close_server(each_server)
+
 def send_email(smtp_host, smtp_protocol, smtp_port, smtp_user, smtp_pass,
                smtp_email_from, email_to, message_body, subject=None,
-               attachment_file=None, attachment_type=False):
+               attachment_file=None, attachment_type=False, pool=None):
     """
     Email a specific recipient or recipients a message.
 
@@ -45,6 +132,8 @@ def send_email(smtp_host, smtp_protocol, smtp_port, smtp_user, smtp_pass,
     :type attachment_file: str
     :param attachment_type: type of attachment ('still' or 'video')
     :type attachment_type: str
+    :param pool: reuse a logged-in connection to the server from this pool
+    :type pool: SMTPPool
 
     :return: success (0) or failure (1)
     :rtype: bool
@@ -98,30 +187,18 @@ def send_email(smtp_host, smtp_protocol, smtp_port, smtp_user, smtp_pass,
             logger.error("Could not determine port to use to send email. Not sending.")
             return 1
 
-        # select encryption protocol
-        response_login = None
-        if smtp_protocol == 'ssl':
-            server = smtplib.SMTP_SSL(smtp_host, port)
-            response_login = server.login(smtp_user, smtp_pass)
-        elif smtp_protocol == 'tls':
-            server = smtplib.SMTP(smtp_host, port)
-            server.starttls()
-            response_login = server.login(smtp_user, smtp_pass)
-        elif smtp_protocol == 'unencrypted':
-            server = smtplib.SMTP(smtp_host, port)
-            response_login = server.login(smtp_user, smtp_pass)
-        elif smtp_protocol == 'unencrypted_no_login':
-            server = smtplib.SMTP(smtp_host, port)
-        else:
+        if smtp_protocol not in ['ssl', 'tls', 'unencrypted', 'unencrypted_no_login']:
             logger.error("Unrecognized protocol: {}".format(smtp_protocol))
             return 1
 
-        if response_login:
-            logger.debug("Email login response: {}".format(response_login))
-
         # Send the email
-        response_send = server.sendmail(smtp_user, recipients, composed)
-        server.close()
+        if pool:
+            with pool.connection(smtp_host, smtp_protocol, port, smtp_user, smtp_pass) as server:
+                response_send = server.sendmail(smtp_user, recipients, composed)
+        else:
+            server = smtp_connect(smtp_host, smtp_protocol, port, smtp_user, smtp_pass)
+            response_send = server.sendmail(smtp_user, recipients, composed)
+            server.close()
 
         logger.debug("Email send response: {}".format(response_send))
 
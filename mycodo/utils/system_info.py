@@ -0,0 +1,447 @@
+# coding=utf-8
+"""
+System and process information, sampled in the background for the Info page
+
+Running pstree, top, df, free, and the other commands of the Info page each
+time it's viewed takes seconds on a loaded Raspberry Pi. Instead, a background
+thread samples the system (uptime, load, memory, disk usage) and the daemon
+and frontend processes (CPU, RSS, threads, and child processes) every
+SAMPLE_PERIOD seconds from /proc, and the Info page is rendered from the last
+snapshot. The CPU, RSS, and thread count of each sample are kept in a ring
+buffer of HISTORY_SAMPLES, for graphs of them over time.
+
+The information that isn't in /proc (kernel messages, network interfaces,
+GPIO pins, and I2C devices) is still collected by running commands, but by
+the background thread and only every COMMAND_PERIOD seconds. A page never
+waits for a sample: if the snapshot is stale, the page is rendered from it and
+the thread is woken to sample again. Only if there's no snapshot yet does the
+page sample /proc itself (without running the commands).
+"""
+import datetime
+import glob
+import logging
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from collections import deque
+
+from mycodo.config import DAEMON_PID_FILE
+from mycodo.config import FRONTEND_PID_FILE
+from mycodo.utils.logging_utils import set_log_level
+
+logger = logging.getLogger("mycodo.system_info")
+logger.setLevel(set_log_level(logging))
+
+SAMPLE_PERIOD = 30  # seconds
+HISTORY_SAMPLES = 2880  # 24 hours of samples
+COMMAND_PERIOD = 300  # seconds
+COMMAND_TIMEOUT = 10  # seconds
+DMESG_LINES = 20
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def human_size(size):
+    """Return a size in bytes as a human-readable string (as "df -h" and "free -h" print them)."""
+    for unit in ('B', 'K', 'M', 'G', 'T'):
+        if abs(size) < 1024 or unit == 'T':
+            break
+        size /= 1024.0
+    if unit == 'B':
+        return '{}{}'.format(int(size), unit)
+    if abs(size) < 10:
+        return '{:.1f}{}'.format(size, unit)
+    return '{:.0f}{}'.format(size, unit)
+
+
+def read_file(path):
+    """Return the contents of a file, or None if it can't be read (e.g. a process exited)."""
+    try:
+        with open(path, 'rb') as read_f:
+            return read_f.read().decode('latin1')
+    except OSError:
+        return
+
+
+def read_pid_file(path_pid):
+    try:
+        with open(path_pid) as pid_file:
+            return int(pid_file.read())
+    except (OSError, ValueError):
+        return
+
+
+def read_stat(path_stat):
+    """
+    Return the fields of a /proc/<pid>/stat or /proc/<pid>/task/<tid>/stat file
+
+    :return: dict of name, state, ppid, cpu (clock ticks of user + system),
+        threads, start (clock ticks after boot), and rss (bytes), or None
+    """
+    stat = read_file(path_stat)
+    if not stat or ')' not in stat:
+        return
+    try:
+        # The command name may contain spaces and parentheses, fields after it are fixed
+        name = stat[stat.index('(') + 1:stat.rindex(')')]
+        fields = stat[stat.rindex(')') + 2:].split()
+        return {
+            'name': name,
+            'state': fields[0],
+            'ppid': int(fields[1]),
+            'cpu': int(fields[11]) + int(fields[12]),
+            'threads': int(fields[17]),
+            'start': int(fields[19]),
+            'rss': int(fields[21]) * PAGE_SIZE
+        }
+    except (IndexError, ValueError):
+        return
+
+
+def child_pids(pid):
+    """Return the IDs of the child processes of a process."""
+    children = set()
+    found = False
+    for path_children in glob.glob('/proc/{}/task/*/children'.format(pid)):
+        content = read_file(path_children)
+        if content is not None:
+            found = True
+            children.update(int(each_pid) for each_pid in content.split())
+    if not found:
+        # The kernel doesn't provide children files, find the processes with this parent
+        for path_stat in glob.glob('/proc/[0-9]*/stat'):
+            stat = read_stat(path_stat)
+            if stat and stat['ppid'] == pid:
+                children.add(int(path_stat.split('/')[2]))
+    return sorted(children)
+
+
+def uptime_output():
+    """Return the time, uptime, and load averages, as uptime prints them."""
+    uptime = read_file('/proc/uptime')
+    loadavg = read_file('/proc/loadavg')
+    if not uptime or not loadavg:
+        return
+    minutes = int(float(uptime.split()[0])) // 60
+    days, minutes = divmod(minutes, 1440)
+    hours, minutes = divmod(minutes, 60)
+    up = '{}:{:02d}'.format(hours, minutes) if hours else '{} min'.format(minutes)
+    if days:
+        up = '{} day{}, {}'.format(days, 's' if days != 1 else '', up)
+    return ' {} up {},  load average: {}'.format(
+        datetime.datetime.now().strftime('%H:%M:%S'), up, ', '.join(loadavg.split()[:3]))
+
+
+def uname_output():
+    """Return the kernel information, as "uname -a" prints it."""
+    return ' '.join(os.uname())
+
+
+def meminfo():
+    """Return the fields of /proc/meminfo, in bytes."""
+    fields = {}
+    for each_line in (read_file('/proc/meminfo') or '').splitlines():
+        name, _, value = each_line.partition(':')
+        try:
+            fields[name] = int(value.split()[0]) * 1024
+        except (IndexError, ValueError):
+            pass
+    return fields
+
+
+def free_output():
+    """Return the memory and swap usage, as "free -h" prints it."""
+    mem = meminfo()
+    if 'MemTotal' not in mem:
+        return
+    buff_cache = mem.get('Buffers', 0) + mem.get('Cached', 0) + mem.get('SReclaimable', 0)
+    used = mem['MemTotal'] - mem.get('MemFree', 0) - buff_cache
+    row = '{:<7}{:>11}{:>11}{:>11}{:>11}{:>11}{:>11}'
+    lines = [
+        row.format('', 'total', 'used', 'free', 'shared', 'buff/cache', 'available'),
+        row.format('Mem:', human_size(mem['MemTotal']), human_size(used),
+                   human_size(mem.get('MemFree', 0)), human_size(mem.get('Shmem', 0)),
+                   human_size(buff_cache), human_size(mem.get('MemAvailable', 0))),
+        row.format('Swap:', human_size(mem.get('SwapTotal', 0)),
+                   human_size(mem.get('SwapTotal', 0) - mem.get('SwapFree', 0)),
+                   human_size(mem.get('SwapFree', 0)), '', '', '').rstrip()
+    ]
+    return '\n'.join(lines)
+
+
+def df_output():
+    """Return the usage of mounted filesystems, as "df -h" prints it."""
+    rows = [('Filesystem', 'Size', 'Used', 'Avail', 'Use%', 'Mounted on')]
+    mounted = set()
+    for each_line in (read_file('/proc/mounts') or '').splitlines():
+        fields = each_line.split()
+        if len(fields) < 2:
+            continue
+        # Spaces in mount points are escaped as \040
+        device, mount_point = fields[0], fields[1].replace('\\040', ' ')
+        try:
+            stat = os.statvfs(mount_point)
+        except OSError:
+            continue
+        if not stat.f_blocks or mount_point in mounted:
+            continue  # A pseudo filesystem (e.g. proc) or mounted over
+        mounted.add(mount_point)
+        size = stat.f_blocks * stat.f_frsize
+        used = (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+        available = stat.f_bavail * stat.f_frsize
+        use = used / float(used + available) * 100 if used + available else 0
+        rows.append((device, human_size(size), human_size(used), human_size(available),
+                     '{:.0f}%'.format(use), mount_point))
+    width = max(len(each_row[0]) for each_row in rows)
+    return '\n'.join(
+        '{:<{width}} {:>5} {:>5} {:>5} {:>4} {}'.format(*each_row, width=width)
+        for each_row in rows)
+
+
+def run_command(command):
+    """Return the output of a command, or None if it couldn't be run."""
+    try:
+        return subprocess.run(
+            command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            timeout=COMMAND_TIMEOUT).stdout.decode('latin1')
+    except (OSError, subprocess.SubprocessError) as err:
+        logger.debug("Could not run {}: {}".format(' '.join(command), err))
+        return
+
+
+class SystemInfoCollector:
+    """Samples system and process information in a background thread."""
+    def __init__(self, period=SAMPLE_PERIOD, history_samples=HISTORY_SAMPLES):
+        self.period = period
+        self.hardware = False  # Collect GPIO pins and I2C devices
+        self.lock = threading.Lock()
+        self.lock_sample = threading.Lock()  # Samples are taken by the thread or a page (if there isn't one)
+        self.thread = None
+        self.running = threading.Event()
+        self.wake = threading.Event()  # Sample now, rather than at the end of the period
+
+        self.history = {
+            'daemon': deque(maxlen=history_samples),
+            'frontend': deque(maxlen=history_samples)
+        }
+        self.snapshot = None
+        self.commands = {}
+        self.time_commands = 0
+        self.cpu_last = {}  # ('process' or 'thread', pid or tid, start): (time, clock ticks of CPU)
+
+    def start(self, hardware=True):
+        """Start sampling, if it hasn't started (or the process was forked since it started)."""
+        with self.lock:
+            self.hardware = hardware
+            if self.thread is None or not self.thread.is_alive():
+                self.running.set()
+                self.thread = threading.Thread(
+                    target=self.run, name='system_info', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        self.wake.set()
+
+    def run(self):
+        try:
+            os.nice(19)  # On Linux, this only lowers the priority of this thread
+        except (AttributeError, OSError):
+            pass
+        while self.running.is_set():
+            try:
+                if time.time() - self.time_commands > COMMAND_PERIOD:
+                    self.commands = self.collect_commands()
+                    self.time_commands = time.time()
+                self.sample()
+            except Exception:
+                logger.exception("Sampling system information")
+            self.wake.wait(self.period)
+            self.wake.clear()
+
+    def cpu_percent(self, key, cpu, now):
+        """Return the CPU usage (percent of one core) of a process or thread since the last sample."""
+        last = self.cpu_last.get(key)
+        self.cpu_last[key] = (now, cpu)
+        if not last or now <= last[0]:
+            return
+        return (cpu - last[1]) / CLOCK_TICKS / (now - last[0]) * 100
+
+    def process_info(self, pid, now, sampled):
+        """
+        Return the information of a process, its threads, and its child processes
+
+        :param sampled: dict of the processes sampled so far (by pid), so each
+            process is sampled once (and its CPU usage is of the whole period)
+        """
+        if pid in sampled:
+            return sampled[pid]
+        stat = read_stat('/proc/{}/stat'.format(pid))
+        if not stat:
+            return
+        cmdline = read_file('/proc/{}/cmdline'.format(pid))
+        process = {
+            'pid': pid,
+            'name': stat['name'],
+            'command': cmdline.replace('\0', ' ').strip() if cmdline else stat['name'],
+            'state': stat['state'],
+            'cpu': self.cpu_percent(('process', pid, stat['start']), stat['cpu'], now),
+            'cpu_seconds': stat['cpu'] / float(CLOCK_TICKS),
+            'rss': stat['rss'],
+            'start': stat['start'],
+            'threads': [],
+            'children': []
+        }
+        sampled[pid] = process
+        for path_task in sorted(glob.glob('/proc/{}/task/[0-9]*'.format(pid)),
+                                key=lambda path: int(os.path.basename(path))):
+            tid = int(os.path.basename(path_task))
+            stat_thread = read_stat(os.path.join(path_task, 'stat'))
+            if not stat_thread:
+                continue
+            process['threads'].append({
+                'tid': tid,
+                'name': stat_thread['name'],
+                'state': stat_thread['state'],
+                'cpu': self.cpu_percent(('thread', tid, stat_thread['start']), stat_thread['cpu'], now),
+                'cpu_seconds': stat_thread['cpu'] / float(CLOCK_TICKS),
+                'start': stat_thread['start']
+            })
+        for each_pid in child_pids(pid):
+            child = self.process_info(each_pid, now, sampled)
+            if child:
+                process['children'].append(child)
+        return process
+
+    def sample(self):
+        """
+        Sample system and process information, and add the processes to their history
+
+        The information collected by commands is that of the last collect_commands().
+        """
+        with self.lock_sample:
+            now = time.time()
+            sampled = {}
+            processes = OrderedDict([
+                ('daemon', read_pid_file(DAEMON_PID_FILE)),
+                ('frontend', read_pid_file(FRONTEND_PID_FILE))
+            ])
+            for name, pid in processes.items():
+                processes[name] = self.process_info(pid, now, sampled) if pid else None
+
+            # The frontend process that's sampling is one of the workers of the frontend
+            this_process = self.process_info(os.getpid(), now, sampled)
+
+            # Forget the CPU usage of processes and threads that have exited
+            cpu_keys = set()
+            for each_process in sampled.values():
+                cpu_keys.add(('process', each_process['pid'], each_process['start']))
+                cpu_keys.update(('thread', each_thread['tid'], each_thread['start'])
+                                for each_thread in each_process['threads'])
+
+            snapshot = {
+                'time': now,
+                'uptime': uptime_output(),
+                'uname': uname_output(),
+                'df': df_output(),
+                'free': free_output(),
+                'daemon': processes['daemon'],
+                'frontend': processes['frontend'],
+                'dmesg': self.commands.get('dmesg'),
+                'ifconfig': self.commands.get('ifconfig'),
+                'gpio_readall': self.commands.get('gpio_readall'),
+                'i2c_devices': self.commands.get('i2c_devices', OrderedDict())
+            }
+
+            self.cpu_last = {key: value for key, value in self.cpu_last.items() if key in cpu_keys}
+            with self.lock:
+                for name, process in (('daemon', processes['daemon']), ('frontend', this_process)):
+                    if process and process['cpu'] is not None:
+                        self.history[name].append(
+                            (now, process['cpu'], process['rss'], len(process['threads'])))
+                self.snapshot = snapshot
+            return snapshot
+
+    def collect_commands(self):
+        """Collect the information that's not in /proc by running commands."""
+        commands = {}
+        dmesg = run_command(['dmesg'])
+        commands['dmesg'] = '\n'.join(dmesg.splitlines()[-DMESG_LINES:]) if dmesg else dmesg
+        commands['ifconfig'] = run_command(['ifconfig', '-a'])
+        if self.hardware:
+            commands['gpio_readall'] = run_command(['gpio', 'readall'])
+            # The 'i2cdetect -y ID' output of each /dev/i2c- device, sorted by device number
+            i2c_devices = {}
+            for each_dev in glob.glob("/dev/i2c-*"):
+                try:
+                    device_int = int(each_dev.replace("/dev/i2c-", ""))
+                except ValueError:
+                    continue
+                output = run_command(['i2cdetect', '-y', str(device_int)])
+                if output:
+                    i2c_devices[device_int] = output
+            commands['i2c_devices'] = OrderedDict(sorted(i2c_devices.items()))
+        return commands
+
+    def get_snapshot(self):
+        """
+        Return the last snapshot, without waiting for a new one
+
+        If the snapshot isn't recent, the sampling thread is woken to take one. If
+        there's no snapshot yet, one is sampled from /proc (without the commands).
+        """
+        with self.lock:
+            snapshot = self.snapshot
+        if snapshot is None:
+            return self.sample()
+        if time.time() - snapshot['time'] > self.period * 2:
+            self.wake.set()
+        return snapshot
+
+    def get_history(self):
+        """Return the history of each process, as lists of [timestamp (ms), value] of each statistic."""
+        with self.lock:
+            history = {name: list(samples) for name, samples in self.history.items()}
+        return {
+            name: {
+                'cpu': [[int(each[0] * 1000), round(each[1], 2)] for each in samples],
+                'rss': [[int(each[0] * 1000), round(each[2] / 1048576.0, 2)] for each in samples],
+                'threads': [[int(each[0] * 1000), each[3]] for each in samples]
+            }
+            for name, samples in history.items()
+        }
+
+
+def format_process(process):
+    """Return a process, its threads, and its child processes, as a table (in place of pstree and top)."""
+    header = '{:>7} {:>7} S {:>6} {:>7} {:>10}  COMMAND'.format('PID', 'TID', '%CPU', 'RSS', 'TIME')
+    return '\n'.join([header] + format_process_lines(process))
+
+
+def format_process_lines(process, indent=0):
+    lines = []
+    prefix = '  ' * indent
+    cpu = '{:.1f}'.format(process['cpu']) if process['cpu'] is not None else '-'
+    lines.append('{:>7} {:>7} {} {:>6} {:>7} {:>10}  {}{}'.format(
+        process['pid'], '', process['state'], cpu, human_size(process['rss']),
+        format_cpu_time(process['cpu_seconds']), prefix, process['command']))
+    for each_thread in process['threads']:
+        cpu = '{:.1f}'.format(each_thread['cpu']) if each_thread['cpu'] is not None else '-'
+        lines.append('{:>7} {:>7} {} {:>6} {:>7} {:>10}  {}  {{{}}}'.format(
+            '', each_thread['tid'], each_thread['state'], cpu, '',
+            format_cpu_time(each_thread['cpu_seconds']), prefix, each_thread['name']))
+    for each_child in process['children']:
+        lines.extend(format_process_lines(each_child, indent=indent + 1))
+    return lines
+
+
+def format_cpu_time(seconds):
+    """Return CPU time as top prints it (minutes:seconds.hundredths)."""
+    minutes, seconds = divmod(seconds, 60)
+    return '{}:{:05.2f}'.format(int(minutes), seconds)
+
+
+system_info_collector = SystemInfoCollector()
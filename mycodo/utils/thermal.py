@@ -0,0 +1,318 @@
+# coding=utf-8
+"""
+Thermal images from the pixel measurements of thermal camera Inputs (e.g. AMG8833)
+
+Each pixel of a thermal camera is stored as a measurement channel of its Input.
+All channels of a frame (or of a range of frames) are fetched in one query,
+grouped into frames by the second they were measured, and rendered with NumPy:
+temperatures are interpolated to the output resolution, then mapped to a
+precomputed colour map. Rendered images of stored frames don't change, so they
+are cached by (input, timestamp). A range of frames can be rendered as an
+animated image (a "thermal video"), with one temperature scale for all frames.
+
+Requires NumPy and Pillow (dependencies of the thermal camera Inputs).
+"""
+import colorsys
+import io
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+from mycodo.databases.models import Conversion
+from mycodo.databases.models import DeviceMeasurements
+from mycodo.databases.models import Input
+from mycodo.utils.database import db_retrieve_table_daemon
+from mycodo.utils.influx import query_channels
+from mycodo.utils.logging_utils import set_log_level
+from mycodo.utils.system_pi import return_measurement_info
+
+logger = logging.getLogger("mycodo.thermal")
+logger.setLevel(set_log_level(logging))
+
+COLOR_DEPTH = 256
+COLOR_START = (0x4b, 0x00, 0x82)  # indigo (coldest)
+COLOR_END = (0xff, 0x00, 0x00)  # red (hottest)
+INTERPOLATIONS = ('nearest', 'bilinear', 'bicubic')
+CACHE_FRAMES = 256  # Rendered images kept in memory
+MAX_VIDEO_FRAMES = 1000  # Longer ranges are sampled down (by InfluxDB) to this number of frames
+RENDER_CHUNK = 100  # Frames rendered at once when rendering a video
+
+_color_maps = {}
+_matrices = {}
+
+
+def color_map(depth=COLOR_DEPTH):
+    """
+    Return the colour map, an array of depth RGB colours from COLOR_START to COLOR_END
+
+    Colours are interpolated in HLS, as colour.Color.range_to() does.
+    """
+    import numpy as np
+
+    if depth not in _color_maps:
+        start = colorsys.rgb_to_hls(*[c / 255.0 for c in COLOR_START])
+        end = colorsys.rgb_to_hls(*[c / 255.0 for c in COLOR_END])
+        hls = np.linspace(start, end, depth)
+        rgb = [colorsys.hls_to_rgb(*each_hls) for each_hls in hls]
+        _color_maps[depth] = (np.array(rgb) * 255).astype(np.uint8)
+    return _color_maps[depth]
+
+
+def interpolation_matrix(n_in, n_out, interpolation='bicubic'):
+    """
+    Return a (n_out, n_in) matrix that resamples a row of n_in values to n_out values
+
+    Resampling both axes of a frame is then two matrix products, for any number
+    of frames at once.
+    """
+    import numpy as np
+
+    key = (n_in, n_out, interpolation)
+    if key in _matrices:
+        return _matrices[key]
+
+    matrix = np.zeros((n_out, n_in))
+    rows = np.arange(n_out)
+    position = (rows + 0.5) * n_in / n_out - 0.5  # Output pixel centers, in input pixels
+    if interpolation == 'nearest':
+        matrix[rows, np.clip(np.round(position).astype(int), 0, n_in - 1)] = 1
+    else:
+        base = np.floor(position).astype(int)
+        fraction = position - base
+        if interpolation == 'bilinear':
+            taps = {0: 1 - fraction, 1: fraction}
+        elif interpolation == 'bicubic':
+            # Cubic convolution (a = -0.5)
+            def cubic(x):
+                x = np.abs(x)
+                return np.where(
+                    x <= 1, 1.5 * x ** 3 - 2.5 * x ** 2 + 1,
+                    np.where(x < 2, -0.5 * x ** 3 + 2.5 * x ** 2 - 4 * x + 2, 0))
+            taps = {offset: cubic(fraction - offset) for offset in (-1, 0, 1, 2)}
+        else:
+            raise ValueError("Unknown interpolation '{}', must be one of {}".format(
+                interpolation, INTERPOLATIONS))
+        for offset, weights in taps.items():
+            # Edge pixels are repeated beyond the edges
+            np.add.at(matrix, (rows, np.clip(base + offset, 0, n_in - 1)), weights)
+
+    _matrices[key] = matrix
+    return matrix
+
+
+def render_frames(frames, nx, ny, scale=25, temp_min=None, temp_max=None,
+                  rotate_ccw=270, interpolation='bicubic'):
+    """
+    Render frames of pixel temperatures as RGB images
+
+    :param frames: array-like of shape (frames, nx * ny), pixels in rows of nx
+    :param scale: output pixels per sensor pixel
+    :param temp_min: temperature of the first colour (default: the coldest pixel of the frames)
+    :param temp_max: temperature of the last colour (default: the hottest pixel of the frames)
+    :param rotate_ccw: degrees to rotate counterclockwise, a multiple of 90
+    :return: uint8 array of shape (frames, height, width, 3)
+    """
+    import numpy as np
+
+    frames = np.asarray(frames, dtype=float).reshape(-1, ny, nx)
+    colors = color_map()
+
+    if temp_min is None:
+        temp_min = frames.min()
+    if temp_max is None:
+        temp_max = frames.max()
+    span = (temp_max - temp_min) or 1.0
+
+    matrix_y = interpolation_matrix(ny, ny * scale, interpolation)
+    matrix_x = interpolation_matrix(nx, nx * scale, interpolation)
+    frames = matrix_y @ frames @ matrix_x.T
+
+    index = (frames - temp_min) * ((len(colors) - 1) / span)
+    images = colors[np.clip(index, 0, len(colors) - 1).astype(np.intp)]
+
+    if rotate_ccw % 90:
+        raise ValueError("Rotation must be a multiple of 90 degrees")
+    return np.rot90(images, k=(rotate_ccw // 90) % 4, axes=(1, 2))
+
+
+def render_image(pixels, nx, ny, image_format='JPEG', **kwargs):
+    """Render a frame of pixel temperatures as an encoded image (see render_frames())."""
+    from PIL import Image
+
+    image = Image.fromarray(render_frames([pixels], nx, ny, **kwargs)[0])
+    encoded = io.BytesIO()
+    image.save(encoded, image_format)
+    return encoded.getvalue()
+
+
+class FrameCache:
+    """Least recently used cache of rendered images."""
+    def __init__(self, size=CACHE_FRAMES):
+        self.size = size
+        self.lock = threading.Lock()
+        self.images = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            image = self.images.get(key)
+            if image is None:
+                self.misses += 1
+            else:
+                self.images.move_to_end(key)
+                self.hits += 1
+            return image
+
+    def put(self, key, image):
+        with self.lock:
+            self.images[key] = image
+            self.images.move_to_end(key)
+            while len(self.images) > self.size:
+                self.images.popitem(last=False)
+
+    def stats(self):
+        return {
+            'frames': len(self.images),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+frame_cache = FrameCache()
+
+
+def input_grid(unique_id):
+    """
+    Return the pixel measurement and grid size of a thermal camera Input
+
+    :return: (unit, measurement, nx, ny), or None if the Input has no square grid of channels
+    """
+    input_dev = db_retrieve_table_daemon(Input, unique_id=unique_id)
+    if not input_dev:
+        return
+    device_measurement = db_retrieve_table_daemon(DeviceMeasurements).filter(
+        DeviceMeasurements.device_id == unique_id).filter(
+        DeviceMeasurements.channel == 0).first()
+    if not device_measurement:
+        return
+    conversion = db_retrieve_table_daemon(
+        Conversion, unique_id=device_measurement.conversion_id)
+    _, unit, measurement = return_measurement_info(device_measurement, conversion)
+
+    nx = ny = int(math.sqrt(input_dev.channels))
+    if nx * ny != input_dev.channels:
+        logger.error("Input {} has {} channels, which aren't a square grid of pixels".format(
+            unique_id, input_dev.channels))
+        return
+    return unit, measurement, nx, ny
+
+
+def query_frames(unique_id, unit, measurement, n_pixels, start_ms, end_ms, group_ms=None):
+    """
+    Fetch the frames measured from start_ms to end_ms with one query
+
+    Pixels are grouped into frames by the second they were measured in, and
+    frames that are missing pixels are skipped. If group_ms is set (a multiple
+    of 1000), only the first frame of each interval of group_ms is fetched.
+
+    :return: (array of frame timestamps in ms, array of shape (frames, n_pixels))
+    """
+    import numpy as np
+
+    channels = query_channels(unit, unique_id, measure=measurement,
+                              start_ms=start_ms, end_ms=end_ms, group_ms=group_ms)
+    if not channels:
+        return np.empty(0, dtype=np.int64), np.empty((0, n_pixels))
+
+    points = {}
+    for channel, values in channels.items():
+        if 0 <= channel < n_pixels and values:
+            values = np.array(values, dtype=float)
+            points[channel] = (values[:, 0].astype(np.int64) // 1000, values[:, 1])
+
+    seconds = np.unique(np.concatenate([s for s, _ in points.values()])) if points else []
+    frames = np.full((len(seconds), n_pixels), np.nan)
+    for channel, (channel_seconds, values) in points.items():
+        frames[np.searchsorted(seconds, channel_seconds), channel] = values
+
+    complete = ~np.isnan(frames).any(axis=1)
+    return np.asarray(seconds)[complete] * 1000, frames[complete]
+
+
+def thermal_image(unique_id, timestamp_ms, **kwargs):
+    """
+    Return the image (JPEG) of the frame an Input measured in the second of timestamp_ms
+
+    :return: encoded image, or None if there's no complete frame
+    """
+    key = (unique_id, int(timestamp_ms) // 1000, tuple(sorted(kwargs.items())))
+    image = frame_cache.get(key)
+    if image is not None:
+        return image
+
+    grid = input_grid(unique_id)
+    if not grid:
+        return
+    unit, measurement, nx, ny = grid
+
+    start_ms = int(timestamp_ms) // 1000 * 1000
+    _, frames = query_frames(
+        unique_id, unit, measurement, nx * ny, start_ms, start_ms + 999)
+    if not len(frames):
+        return
+
+    image = render_image(frames[-1], nx, ny, **kwargs)
+    frame_cache.put(key, image)
+    return image
+
+
+def thermal_video(unique_id, start_ms, end_ms, fps=4, temp_min=None, temp_max=None, **kwargs):
+    """
+    Return the frames an Input measured from start_ms to end_ms as an animated GIF
+
+    All frames are fetched with one query and rendered with the same temperature
+    scale (the range of all frames, unless temp_min or temp_max are set). Ranges
+    longer than MAX_VIDEO_FRAMES seconds are sampled down by the query, to the
+    first frame of each interval, so only the frames that are rendered are fetched.
+
+    :return: encoded GIF, or None if there are no complete frames
+    """
+    from PIL import Image
+
+    grid = input_grid(unique_id)
+    if not grid:
+        return
+    unit, measurement, nx, ny = grid
+
+    group_ms = None
+    if end_ms - start_ms > MAX_VIDEO_FRAMES * 1000:
+        # Frames are at most one per second, so intervals are whole seconds
+        group_ms = math.ceil((end_ms - start_ms) / MAX_VIDEO_FRAMES / 1000) * 1000
+
+    _, frames = query_frames(
+        unique_id, unit, measurement, nx * ny, start_ms, end_ms, group_ms=group_ms)
+    if not len(frames):
+        return
+    frames = frames[:MAX_VIDEO_FRAMES]  # Intervals aligned to epoch may add one
+
+    if temp_min is None:
+        temp_min = frames.min()
+    if temp_max is None:
+        temp_max = frames.max()
+
+    def images():
+        for index in range(0, len(frames), RENDER_CHUNK):
+            rendered = render_frames(
+                frames[index:index + RENDER_CHUNK], nx, ny,
+                temp_min=temp_min, temp_max=temp_max, **kwargs)
+            for each_image in rendered:
+                yield Image.fromarray(each_image)
+
+    video = io.BytesIO()
+    rendered = images()
+    next(rendered).save(
+        video, 'GIF', save_all=True, append_images=rendered,
+        duration=int(1000 / fps), loop=0)
+    return video.getvalue()
@@ -187,7 +187,10 @@ WIDGET_INFORMATION = {
             // The image is available and younger than the max age
             const timestamp = data[1];
             const image_no_cache_timestamp = Date.now();
-            document.getElementById(dashboard_id + "-image-src").src = "/camera/" + camera_unique_id + "/" + image_type_str + "/" + filename + "?" + image_no_cache_timestamp;
+            // Request a thumbnail the width of the widget, the link opens the full size image
+            const image_src = document.getElementById(dashboard_id + "-image-src");
+            const image_width = Math.ceil((image_src.clientWidth || 320) * (window.devicePixelRatio || 1));
+            image_src.src = "/camera/" + camera_unique_id + "/" + image_type_str + "/" + filename + "?" + image_no_cache_timestamp + "&width=" + image_width;
             document.getElementById(dashboard_id + "-image-href").href = "/camera/" + camera_unique_id + "/" + image_type_str + "/" + filename + "?" + image_no_cache_timestamp;
             if (document.getElementById(dashboard_id + "-timestamp")) document.getElementById(dashboard_id + "-timestamp").innerHTML = timestamp_str + timestamp;
           }
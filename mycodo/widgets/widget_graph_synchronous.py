@@ -35,13 +35,12 @@ from mycodo.databases.models import CustomController
 from mycodo.databases.models import DeviceMeasurements
 from mycodo.databases.models import Input
 from mycodo.databases.models import Math
-from mycodo.databases.models import Measurement
 from mycodo.databases.models import NoteTags
 from mycodo.databases.models import Output
 from mycodo.databases.models import PID
 from mycodo.mycodo_flask.utils.utils_general import use_unit_generate
+from mycodo.mycodo_flask.utils.utils_render_context import get_render_context
 from mycodo.utils.constraints_pass import constraints_pass_positive_value
-from mycodo.utils.system_pi import add_custom_measurements
 from mycodo.utils.system_pi import return_measurement_info
 
 logger = logging.getLogger(__name__)
@@ -100,7 +99,7 @@ def execute_at_modification(
 
 
 def generate_page_variables(widget_unique_id, widget_options):
-    dict_measurements = add_custom_measurements(Measurement.query.all())
+    dict_measurements = get_render_context().dict_measurements
 
     # Generate dictionary of custom colors for each graph
     colors_graph = dict_custom_colors(widget_options)
@@ -716,7 +715,7 @@ WIDGET_INFORMATION = {
           {%- for output_and_measurement_ids in graph_output_ids -%}
             {%- set output_id = output_and_measurement_ids.split(',')[0] -%}
             {%- set measurement_id = output_and_measurement_ids.split(',')[1] -%}
-            {%- set all_output = table_output.query.filter(table_output.unique_id == output_id).all() -%}
+            {%- set all_output = [output_dict[output_id]] if output_id in output_dict else [] -%}
             {%- if all_output -%}
               {% for each_output in all_output %}
           getPastDataSynchronousGraph('{{each_widget.unique_id}}', {{count_series|count}}, '{{each_output.unique_id}}', 'output', '{{measurement_id}}', {{widget_options['x_axis_minutes']*60}});
@@ -731,7 +730,7 @@ WIDGET_INFORMATION = {
           {%- for input_and_measurement_ids in graph_input_ids -%}
             {%- set input_id = input_and_measurement_ids.split(',')[0] -%}
             {%- set measurement_id = input_and_measurement_ids.split(',')[1] -%}
-            {%- set all_input = table_input.query.filter(table_input.unique_id == input_id).all() -%}
+            {%- set all_input = [input_dict[input_id]] if input_id in input_dict else [] -%}
             {%- if all_input -%}
               {% for each_input in all_input %}
           getPastDataSynchronousGraph('{{each_widget.unique_id}}', {{count_series|count}}, '{{each_input.unique_id}}', 'input', '{{measurement_id}}', {{widget_options['x_axis_minutes']*60}});
@@ -746,7 +745,7 @@ WIDGET_INFORMATION = {
           {%- for math_and_measurement_ids in graph_math_ids -%}
             {%- set math_id = math_and_measurement_ids.split(',')[0] -%}
             {%- set measurement_id = math_and_measurement_ids.split(',')[1] -%}
-            {%- set all_math = table_math.query.filter(table_math.unique_id == math_id).all() -%}
+            {%- set all_math = [math_dict[math_id]] if math_id in math_dict else [] -%}
             {%- if all_math -%}
               {% for each_math in all_math %}
           getPastDataSynchronousGraph('{{each_widget.unique_id}}', {{count_series|count}}, '{{each_math.unique_id}}', 'math', '{{measurement_id}}', {{widget_options['x_axis_minutes']*60}});
@@ -761,7 +760,7 @@ WIDGET_INFORMATION = {
           {%- for function_and_measurement_ids in graph_function_ids -%}
             {%- set function_id = function_and_measurement_ids.split(',')[0] -%}
             {%- set measurement_id = function_and_measurement_ids.split(',')[1] -%}
-            {%- set all_function = table_function.query.filter(table_function.unique_id == function_id).all() -%}
+            {%- set all_function = [function_dict[function_id]] if function_id in function_dict else [] -%}
             {%- if all_function -%}
               {% for each_function in all_function %}
           getPastDataSynchronousGraph('{{each_widget.unique_id}}', {{count_series|count}}, '{{each_function.unique_id}}', 'function', '{{measurement_id}}', {{widget_options['x_axis_minutes']*60}});
@@ -1006,7 +1005,7 @@ WIDGET_INFORMATION = {
     series: [
   {%- for output_and_measurement_ids in graph_output_ids -%}
     {%- set output_id = output_and_measurement_ids.split(',')[0] -%}
-    {%- set all_output = table_output.query.filter(table_output.unique_id == output_id).all() -%}
+    {%- set all_output = [output_dict[output_id]] if output_id in output_dict else [] -%}
     {%- if all_output -%}
       {%- for each_output in all_output -%}
         {%- set measurement_id = output_and_measurement_ids.split(',')[1] -%}
@@ -1051,7 +1050,7 @@ WIDGET_INFORMATION = {
         tooltip: {
           valueSuffix: '
           {%- if device_measurements_dict[measurement_id].conversion_id -%}
-            {{' ' + dict_units[table_conversion.query.filter(table_conversion.unique_id == device_measurements_dict[measurement_id].conversion_id).first().convert_unit_to]['unit']}}
+            {{' ' + dict_units[conversion_dict[device_measurements_dict[measurement_id].conversion_id].convert_unit_to]['unit']}}
           {%- elif device_measurements_dict[measurement_id].rescaled_unit -%}
             {{' ' + dict_units[device_measurements_dict[measurement_id].rescaled_unit]['unit']}}
           {%- else -%}
@@ -1075,7 +1074,7 @@ WIDGET_INFORMATION = {
 
   {%- for input_and_measurement_ids in graph_input_ids -%}
     {%- set input_id = input_and_measurement_ids.split(',')[0] -%}
-    {%- set all_input = table_input.query.filter(table_input.unique_id == input_id).all() -%}
+    {%- set all_input = [input_dict[input_id]] if input_id in input_dict else [] -%}
     {%- if all_input -%}
       {%- for each_input in all_input -%}
         {%- set measurement_id = input_and_measurement_ids.split(',')[1] -%}
@@ -1120,7 +1119,7 @@ WIDGET_INFORMATION = {
         tooltip: {
           valueSuffix: '
           {%- if device_measurements_dict[measurement_id].conversion_id -%}
-            {{' ' + dict_units[table_conversion.query.filter(table_conversion.unique_id == device_measurements_dict[measurement_id].conversion_id).first().convert_unit_to]['unit']}}
+            {{' ' + dict_units[conversion_dict[device_measurements_dict[measurement_id].conversion_id].convert_unit_to]['unit']}}
           {%- elif device_measurements_dict[measurement_id].rescaled_unit -%}
             {{' ' + dict_units[device_measurements_dict[measurement_id].rescaled_unit]['unit']}}
           {%- else -%}
@@ -1186,7 +1185,7 @@ WIDGET_INFORMATION = {
       tooltip: {
         valueSuffix: '
         {%- if device_measurements_dict[measurement_id].conversion_id -%}
-          {{' ' + dict_units[table_conversion.query.filter(table_conversion.unique_id == device_measurements_dict[measurement_id].conversion_id).first().convert_unit_to]['unit']}}
+          {{' ' + dict_units[conversion_dict[device_measurements_dict[measurement_id].conversion_id].convert_unit_to]['unit']}}
         {%- elif device_measurements_dict[measurement_id].rescaled_unit -%}
           {{' ' + dict_units[device_measurements_dict[measurement_id].rescaled_unit]['unit']}}
         {%- else -%}
@@ -1251,7 +1250,7 @@ WIDGET_INFORMATION = {
       tooltip: {
         valueSuffix: '
         {%- if device_measurements_dict[measurement_id].conversion_id -%}
-          {{' ' + dict_units[table_conversion.query.filter(table_conversion.unique_id == device_measurements_dict[measurement_id].conversion_id).first().convert_unit_to]['unit']}}
+          {{' ' + dict_units[conversion_dict[device_measurements_dict[measurement_id].conversion_id].convert_unit_to]['unit']}}
         {%- elif device_measurements_dict[measurement_id].rescaled_unit -%}
           {{' ' + dict_units[device_measurements_dict[measurement_id].rescaled_unit]['unit']}}
         {%- else -%}
@@ -1922,12 +1921,13 @@ def graph_y_axes(dict_measurements, widget_options):
     """Determine which y-axes to use for each Graph."""
     y_axes = []
 
-    function = CustomController.query.all()
-    device_measurements = DeviceMeasurements.query.all()
-    input_dev = Input.query.all()
-    math = Math.query.all()
-    output = Output.query.all()
-    pid = PID.query.all()
+    context = get_render_context()
+    function = context.function
+    device_measurements = context.device_measurements
+    input_dev = context.input_dev
+    math = context.math
+    output = context.output
+    pid = context.pid
 
     devices_list = [input_dev, math, function, output, pid]
 
@@ -1955,30 +1955,13 @@ def graph_y_axes(dict_measurements, widget_options):
 
                 measure_id = each_id_measure.split(',')[1]
 
-                for each_measurement in device_measurements:
-                    if each_measurement.unique_id == measure_id:
-
-                        unit = None
-                        if each_measurement.measurement_type == 'setpoint':
-                            setpoint_pid = PID.query.filter(PID.unique_id == each_measurement.device_id).first()
-                            if setpoint_pid and ',' in setpoint_pid.measurement:
-                                pid_measurement = setpoint_pid.measurement.split(',')[1]
-                                setpoint_measurement = DeviceMeasurements.query.filter(
-                                    DeviceMeasurements.unique_id == pid_measurement).first()
-                                if setpoint_measurement:
-                                    conversion = Conversion.query.filter(
-                                        Conversion.unique_id == setpoint_measurement.conversion_id).first()
-                                    _, unit, measurement = return_measurement_info(setpoint_measurement, conversion)
-                        else:
-                            conversion = Conversion.query.filter(
-                                Conversion.unique_id == each_measurement.conversion_id).first()
-                            _, unit, _ = return_measurement_info(each_measurement, conversion)
-
-                        if unit:
-                            if not y_axes:
-                                y_axes = [unit]
-                            elif y_axes and unit not in y_axes:
-                                y_axes.append(unit)
+                # Unit of the measurement (of the PID measurement, for setpoints)
+                unit = context.dict_measure_units.get(measure_id)
+                if unit:
+                    if not y_axes:
+                        y_axes = [unit]
+                    elif y_axes and unit not in y_axes:
+                        y_axes.append(unit)
 
             elif len(each_id_measure.split(',')) == 4:
 
@@ -144,8 +144,8 @@ WIDGET_INFORMATION = {
 {%- endif -%}
 
 {%- if device_id and channel_id -%}
-    {% set out = table_output.query.filter(table_output.unique_id == device_id).first() %}
-    {% set out_chan = table_output_channel.query.filter(table_output_channel.unique_id == channel_id).first() %}
+    {% set out = output_dict.get(device_id) %}
+    {% set out_chan = output_channel_dict.get(channel_id) %}
 {%- endif -%}
 
 {%- if out and out_chan and 
@@ -155,9 +155,7 @@ WIDGET_INFORMATION = {
        out_chan.channel in dict_outputs[out.output_type]["channels_dict"] -%}
     {%- set channel_output = dict_outputs[out.output_type]["channels_dict"][out_chan.channel] -%}
     {%- if "measurements" in channel_output and channel_output["measurements"] -%}
-        {% set measurements = table_device_measurements.query.filter(
-                                and_(table_device_measurements.device_id == device_id,
-                                     table_device_measurements.channel.in_(channel_output["measurements"]))).all() %}
+        {% set measurements = measurements_by_device.get(device_id, [])|selectattr('channel', 'in', channel_output["measurements"])|list %}
     {%- endif -%}
 {%- endif -%}
 
@@ -458,8 +456,8 @@ WIDGET_INFORMATION = {
 {%- endif -%}
 
 {%- if device_id and channel_id -%}
-    {% set out = table_output.query.filter(table_output.unique_id == device_id).first() %}
-    {% set out_chan = table_output_channel.query.filter(table_output_channel.unique_id == channel_id).first() %}
+    {% set out = output_dict.get(device_id) %}
+    {% set out_chan = output_channel_dict.get(channel_id) %}
 {%- endif -%}
 
 {%- if out and out_chan and 
@@ -469,9 +467,7 @@ WIDGET_INFORMATION = {
        out_chan.channel in dict_outputs[out.output_type]["channels_dict"] -%}
     {%- set channel_output = dict_outputs[out.output_type]["channels_dict"][out_chan.channel] -%}
     {%- if "measurements" in channel_output and channel_output["measurements"] -%}
-        {% set measurements = table_device_measurements.query.filter(
-                                and_(table_device_measurements.device_id == device_id,
-                                     table_device_measurements.channel.in_(channel_output["measurements"]))).all() %}
+        {% set measurements = measurements_by_device.get(device_id, [])|selectattr('channel', 'in', channel_output["measurements"])|list %}
     {%- endif -%}
 {%- endif -%}
 
@@ -125,7 +125,7 @@ WIDGET_INFORMATION = {
 """,
 
     'widget_dashboard_body': """
-{% set this_pid = table_pid.query.filter(table_pid.unique_id == widget_options['pid']).first() %}
+{% set this_pid = pid_dict.get(widget_options['pid']) %}
 <div class="pause-background" id="container-pid-{{each_widget.unique_id}}" style="height: 100%">
 
   <div class="row no-gutters" style="padding-top: 0.4em">
@@ -460,11 +460,11 @@ WIDGET_INFORMATION = {
   getLastDataPID('{{each_widget.unique_id}}', '{{widget_options['pid']}}', {{widget_options['max_measure_age']}}, {{widget_options['decimal_places']}}, '
 
       {%- set measurement_id = each_pid.measurement.split(',')[1] -%}
-      {%- set device_measurement = table_device_measurements.query.filter(table_device_measurements.unique_id == measurement_id).first() -%}
+      {%- set device_measurement = device_measurements_dict.get(measurement_id) -%}
 
       {%- if device_measurement -%}
         {%- if device_measurement.conversion_id -%}
-          {{dict_units[table_conversion.query.filter(table_conversion.unique_id == device_measurement.conversion_id).first().convert_unit_to]['unit']}}
+          {{dict_units[conversion_dict[device_measurement.conversion_id].convert_unit_to]['unit']}}
         {%- elif device_measurement.rescaled_unit -%}
           {{dict_units[device_measurement.rescaled_unit]['unit']}}
         {%- else -%}
@@ -476,11 +476,11 @@ WIDGET_INFORMATION = {
   repeatLastDataPID('{{each_widget.unique_id}}', '{{widget_options['pid']}}', {{widget_options['refresh_seconds']}}, {{widget_options['max_measure_age']}}, {{widget_options['decimal_places']}}, '
 
       {%- set measurement_id = each_pid.measurement.split(',')[1] -%}
-      {%- set device_measurement = table_device_measurements.query.filter(table_device_measurements.unique_id == measurement_id).first() -%}
+      {%- set device_measurement = device_measurements_dict.get(measurement_id) -%}
 
       {%- if device_measurement -%}
         {%- if device_measurement.conversion_id -%}
-          {{dict_units[table_conversion.query.filter(table_conversion.unique_id == device_measurement.conversion_id).first().convert_unit_to]['unit']}}
+          {{dict_units[conversion_dict[device_measurement.conversion_id].convert_unit_to]['unit']}}
         {%- elif device_measurement.rescaled_unit -%}
           {{dict_units[device_measurement.rescaled_unit]['unit']}}
         {%- else -%}